@@ -25,18 +25,24 @@ from datetime import datetime
 import cloudinary
 import pytz
 from flask import Flask, g, render_template, request, send_from_directory, session
-from sqlalchemy import and_, func, not_
+from sqlalchemy import text
 
 from app.blueprints.cliente.auth import perfil
-from app.models.serializers import format_currency_cop
-from app.utils.admin_jwt_utils import decode_admin_jwt_token
-from app.utils.jwt_utils import decode_jwt_token, jwt_required
+from app.models.serializers import format_currency_cop, pedidos_detalle_cliente_to_dict_list
+from app.utils import analitica_clientes, carrito, cart_summary, category_counters, category_status, contador_consultas, dashboard_stats, facet_index, inventario, navigation_cache, notificaciones, presence, product_search, recomendaciones, tareas
+from app.utils.identity import (
+    get_identity_query_count,
+    get_usuario_por_id,
+    resolver_admin_actual,
+    resolver_usuario_actual,
+)
+from app.utils.jwt_utils import jwt_required
+from app.utils.lazy import lazy_value
 from config import Config
 
 from .extensions import bcrypt, db, jwt, login_manager, migrate
 from .models.domains.order_models import Pedido, PedidoProducto
-from .models.domains.user_models import Admins, Usuarios
-from .models.enums import EstadoEnum, EstadoPedido
+from .models.enums import EstadoEnum
 
 
 def create_app(config_class=Config):
@@ -91,6 +97,20 @@ def create_app(config_class=Config):
     bcrypt.init_app(app)
     migrate.init_app(app, db)
     login_manager.init_app(app)
+    presence.init_presence(app)
+    navigation_cache.init_navigation_cache(app)
+    facet_index.init_facet_index(app)
+    product_search.init_product_search(app)
+    category_counters.init_category_counters(app)
+    category_status.init_category_status(app)
+    notificaciones.init_notificaciones(app)
+    tareas.init_tareas(app)
+    inventario.init_inventario(app)
+    carrito.init_carrito(app)
+    cart_summary.init_cart_summary(app)
+    recomendaciones.init_recomendaciones(app)
+    analitica_clientes.init_analitica_clientes(app)
+    dashboard_stats.init_dashboard_stats(app)
 
     # Inicializa Flask-JWT-Extended para la gestión de tokens JWT.
     jwt.init_app(app)
@@ -106,7 +126,7 @@ def create_app(config_class=Config):
         Función de callback requerida por Flask-Login para cargar un usuario desde la sesión.
         Dado un ID de usuario, devuelve el objeto de usuario correspondiente.
         """
-        return Usuarios.query.get(id)
+        return get_usuario_por_id(id)
 
     # --- PROCESADORES DE CONTEXTO Y MANEJADORES DE PETICIONES ---
     @app.context_processor
@@ -114,17 +134,13 @@ def create_app(config_class=Config):
         """
         Procesador de contexto para inyectar el objeto `admin_user` en todas las plantillas.
 
-        Intenta decodificar el token JWT de administrador desde las cookies. Si es válido,
-        recupera el administrador de la base de datos y lo hace disponible globalmente
-        en el contexto de las plantillas Jinja2. Esto es útil para la barra de navegación
-        del panel de administración y otros elementos comunes de la UI.
-        """
-        admin_user = None
-        token = request.cookies.get("admin_jwt")
-        if token:
-            payload = decode_admin_jwt_token(token)
-            if payload and "user_id" in payload:
-                admin_user = Admins.query.get(payload["user_id"])
+        Reutiliza el administrador ya resuelto en `g.admin_user` por el middleware
+        `before_request`; si no existe, recurre al resolutor de identidad por petición,
+        que decodifica el token y consulta la base de datos como máximo una vez.
+        Esto es útil para la barra de navegación del panel de administración y otros
+        elementos comunes de la UI.
+        """
+        admin_user = getattr(g, "admin_user", None) or resolver_admin_actual()
         return dict(admin_user=admin_user)
 
     @app.before_request
@@ -137,11 +153,14 @@ def create_app(config_class=Config):
         2. **Asignación a `g`**: Asigna el usuario cliente (`g.user`) y el administrador
            (`g.admin_user`) al objeto global `g` de Flask si se encuentran tokens válidos.
            El objeto `g` persiste durante el ciclo de vida de una única petición.
-        3. **Actualización de `last_seen` del Admin**: Actualiza el timestamp `last_seen` del
-           administrador en cada petición para mantener un seguimiento preciso de su actividad.
-        """
-        from datetime import datetime, timezone
+        3. **Actualización de `last_seen` del Admin**: Registra la actividad del administrador
+           en el buffer de presencia (`app.utils.presence`), que la vuelca en lote a la base
+           de datos. Así no se abre una transacción de escritura en cada petición.
 
+        La identidad se obtiene a través de `app.utils.identity`, por lo que cada token se
+        decodifica una sola vez y cada usuario/administrador se carga una sola vez por petición,
+        aunque después lo necesiten los decoradores y los procesadores de contexto.
+        """
         from flask import g
 
         from .blueprints.cliente.auth import restore_session_from_jwt
@@ -152,25 +171,59 @@ def create_app(config_class=Config):
 
         # 2. Asignar admin a g.admin_user si está autenticado
         # La actualización de last_seen se maneja en el login del admin.
-        client_token = request.cookies.get("token")
-        if client_token:
-            payload = decode_jwt_token(client_token)
-            if payload and "user_id" in payload:
-                user = Usuarios.query.get(payload["user_id"])
-                if user:
-                    g.user = user
-
-        admin_token = request.cookies.get("admin_jwt")
-        if admin_token:
-            payload = decode_admin_jwt_token(admin_token)
-            if payload and "user_id" in payload:
-                admin = Admins.query.get(payload["user_id"])
-                if admin:
-                    g.admin_user = admin
-                    # Actualizar last_seen en cada petición del admin.
-                    # Esto asegura que el estado "En línea" sea preciso y en tiempo real.
-                    admin.last_seen = datetime.now(timezone.utc)
-                    db.session.commit()
+        if not getattr(g, "user", None):
+            user = resolver_usuario_actual()
+            if user:
+                g.user = user
+
+        admin = resolver_admin_actual()
+        if admin:
+            g.admin_user = admin
+            # Registrar actividad en cada petición del admin, sin commit por petición.
+            # `is_online` lee a través del buffer, por lo que el estado "En línea" sigue siendo inmediato.
+            presence.touch(presence.ADMIN, admin.id)
+
+    @app.after_request
+    def log_identity_queries(response):
+        """
+        Registra cuántas consultas de identidad emitió la petición.
+
+        Con el resolutor por petición lo esperado es, como mucho, una consulta para el
+        cliente y otra para el administrador. Un valor mayor indica que algún código
+        volvió a cargar un principal por fuera de `app.utils.identity`. La cabecera
+        `X-Identity-Queries` solo se envía en modo debug o con `IDENTITY_QUERIES_HEADER`.
+        """
+        total = get_identity_query_count()
+        if total > 2:
+            app.logger.warning(f"{request.path}: {total} consultas de identidad en una sola petición.")
+        if app.debug or app.config.get("IDENTITY_QUERIES_HEADER"):
+            response.headers["X-Identity-Queries"] = str(total)
+        return response
+
+    @app.after_request
+    def flush_presence_buffer(response):
+        """
+        Vuelca el buffer de presencia (`last_seen`) si ya pasó el intervalo configurado.
+
+        Se ejecuta al final de las peticiones en lugar de en un hilo en segundo plano. En
+        serverless el intervalo por defecto es 0, de modo que la actividad se escribe en
+        la misma petición que la registró y no depende de que la instancia siga viva.
+        """
+        presence.maybe_flush_presence()
+        return response
+
+    @app.after_request
+    def run_periodic_tasks(response):
+        """
+        Encola las tareas periódicas cuyo intervalo venció (purga de carritos abandonados,
+        recálculo de las recomendaciones, fotografía diaria del stock).
+
+        Corren en el hilo de fondo de `app.utils.tareas` y no retrasan la respuesta. Con
+        `PERIODIC_TASKS_IN_REQUESTS` desactivado no hace nada y las tareas se ejecutan
+        con `flask tareas-periodicas` desde un cron.
+        """
+        tareas.maybe_lanzar_periodicas()
+        return response
 
     # --- REGISTRO DE BLUEPRINTS ---
     # Registrar blueprints admin
@@ -238,31 +291,13 @@ def create_app(config_class=Config):
         Args:
             usuario (Usuarios): El objeto de usuario inyectado por el decorador `@jwt_required`.
         """
-        # Contar todos los pedidos excepto aquellos 'en proceso' que están 'inactivos'.
-        # Esto incluye:
-        # - Pedidos 'en proceso' y 'activos'.
-        # - Todos los pedidos 'completados' (activos e inactivos).
-        # - Todos los pedidos 'cancelados' (activos e inactivos).
-        pedidos_realizados = Pedido.query.filter(
-            Pedido.usuario_id == usuario.id,
-            not_(
-                and_(
-                    Pedido.estado_pedido == EstadoPedido.EN_PROCESO.value,
-                    Pedido.estado == "inactivo",
-                )
-            ),
-        ).count()
-
-        # El total de compras debe sumar todos los pedidos 'completados', sin importar si están activos o inactivos.
-        total_compras_valor = (
-            db.session.query(func.sum(Pedido.total))
-            .filter(
-                Pedido.usuario_id == usuario.id,
-                Pedido.estado_pedido == EstadoPedido.COMPLETADO.value,
-            )
-            .scalar()
-            or 0
-        )
+        # MEJORA PROFESIONAL: Los contadores salen del componente compartido de estadísticas
+        # de pedidos (un único `GROUP BY`, cacheado por usuario). `todos` cuenta todos los
+        # pedidos excepto los 'en proceso' que están 'inactivos', y el total de compras
+        # suma los pedidos 'completados', sin importar si están activos o inactivos.
+        stats = analitica_clientes.estadisticas_pedidos(usuario.id)
+        pedidos_realizados = stats['todos']
+        total_compras_valor = stats['total_gastado']
 
         total_compras_formateado = format_currency_cop(total_compras_valor)
 
@@ -308,10 +343,18 @@ def create_app(config_class=Config):
         - `total_favoritos`: Para el contador de la lista de deseos.
         - `usuario_autenticado`: Un booleano para cambiar la UI según el estado de sesión.
         - `now`: La fecha y hora actual para comparaciones en las plantillas.
+
+        MEJORA PROFESIONAL: Los datos del carrito y de favoritos se exponen como valores
+        perezosos (`app.utils.lazy.lazy_value`): sus consultas solo se ejecutan si la
+        plantilla los usa, de modo que las páginas del panel o de error no las pagan.
         """
         from sqlalchemy.orm import joinedload
 
-        from app.blueprints.cliente.cart import get_cart_items, get_or_create_cart
+        from app.blueprints.cliente.cart import (
+            get_cart_items,
+            get_cart_summary,
+            get_or_create_cart,
+        )
         from app.models.domains.product_models import (
             CategoriasPrincipales,
             Productos,
@@ -320,33 +363,37 @@ def create_app(config_class=Config):
         )
         from app.models.serializers import categoria_principal_to_dict
 
-        # Datos del carrito
-        cart_info = get_or_create_cart()
-        items = get_cart_items(cart_info)
-        total_items = sum(item["quantity"] for item in items)
-        total_price = sum(item["subtotal"] for item in items)
-
-        # Obtener las 7 categorías más antiguas y activas
-        categorias_obj = (
-            CategoriasPrincipales.query.filter(CategoriasPrincipales.estado == "activo")
-            .order_by(CategoriasPrincipales.created_at.asc())
-            .limit(7)
-            .options(
-                joinedload(
-                    CategoriasPrincipales.subcategorias.and_(
-                        Subcategorias.estado == "activo"
-                    )
-                ).joinedload(
-                    Subcategorias.seudocategorias.and_(
-                        Seudocategorias.estado == "activo"
+        # Datos del carrito (perezosos). El carrito se resuelve una sola vez y solo si se usa.
+        cart_info = lazy_value(get_or_create_cart)
+        items = lazy_value(lambda: get_cart_items(cart_info))
+        total_price = lazy_value(lambda: get_cart_summary(cart_info)[1])
+
+        def construir_arbol_navegacion():
+            # Obtener las 7 categorías más antiguas y activas
+            categorias_obj = (
+                CategoriasPrincipales.query.filter(CategoriasPrincipales.estado == "activo")
+                .order_by(CategoriasPrincipales.created_at.asc())
+                .limit(7)
+                .options(
+                    joinedload(
+                        CategoriasPrincipales.subcategorias.and_(
+                            Subcategorias.estado == "activo"
+                        )
+                    ).joinedload(
+                        Subcategorias.seudocategorias.and_(
+                            Seudocategorias.estado == "activo"
+                        )
                     )
                 )
+                .all()
             )
-            .all()
-        )
+            # Convertir objetos SQLAlchemy a diccionarios para una serialización JSON consistente
+            return [categoria_principal_to_dict(c) for c in categorias_obj]
 
-        # Convertir objetos SQLAlchemy a diccionarios para una serialización JSON consistente
-        categorias_data = [categoria_principal_to_dict(c) for c in categorias_obj]
+        # MEJORA PROFESIONAL: El árbol de navegación se sirve desde una caché versionada con TTL.
+        # Solo se consulta la base de datos cuando un administrador modifica categorías o expira el TTL.
+        # Las plantillas acceden a los diccionarios con la misma sintaxis que a los objetos.
+        categorias_data = navigation_cache.get_navigation_tree(construir_arbol_navegacion)
 
         # Exponer favoritos y autenticación global
         from flask import session
@@ -359,10 +406,11 @@ def create_app(config_class=Config):
         usuario_autenticado = "user" in session and "id" in session["user"]
         total_favoritos = 0
         if usuario_autenticado:
-            total_favoritos = (
-                Likes.query.join(Productos)
+            usuario_id = session["user"]["id"]
+            total_favoritos = lazy_value(
+                lambda: Likes.query.join(Productos)
                 .filter(
-                    Likes.usuario_id == session["user"]["id"],
+                    Likes.usuario_id == usuario_id,
                     Likes.estado == "activo",
                     Productos.estado == "activo",
                 )
@@ -377,7 +425,7 @@ def create_app(config_class=Config):
             "cart_items": items,
             "total_price": total_price,
             "categorias": categorias_data,
-            "categorias_principales": categorias_obj,
+            "categorias_principales": categorias_data,
             "total_favoritos": total_favoritos,
             "usuario_autenticado": usuario_autenticado,
             "usuario": current_user,  # Usuario actual para acceso a avatar_url y otros campos
@@ -477,6 +525,225 @@ def create_app(config_class=Config):
 
     app.jinja_env.filters["format_currency_cop"] = format_currency_cop
 
+    # --- COMANDOS CLI ---
+    @app.cli.command("rebuild-ventas-resumen")
+    def rebuild_ventas_resumen_command():
+        """
+        Reconstruye las tablas materializadas `producto_ventas_resumen` y `ventas_diarias`.
+
+        Recalcula desde cero los acumulados de ventas por producto, y el acumulado por
+        día y producto (`ventas_diarias`), a partir de los pedidos completados. Útil tras
+        una migración, una carga masiva de datos o si se sospecha que el resumen
+        incremental quedó desincronizado.
+        """
+        from app.utils.ventas_diarias import reconstruir_ventas_diarias
+        from app.utils.ventas_resumen import reconstruir_resumen
+
+        try:
+            total = reconstruir_resumen()
+            dias = reconstruir_ventas_diarias()
+            db.session.commit()
+            print(f"Resumen de ventas reconstruido para {total} productos ({dias} filas de ventas diarias).")
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error al reconstruir el resumen de ventas: {e}", exc_info=True)
+            raise
+
+    @app.cli.command("preparar-despliegue")
+    def preparar_despliegue_command():
+        """
+        Ejecuta los rellenos de datos idempotentes que necesita cada despliegue.
+
+        Se lanza en la fase de release (`Procfile`) o antes de arrancar el servidor
+        (`render.yaml`), tras `flask db upgrade`. Cada paso comprueba si hace falta y,
+        si no, no hace nada, por lo que es seguro ejecutarlo en todos los despliegues:
+        - Rellena `producto_ventas_resumen` si la tabla está vacía.
+        - Rellena `ventas_diarias` si la tabla está vacía.
+        - Reconstruye los contadores de la jerarquía de categorías si nunca se rellenaron.
+        - Migra a `pedido_eventos` el historial JSON de los pedidos que aún no tienen eventos.
+        """
+        from app.utils.seguimiento import backfill_pedido_eventos
+        from app.utils.ventas_diarias import backfill_ventas_diarias_si_vacio
+        from app.utils.ventas_resumen import backfill_resumen_si_vacio
+
+        try:
+            total = backfill_resumen_si_vacio()
+            dias = backfill_ventas_diarias_si_vacio()
+            contadores = category_counters.backfill_contadores_si_vacios()
+            eventos = backfill_pedido_eventos()
+            db.session.commit()
+            if total is not None:
+                print(f"Resumen de ventas rellenado para {total} productos.")
+            if dias is not None:
+                print(f"Ventas diarias rellenadas con {dias} filas (día, producto).")
+            if contadores:
+                print("Contadores de categorías reconstruidos.")
+            if eventos:
+                print(f"Historial migrado: {eventos} eventos de seguimiento creados.")
+            print("Despliegue preparado.")
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error al preparar el despliegue: {e}", exc_info=True)
+            raise
+
+    @app.cli.command("setup-busqueda")
+    def setup_busqueda_command():
+        """
+        Prepara PostgreSQL para la búsqueda de productos.
+
+        Habilita la extensión `pg_trgm`, necesaria para los índices de trigramas
+        (`idx_producto_nombre_trgm`, `idx_producto_marca_trgm`) y para el respaldo
+        por similitud ante errores de escritura. Debe ejecutarse antes de crear esos
+        índices. En otros motores no hace nada.
+        """
+        if db.engine.dialect.name != "postgresql":
+            print("La base de datos no es PostgreSQL; se usará el backend de búsqueda en memoria.")
+            return
+        with db.engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        print("Extensión pg_trgm habilitada.")
+
+    @app.cli.command("rebuild-contadores-categorias")
+    def rebuild_contadores_categorias_command():
+        """
+        Recalcula los contadores denormalizados de la jerarquía de categorías.
+
+        Los contadores (`total_productos`, `productos_activos`, `subcategorias_activas`,
+        `seudocategorias_activas`) se mantienen en cada flush y `flask preparar-despliegue`
+        los rellena tras la migración que añade las columnas. Este comando los recalcula
+        siempre, por ejemplo tras una carga masiva por SQL.
+        """
+        try:
+            category_counters.reconstruir_contadores()
+            db.session.commit()
+            print("Contadores de categorías reconstruidos.")
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error al reconstruir los contadores de categorías: {e}", exc_info=True)
+            raise
+
+    @app.cli.command("snapshot-stock")
+    def snapshot_stock_command():
+        """
+        Fotografía la existencia, el costo y el precio de todos los productos.
+
+        Las consultas de inventario a una fecha parten de la fotografía más reciente y
+        solo leen los movimientos de `movimientos_stock` posteriores a ella. La
+        fotografía diaria es una tarea periódica (`flask tareas-periodicas`); este
+        comando la toma (o la reemplaza) en el momento.
+        """
+        try:
+            total = inventario.tomar_snapshot()
+            db.session.commit()
+            print(f"Snapshot de stock registrado para {total} productos.")
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error al registrar el snapshot de stock: {e}", exc_info=True)
+            raise
+
+    @app.cli.command("backfill-pedido-eventos")
+    def backfill_pedido_eventos_command():
+        """
+        Migra el historial de seguimiento JSON de los pedidos a la tabla `pedido_eventos`.
+
+        `flask preparar-despliegue` ya lo hace en cada despliegue. Es idempotente: los
+        pedidos que ya tienen eventos se omiten.
+        """
+        from app.utils.seguimiento import backfill_pedido_eventos
+
+        try:
+            total = backfill_pedido_eventos()
+            db.session.commit()
+            print(f"Historial migrado: {total} eventos de seguimiento creados.")
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error al migrar el historial de seguimiento: {e}", exc_info=True)
+            raise
+
+    @app.cli.command("tareas-periodicas")
+    def tareas_periodicas_command():
+        """
+        Ejecuta una vez todas las tareas periódicas (purga de carritos abandonados,
+        recálculo de las recomendaciones y fotografía diaria del stock si están vencidos).
+
+        Pensado para un cron (Render Cron Job, Heroku Scheduler...), necesario en
+        despliegues serverless y con `PERIODIC_TASKS_IN_REQUESTS=false`. Intenta todas
+        las tareas y, si alguna falló, termina relanzando el primer error.
+        """
+        resultados = tareas.ejecutar_periodicas()
+        for nombre, error in resultados.items():
+            print(f"{nombre}: {'error: ' + str(error) if error else 'ok'}")
+        errores = [error for error in resultados.values() if error]
+        if errores:
+            raise errores[0]
+
+    @app.cli.command("purgar-carritos")
+    def purgar_carritos_command():
+        """
+        Elimina los carritos de invitado sin actividad desde hace `CART_GUEST_TTL_DAYS` días.
+
+        Es una de las tareas de `flask tareas-periodicas`; este comando la ejecuta sola.
+        """
+        try:
+            total = carrito.purgar_carritos_abandonados()
+            print(f"Carritos abandonados purgados: {total} líneas eliminadas.")
+        except Exception as e:
+            app.logger.error(f"Error al purgar carritos abandonados: {e}", exc_info=True)
+            raise
+
+    @app.cli.command("deduplicar-carritos")
+    def deduplicar_carritos_command():
+        """
+        Fusiona las líneas repetidas de un mismo producto en un mismo carrito.
+
+        Debe ejecutarse antes de `flask db upgrade` al aplicar la migración que crea las
+        restricciones únicas `uq_cart_user_product` y `uq_cart_session_product`, que
+        fallaría con líneas repetidas. Es idempotente.
+        """
+        try:
+            total = carrito.deduplicar_lineas()
+            db.session.commit()
+            print(f"Carritos deduplicados: {total} líneas repetidas eliminadas.")
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error al deduplicar los carritos: {e}", exc_info=True)
+            raise
+
+    @app.cli.command("rebuild-recomendaciones")
+    def rebuild_recomendaciones_command():
+        """
+        Recalcula las listas de productos relacionados (`producto_recomendaciones`).
+
+        Útil tras una carga masiva del catálogo: a diferencia de la tarea periódica
+        (`flask tareas-periodicas`), recalcula aunque el último cálculo sea reciente.
+        """
+        try:
+            total = recomendaciones.reconstruir_recomendaciones()
+            db.session.commit()
+            print(f"Recomendaciones recalculadas para {total} productos.")
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error al recalcular las recomendaciones: {e}", exc_info=True)
+            raise
+
+    @app.cli.command("verificar-consultas-pedidos")
+    def verificar_consultas_pedidos_command():
+        """
+        Comprueba que serializar una página de pedidos cuesta un número constante de consultas.
+
+        Serializa con `pedidos_detalle_cliente_to_dict_list` un pedido y luego los 50 más
+        recientes, y falla si cualquiera de las dos páginas ejecuta más de 4 sentencias
+        (pedidos con su usuario, líneas, productos e historial de seguimiento).
+        """
+        pedido_ids = [
+            fila.id for fila in db.session.query(Pedido.id).order_by(Pedido.created_at.desc()).limit(50)
+        ]
+        for pagina in (pedido_ids[:1], pedido_ids):
+            db.session.expunge_all()
+            with contador_consultas.assert_max_consultas(4) as contador:
+                pedidos_detalle_cliente_to_dict_list(pagina)
+            print(f"{len(pagina)} pedidos serializados con {contador.total} consultas.")
+
     # --- MANEJADOR DE ERRORES ---
     @app.errorhandler(404)
     def page_not_found(e):
@@ -19,13 +19,14 @@ Funcionalidades:
 from flask import Blueprint, jsonify, request, current_app, render_template
 from app.utils.admin_jwt_utils import admin_jwt_required
 from app.models.domains.product_models import CategoriasPrincipales, Subcategorias, Seudocategorias, Productos
-from app.models.domains.order_models import Pedido, PedidoProducto
+from app.models.domains.order_models import Pedido, PedidoProducto, ProductoVentasResumen, VentasDiarias
 from app.models.enums import EstadoPedido, EstadoEnum
-from app.models.serializers import categoria_principal_to_dict, subcategoria_to_dict, seudocategoria_to_dict, admin_producto_to_dict
+from app.models.serializers import categoria_principal_to_dict, subcategoria_to_dict, seudocategoria_to_dict, admin_producto_to_dict, get_product_sales_stats, EMPTY_SALES_STATS, admin_productos_to_dict_list
 from app.extensions import db
+from app.utils import ventas_diarias
 from sqlalchemy import func, and_, or_, case, desc
 from sqlalchemy.orm import joinedload, subqueryload
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import random
 
 admin_categoria_detalle_bp = Blueprint('admin_categoria_detalle', __name__, url_prefix='/admin')
@@ -51,12 +52,12 @@ def view_category_details_page(admin_user, category_slug):
     """
     # MEJORA PROFESIONAL: Carga anticipada (Eager Loading) para evitar el problema N+1.
     # Al renderizar la página, el serializador `categoria_principal_to_dict` necesita acceder
-    # a toda la jerarquía. Sin `subqueryload`, cada acceso a `subcategorias`, `seudocategorias`
-    # y `productos` dispararía una nueva consulta a la base de datos.
+    # a toda la jerarquía. Sin `subqueryload`, cada acceso a `subcategorias` o `seudocategorias`
+    # dispararía una nueva consulta. Los productos ya no se cargan: los totales vienen de
+    # los contadores denormalizados de cada categoría.
     categoria_obj = CategoriasPrincipales.query.options(
         subqueryload(CategoriasPrincipales.subcategorias)
-        .subqueryload(Subcategorias.seudocategorias)
-        .subqueryload(Seudocategorias.productos)).filter_by(slug=category_slug).first()
+        .subqueryload(Subcategorias.seudocategorias)).filter_by(slug=category_slug).first()
     if not categoria_obj:
         return render_template('admin/404.html'), 404
     
@@ -106,13 +107,11 @@ def get_category_details(admin_user, categoria_id):
     try:
         # Obtener información básica de la categoría con carga optimizada
         # MEJORA PROFESIONAL: Se utiliza subqueryload para resolver el problema N+1.
-        # Esto carga todas las subcategorías, seudocategorías y sus productos
-        # en consultas separadas y eficientes, en lugar de una por cada elemento.
+        # Esto carga todas las subcategorías y seudocategorías en consultas separadas y
+        # eficientes. Los conteos de productos salen de los contadores denormalizados.
         categoria = CategoriasPrincipales.query.options(
             subqueryload(CategoriasPrincipales.subcategorias)
                 .subqueryload(Subcategorias.seudocategorias)
-                # Aquí está la clave: cargamos los productos de todas las seudocategorías a la vez.
-                .subqueryload(Seudocategorias.productos) 
         ).get(categoria_id)
 
         if not categoria:
@@ -295,9 +294,10 @@ def get_related_products_filtered(categoria_id, page=1, per_page=10, search='',
     productos = query.offset((page - 1) * per_page).limit(per_page).all()
     
     # Formatear resultados
+    sales_stats = get_product_sales_stats(prod.id for prod in productos)
     products_data = []
     for prod in productos:
-        prod_dict = admin_producto_to_dict(prod)
+        prod_dict = admin_producto_to_dict(prod, sales_stats.get(prod.id, EMPTY_SALES_STATS))
         prod_dict['categoria_principal_nombre'] = prod.seudocategoria.subcategoria.categoria_principal.nombre if prod.seudocategoria and prod.seudocategoria.subcategoria and prod.seudocategoria.subcategoria.categoria_principal else None
         prod_dict['subcategoria_nombre'] = prod.seudocategoria.subcategoria.nombre if prod.seudocategoria and prod.seudocategoria.subcategoria else None
         prod_dict['seudocategoria_nombre'] = prod.seudocategoria.nombre if prod.seudocategoria else None
@@ -605,18 +605,17 @@ def get_category_metrics(categoria_id):
     periodo_anterior_fin = periodo_actual_inicio
     periodo_anterior_inicio = periodo_actual_inicio - timedelta(days=30)
 
-    # Ventas y unidades totales (histórico) - optimizado
+    # Ventas y unidades totales (histórico) - leídas del resumen materializado por producto,
+    # sin recorrer las líneas de pedido.
     query_total_historico = db.session.query(
-        func.sum(PedidoProducto.cantidad * PedidoProducto.precio_unitario).label('total_ventas'),
-        func.sum(PedidoProducto.cantidad * Productos.costo).label('total_inversion'),
-        func.sum(PedidoProducto.cantidad).label('unidades_vendidas'),
-        func.sum(PedidoProducto.cantidad * (PedidoProducto.precio_unitario - Productos.costo)).label('ganancia_total'),
-        func.sum(PedidoProducto.cantidad * PedidoProducto.precio_unitario).label('ingresos_totales_para_margen')
-    ).join(Pedido).join(Productos, PedidoProducto.producto_id == Productos.id).filter(
-        Pedido.estado_pedido == EstadoPedido.COMPLETADO.value,
-        PedidoProducto.producto_id.in_(product_ids_subquery),
+        func.sum(ProductoVentasResumen.ingresos_totales).label('total_ventas'),
+        func.sum(ProductoVentasResumen.costo_total).label('total_inversion'),
+        func.sum(ProductoVentasResumen.unidades_vendidas).label('unidades_vendidas'),
+        func.sum(ProductoVentasResumen.ingresos_totales - ProductoVentasResumen.costo_total).label('ganancia_total'),
+        func.sum(ProductoVentasResumen.ingresos_totales).label('ingresos_totales_para_margen')
+    ).join(Productos, ProductoVentasResumen.producto_id == Productos.id).filter(
+        ProductoVentasResumen.producto_id.in_(product_ids_subquery),
         # MEJORA: Asegurarse de que solo se incluyan productos con costo definido para cálculos precisos.
-        PedidoProducto.precio_unitario > 0,
         Productos.costo > 0
     )
     
@@ -712,48 +711,16 @@ def get_market_trends(categoria_id):
     3.  **Indicadores Clave**: Participación de mercado, tasa de crecimiento interanual (YoY)
         y satisfacción del cliente (calificación promedio).
     """
-    now = datetime.utcnow()
-    
-    # Obtener IDs de productos de la categoría (activos e inactivos)
-    product_ids_subquery = db.session.query(Productos.id).join(
-        Seudocategorias, Productos.seudocategoria_id == Seudocategorias.id
-    ).join(
-        Subcategorias, Seudocategorias.subcategoria_id == Subcategorias.id
-    ).filter(
-        Subcategorias.categoria_principal_id == categoria_id
-    ).subquery()
-    
-    product_ids_result = db.session.query(product_ids_subquery).all()
-    product_ids = [pid[0] for pid in product_ids_result]
+    # MEJORA PROFESIONAL: Todas las cifras de ventas se leen del acumulado diario
+    # (`ventas_diarias`): la evolución es una sola serie mensual generada en SQL, en lugar
+    # de una consulta por mes sobre las líneas de pedido.
+    hoy = datetime.utcnow().date()
 
-    # --- Evolución de ventas (últimos 6 meses) ---
-    labels = []
-    data_ventas = []
-    
-    for i in range(5, -1, -1):
-        mes = now - timedelta(days=i*30)
-        inicio_mes = mes.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        
-        # Calcular el fin del mes correctamente
-        if mes.month == 12:
-            fin_mes = datetime(mes.year + 1, 1, 1) - timedelta(seconds=1)
-        else:
-            fin_mes = datetime(mes.year, mes.month + 1, 1) - timedelta(seconds=1)
-        
-        labels.append(mes.strftime('%b'))
-        
-        if product_ids:
-            ventas_mes = db.session.query(
-                func.sum(PedidoProducto.cantidad * PedidoProducto.precio_unitario)
-            ).join(Pedido).filter(
-                Pedido.estado_pedido == EstadoPedido.COMPLETADO.value,
-                PedidoProducto.producto_id.in_(product_ids),
-                Pedido.created_at.between(inicio_mes, fin_mes)
-            ).scalar() or 0
-        else:
-            ventas_mes = 0
-            
-        data_ventas.append(float(ventas_mes))
+    # --- Evolución de ventas (últimos 6 meses, incluido el actual) ---
+    anio, mes = divmod(hoy.year * 12 + hoy.month - 1 - 5, 12)
+    evolucion = ventas_diarias.serie_ventas(date(anio, mes + 1, 1), hoy, 'month', categoria_id)
+    labels = [punto['periodo'].strftime('%b') for punto in evolucion]
+    data_ventas = [punto['ingresos'] for punto in evolucion]
 
     evolucion_ventas = {
         'labels': labels,
@@ -761,91 +728,52 @@ def get_market_trends(categoria_id):
     }
 
     # --- Comparación con otras categorías (Top 5 en el último mes) ---
-    periodo_actual_fin = now
-    periodo_actual_inicio = now - timedelta(days=30)
-    periodo_anterior_fin = periodo_actual_inicio
+    periodo_actual_inicio = hoy - timedelta(days=29)
     periodo_anterior_inicio = periodo_actual_inicio - timedelta(days=30)
+    en_periodo_actual = VentasDiarias.fecha >= periodo_actual_inicio
 
-    # 1. Encontrar las 5 categorías principales con más ventas en el último mes
-    top_categories_query = db.session.query(
+    # Ventas de cada categoría en los dos períodos con una sola consulta; el top 5 se
+    # ordena por las del período actual.
+    sales_data_query = db.session.query(
         CategoriasPrincipales.id,
-        CategoriasPrincipales.nombre
-    ).join(Subcategorias).join(Seudocategorias).join(Productos).join(PedidoProducto).join(Pedido).filter(
-        Pedido.estado_pedido == EstadoPedido.COMPLETADO.value,
-        Pedido.created_at.between(periodo_actual_inicio, periodo_actual_fin)
-    ).group_by(CategoriasPrincipales.id, CategoriasPrincipales.nombre).order_by(
-        desc(func.sum(PedidoProducto.cantidad * PedidoProducto.precio_unitario))
-    ).limit(5).all()
-
-    top_category_ids = [cat.id for cat in top_categories_query]
-    top_category_names = [cat.nombre for cat in top_categories_query]
-
-    if not top_category_ids:
-        # Si no hay ventas recientes, mostrar el gráfico vacío
-        comparacion_categorias = {
-            'labels': [], 'current_data': [], 'previous_data': []
-        }
-    else:
-        # 2. Obtener las ventas para estas categorías en el período actual y anterior
-        sales_data_query = db.session.query(
-            CategoriasPrincipales.id,
-            func.sum(case((Pedido.created_at.between(periodo_actual_inicio, periodo_actual_fin), PedidoProducto.cantidad * PedidoProducto.precio_unitario), else_=0)).label('ventas_actuales'),
-            func.sum(case((Pedido.created_at.between(periodo_anterior_inicio, periodo_anterior_fin), PedidoProducto.cantidad * PedidoProducto.precio_unitario), else_=0)).label('ventas_anteriores')
-        ).join(Subcategorias).join(Seudocategorias).join(Productos).join(PedidoProducto).join(Pedido).filter(
-            Pedido.estado_pedido == EstadoPedido.COMPLETADO.value,
-            CategoriasPrincipales.id.in_(top_category_ids)
-        ).group_by(CategoriasPrincipales.id)
-
-        sales_data = {str(row.id): row for row in sales_data_query.all()}
-
-        # 3. Construir los datos para el gráfico, asegurando el orden
-        current_data = [float(sales_data.get(str(cat_id)).ventas_actuales) if sales_data.get(str(cat_id)) else 0 for cat_id in top_category_ids]
-        previous_data = [float(sales_data.get(str(cat_id)).ventas_anteriores) if sales_data.get(str(cat_id)) else 0 for cat_id in top_category_ids]
-
-        comparacion_categorias = {
-            'labels': top_category_names, 'current_data': current_data, 'previous_data': previous_data
-        }
+        CategoriasPrincipales.nombre,
+        func.sum(case((en_periodo_actual, VentasDiarias.ingresos), else_=0)).label('ventas_actuales'),
+        func.sum(case((en_periodo_actual, 0), else_=VentasDiarias.ingresos)).label('ventas_anteriores')
+    ).join(Seudocategorias, Seudocategorias.id == VentasDiarias.seudocategoria_id)\
+     .join(Subcategorias, Subcategorias.id == Seudocategorias.subcategoria_id)\
+     .join(CategoriasPrincipales, CategoriasPrincipales.id == Subcategorias.categoria_principal_id)\
+     .filter(VentasDiarias.fecha >= periodo_anterior_inicio)\
+     .group_by(CategoriasPrincipales.id, CategoriasPrincipales.nombre)\
+     .having(func.sum(case((en_periodo_actual, VentasDiarias.ingresos), else_=0)) > 0)\
+     .order_by(desc('ventas_actuales')).limit(5).all()
+
+    comparacion_categorias = {
+        'labels': [row.nombre for row in sales_data_query],
+        'current_data': [float(row.ventas_actuales or 0) for row in sales_data_query],
+        'previous_data': [float(row.ventas_anteriores or 0) for row in sales_data_query]
+    }
 
     # --- Indicadores clave ---
     # Participación de mercado
     ventas_totales_categoria = sum(data_ventas) # Usamos las ventas de los últimos 6 meses
     
     # Ventas totales globales en los últimos 6 meses
-    ventas_totales_globales = db.session.query(
-        func.sum(PedidoProducto.cantidad * PedidoProducto.precio_unitario)
-    ).join(Pedido).filter(
-        Pedido.estado_pedido == EstadoPedido.COMPLETADO.value,
-        Pedido.created_at >= (now - timedelta(days=180))
-    ).scalar() or 1 # Evitar división por cero
+    ventas_totales_globales = ventas_diarias.totales_ventas(hoy - timedelta(days=180), hoy)['ingresos'] or 1 # Evitar división por cero
     
     participacion_mercado = (ventas_totales_categoria / ventas_totales_globales) * 100
 
     # Tasa de crecimiento (YoY - últimos 12 meses vs 12 meses anteriores)
     tasa_crecimiento = 0
-    if product_ids:
-        hace_1_ano = now - timedelta(days=365)
-        hace_2_anos = now - timedelta(days=730)
-        
-        ventas_ultimos_12m = db.session.query(
-            func.sum(PedidoProducto.cantidad * PedidoProducto.precio_unitario)
-        ).join(Pedido).filter(
-            Pedido.estado_pedido == EstadoPedido.COMPLETADO.value,
-            PedidoProducto.producto_id.in_(product_ids),
-            Pedido.created_at >= hace_1_ano
-        ).scalar() or 0
-        
-        ventas_12m_anteriores = db.session.query(
-            func.sum(PedidoProducto.cantidad * PedidoProducto.precio_unitario)
-        ).join(Pedido).filter(
-            Pedido.estado_pedido == EstadoPedido.COMPLETADO.value,
-            PedidoProducto.producto_id.in_(product_ids),
-            Pedido.created_at.between(hace_2_anos, hace_1_ano)
-        ).scalar() or 0
+    hace_1_ano = hoy - timedelta(days=365)
+    hace_2_anos = hoy - timedelta(days=730)
+
+    ventas_ultimos_12m = ventas_diarias.totales_ventas(hace_1_ano, hoy, categoria_id)['ingresos']
+    ventas_12m_anteriores = ventas_diarias.totales_ventas(hace_2_anos, hace_1_ano - timedelta(days=1), categoria_id)['ingresos']
 
-        if ventas_12m_anteriores > 0:
-            tasa_crecimiento = ((ventas_ultimos_12m - ventas_12m_anteriores) / ventas_12m_anteriores) * 100
-        elif ventas_ultimos_12m > 0:
-            tasa_crecimiento = 100  # Crecimiento del 100% si no había ventas antes
+    if ventas_12m_anteriores > 0:
+        tasa_crecimiento = ((ventas_ultimos_12m - ventas_12m_anteriores) / ventas_12m_anteriores) * 100
+    elif ventas_ultimos_12m > 0:
+        tasa_crecimiento = 100  # Crecimiento del 100% si no había ventas antes
 
     # Clamp the growth rate for the progress circle (0 to 100)
     tasa_crecimiento_clamped = min(100, max(0, tasa_crecimiento))
@@ -1005,44 +933,50 @@ def get_top_products(categoria_id, limit=10):
     periodo_actual_inicio = now - timedelta(days=30)
     periodo_anterior_inicio = now - timedelta(days=60)
 
-    # Obtener datos de ventas para esos productos de manera optimizada
-    sales_query = db.session.query(
-        PedidoProducto.producto_id,
-        func.sum(PedidoProducto.cantidad).label('unidades_vendidas'),
-        func.sum(PedidoProducto.cantidad * PedidoProducto.precio_unitario).label('ingresos'),
-        func.sum(
-            case(
-                (Pedido.created_at >= periodo_actual_inicio, PedidoProducto.cantidad * PedidoProducto.precio_unitario),
-                else_=0
-            )
-        ).label('ingresos_actual'),
-        func.sum(
-            case(
-                (Pedido.created_at.between(periodo_anterior_inicio, periodo_actual_inicio), PedidoProducto.cantidad * PedidoProducto.precio_unitario),
-                else_=0
-            )
-        ).label('ingresos_anterior')
-    ).join(Pedido).filter(
-        Pedido.estado_pedido == EstadoPedido.COMPLETADO.value,
-        PedidoProducto.producto_id.in_(product_ids)
-    ).group_by(PedidoProducto.producto_id).subquery()
-
-    # Unir con la tabla de productos y ordenar
-    top_products_query = db.session.query(
+    # Ranking histórico leído del resumen materializado: O(productos) en lugar de O(líneas de pedido).
+    top_products_data = db.session.query(
         Productos,
-        sales_query.c.unidades_vendidas,
-        sales_query.c.ingresos,
-        sales_query.c.ingresos_actual,
-        sales_query.c.ingresos_anterior
+        ProductoVentasResumen.unidades_vendidas,
+        ProductoVentasResumen.ingresos_totales
     ).join(
-        sales_query, Productos.id == sales_query.c.producto_id
-    ).order_by(desc(sales_query.c.ingresos)).limit(limit)
+        ProductoVentasResumen, Productos.id == ProductoVentasResumen.producto_id
+    ).filter(
+        Productos.id.in_(product_ids),
+        ProductoVentasResumen.unidades_vendidas > 0
+    ).order_by(desc(ProductoVentasResumen.ingresos_totales)).limit(limit).all()
 
-    top_products_data = top_products_query.all()
+    if not top_products_data:
+        return []
+
+    # La tendencia sí depende de la ventana de 60 días; se calcula solo para los productos del top.
+    top_ids = [prod.id for prod, _, _ in top_products_data]
+    tendencias = {
+        row.producto_id: (row.ingresos_actual, row.ingresos_anterior)
+        for row in db.session.query(
+            PedidoProducto.producto_id,
+            func.sum(
+                case(
+                    (Pedido.created_at >= periodo_actual_inicio, PedidoProducto.cantidad * PedidoProducto.precio_unitario),
+                    else_=0
+                )
+            ).label('ingresos_actual'),
+            func.sum(
+                case(
+                    (Pedido.created_at.between(periodo_anterior_inicio, periodo_actual_inicio), PedidoProducto.cantidad * PedidoProducto.precio_unitario),
+                    else_=0
+                )
+            ).label('ingresos_anterior')
+        ).join(Pedido).filter(
+            Pedido.estado_pedido == EstadoPedido.COMPLETADO.value,
+            Pedido.created_at >= periodo_anterior_inicio,
+            PedidoProducto.producto_id.in_(top_ids)
+        ).group_by(PedidoProducto.producto_id).all()
+    }
 
     # Formatear la salida
     result = []
-    for prod, unidades, ingresos, ingresos_actual, ingresos_anterior in top_products_data:
+    for prod, unidades, ingresos in top_products_data:
+        ingresos_actual, ingresos_anterior = tendencias.get(prod.id, (0, 0))
         ingresos_actual = ingresos_actual or 0
         ingresos_anterior = ingresos_anterior or 0
         
@@ -1126,9 +1060,7 @@ def get_related_products(categoria_id, page=1, per_page=10, search=''):
     productos = query.offset((page - 1) * per_page).limit(per_page).all()
     
     # Formatear resultados
-    products_data = []
-    for prod in productos:
-        products_data.append(admin_producto_to_dict(prod))
+    products_data = admin_productos_to_dict_list(productos)
     
     return {
         'success': True,
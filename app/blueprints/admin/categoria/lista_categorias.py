@@ -20,6 +20,7 @@ Funcionalidades Clave:
 """
 from flask import Blueprint, jsonify, request, render_template, current_app
 from app.utils.admin_jwt_utils import admin_jwt_required
+from app.utils.navigation_cache import invalidate_navigation_tree
 from app.models.domains.product_models import CategoriasPrincipales, Subcategorias, Seudocategorias
 from app.models.serializers import categoria_principal_to_dict, subcategoria_to_dict, seudocategoria_to_dict
 from app.models.enums import EstadoEnum
@@ -84,11 +85,11 @@ def get_all_categories(admin_user, view_type=None):
         # Cargar datos según la vista actual.
         if current_view == 'main':
             # Vista de categorías principales
-            # MEJORA PROFESIONAL: Carga anticipada de toda la jerarquía para evitar N+1 en el serializador.
+            # MEJORA PROFESIONAL: Carga anticipada de la jerarquía para evitar N+1 en el serializador.
+            # Los productos no se cargan: los totales vienen de los contadores denormalizados.
             query = CategoriasPrincipales.query.options(
                 subqueryload(CategoriasPrincipales.subcategorias)
-                .subqueryload(Subcategorias.seudocategorias)
-                .subqueryload(Seudocategorias.productos))
+                .subqueryload(Subcategorias.seudocategorias))
             
             if nombre:
                 query = query.filter(CategoriasPrincipales.nombre.ilike(f'%{nombre}%'))
@@ -125,7 +126,7 @@ def get_all_categories(admin_user, view_type=None):
             # MEJORA PROFESIONAL: Carga anticipada completa para el serializador.
             query = Subcategorias.query.options(
                 joinedload(Subcategorias.categoria_principal), 
-                subqueryload(Subcategorias.seudocategorias).subqueryload(Seudocategorias.productos)
+                subqueryload(Subcategorias.seudocategorias)
             )
             
             if nombre:
@@ -169,8 +170,7 @@ def get_all_categories(admin_user, view_type=None):
             # Vista de seudocategorías
             # MEJORA PROFESIONAL: Carga anticipada completa para el serializador.
             query = Seudocategorias.query.options(
-                joinedload(Seudocategorias.subcategoria).joinedload(Subcategorias.categoria_principal), 
-                subqueryload(Seudocategorias.productos)
+                joinedload(Seudocategorias.subcategoria).joinedload(Subcategorias.categoria_principal)
             )
             
             if nombre:
@@ -216,12 +216,11 @@ def get_all_categories(admin_user, view_type=None):
         else:  # Vista 'all' - jerárquica
             # Obtener todas las categorías principales con sus relaciones
             # Se utiliza subqueryload para resolver el problema N+1.
-            # Esto carga todas las subcategorías, seudocategorías y sus productos
-            # en consultas separadas y eficientes. La clave es cargar la jerarquía completa.
+            # Esto carga todas las subcategorías y seudocategorías en consultas separadas y
+            # eficientes. Los totales de productos vienen de los contadores denormalizados.
             query = CategoriasPrincipales.query.options(
                 subqueryload(CategoriasPrincipales.subcategorias)
                 .subqueryload(Subcategorias.seudocategorias)
-                .subqueryload(Seudocategorias.productos)
             )
 
             # Apply sorting (if needed for 'all' view, using 'nombre' as default)
@@ -331,6 +330,7 @@ def update_main_category_status(admin_user, categoria_id):
 
         # Guardar cambios en la base de datos
         db.session.commit()
+        invalidate_navigation_tree()
 
         # Registrar la acción en el log
         current_app.logger.info(
@@ -431,6 +431,7 @@ def update_subcategory_status(admin_user, subcategoria_id):
 
         # Guardar cambios en la base de datos
         db.session.commit()
+        invalidate_navigation_tree()
 
         # Registrar la acción en el log
         current_app.logger.info(
@@ -527,6 +528,7 @@ def update_pseudocategory_status(admin_user, seudocategoria_id):
 
         # Guardar cambios en la base de datos
         db.session.commit()
+        invalidate_navigation_tree()
 
         # Registrar la acción en el log
         current_app.logger.info(
@@ -694,6 +696,7 @@ def update_category_details(admin_user, category_type, category_id):
         category.descripcion = descripcion
 
         db.session.commit()
+        invalidate_navigation_tree()
         
         current_app.logger.info(
             f"Categoría ({category_type}) ID {category.id} actualizada por administrador {admin_user.id} ('{admin_user.nombre}')"
@@ -1109,6 +1112,7 @@ def create_main_category(admin_user):
         )
         db.session.add(new_category)
         db.session.commit()
+        invalidate_navigation_tree()
 
         current_app.logger.info(
             f"Categoría principal '{nombre}' creada por administrador {admin_user.id} ('{admin_user.nombre}')"
@@ -1171,6 +1175,7 @@ def create_subcategory(admin_user):
         )
         db.session.add(new_subcategory)
         db.session.commit()
+        invalidate_navigation_tree()
 
         current_app.logger.info(
             f"Subcategoría '{nombre}' creada en categoría principal '{main_category.nombre}' por administrador {admin_user.id} ('{admin_user.nombre}')"
@@ -1233,6 +1238,7 @@ def create_pseudocategory(admin_user):
         )
         db.session.add(new_pseudocategory)
         db.session.commit()
+        invalidate_navigation_tree()
 
         current_app.logger.info(
             f"Seudocategoría '{nombre}' creada en subcategoría '{sub_category.nombre}' por administrador {admin_user.id} ('{admin_user.nombre}')"
@@ -16,9 +16,10 @@ from app.models.domains.user_models import Usuarios
 from app.models.domains.product_models import Productos
 from app.models.domains.order_models import Pedido, PedidoProducto
 from app.models.enums import EstadoPedido, EstadoEnum
-from app.models.serializers import usuario_to_dict, producto_to_dict, pedido_to_dict, pedido_detalle_to_dict
+from app.models.serializers import usuario_to_dict, productos_to_dict_list, pedido_to_dict, pedido_detalle_to_dict
 from app.extensions import db
 from sqlalchemy import or_
+from sqlalchemy.orm import selectinload
 
 admin_api_bp = Blueprint('admin_api', __name__, url_prefix='/admin/api')
 
@@ -125,8 +126,8 @@ def search_products(admin_user):
 
         productos = query.limit(20).all()
         
-        # Serializar productos a diccionario
-        productos_data = [producto_to_dict(p) for p in productos]
+        # Serializar productos a diccionario (ventas calculadas en una sola consulta)
+        productos_data = productos_to_dict_list(productos)
         
         return jsonify({
             'success': True,
@@ -176,7 +177,8 @@ def get_all_pedidos(admin_user):
             estado_enum = EstadoPedido(estado_filter)
         except ValueError:
             return jsonify({'success': False, 'message': f'Estado no válido: {estado_filter}'}), 400
-        query = Pedido.query.join(Usuarios).filter(Pedido.estado_pedido == estado_enum)
+        # El historial de seguimiento de la página se carga en una sola consulta.
+        query = Pedido.query.join(Usuarios).options(selectinload(Pedido.eventos)).filter(Pedido.estado_pedido == estado_enum)
 
         if cliente_filter:
             query = query.filter(or_(
@@ -18,15 +18,15 @@ Funcionalidades Clave:
 """
 from flask import Blueprint, jsonify, request, render_template, current_app
 from app.utils.admin_jwt_utils import admin_jwt_required
-from app.models.domains.order_models import Pedido, PedidoProducto
+from app.utils import notificaciones, seguimiento, stock
+from app.utils.ventas_resumen import aplicar_pedido_al_resumen, registrar_transicion_pedido
+from app.models.domains.order_models import Pedido, PedidoEvento, PedidoProducto
 from app.models.domains.user_models import Usuarios
-from app.models.domains.product_models import Productos
-from app.models.enums import EstadoPedido, EstadoSeguimiento, EstadoEnum
-from app.models.serializers import pedido_to_dict, pedido_detalle_to_dict
+from app.models.enums import EstadoPedido, EstadoSeguimiento, EstadoEnum, MotivoMovimientoStock
+from app.models.serializers import opciones_pedido_detalle, pedido_to_dict, pedido_detalle_to_dict
 from app.extensions import db
-from sqlalchemy import or_, and_, func, desc
-from sqlalchemy.orm import joinedload
-from sqlalchemy.orm.attributes import flag_modified
+from sqlalchemy import or_, and_, func, desc, update
+from sqlalchemy.orm import joinedload, selectinload
 from datetime import datetime, timedelta
 from flask_wtf.csrf import generate_csrf
 
@@ -39,6 +39,39 @@ ESTADO_PEDIDO_MAP = {
     'cancelado': EstadoPedido.CANCELADO,
 }
 
+def _cantidades_del_pedido(pedido):
+    """
+    Agrupa por producto las cantidades de las líneas de un pedido.
+
+    Returns:
+        dict: `{producto_id: cantidad}`, listo para `stock.reservar_stock` / `stock.liberar_stock`.
+    """
+    return stock.cantidades_por_producto((item.producto_id, item.cantidad) for item in pedido.productos)
+
+
+def _reservar_stock_reactivacion(pedido):
+    """
+    Vuelve a descontar el stock de un pedido cancelado que se reactiva.
+
+    MEJORA PROFESIONAL: Los productos se bloquean y descuentan en una sola operación
+    atómica (ver `app.utils.stock`), en lugar de validar y restar línea por línea.
+
+    Returns:
+        tuple | None: La respuesta de error (ya revertida la transacción) si falta stock,
+        o None si la reserva se hizo.
+    """
+    try:
+        stock.reservar_stock(_cantidades_del_pedido(pedido), MotivoMovimientoStock.REACTIVACION, pedido_id=pedido.id)
+    except (stock.ProductoNoDisponible, stock.StockInsuficiente) as e:
+        db.session.rollback()
+        producto = e.producto.nombre if isinstance(e, stock.StockInsuficiente) else f"ID {e.producto_id}"
+        return jsonify({
+            'success': False,
+            'message': f'Stock insuficiente para reactivar el pedido. Producto: {producto}.'
+        }), 400
+    return None
+
+
 def _build_pedidos_query(estado_pedido_filter, pedido_id, cliente, fecha_inicio, fecha_fin, status_filter, sort_by, sort_order):
     """
     Función auxiliar para construir y filtrar la consulta de pedidos.
@@ -59,8 +92,8 @@ def _build_pedidos_query(estado_pedido_filter, pedido_id, cliente, fecha_inicio,
     Returns:
         Query: Un objeto de consulta de SQLAlchemy con los filtros y ordenamiento aplicados.
     """
-    # Construir consulta base con carga anticipada del usuario para optimización.
-    query = Pedido.query.options(joinedload(Pedido.usuario)).filter(
+    # Construir consulta base con carga anticipada del usuario y del historial de seguimiento.
+    query = Pedido.query.options(joinedload(Pedido.usuario), selectinload(Pedido.eventos)).filter(
         Pedido.estado_pedido == estado_pedido_filter
     )
 
@@ -220,10 +253,7 @@ def get_pedido_detalle(admin_user, pedido_id):
         JSON: Un objeto con los detalles completos del pedido.
     """
     try:
-        pedido = Pedido.query.options(
-            joinedload(Pedido.usuario),
-            joinedload(Pedido.productos).joinedload(PedidoProducto.producto)
-        ).get(pedido_id)
+        pedido = Pedido.query.options(*opciones_pedido_detalle()).get(pedido_id)
         
         if not pedido:
             return jsonify({
@@ -289,47 +319,51 @@ def create_pedido(admin_user):
             if not producto_id or not isinstance(cantidad, int) or cantidad <= 0:
                 return jsonify({'success': False, 'message': f'Datos de producto inválidos: {item}'}), 400
 
-            producto = Productos.query.get(producto_id)
-            if not producto:
-                return jsonify({'success': False, 'message': f'Producto con ID {producto_id} no encontrado'}), 404
-            
-            # Modificación: Validar stock con mensaje más detallado
-            if producto.existencia < cantidad:
-                return jsonify({
-                    'success': False, 
-                    'message': f'Stock insuficiente para {producto.nombre}. Disponible: {producto.existencia}, solicitado: {cantidad}'
-                }), 400
-
-            subtotal = producto.precio * cantidad
-            total_pedido += subtotal
-            
-            productos_a_procesar.append({
-                'producto_obj': producto,
-                'cantidad': cantidad,
-                'precio_unitario': producto.precio
-            })
-
         # Crear el pedido
         nuevo_pedido = Pedido(
             usuario_id=usuario_id,
-            total=total_pedido,
+            total=0, # Se calcula tras reservar el stock, con los precios de las filas bloqueadas.
             estado_pedido=EstadoPedido.EN_PROCESO,
             estado=EstadoEnum.ACTIVO.value,
-            # Inicializar el historial de seguimiento al crear el pedido.
-            # Esto asegura que el estado 'recibido' siempre tenga un timestamp y una nota.
             seguimiento_estado=EstadoSeguimiento.RECIBIDO,
             notas_seguimiento="Tu Pedido fue recibido y esta siendo procesado",
-            seguimiento_historial=[{
-                'estado': EstadoSeguimiento.RECIBIDO.value,
-                'notas': "Tu Pedido fue recibido y esta siendo procesado",
-                'timestamp': datetime.utcnow().isoformat() + "Z",
-                'notified_to_client': False # Marcar para notificación inicial.
-            }]
+        )
+        # Inicializar el historial de seguimiento al crear el pedido.
+        # Esto asegura que el estado 'recibido' siempre tenga un timestamp y una nota.
+        nuevo_pedido.registrar_evento(
+            EstadoSeguimiento.RECIBIDO, "Tu Pedido fue recibido y esta siendo procesado",
+            notificado=False # Marcar para notificación inicial.
         )
         db.session.add(nuevo_pedido)
         db.session.flush() # Para obtener el ID del nuevo pedido antes del commit
 
-        # Añadir productos al pedido y actualizar stock
+        # MEJORA PROFESIONAL: Reserva atómica del stock (bloqueo ordenado + UPDATE condicional).
+        try:
+            productos = stock.reservar_stock(
+                stock.cantidades_por_producto((item['id'], item['cantidad']) for item in productos_payload),
+                MotivoMovimientoStock.PEDIDO, pedido_id=nuevo_pedido.id
+            )
+        except stock.ProductoNoDisponible as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': str(e)}), 404
+        except stock.StockInsuficiente as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': str(e)}), 400
+
+        for item in productos_payload:
+            producto = productos[str(item['id'])]
+            cantidad = item['cantidad']
+            subtotal = producto.precio * cantidad
+            total_pedido += subtotal
+            
+            productos_a_procesar.append({
+                'producto_obj': producto,
+                'cantidad': cantidad,
+                'precio_unitario': producto.precio
+            })
+        nuevo_pedido.total = total_pedido
+
+        # Añadir productos al pedido (el stock ya se descontó al reservarlo).
         for item in productos_a_procesar:
             pedido_producto = PedidoProducto(
                 pedido_id=nuevo_pedido.id,
@@ -338,10 +372,8 @@ def create_pedido(admin_user):
                 precio_unitario=item['precio_unitario']
             )
             db.session.add(pedido_producto)
-            
-            # Disminuir stock
-            item['producto_obj'].existencia -= item['cantidad']
 
+        notificaciones.publicar_pedido(nuevo_pedido)
         db.session.commit()
         
         current_app.logger.info(f"Nuevo pedido {nuevo_pedido.id} creado por administrador {admin_user.id} para el usuario {usuario.nombre}")
@@ -416,18 +448,17 @@ def update_pedido(admin_user, pedido_id):
             if diff != 0:
                 stock_changes[prod_id] = diff
 
-        # Verificar stock ANTES de aplicar cualquier cambio.
-        for prod_id, diff in stock_changes.items():
-            if diff > 0: # Si se añaden productos o se aumenta la cantidad.
-                producto = Productos.query.get(prod_id)
-                if not producto or producto.existencia < diff:
-                    raise ValueError(f'Stock insuficiente para {producto.nombre}. Disponible: {producto.existencia}, solicitado adicional: {diff}')
+        # 3. Bloquear todos los productos implicados en una sola consulta y aplicar las
+        # diferencias con un único UPDATE condicional. Si falta stock, `StockInsuficiente`
+        # (un ValueError) revierte la transacción completa.
+        productos = stock.bloquear_productos(all_product_ids)
+        stock.ajustar_stock(stock_changes, MotivoMovimientoStock.AJUSTE_PEDIDO, productos, pedido_id=pedido.id)
 
-        # 3. Aplicar cambios de stock.
-        for prod_id, diff in stock_changes.items():
-            producto = Productos.query.get(prod_id)
-            if producto:
-                producto.existencia -= diff
+        # MEJORA PROFESIONAL: Si el pedido ya está completado, retirar sus líneas actuales
+        # del resumen de ventas antes de reemplazarlas (se vuelven a sumar al final).
+        pedido_completado = pedido.estado_pedido == EstadoPedido.COMPLETADO
+        if pedido_completado:
+            aplicar_pedido_al_resumen(pedido, -1)
 
         # 4. Actualizar PedidoProducto y calcular nuevo total.
         PedidoProducto.query.filter_by(pedido_id=pedido.id).delete()
@@ -435,7 +466,9 @@ def update_pedido(admin_user, pedido_id):
         
         new_total = 0
         for item_payload in productos_payload:
-            producto = Productos.query.get(item_payload['id'])
+            producto = productos.get(str(item_payload['id']))
+            if not producto:
+                raise ValueError(f"Producto con ID {item_payload['id']} no encontrado")
             cantidad = item_payload['cantidad']
             precio_unitario = producto.precio # Usar el precio actual del producto.
             
@@ -464,40 +497,36 @@ def update_pedido(admin_user, pedido_id):
             new_timestamp_utc = now_colombia.astimezone(timezone.utc)
             pedido.created_at = new_timestamp_utc
             
-            if pedido.seguimiento_historial:
-                for entry in pedido.seguimiento_historial:
-                    entry['timestamp'] = new_timestamp_utc.isoformat() + "Z"
-                # Marcar el campo JSON como modificado para que SQLAlchemy lo guarde.
-                flag_modified(pedido, "seguimiento_historial")
-            
+            # Reasignar el historial al nuevo cliente con la nueva fecha (una sola sentencia).
+            db.session.execute(
+                update(PedidoEvento)
+                .where(PedidoEvento.pedido_id == pedido.id)
+                .values(usuario_id=usuario_id, created_at=new_timestamp_utc.replace(tzinfo=None))
+            )
+
             # Asignar el nuevo usuario.
             pedido.usuario_id = usuario_id
         
         pedido.total = new_total
         pedido.updated_at = now_colombia.astimezone(timezone.utc)
 
+        if pedido_completado:
+            aplicar_pedido_al_resumen(pedido, 1)
+
         # --- MEJORA PROFESIONAL: Notificar al cliente si el pedido está activo ---
         # Si el pedido está activo, es visible para el cliente. Por lo tanto, cualquier
         # modificación debe ser notificada para mantener la transparencia.
         if pedido.estado == EstadoEnum.ACTIVO:
-            if pedido.seguimiento_historial is None:
-                pedido.seguimiento_historial = []
-
             # Crear una nueva entrada en el historial para notificar la actualización.
             # Se usa el estado de seguimiento actual para no alterar el flujo logístico.
             nota_actualizacion = "Hemos actualizado los detalles de tu pedido."
-            
-            new_history_entry = {
-                'estado': pedido.seguimiento_estado.value,
-                'notas': nota_actualizacion,
-                'timestamp': datetime.utcnow().isoformat() + "Z",
-                'notified_to_client': False  # Marcar para que el sistema envíe la notificación.
-            }
-            pedido.seguimiento_historial.append(new_history_entry)
-            flag_modified(pedido, "seguimiento_historial")
-            current_app.logger.info(f"Pedido {pedido.id} actualizado y marcado para notificación al cliente (estado: activo).")
 
+            # Marcar para que el sistema envíe la notificación.
+            pedido.registrar_evento(pedido.seguimiento_estado, nota_actualizacion, notificado=False)
+            current_app.logger.info(f"Pedido {pedido.id} actualizado y marcado para notificación al cliente (estado: activo).")
 
+        # Empujar la notificación al stream del cliente una vez confirmado el cambio.
+        notificaciones.publicar_pedido(pedido)
         db.session.commit()
 
         current_app.logger.info(f"Pedido {pedido.id} actualizado por administrador {admin_user.id} para el usuario {usuario.nombre}")
@@ -587,10 +616,7 @@ def update_pedido_seguimiento(admin_user, pedido_id):
                     nuevo_estado_pedido = EstadoPedido.CANCELADO.value
                     
                     # Devolver stock al inventario.
-                    for item in pedido.productos:
-                        producto = Productos.query.get(item.producto_id)
-                        if producto:
-                            producto.existencia += item.cantidad
+                    stock.liberar_stock(_cantidades_del_pedido(pedido), pedido_id=pedido.id)
                     current_app.logger.info(f"Stock devuelto para pedido {pedido.id} ({old_estado_pedido} -> cancelado).")
 
             # 2. Si el nuevo estado de seguimiento es ENTREGADO
@@ -606,18 +632,9 @@ def update_pedido_seguimiento(admin_user, pedido_id):
                 if old_estado_pedido != EstadoPedido.EN_PROCESO: # pragma: no cover
                     # Si venimos de 'cancelado', hay que re-validar y restar stock
                     if old_estado_pedido == EstadoPedido.CANCELADO:
-                        for item in pedido.productos:
-                            producto = Productos.query.get(item.producto_id)
-                            if not producto or producto.existencia < item.cantidad:
-                                db.session.rollback()
-                                return jsonify({
-                                    'success': False,
-                                    'message': f'Stock insuficiente para reactivar el pedido. Producto: {producto.nombre if producto else "ID " + str(item.producto_id)}.'
-                                }), 400
-                        for item in pedido.productos:
-                            producto = Productos.query.get(item.producto_id)
-                            if producto:
-                                producto.existencia -= item.cantidad
+                        error = _reservar_stock_reactivacion(pedido)
+                        if error:
+                            return error
                         current_app.logger.info(f"Stock restado para pedido {pedido.id} reactivado (cancelado -> en proceso) a través del seguimiento.")
                     
                     pedido.estado_pedido = EstadoPedido.EN_PROCESO
@@ -628,28 +645,20 @@ def update_pedido_seguimiento(admin_user, pedido_id):
             # --- MEJORA PROFESIONAL: Lógica de relleno de historial ---
             # Al cambiar el estado de seguimiento, rellenamos los pasos intermedios para
             # que el cliente vea un historial completo y profesional.
-            if pedido.seguimiento_historial is None:
-                pedido.seguimiento_historial = []
-
             # MEJORA PROFESIONAL: Determinar si se debe notificar al cliente.
             # Si el pedido está inactivo, no se notifica. La notificación se enviará al activarlo.
             debe_notificar = pedido.estado == EstadoEnum.ACTIVO.value
 
-            timestamp_actual = datetime.utcnow().isoformat() + "Z"
+            momento_actual = datetime.utcnow()
 
             # MEJORA PROFESIONAL: Si el estado es 'cancelado', no rellenar estados intermedios.
             # Esto preserva el historial exacto de en qué punto se canceló el pedido.
             if nuevo_seguimiento_enum == EstadoSeguimiento.CANCELADO:
-                new_history_entry = {
-                    'estado': nuevo_seguimiento_enum.value,
-                    'notas': notas,
-                    'timestamp': timestamp_actual,
-                    'notified_to_client': not debe_notificar
-                }
-                pedido.seguimiento_historial.append(new_history_entry)
+                pedido.registrar_evento(nuevo_seguimiento_enum, notas, notificado=not debe_notificar,
+                                        momento=momento_actual)
             else:
                 # Lógica de relleno para los demás estados.
-                estados_existentes = {entry['estado'] for entry in pedido.seguimiento_historial}
+                estados_existentes = seguimiento.estados_registrados(pedido.id)
 
                 # Definir la secuencia completa de seguimiento y las notas por defecto.
                 secuencia_completa = [
@@ -663,33 +672,27 @@ def update_pedido_seguimiento(admin_user, pedido_id):
                 for estado_secuencia, nota_secuencia in secuencia_completa:
                     # Si el estado es el que el admin acaba de seleccionar:
                     if estado_secuencia == nuevo_seguimiento_enum:
-                        # Añadirlo al historial con las notas del admin y marcarlo para notificación.
-                        new_history_entry = {
-                            'estado': estado_secuencia.value,
-                            'notas': notas, # Usar las notas proporcionadas por el admin.
-                            'timestamp': timestamp_actual,
-                            'notified_to_client': not debe_notificar # Marcar para notificar solo si está activo.
-                        }
-                        pedido.seguimiento_historial.append(new_history_entry)
+                        # Añadirlo al historial con las notas del admin y marcarlo para notificación
+                        # (solo si está activo).
+                        pedido.registrar_evento(estado_secuencia, notas, notificado=not debe_notificar,
+                                                momento=momento_actual)
                         # Una vez que llegamos al estado seleccionado, no rellenamos más.
                         break
                     
                     # Si es un estado intermedio que no estaba en el historial:
                     elif estado_secuencia.value not in estados_existentes:
-                        # Añadirlo con una nota por defecto y marcarlo como ya notificado.
-                        new_history_entry = {
-                            'estado': estado_secuencia.value,
-                            'notas': nota_secuencia, # Usar la nota por defecto.
-                            'timestamp': timestamp_actual,
-                            'notified_to_client': True # Marcar como ya notificado para no enviar alertas extra.
-                        }
-                        pedido.seguimiento_historial.append(new_history_entry)
+                        # Añadirlo con una nota por defecto y marcarlo como ya notificado
+                        # para no enviar alertas extra.
+                        pedido.registrar_evento(estado_secuencia, nota_secuencia, notificado=True,
+                                                momento=momento_actual)
 
-            flag_modified(pedido, "seguimiento_historial")
+            # Mantener el resumen materializado de ventas si el pedido entró o salió de 'completado'.
+            registrar_transicion_pedido(pedido, old_estado_pedido, pedido.estado_pedido)
 
             pedido.seguimiento_estado = nuevo_seguimiento_enum
             pedido.notas_seguimiento = notas
             pedido.updated_at = datetime.utcnow()
+            notificaciones.publicar_pedido(pedido)
             db.session.commit()
 
             current_app.logger.info(
@@ -782,29 +785,15 @@ def update_pedido_estado(admin_user, pedido_id):
 
             # 2. Mover desde 'cancelado' (a 'en proceso' o 'completado')
             if old_status == EstadoPedido.CANCELADO and nuevo_estado in [EstadoPedido.EN_PROCESO, EstadoPedido.COMPLETADO]:
-                # Verificar stock antes de hacer cambios
-                for item in pedido.productos:
-                    producto = Productos.query.get(item.producto_id)
-                    if not producto or producto.existencia < item.cantidad:
-                        db.session.rollback()
-                        return jsonify({
-                            'success': False,
-                            'message': f'Stock insuficiente para reactivar el pedido. Producto: {producto.nombre if producto else "ID " + str(item.producto_id)}.'
-                        }), 400
-
-                # Si hay stock, restarlo
-                for item in pedido.productos:
-                    producto = Productos.query.get(item.producto_id)
-                    if producto:
-                        producto.existencia -= item.cantidad
+                # Verificar y restar el stock en una sola operación atómica.
+                error = _reservar_stock_reactivacion(pedido)
+                if error:
+                    return error
                 current_app.logger.info(f"Stock restado para pedido {pedido.id} reactivado (cancelado -> {nuevo_estado}).")
             
             # 1. Mover a 'cancelado' (desde 'en proceso' o 'completado')
             elif nuevo_estado == EstadoPedido.CANCELADO and old_status in [EstadoPedido.EN_PROCESO, EstadoPedido.COMPLETADO]:
-                for item in pedido.productos:
-                    producto = Productos.query.get(item.producto_id)
-                    if producto:
-                        producto.existencia += item.cantidad
+                stock.liberar_stock(_cantidades_del_pedido(pedido), pedido_id=pedido.id)
                 current_app.logger.info(f"Stock devuelto para pedido {pedido.id} ({old_status} -> cancelado).")
 
             # Sincronizar estado de seguimiento automáticamente
@@ -824,11 +813,8 @@ def update_pedido_estado(admin_user, pedido_id):
                 nota_por_defecto = "Tu pedido ha sido completado y entregado."
 
                 # --- Lógica de relleno de historial ---
-                if pedido.seguimiento_historial is None:
-                    pedido.seguimiento_historial = []
-
                 # Obtener los estados ya registrados en el historial.
-                estados_existentes = {entry['estado'] for entry in pedido.seguimiento_historial}
+                estados_existentes = seguimiento.estados_registrados(pedido.id)
 
                 # Definir la secuencia completa de seguimiento y las notas por defecto.
                 secuencia_completa = [
@@ -843,31 +829,18 @@ def update_pedido_estado(admin_user, pedido_id):
                     if estado_secuencia.value not in estados_existentes:
                         # MEJORA PROFESIONAL: Al rellenar, marcar los estados intermedios como ya notificados
                         # para no abrumar al cliente. La notificación real será la del estado final.
-                        new_history_entry = {
-                            'estado': estado_secuencia.value,
-                            'notas': nota_secuencia,
-                            'timestamp': datetime.utcnow().isoformat() + "Z",
-                            'notified_to_client': True # Marcar intermedios como ya notificados.
-                        }
-                        pedido.seguimiento_historial.append(new_history_entry)
+                        pedido.registrar_evento(estado_secuencia, nota_secuencia, notificado=True)
                         current_app.logger.debug(f"Pedido {pedido_id}: Rellenando historial con estado '{estado_secuencia.value}' (notified=True).")
 
                 # MEJORA PROFESIONAL: Asegurar que SIEMPRE se añada una nueva entrada para el estado final
                 # con la notificación activada, incluso si ya existía una entrada previa.
                 # Esto es clave para reactivaciones.
-                final_history_entry = {
-                    'estado': EstadoSeguimiento.ENTREGADO.value,
-                    'notas': nota_por_defecto,
-                    'timestamp': datetime.utcnow().isoformat() + "Z",
-                    # MEJORA PROFESIONAL: Solo marcar para notificar si el pedido ya está activo.
-                    # Si está inactivo, la notificación se gestionará al momento de activarlo.
-                    'notified_to_client': pedido.estado != 'activo'
-                }
-                pedido.seguimiento_historial.append(final_history_entry)
+                # MEJORA PROFESIONAL: Solo marcar para notificar si el pedido ya está activo.
+                # Si está inactivo, la notificación se gestionará al momento de activarlo.
+                pedido.registrar_evento(EstadoSeguimiento.ENTREGADO, nota_por_defecto,
+                                        notificado=pedido.estado != 'activo')
                 current_app.logger.info(f"Pedido {pedido_id}: Añadiendo entrada final de historial para '{EstadoSeguimiento.ENTREGADO.value}' (notified=False).")
-                
-                # Marcar el historial como modificado para que SQLAlchemy detecte el cambio.
-                flag_modified(pedido, "seguimiento_historial")
+
                 pedido.notas_seguimiento = nota_por_defecto
 
             elif nuevo_estado == EstadoPedido.CANCELADO:
@@ -879,19 +852,9 @@ def update_pedido_estado(admin_user, pedido_id):
                 
                 # MEJORA PROFESIONAL: Siempre añadir una nueva entrada para el cambio de estado,
                 # marcada para notificación, en lugar de depender de la lógica de relleno.
-                if pedido.seguimiento_historial is None:
-                    pedido.seguimiento_historial = []
-                
-                new_history_entry = {
-                    'estado': nuevo_seguimiento,
-                    'notas': nota_por_defecto,
-                    'timestamp': datetime.utcnow().isoformat() + "Z",
-                    'notified_to_client': pedido.estado != 'activo'
-                }
-                pedido.seguimiento_historial.append(new_history_entry)
+                pedido.registrar_evento(nuevo_seguimiento, nota_por_defecto, notificado=pedido.estado != 'activo')
                 current_app.logger.info(f"Pedido {pedido_id}: Añadiendo entrada de historial para '{nuevo_seguimiento}' (notified=False).")
-                
-                flag_modified(pedido, "seguimiento_historial")
+
                 pedido.notas_seguimiento = nota_por_defecto
 
             elif nuevo_estado == EstadoPedido.EN_PROCESO:
@@ -903,19 +866,9 @@ def update_pedido_estado(admin_user, pedido_id):
                 
                 # MEJORA PROFESIONAL: Siempre añadir una nueva entrada para el cambio de estado,
                 # marcada para notificación.
-                if pedido.seguimiento_historial is None:
-                    pedido.seguimiento_historial = []
-                
-                new_history_entry = {
-                    'estado': nuevo_seguimiento,
-                    'notas': nota_por_defecto,
-                    'timestamp': datetime.utcnow().isoformat() + "Z",
-                    'notified_to_client': pedido.estado != 'activo'
-                }
-                pedido.seguimiento_historial.append(new_history_entry)
+                pedido.registrar_evento(nuevo_seguimiento, nota_por_defecto, notificado=pedido.estado != 'activo')
                 current_app.logger.info(f"Pedido {pedido_id}: Añadiendo entrada de historial para '{nuevo_seguimiento}' (notified=False).")
-                
-                flag_modified(pedido, "seguimiento_historial")
+
                 pedido.notas_seguimiento = nota_por_defecto
             
             # MEJORA PROFESIONAL: Resetear el seguro de notificación CADA VEZ que el estado del pedido cambia.
@@ -931,12 +884,13 @@ def update_pedido_estado(admin_user, pedido_id):
                     pedido.notificacion_final_enviada = False
                     current_app.logger.info(f"Pedido {pedido_id} inactivo. 'notificacion_final_enviada' reseteada para el nuevo estado {nuevo_estado.value}.")
 
+            # Mantener el resumen materializado de ventas (suma al completar, resta al salir de 'completado').
+            registrar_transicion_pedido(pedido, old_status, nuevo_estado)
+
             pedido.estado_pedido = nuevo_estado
             pedido.updated_at = datetime.utcnow()
 
-            # LOG DE DEPURACIÓN: Imprimir el historial final antes de hacer commit.
-            current_app.logger.debug(f"Pedido {pedido_id}: Historial de seguimiento final antes de commit: {pedido.seguimiento_historial}")
-            
+            notificaciones.publicar_pedido(pedido)
             db.session.commit()
 
             current_app.logger.info(
@@ -1004,7 +958,8 @@ def filter_pedidos_api(admin_user):
         # Construir consulta base con joins optimizados para rendimiento
         query = Pedido.query.options(
             joinedload(Pedido.usuario),
-            joinedload(Pedido.productos).joinedload(PedidoProducto.producto)
+            joinedload(Pedido.productos).joinedload(PedidoProducto.producto),
+            selectinload(Pedido.eventos)
         ).filter(
             Pedido.estado_pedido == estado_pedido_filter
         )
@@ -1158,12 +1113,11 @@ def update_pedido_estado_activo(admin_user, pedido_id):
             # MEJORA PROFESIONAL: Lógica unificada para notificar una sola vez al activar, para CUALQUIER estado de pedido.
             # Solo se notifica si el "seguro" (`notificacion_final_enviada`) no ha sido activado para el estado actual.
             if not pedido.notificacion_final_enviada:
-                if pedido.seguimiento_historial and len(pedido.seguimiento_historial) > 0:
-                    ultima_entrada = pedido.seguimiento_historial[-1]
+                ultima_entrada = seguimiento.ultimo_evento(pedido.id)
+                if ultima_entrada is not None:
                     # Marcar la última entrada para notificación y activar el seguro.
-                    ultima_entrada['notified_to_client'] = False
+                    ultima_entrada.notificado = False
                     pedido.notificacion_final_enviada = True # ¡Activamos el seguro!
-                    flag_modified(pedido, "seguimiento_historial")
                     current_app.logger.info(f"Pedido {pedido.id} ({pedido.estado_pedido.value}) activado. Se enviará notificación por primera vez para este estado.")
 
         current_app.logger.info(
@@ -1188,6 +1142,7 @@ def update_pedido_estado_activo(admin_user, pedido_id):
         }
         
         # Mover el commit al final para asegurar que todos los cambios se guarden atómicamente.
+        notificaciones.publicar_pedido(pedido)
         db.session.commit()
         return jsonify(response_data)
 
@@ -15,9 +15,10 @@ from app.utils.cloudinary_utils import upload_image_and_get_url
 from flask import Blueprint, render_template, request, abort, current_app, jsonify, redirect, url_for, flash
 from flask_wtf.csrf import generate_csrf
 from app.utils.admin_jwt_utils import admin_jwt_required
+from app.utils.stock import registrar_movimientos
 from app.models.domains.product_models import Productos, Seudocategorias, Subcategorias, CategoriasPrincipales
 import cloudinary.uploader
-from app.models.enums import EstadoEnum
+from app.models.enums import EstadoEnum, MotivoMovimientoStock
 from app.extensions import db
 import json
 
@@ -165,9 +166,15 @@ def create_product(admin_user):
 
             # --- 7. Persistencia en la Base de Datos ---
             db.session.add(nuevo_producto)
-            db.session.commit()
-            
+            db.session.flush()
+            # La existencia inicial abre el diario de stock del producto.
+            registrar_movimientos(
+                [(nuevo_producto.id, nuevo_producto.existencia, nuevo_producto.existencia)],
+                MotivoMovimientoStock.ALTA_PRODUCTO
+            )
+            # El estado de la seudocategoría (y sus ancestros) se recalcula al confirmar.
             seudocategoria.check_and_update_status()
+            db.session.commit()
             
             return jsonify({
                 'success': True,
@@ -14,8 +14,11 @@ from flask import Blueprint, render_template, request, abort, current_app, jsoni
 from app.utils.cloudinary_utils import upload_image_and_get_url
 from flask_wtf.csrf import generate_csrf
 from app.utils.admin_jwt_utils import admin_jwt_required
+from app.utils.category_status import SEUDOCATEGORIA, solicitar_recalculo
+from app.utils.stock import ajustar_stock, bloquear_productos
 from app.models.domains.product_models import Productos, Seudocategorias, Subcategorias, CategoriasPrincipales
 from app.models.serializers import admin_producto_to_dict
+from app.models.enums import MotivoMovimientoStock
 import cloudinary.uploader
 import cloudinary.api
 from app.extensions import db
@@ -220,6 +223,25 @@ def update_product_api(admin_user, product_slug):
                     )
 
         # --- 6. Actualización de los campos del producto ---
+        # MEJORA PROFESIONAL: El ajuste manual de existencia usa el mismo camino que los
+        # pedidos (`app.utils.stock`): se bloquea la fila, se relee la existencia y el delta
+        # se aplica con el UPDATE condicional, que también lo registra en el diario. Así una
+        # venta simultánea no se pisa ni el diario guarda un delta calculado sobre un valor
+        # obsoleto. El `flush` envía antes los cambios ya hechos (slug), porque el bloqueo
+        # relee el producto desde la base de datos.
+        # El UPDATE no pasa por el setter de `existencia`, que cambiaría el estado a 'activo'
+        # si la existencia es > 0: el estado se mantiene como estaba al momento de la edición.
+        db.session.flush()
+        productos_bloqueados = bloquear_productos([product.id])
+        new_existencia = int(existencia_str)
+        ajustar_stock(
+            {product.id: product._existencia - new_existencia},
+            MotivoMovimientoStock.AJUSTE_MANUAL,
+            productos=productos_bloqueados
+        )
+        if new_existencia == 0:
+            product.estado = 'inactivo' # Se mantiene la regla de negocio de desactivar si el stock es 0.
+
         product.nombre = nombre
         # El slug se actualiza antes si el nombre cambia
         product.marca = marca
@@ -227,27 +249,20 @@ def update_product_api(admin_user, product_slug):
         product.imagen_url = imagen_url_final
         product.precio = precio
         product.costo = costo
-        
-        # MEJORA PROFESIONAL: Evitar el cambio de estado automático.
-        # Se asigna directamente a `_existencia` para no disparar el setter de la propiedad `existencia`,
-        # que cambia el estado a 'activo' si la existencia es > 0.
-        # De esta forma, el estado del producto se mantiene como estaba al momento de la edición.
-        new_existencia = int(existencia_str)
-        product._existencia = new_existencia
-        if new_existencia == 0:
-            product.estado = 'inactivo' # Se mantiene la regla de negocio de desactivar si el stock es 0.
 
         product.stock_minimo = int(stock_minimo_str)
         product.stock_maximo = int(stock_maximo_str)
+        seudocategoria_anterior_id = product.seudocategoria_id
         product.seudocategoria_id = seudocategoria_id
         product.especificaciones = especificaciones
 
+        # Recalcular el estado de la seudocategoría (y la anterior, si el producto se movió)
+        # en el mismo commit que la edición.
+        solicitar_recalculo(db.session, SEUDOCATEGORIA, seudocategoria_id, seudocategoria_anterior_id)
+
         # --- 7. Persistencia en la Base de Datos ---
         db.session.commit()
         
-        # Opcional: Actualizar el estado de la seudocategoría si es necesario
-        seudocategoria.check_and_update_status()
-        
         return jsonify({
             'success': True,
             'message': 'Producto actualizado exitosamente.',
@@ -6,6 +6,7 @@ from app.models.domains.product_models import Productos, Seudocategorias, Subcat
 from app.models.domains.order_models import Pedido, PedidoProducto
 from app.models.domains.review_models import Reseñas
 from app.models.serializers import (
+    opciones_pedido_detalle,
     pedido_detalle_to_dict,
     producto_to_dict,
     resena_to_dict,
@@ -15,7 +16,9 @@ from app.models.serializers import (
 )
 from app.models.enums import EstadoPedido
 from app.extensions import db
+from app.utils import analitica_clientes
 from sqlalchemy import or_, and_, func, desc
+from sqlalchemy.orm import selectinload
 from datetime import datetime, timedelta
 import calendar
 
@@ -43,26 +46,14 @@ def detalle_usuario(admin_user, user_id):
         usuario = Usuarios.query.get_or_404(user_id)
         
         # Calcular estadísticas del usuario
-        total_invertido = db.session.query(func.sum(Pedido.total)).filter(
-            Pedido.usuario_id == user_id, 
-            Pedido.estado_pedido == EstadoPedido.COMPLETADO
-        ).scalar() or 0
-        
-        # MEJORA PROFESIONAL: Se consolidan múltiples consultas de conteo en una sola.
-        # En lugar de hacer 4 llamadas a la base de datos para contar pedidos por estado,
-        # se realiza una única consulta que agrupa por estado y cuenta todos a la vez.
-        # Esto reduce la sobrecarga de la red y la base de datos, mejorando el rendimiento.
-        counts_by_status = db.session.query(
-            Pedido.estado_pedido, func.count(Pedido.id)
-        ).filter(
-            Pedido.usuario_id == user_id
-        ).group_by(
-            Pedido.estado_pedido
-        ).all()
-        
-        pedidos_completados_count = sum(count for estado, count in counts_by_status if estado == EstadoPedido.COMPLETADO)
-        pedidos_en_proceso_count = sum(count for estado, count in counts_by_status if estado == EstadoPedido.EN_PROCESO)
-        pedidos_cancelados_count = sum(count for estado, count in counts_by_status if estado == EstadoPedido.CANCELADO)
+        # MEJORA PROFESIONAL: El gasto total, los conteos por estado y la fecha del último
+        # pedido salen de la misma consulta agrupada que usan "Mis pedidos" y el perfil,
+        # cacheada por usuario e invalidada cuando cambian sus pedidos.
+        stats = analitica_clientes.estadisticas_pedidos(user_id)
+        total_invertido = stats['total_gastado']
+        pedidos_completados_count = stats['completado']
+        pedidos_en_proceso_count = stats['en_proceso'] + stats['en_proceso_inactivos']
+        pedidos_cancelados_count = stats['cancelado']
         pedidos_count = pedidos_completados_count + pedidos_en_proceso_count + pedidos_cancelados_count
         
         # Calcular tiempo como cliente
@@ -85,9 +76,8 @@ def detalle_usuario(admin_user, user_id):
         
         # Calcular días desde última compra
         dias_ultima_compra = 0
-        ultimo_pedido = Pedido.query.filter_by(usuario_id=user_id).order_by(desc(Pedido.created_at)).first()
-        if ultimo_pedido:
-            dias_ultima_compra = (datetime.utcnow() - ultimo_pedido.created_at).days
+        if stats['ultimo_pedido_en']:
+            dias_ultima_compra = (datetime.utcnow() - stats['ultimo_pedido_en']).days
         
         # Calcular tasa de finalización
         tasa_finalizacion = 0
@@ -183,7 +173,11 @@ def get_usuario_pedidos(admin_user, user_id):
         fecha_fin = request.args.get('fecha_fin', '')        
         
         # Construir consulta base
-        query = Pedido.query.filter_by(usuario_id=user_id)
+        # MEJORA PROFESIONAL: Las líneas y los productos de toda la página se cargan con un
+        # `SELECT ... IN` cada uno, en lugar de una consulta por pedido y otra por línea.
+        query = Pedido.query.options(
+            selectinload(Pedido.productos).selectinload(PedidoProducto.producto)
+        ).filter_by(usuario_id=user_id)
 
         # LOGGING: Registrar los parámetros recibidos para depuración.
         current_app.logger.info(f"API get_usuario_pedidos: page={page}, estado='{estado}', search='{search}'")
@@ -298,10 +292,7 @@ def get_pedido_detalle(admin_user, pedido_id):
         JSON: Un objeto con los detalles completos del pedido o un error si no se encuentra.
     """
     try:
-        pedido = Pedido.query.options(
-            db.joinedload(Pedido.usuario),
-            db.joinedload(Pedido.productos).joinedload(PedidoProducto.producto)
-        ).get(pedido_id)
+        pedido = Pedido.query.options(*opciones_pedido_detalle()).get(pedido_id)
 
         if not pedido:
             return jsonify({'success': False, 'message': 'Pedido no encontrado'}), 404
@@ -22,6 +22,7 @@ from sqlalchemy import or_, case, desc, func
 from app.extensions import bcrypt
 from flask_wtf.csrf import generate_csrf
 from app.utils.admin_jwt_utils import admin_jwt_required
+from app.utils import presence
 import uuid, datetime
 
 # MEJORA: Crear un serializador específico para esta ruta que omita 'updated_at'.
@@ -683,15 +684,15 @@ def admin_heartbeat(admin_user):
     """
     API: Endpoint "heartbeat" para que el frontend del admin reporte actividad.
 
-    Actualiza el 'last_seen' del administrador para mantenerlo 'En línea'.
+    Registra el 'last_seen' del administrador en el buffer de presencia para
+    mantenerlo 'En línea'; el volcado a la base de datos se hace en lote.
 
     Args:
         admin_user: El objeto del administrador autenticado.
     """
     try:
         # El decorador @admin_jwt_required ya nos da el admin_user
-        admin_user.last_seen = datetime.datetime.now(datetime.timezone.utc)
-        db.session.commit()
+        presence.touch(presence.ADMIN, admin_user.id)
         return jsonify({'success': True}), 200
     except Exception as e:
         current_app.logger.error(f"Error en el heartbeat del admin {admin_user.id}: {str(e)}")
@@ -16,14 +16,16 @@ Funcionalidades Clave:
 """
 from flask import Blueprint, jsonify, request, render_template, current_app
 from app.utils.admin_jwt_utils import admin_jwt_required
-from app.models.domains.order_models import Pedido, PedidoProducto
+from app.utils import notificaciones, stock, ventas_diarias
+from app.utils.ventas_resumen import aplicar_pedido_al_resumen, registrar_transicion_pedido
+from app.models.domains.order_models import Pedido, PedidoEvento, PedidoProducto
 from app.models.domains.user_models import Usuarios
 from app.models.domains.product_models import Productos
-from app.models.enums import EstadoPedido, EstadoEnum, EstadoSeguimiento
-from app.models.serializers import pedido_to_dict, pedido_detalle_to_dict
+from app.models.enums import EstadoPedido, EstadoEnum, EstadoSeguimiento, MotivoMovimientoStock
+from app.models.serializers import opciones_pedido_detalle, pedido_to_dict, pedido_detalle_to_dict
 from app.extensions import db
-from sqlalchemy import or_, and_, func, desc, case
-from sqlalchemy.orm import joinedload, attributes
+from sqlalchemy import or_, and_, func, desc, case, update
+from sqlalchemy.orm import joinedload, selectinload
 from datetime import datetime, timedelta, date, timezone
 from flask_wtf.csrf import generate_csrf
 
@@ -47,7 +49,7 @@ def _build_ventas_query(args):
                listo para ser ordenado, paginado o para agregarle más filtros
                específicos.
     """
-    query = Pedido.query.options(joinedload(Pedido.usuario)).filter(
+    query = Pedido.query.options(joinedload(Pedido.usuario), selectinload(Pedido.eventos)).filter(
         Pedido.estado_pedido == EstadoPedido.COMPLETADO
     )
 
@@ -82,6 +84,27 @@ def _build_ventas_query(args):
     # No se aplican filtros de monto aquí, ya que se manejan de forma diferente para el total y el gráfico.
     return query
 
+def _rango_de_fechas(args):
+    """
+    Devuelve el rango de días `(desde, hasta)` de los filtros `fecha_inicio` y `fecha_fin`.
+
+    Interpreta los filtros igual que `_build_ventas_query`: un valor ausente o inválido
+    no acota el rango (None).
+
+    Args:
+        args (ImmutableMultiDict): Los argumentos de la solicitud.
+
+    Returns:
+        tuple: `(desde, hasta)`, ambos `date` o None; `hasta` es inclusivo.
+    """
+    rango = []
+    for campo in ('fecha_inicio', 'fecha_fin'):
+        try:
+            rango.append(datetime.strptime(args.get(campo, ''), '%Y-%m-%d').date())
+        except ValueError:
+            rango.append(None)
+    return tuple(rango)
+
 @admin_ventas_bp.route('/lista-ventas', methods=['GET'])
 @admin_jwt_required
 def get_ventas(admin_user):
@@ -118,7 +141,7 @@ def get_ventas(admin_user):
         estado = request.args.get('estado', 'todos')
         
         # --- 2. Construcción de la consulta base (solo pedidos completados) ---
-        query = Pedido.query.options(joinedload(Pedido.usuario)).filter(
+        query = Pedido.query.options(joinedload(Pedido.usuario), selectinload(Pedido.eventos)).filter(
             Pedido.estado_pedido == EstadoPedido.COMPLETADO
         )
         
@@ -351,29 +374,10 @@ def create_venta(admin_user):
             if not producto_id or not isinstance(cantidad, int) or cantidad <= 0:
                 return jsonify({'success': False, 'message': f'Datos de producto inválidos: {item}'}), 400
 
-            producto = Productos.query.get(producto_id)
-            if not producto:
-                return jsonify({'success': False, 'message': f'Producto con ID {producto_id} no encontrado'}), 404
-            
-            if producto.existencia < cantidad:
-                return jsonify({
-                    'success': False, 
-                    'message': f'Stock insuficiente para {producto.nombre}. Disponible: {producto.existencia}, solicitado: {cantidad}'
-                }), 400
-
-            subtotal = producto.precio * cantidad
-            total_venta += subtotal
-            
-            productos_a_procesar.append({
-                'producto_obj': producto,
-                'cantidad': cantidad,
-                'precio_unitario': producto.precio
-            })
-
         # MEJORA PROFESIONAL: Al crear una venta directa, generar un historial de seguimiento completo.
         # Esto le da al cliente una visión profesional de todo el proceso, aunque se haya completado en un solo paso.
         nota_final = "Tu pedido ha sido completado y entregado con éxito."
-        timestamp_actual = datetime.utcnow().isoformat() + "Z"
+        momento_actual = datetime.utcnow()
 
         # Secuencia completa de seguimiento con notas profesionales.
         secuencia_completa = [
@@ -388,27 +392,48 @@ def create_venta(admin_user):
         # Los estados anteriores se añaden al historial para que el cliente vea un
         # timeline completo, pero se marcan como ya notificados para no enviarle
         # alertas innecesarias de 'recibido', 'en preparación', etc., en una venta directa.
-        historial_inicial = [
-            {
-                'estado': estado_secuencia.value,
-                'notas': nota_secuencia,
-                'timestamp': timestamp_actual,
-                'notified_to_client': True if estado_secuencia != EstadoSeguimiento.ENTREGADO else False
-            } for estado_secuencia, nota_secuencia in secuencia_completa
-        ]
-
         nueva_venta = Pedido(
             usuario_id=usuario_id,
-            total=total_venta,
+            total=0, # Se calcula tras reservar el stock, con los precios de las filas bloqueadas.
             estado_pedido=EstadoPedido.COMPLETADO, # La diferencia clave: se crea como COMPLETADO
             estado=EstadoEnum.ACTIVO.value,
             seguimiento_estado=EstadoSeguimiento.ENTREGADO,
             notas_seguimiento=nota_final,
-            seguimiento_historial=historial_inicial
         )
+        for estado_secuencia, nota_secuencia in secuencia_completa:
+            nueva_venta.registrar_evento(
+                estado_secuencia, nota_secuencia,
+                notificado=estado_secuencia != EstadoSeguimiento.ENTREGADO, momento=momento_actual
+            )
         db.session.add(nueva_venta)
         db.session.flush()
 
+        # MEJORA PROFESIONAL: Reserva atómica del stock (bloqueo ordenado + UPDATE condicional).
+        try:
+            productos = stock.reservar_stock(
+                stock.cantidades_por_producto((item['id'], item['cantidad']) for item in productos_payload),
+                MotivoMovimientoStock.VENTA, pedido_id=nueva_venta.id
+            )
+        except stock.ProductoNoDisponible as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': str(e)}), 404
+        except stock.StockInsuficiente as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': str(e)}), 400
+
+        for item in productos_payload:
+            producto = productos[str(item['id'])]
+            cantidad = item['cantidad']
+            subtotal = producto.precio * cantidad
+            total_venta += subtotal
+            
+            productos_a_procesar.append({
+                'producto_obj': producto,
+                'cantidad': cantidad,
+                'precio_unitario': producto.precio
+            })
+        nueva_venta.total = total_venta
+
         for item in productos_a_procesar:
             pedido_producto = PedidoProducto(
                 pedido_id=nueva_venta.id,
@@ -417,8 +442,11 @@ def create_venta(admin_user):
                 precio_unitario=item['precio_unitario']
             )
             db.session.add(pedido_producto)
-            item['producto_obj'].existencia -= item['cantidad']
 
+        # La venta nace 'completada': sus líneas se suman directamente al resumen de ventas.
+        registrar_transicion_pedido(nueva_venta, None, EstadoPedido.COMPLETADO)
+
+        notificaciones.publicar_pedido(nueva_venta)
         db.session.commit()
         current_app.logger.info(f"Nueva venta (pedido completado) {nueva_venta.id} creada por administrador {admin_user.id}")
         return jsonify({'success': True, 'message': 'Venta creada exitosamente', 'pedido_id': nueva_venta.id}), 201
@@ -446,10 +474,7 @@ def get_venta_detalle(admin_user, venta_id):
         JSON: Un objeto con los detalles completos de la venta.
     """
     try:
-        venta = Pedido.query.options(
-            joinedload(Pedido.usuario),
-            joinedload(Pedido.productos).joinedload(PedidoProducto.producto)
-        ).get(venta_id)
+        venta = Pedido.query.options(*opciones_pedido_detalle()).get(venta_id)
         
         if not venta or venta.estado_pedido != EstadoPedido.COMPLETADO:
             return jsonify({
@@ -531,18 +556,14 @@ def update_venta(admin_user, venta_id):
                 if diff != 0:
                     stock_changes[prod_id] = diff
 
-            # Verificar stock antes de aplicar cambios
-            for prod_id, diff in stock_changes.items():
-                if diff > 0: # Si se añaden productos
-                    producto = Productos.query.get(prod_id)
-                    if not producto or producto.existencia < diff:
-                        raise ValueError(f'Stock insuficiente para {producto.nombre}. Disponible: {producto.existencia}, solicitado adicional: {diff}')
+            # 3. Bloquear los productos implicados y aplicar las diferencias de stock con un
+            # único UPDATE condicional. Si falta stock, `StockInsuficiente` (un ValueError)
+            # revierte la transacción completa.
+            productos = stock.bloquear_productos(all_product_ids)
+            stock.ajustar_stock(stock_changes, MotivoMovimientoStock.AJUSTE_PEDIDO, productos, pedido_id=venta.id)
 
-            # 3. Aplicar cambios de stock
-            for prod_id, diff in stock_changes.items():
-                producto = Productos.query.get(prod_id)
-                if producto:
-                    producto.existencia -= diff
+            # Retirar las líneas actuales del resumen de ventas; se suman de nuevo tras editarlas.
+            aplicar_pedido_al_resumen(venta, -1)
 
             # 4. Actualizar PedidoProducto y calcular nuevo total
             venta.productos.clear()
@@ -550,7 +571,9 @@ def update_venta(admin_user, venta_id):
             
             new_total = 0
             for item_payload in new_productos_payload:
-                producto = Productos.query.get(item_payload['id'])
+                producto = productos.get(str(item_payload['id']))
+                if not producto:
+                    raise ValueError(f"Producto con ID {item_payload['id']} no encontrado")
                 cantidad = item_payload['cantidad']
                 precio_unitario = producto.precio # Usar el precio actual del producto
                 
@@ -581,33 +604,31 @@ def update_venta(admin_user, venta_id):
                 # Actualizar la fecha de creación de la venta para el nuevo cliente.
                 venta.created_at = new_timestamp_utc
                 
-                # Actualizar las fechas del historial de seguimiento.
-                if venta.seguimiento_historial:
-                    for entry in venta.seguimiento_historial:
-                        entry['timestamp'] = new_timestamp_utc.isoformat()
+                # Reasignar el historial de seguimiento al nuevo cliente con la nueva fecha.
+                db.session.execute(
+                    update(PedidoEvento)
+                    .where(PedidoEvento.pedido_id == venta.id)
+                    .values(usuario_id=new_usuario_id, created_at=new_timestamp_utc.replace(tzinfo=None))
+                )
 
             venta.total = new_total
             venta.usuario_id = new_usuario_id
             venta.updated_at = now_colombia.astimezone(timezone.utc)
 
-            # 6. MEJORA PROFESIONAL: Añadir entrada al historial y notificar si está activo.
-            # Si el historial no existe, se inicializa.
-            if venta.seguimiento_historial is None:
-                venta.seguimiento_historial = []
+            aplicar_pedido_al_resumen(venta, 1)
 
+            # 6. MEJORA PROFESIONAL: Añadir entrada al historial y notificar si está activo.
             # Determinar si se debe notificar al cliente.
             notificar_cliente = venta.estado == EstadoEnum.ACTIVO.value
 
-            # Crear la nueva entrada en el historial.
-            historial_entry = {
-                'estado': venta.seguimiento_estado.value, # Usar el estado de seguimiento actual (ej. 'entregado')
-                'notas': "Tu pedido esta actualizado y completado",
-                'timestamp': now_colombia.isoformat(),
-                'notified_to_client': not notificar_cliente # notificar si es True (False para que el sistema lo envíe)
-            }
-            venta.seguimiento_historial.append(historial_entry)
-            attributes.flag_modified(venta, "seguimiento_historial")
+            # Crear la nueva entrada en el historial con el estado de seguimiento actual
+            # (ej. 'entregado'); queda pendiente de notificar solo si el pedido está activo.
+            venta.registrar_evento(
+                venta.seguimiento_estado, "Tu pedido esta actualizado y completado",
+                notificado=not notificar_cliente, momento=now_colombia
+            )
 
+        notificaciones.publicar_pedido(venta)
         db.session.commit()
         current_app.logger.info(f"Venta {venta_id} actualizada por administrador {admin_user.id}")
         return jsonify({'success': True, 'message': 'Venta actualizada exitosamente', 'pedido_id': venta.id}), 200
@@ -716,16 +737,19 @@ def get_ventas_estadisticas(admin_user):
         periodo = request.args.get('periodo', '30d') # Nuevo: 7d, 30d, 1y
 
         # Aplicar filtros de monto a la consulta.
+        filtro_monto = False
         try:
             if monto_min and monto_min.strip():
                 monto_min_float = float(monto_min)
                 query = query.filter(Pedido.total >= monto_min_float)
+                filtro_monto = True
         except (ValueError, TypeError):
             pass
         try:
             if monto_max and monto_max.strip():
                 monto_max_float = float(monto_max)
                 query = query.filter(Pedido.total <= monto_max_float)
+                filtro_monto = True
         except (ValueError, TypeError):
             pass
         
@@ -733,33 +757,40 @@ def get_ventas_estadisticas(admin_user):
         # Esto asegura que total_ventas, total_ingresos, etc., reflejen los mismos filtros.
         filtered_query = query.subquery()
 
-        pedidos_filtrados_ids = db.session.query(filtered_query.c.id).subquery()
+        # MEJORA PROFESIONAL: Si solo se filtra por fechas, los agregados financieros se leen
+        # del acumulado diario (`ventas_diarias`) en lugar de recorrer las líneas de pedido.
+        # Los filtros por pedido (estado, ID, cliente, monto) no existen en el acumulado.
+        filtros_de_pedido = (
+            filtro_monto
+            or request.args.get('estado') in ['activo', 'inactivo']
+            or any(request.args.get(campo) for campo in ('venta_id', 'cliente'))
+        )
+        if not filtros_de_pedido:
+            totales = ventas_diarias.totales_ventas(*_rango_de_fechas(request.args))
+            total_ingresos = totales['ingresos']
+            total_inversion = totales['costo']
+        else:
+            pedidos_filtrados_ids = db.session.query(filtered_query.c.id).subquery()
+
+            # Consulta para calcular agregados financieros (ingresos, inversión, utilidad).
+            # Se une PedidoProducto y Productos para acceder al costo.
+            financials = db.session.query(
+                func.sum(PedidoProducto.cantidad * PedidoProducto.precio_unitario).label('total_ingresos'),
+                func.sum(PedidoProducto.cantidad * Productos.costo).label('total_inversion')
+            ).join(
+                Productos, PedidoProducto.producto_id == Productos.id
+            ).filter(
+                PedidoProducto.pedido_id.in_(pedidos_filtrados_ids)
+            ).one()
+            total_ingresos = financials.total_ingresos or 0
+            total_inversion = financials.total_inversion or 0
 
-        # Consulta para calcular agregados financieros (ingresos, inversión, utilidad).
-        # Se une PedidoProducto y Productos para acceder al costo.
-        financials = db.session.query(
-            func.sum(PedidoProducto.cantidad * PedidoProducto.precio_unitario).label('total_ingresos'),
-            func.sum(PedidoProducto.cantidad * Productos.costo).label('total_inversion')
-        ).join(
-            Productos, PedidoProducto.producto_id == Productos.id
-        ).filter(
-            PedidoProducto.pedido_id.in_(pedidos_filtrados_ids)
-        ).one()
+        total_utilidad = total_ingresos - total_inversion
 
-        # --- MEJORA PROFESIONAL: Calcular utilidad e inversión del período actual ---
+        # --- MEJORA PROFESIONAL: Utilidad e inversión del período actual ---
         # Estos valores se usarán en el frontend para mostrar la ganancia/pérdida sobre la inversión.
-        financials_periodo_actual = db.session.query(
-            func.sum(PedidoProducto.cantidad * PedidoProducto.precio_unitario).label('total_ingresos'),
-            func.sum(PedidoProducto.cantidad * Productos.costo).label('total_inversion')
-        ).join(Productos, PedidoProducto.producto_id == Productos.id).filter(
-            PedidoProducto.pedido_id.in_(pedidos_filtrados_ids)
-        ).one()
-        utilidad_periodo_actual = (financials_periodo_actual.total_ingresos or 0) - (financials_periodo_actual.total_inversion or 0)
-        inversion_periodo_actual = financials_periodo_actual.total_inversion or 0
-
-        total_ingresos = financials.total_ingresos or 0
-        total_inversion = financials.total_inversion or 0
-        total_utilidad = total_ingresos - total_inversion
+        utilidad_periodo_actual = total_utilidad
+        inversion_periodo_actual = total_inversion
 
         total_ventas = db.session.query(func.count()).select_from(filtered_query).scalar() or 0
 
@@ -771,58 +802,32 @@ def get_ventas_estadisticas(admin_user):
         hoy = datetime.utcnow().date()
         if periodo == '7d':
             start_date = hoy - timedelta(days=6)
-            group_by_format = '%Y-%m-%d'
+            granularidad = 'day'
             label_format = '%d/%m'
-            date_trunc = func.date(Pedido.created_at)
         elif periodo == '1y':
-            start_date = hoy - timedelta(days=365)
-            group_by_format = 'YYYY-MM' # Formato para PostgreSQL
+            # Los 12 meses que terminan en el mes actual.
+            anio, mes = divmod(hoy.year * 12 + hoy.month - 1 - 11, 12)
+            start_date = date(anio, mes + 1, 1)
+            granularidad = 'month'
             label_format = '%b %Y'
-            date_trunc = func.to_char(Pedido.created_at, group_by_format)
         else: # 30d por defecto
             start_date = hoy - timedelta(days=29)
-            group_by_format = '%Y-%m-%d'
+            granularidad = 'day'
             label_format = '%d/%m'
-            date_trunc = func.date(Pedido.created_at)
 
-        grafico_query = query.with_entities(
-            date_trunc.label('fecha'),
+        # El gráfico cuenta pedidos y respeta todos los filtros, así que agrupa los pedidos
+        # filtrados; los días o meses sin ventas los aporta la serie generada en SQL.
+        periodo_venta = ventas_diarias.periodo(Pedido.created_at, granularidad)
+        ventas_agrupadas = query.with_entities(
+            periodo_venta,
             func.count(Pedido.id).label('cantidad'),
             func.sum(Pedido.total).label('total')
-        ).filter(Pedido.created_at >= start_date).group_by('fecha').order_by('fecha')
+        ).filter(Pedido.created_at >= start_date).group_by(periodo_venta).subquery()
 
-        ventas_agrupadas = grafico_query.all()
-        
-        # Crear un diccionario para un acceso rápido a los datos del gráfico.
-        ventas_dict = {}
-        for r in ventas_agrupadas:
-            clave = r.fecha.strftime('%Y-%m-%d') if isinstance(r.fecha, (datetime, date)) else str(r.fecha)
-            ventas_dict[clave] = {'cantidad': r.cantidad, 'total': float(r.total)}
-
-        # Generar etiquetas y datos para el rango de fechas completo para el gráfico.
-        fechas = []
-        cantidades = []
-        totales = []
-        num_dias = 365 if periodo == '1y' else (7 if periodo == '7d' else 30)
-
-        if periodo == '1y':
-            for i in range(12):
-                mes_actual = (hoy.month - i - 1) % 12 + 1
-                ano_actual = hoy.year if mes_actual <= hoy.month else hoy.year - 1
-                fecha = datetime(ano_actual, mes_actual, 1)
-                clave = fecha.strftime('%Y-%m') # Usamos el formato Python para generar la clave
-                fechas.insert(0, fecha.strftime(label_format))
-                venta_mes = ventas_dict.get(clave, {'cantidad': 0, 'total': 0})
-                cantidades.insert(0, venta_mes['cantidad'])
-                totales.insert(0, venta_mes['total'])
-        else:
-            for i in range(num_dias):
-                fecha = hoy - timedelta(days=i)
-                clave = fecha.strftime('%Y-%m-%d') # Usamos el formato Python para generar la clave
-                fechas.insert(0, fecha.strftime(label_format))
-                venta_dia = ventas_dict.get(clave, {'cantidad': 0, 'total': 0})
-                cantidades.insert(0, venta_dia['cantidad'])
-                totales.insert(0, venta_dia['total'])
+        serie = ventas_diarias.serie_completa(ventas_agrupadas, start_date, hoy, granularidad)
+        fechas = [fila.periodo.strftime(label_format) for fila in serie]
+        cantidades = [int(fila.cantidad) for fila in serie]
+        totales = [float(fila.total) for fila in serie]
         
         return jsonify({
             'success': True,
@@ -38,6 +38,8 @@ from app.extensions import bcrypt, db, login_manager
 # --- Importaciones Locales de la Aplicación ---
 from app.models.domains.user_models import Usuarios
 from app.models.serializers import usuario_to_dict
+from app.utils import carrito, presence
+from app.utils.identity import get_usuario_por_id, resolver_usuario_desde_token
 from app.utils.jwt_utils import jwt_required
 
 auth_bp = Blueprint("auth", __name__)
@@ -59,7 +61,7 @@ def restore_session_from_jwt():
 
     user_id_from_session = session.get("user", {}).get("id")
     if user_id_from_session and not (hasattr(g, "user") and g.user):
-        g.user = Usuarios.query.get(user_id_from_session)
+        g.user = get_usuario_por_id(user_id_from_session)
     # Evita restaurar la sesión si el usuario acaba de cerrarla explícitamente.
     if request.endpoint == "auth.logout" and request.method == "POST":
         return
@@ -76,7 +78,8 @@ def restore_session_from_jwt():
         return  # No hay token, no se puede restaurar.
 
     # Verifica la validez del token y obtiene el objeto de usuario.
-    usuario = Usuarios.verificar_jwt(token)
+    # El resolutor de identidad decodifica el token y carga el usuario una sola vez por petición.
+    usuario = resolver_usuario_desde_token(token)
     if usuario:
         # Si el token es válido, se puebla la sesión de Flask con los datos del usuario.
         g.user = usuario
@@ -117,8 +120,8 @@ def me():
     if not token:
         return jsonify({"error": "Token no proporcionado"}), 401
     try:
-        # Verifica el token y obtiene el usuario.
-        usuario = Usuarios.verificar_jwt(token)
+        # Verifica el token y obtiene el usuario (reutilizando lo resuelto por el middleware).
+        usuario = resolver_usuario_desde_token(token)
         if not usuario:
             return jsonify({"error": "Token inválido o expirado"}), 401
 
@@ -282,6 +285,13 @@ def login():
 
     # Actualizar la última vez que se vio al usuario al iniciar sesión.
     usuario.last_seen = datetime.now(timezone.utc)
+
+    # MEJORA PROFESIONAL: Trasladar el carrito de invitado al usuario en el servidor, con
+    # una única sentencia set-based, en la misma transacción del inicio de sesión.
+    cart_id = session.pop("cart_id", None)
+    if cart_id:
+        trasladadas = carrito.fusionar_carrito_invitado(cart_id, usuario.id)
+        app.logger.info(f"Carrito de invitado fusionado al iniciar sesión: {trasladadas} líneas para {usuario.id}")
     db.session.commit()
 
     # Almacena datos adicionales en la sesión para un acceso rápido.
@@ -523,7 +533,7 @@ def logout():
         # Esto asegura que el timestamp 'last_seen' se actualice correctamente.
         user_id = session.get("user", {}).get("id")
         if user_id:
-            usuario = Usuarios.query.get(user_id)
+            usuario = get_usuario_por_id(user_id)
             if usuario:
                 # Guardar la hora exacta de la desconexión.
                 usuario.last_seen = datetime.now(timezone.utc)
@@ -698,12 +708,12 @@ def update_profile(usuario):
 def client_heartbeat(usuario):
     """
     Endpoint para que el frontend del cliente reporte actividad.
-    Actualiza el 'last_seen' del usuario para mantenerlo 'En línea'.
+    Registra el 'last_seen' del usuario en el buffer de presencia para mantenerlo
+    'En línea'; el volcado a la base de datos se hace en lote.
     """
     try:
         # El decorador @jwt_required ya nos da el objeto 'usuario'
-        usuario.last_seen = datetime.now(timezone.utc)
-        db.session.commit()
+        presence.touch(presence.USUARIO, usuario.id)
         return jsonify({"success": True}), 200
     except Exception as e:
         current_app.logger.error(
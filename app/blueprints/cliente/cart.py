@@ -11,7 +11,7 @@ Sus responsabilidades incluyen:
 """
 
 # --- Importaciones de Flask y Librerías Estándar ---
-from flask import Blueprint, request, jsonify, session, render_template, current_app, make_response, url_for
+from flask import Blueprint, request, jsonify, session, render_template, current_app, make_response, url_for, g
 from datetime import datetime, timedelta
 import uuid
 from io import BytesIO
@@ -20,9 +20,12 @@ from io import BytesIO
 from app.models.domains.product_models import Productos, Seudocategorias, Subcategorias, CategoriasPrincipales
 from app.models.domains.cart_models import CartItem
 from app.models.domains.order_models import Pedido, PedidoProducto
-from app.models.enums import EstadoPedido, EstadoEnum, EstadoSeguimiento
+from app.models.enums import EstadoPedido, EstadoEnum, EstadoSeguimiento, MotivoMovimientoStock
 from app.extensions import db
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
 from app.utils.jwt_utils import jwt_required
+from app.utils import carrito, cart_summary, stock
 
 cart_bp = Blueprint('cart', __name__)
 
@@ -48,47 +51,82 @@ def get_or_create_cart():
             session['cart_id'] = str(uuid.uuid4())
         return {'session_id': session['cart_id']}
 
-def get_cart_items(cart_info):
+def _active_cart_items_query(cart_info):
     """
-    Obtiene los artículos del carrito con sus productos asociados.
+    Construye la consulta base de los artículos del carrito visibles para el cliente.
 
-    Realiza una consulta a la base de datos que filtra los artículos según el `cart_info`
-    proporcionado. Crucialmente, realiza `joins` para asegurar que tanto los productos
-    como toda su jerarquía de categorías (principal, sub, seudo) estén activos.
+    Filtra por `user_id` o `session_id` y realiza los `joins` necesarios para asegurar
+    que tanto los productos como toda su jerarquía de categorías (principal, sub, seudo)
+    estén activos.
 
     Args:
         cart_info (dict): Diccionario con `user_id` o `session_id`.
 
     Returns:
-        list: Una lista de diccionarios, donde cada uno representa un artículo del carrito.
+        Query: La consulta de `CartItem` lista para enumerar o agregar.
     """
     if 'user_id' in cart_info:
         # Consulta para usuarios autenticados.
-        items = CartItem.query.filter_by(user_id=cart_info['user_id'])\
-            .join(CartItem.product)\
-            .filter(Productos.estado == EstadoEnum.ACTIVO)\
-            .join(Productos.seudocategoria)\
-            .filter(Seudocategorias.estado == EstadoEnum.ACTIVO)\
-            .join(Seudocategorias.subcategoria)\
-            .filter(Subcategorias.estado == EstadoEnum.ACTIVO)\
-            .join(Subcategorias.categoria_principal)\
-            .filter(CategoriasPrincipales.estado == EstadoEnum.ACTIVO)\
-            .all()
+        query = CartItem.query.filter_by(user_id=cart_info['user_id'])
     else:
         # Consulta para usuarios anónimos (visitantes).
-        items = CartItem.query.filter_by(session_id=cart_info['session_id'])\
-            .join(CartItem.product)\
-            .filter(Productos.estado == EstadoEnum.ACTIVO)\
-            .join(Productos.seudocategoria)\
-            .filter(Seudocategorias.estado == EstadoEnum.ACTIVO)\
-            .join(Seudocategorias.subcategoria)\
-            .filter(Subcategorias.estado == EstadoEnum.ACTIVO)\
-            .join(Subcategorias.categoria_principal)\
-            .filter(CategoriasPrincipales.estado == EstadoEnum.ACTIVO)\
-            .all()
+        query = CartItem.query.filter_by(session_id=cart_info['session_id'])
+    return query.join(CartItem.product)\
+        .filter(Productos.estado == EstadoEnum.ACTIVO)\
+        .join(Productos.seudocategoria)\
+        .filter(Seudocategorias.estado == EstadoEnum.ACTIVO)\
+        .join(Seudocategorias.subcategoria)\
+        .filter(Subcategorias.estado == EstadoEnum.ACTIVO)\
+        .join(Subcategorias.categoria_principal)\
+        .filter(CategoriasPrincipales.estado == EstadoEnum.ACTIVO)
+
+
+def get_cart_items(cart_info):
+    """
+    Obtiene los artículos del carrito con sus productos asociados.
+
+    Solo incluye artículos cuyo producto y jerarquía de categorías estén activos
+    (ver `_active_cart_items_query`).
+
+    Args:
+        cart_info (dict): Diccionario con `user_id` o `session_id`.
+
+    Returns:
+        list: Una lista de diccionarios, donde cada uno representa un artículo del carrito.
+    """
+    items = _active_cart_items_query(cart_info).all()
     return [item.to_dict() for item in items]
 
 
+def get_cart_summary(cart_info):
+    """
+    Obtiene el resumen `(total_items, total_price)` del carrito con una sola consulta agregada.
+
+    Es la ruta barata para el contador del encabezado: no carga ni serializa los
+    artículos, solo suma cantidades y `cantidad * precio` en la base de datos.
+    El resultado se guarda por carrito en `app.utils.cart_summary` (se invalida al
+    confirmar cualquier cambio del carrito) y se memoriza en `g` durante la petición.
+
+    Args:
+        cart_info (dict): Diccionario con `user_id` o `session_id`.
+
+    Returns:
+        tuple: `(total_items, total_price)`.
+    """
+    def calcular():
+        total_items, total_price = _active_cart_items_query(cart_info).with_entities(
+            func.coalesce(func.sum(CartItem.quantity), 0),
+            func.coalesce(func.sum(CartItem.quantity * Productos.precio), 0)
+        ).one()
+        return int(total_items), float(total_price)
+
+    cache = g.setdefault('_cart_summary', {})
+    key = cart_summary.clave_carrito(cart_info)
+    if key not in cache:
+        cache[key] = cart_summary.obtener_resumen(cart_info, calcular)
+    return cache[key]
+
+
 @cart_bp.route('/carrito')
 def view_cart():
     """
@@ -124,8 +162,7 @@ def get_cart_count():
     Es utilizado por el frontend para actualizar el contador del ícono del carrito.
     """
     cart_info = get_or_create_cart()
-    items = get_cart_items(cart_info)
-    total_items = sum(item['quantity'] for item in items)
+    total_items, _ = get_cart_summary(cart_info)
 
     return jsonify({'total_items': total_items})
 
@@ -178,8 +215,7 @@ def add_to_cart():
         db.session.commit()
         return jsonify({
             'success': True,
-            'total_items': sum(item['quantity'] for item in get_cart_items(cart_info)),
-            'items': get_cart_items(cart_info),
+            'total_items': get_cart_summary(cart_info)[0],
             'message': 'Producto agregado exitosamente'
         })
     except Exception as e:
@@ -273,13 +309,17 @@ def add_to_cart_optimized():
             warnings.append(f'La cantidad de {product.nombre} se ajustó a {product._existencia} debido a la disponibilidad.')
             response_type = 'warning' # Change type if there's a warning
 
+        # MEJORA PROFESIONAL: La respuesta solo lleva los totales, resueltos con la consulta
+        # agregada (o la caché del resumen), en lugar de cargar y serializar el carrito
+        # completo dos veces. El frontend mantiene las líneas en su propio estado.
+        total_items, total_price = get_cart_summary(cart_info)
         return jsonify({
             'success': True,
             'message': response_message,
             'type': response_type,
             'warnings': warnings,
-            'total_items': sum(item['quantity'] for item in get_cart_items(cart_info)),
-            'items': get_cart_items(cart_info)
+            'total_items': total_items,
+            'total_price': total_price
         })
 
     except Exception as e:
@@ -306,7 +346,6 @@ def sync_cart(usuario):
           en lugar de sobrescribirlo. Se usa típicamente justo después del login.
     """
     try:
-        warnings = [] # Initialize warnings list
         if not request.is_json or request.json is None:
             return jsonify({'success': False, 'message': 'Solicitud inválida: se requiere JSON'}), 400
 
@@ -314,95 +353,14 @@ def sync_cart(usuario):
         merge = request.json.get('merge', False)
         user_id = usuario.id
 
-        # Carga los items existentes en la BD en un mapa para acceso rápido.
-        existing_db_cart_items = CartItem.query.filter_by(user_id=user_id).all()
-        existing_db_cart_map_by_id = {item.id: item for item in existing_db_cart_items}
-        existing_db_cart_map_by_product_id = {item.product_id: item for item in existing_db_cart_items}
-
-        items_to_keep_in_db = set() # Track items that are in frontend cart and should remain in DB
-
-        for item_data in cart_data_from_frontend:
-            # Procesa cada artículo enviado desde el frontend.
-            frontend_item_id = item_data.get('id')
-            product_id = item_data.get('product_id')
-            quantity = item_data.get('quantity')
-
-            if not product_id or not isinstance(quantity, int) or quantity <= 0:
-                current_app.logger.warning(f"Invalid cart item data received: {item_data}")
-                continue
-
-            product = Productos.query.get(str(product_id))
-            if not product or product.estado != EstadoEnum.ACTIVO:
-                current_app.logger.warning(f"Product {product_id} not found or inactive during sync.")
-                continue
-
-            # Valida y ajusta la cantidad según el stock disponible.
-            original_quantity = quantity # Store original quantity for comparison
-            quantity = min(original_quantity, product._existencia )
-            if original_quantity > product._existencia :
-                warnings.append(f'La cantidad de {product.nombre} se ajustó a {product._existencia } debido a la disponibilidad.')
-
-            # Busca el artículo en la base de datos, primero por ID real y luego por ID de producto.
-            db_item = None
-            if frontend_item_id and not frontend_item_id.startswith('temp_'):
-                # Try to find by real ID if available
-                db_item = existing_db_cart_map_by_id.get(frontend_item_id)
-            
-            if not db_item:
-                # If not found by real ID, or if it's a temp ID, try to find by product_id
-                db_item = existing_db_cart_map_by_product_id.get(product_id)
-
-            if db_item:
-                # Re-fetch the item to ensure it's not stale and still exists
-                # This is a defensive check against race conditions
-                current_db_item = db.session.query(CartItem).filter_by(id=db_item.id, user_id=user_id).first()
-                
-                if current_db_item:
-                    # Item still exists, proceed with update
-                    if merge:
-                        current_db_item.quantity += quantity
-                    else:
-                        current_db_item.quantity = quantity
-                    
-                    # Check if quantity was adjusted due to stock during merge/update
-                    if current_db_item.quantity > product._existencia :
-                        current_db_item.quantity = product._existencia 
-                        warnings.append(f'La cantidad de {product.nombre} se ajustó a {product._existencia } debido a la disponibilidad.')
-
-                    current_db_item.updated_at = datetime.utcnow()
-                    items_to_keep_in_db.add(current_db_item.id) # Mark as kept
-                else:
-                    # Item was found in initial map but deleted concurrently.
-                    # If frontend still has it, add it as a new item.
-                    cart_item = CartItem(
-                        user_id=user_id,
-                        product_id=product_id,
-                        quantity=quantity
-                    )
-                    db.session.add(cart_item)
-                    db.session.flush() # Get the ID for the newly added item
-                    items_to_keep_in_db.add(cart_item.id) # Mark as kept
-            else:
-                # El artículo no existe en la BD, se crea uno nuevo.
-                cart_item = CartItem(
-                    user_id=user_id,
-                    product_id=product_id,
-                    quantity=quantity
-                )
-                db.session.add(cart_item)
-                db.session.flush() # Get the ID for the newly added item
-                items_to_keep_in_db.add(cart_item.id) # Mark as kept
-
-        # Si no es una fusión, elimina los artículos de la BD que ya no están en el carrito del frontend.
-        if not merge:
-            for db_item in existing_db_cart_items:
-                if db_item.id not in items_to_keep_in_db:
-                    db.session.delete(db_item)
-
+        # MEJORA PROFESIONAL: Reconciliación en bloque. Una consulta de productos, una de
+        # los artículos guardados, un único upsert y un único borrado, sin importar el
+        # tamaño del carrito (antes eran unas tres consultas por artículo).
+        warnings = carrito.sincronizar_carrito(user_id, cart_data_from_frontend, merge=merge)
         db.session.commit()
-        
+
         # Return the updated cart from the database
-        items = CartItem.query.filter_by(user_id=user_id).all()
+        items = CartItem.query.options(joinedload(CartItem.product)).filter_by(user_id=user_id).all()
         cart_items_response = [item.to_dict() for item in items]
 
         total_items = sum(item['quantity'] for item in cart_items_response)
@@ -569,48 +527,54 @@ def create_order(usuario):
         if not cart_items:
             return jsonify({'success': False, 'message': 'El carrito está vacío.'}), 400
 
-        total_pedido = 0
-        productos_pedido = []
-
-        for item in cart_items:
-            product = Productos.query.get(item.product_id)
-            if not product or product.estado != EstadoEnum.ACTIVO:
-                db.session.rollback()
-                return jsonify({'success': False, 'message': f'Producto {item.product_id} no disponible.'}), 400
-            
-            if product._existencia < item.quantity:
-                db.session.rollback()
-                return jsonify({'success': False, 'message': f'Stock insuficiente para {product.nombre}. Disponible: {product._existencia}, solicitado: {item.quantity}'}), 400
-
-            subtotal = product.precio * item.quantity
-            total_pedido += subtotal
-            productos_pedido.append({
-                'producto_obj': product,
-                'cantidad': item.quantity,
-                'precio_unitario': product.precio
-            })
-
         # Crear el pedido
         # Inicializar el historial de seguimiento al crear el pedido.
         # Esto asegura que el estado 'recibido' siempre tenga un timestamp y una nota inicial.
+        # El total se calcula tras reservar el stock, con los precios de las filas bloqueadas.
         nota_inicial = "Tu pedido ha sido recibido y está pendiente de confirmación por parte de nuestro equipo."
         nuevo_pedido = Pedido(
             usuario_id=user_id,
-            total=total_pedido,
+            total=0,
             estado_pedido=EstadoPedido.EN_PROCESO,
             estado=EstadoEnum.INACTIVO,
             seguimiento_estado=EstadoSeguimiento.RECIBIDO,
             notas_seguimiento=nota_inicial,
-            seguimiento_historial=[{
-                'estado': EstadoSeguimiento.RECIBIDO.value,
-                'notas': nota_inicial,
-                'timestamp': datetime.utcnow().isoformat() + "Z"
-            }]
         )
+        nuevo_pedido.registrar_evento(EstadoSeguimiento.RECIBIDO, nota_inicial)
         db.session.add(nuevo_pedido)
         db.session.flush()
 
-        # Añadir productos al pedido y actualizar stock
+        # MEJORA PROFESIONAL: Reserva atómica del stock. Los productos del carrito se
+        # bloquean en una sola consulta (`FOR UPDATE`, ordenada por ID) y se descuentan
+        # con un único UPDATE condicional, de modo que dos checkouts simultáneos no
+        # pueden vender la misma unidad. Los movimientos quedan en el diario de stock.
+        try:
+            productos = stock.reservar_stock(
+                stock.cantidades_por_producto((item.product_id, item.quantity) for item in cart_items),
+                MotivoMovimientoStock.PEDIDO, pedido_id=nuevo_pedido.id, exigir_activos=True
+            )
+        except stock.ProductoNoDisponible as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': f'Producto {e.producto_id} no disponible.'}), 400
+        except stock.StockInsuficiente as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': str(e)}), 400
+
+        total_pedido = 0
+        productos_pedido = []
+
+        for item in cart_items:
+            product = productos[str(item.product_id)]
+            subtotal = product.precio * item.quantity
+            total_pedido += subtotal
+            productos_pedido.append({
+                'producto_obj': product,
+                'cantidad': item.quantity,
+                'precio_unitario': product.precio
+            })
+        nuevo_pedido.total = total_pedido
+
+        # Añadir productos al pedido (el stock ya se descontó al reservarlo).
         for item_data in productos_pedido:
             pedido_producto = PedidoProducto(
                 pedido_id=nuevo_pedido.id,
@@ -620,9 +584,6 @@ def create_order(usuario):
             )
             db.session.add(pedido_producto)
 
-            # Disminuir stock
-            item_data['producto_obj'].existencia -= item_data['cantidad']
-
         db.session.commit()
 
         current_app.logger.info(f"Nuevo pedido {nuevo_pedido.id} creado para el usuario {usuario.nombre}")
@@ -649,6 +610,7 @@ def clear_cart(usuario):
     try:
         user_id = usuario.id
         CartItem.query.filter_by(user_id=user_id).delete()
+        cart_summary.invalidar_carrito(db.session, user_id=user_id)
         db.session.commit()
         return jsonify({'success': True, 'message': 'Carrito vaciado exitosamente'})
     except Exception as e:
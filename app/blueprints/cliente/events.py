@@ -1,39 +1,160 @@
 """
 Módulo de Notificaciones y Eventos del Cliente.
 
-Este blueprint se encarga de gestionar las notificaciones periódicas para el cliente.
-Su principal función es verificar si existen actualizaciones en el estado de los pedidos
-que aún no han sido vistas por el usuario, para luego mostrarlas como notificaciones
-emergentes (toasts) en la interfaz.
+Este blueprint se encarga de entregar al cliente las actualizaciones en el estado de
+sus pedidos que aún no ha visto, para mostrarlas como notificaciones emergentes en la
+interfaz.
+
+- `/events/api/check-notifications`: Consulta puntual que el frontend hace en cada
+  carga de página. Es el canal por defecto.
+- `/events/stream`: Canal Server-Sent Events opcional (`NOTIFICATIONS_SSE_ENABLED`). Al
+  conectarse entrega la notificación pendiente (si la hay) y después espera los eventos
+  que publican los endpoints del panel (`app.utils.notificaciones`) sin consultar la
+  base de datos. Requiere workers asíncronos (ver `config.py`).
 """
 
 # --- Importaciones de Flask y Librerías Estándar ---
-from flask import Blueprint, jsonify, current_app
+import json
+import time
+from flask import Blueprint, Response, jsonify, current_app, stream_with_context
 
 # --- Importaciones de Extensiones y Terceros ---
 from app.utils.jwt_utils import jwt_required
-from sqlalchemy import desc
-from sqlalchemy.orm.attributes import flag_modified
+from app.utils import notificaciones, seguimiento
 
 # --- Importaciones Locales de la Aplicación ---
-from app.models.domains.order_models import Pedido
 from app.extensions import db
 
 events_bp = Blueprint('events', __name__, url_prefix='/events')
 
+
+def _tomar_notificacion_pendiente(usuario_id):
+    """
+    Busca la notificación no leída más reciente del usuario y la marca como leída.
+
+    La búsqueda usa el índice parcial de eventos sin notificar de `pedido_eventos`, por
+    lo que no recorre los pedidos ni su historial. Solo se marca la notificación que se
+    devuelve; las demás se entregarán en la siguiente consulta.
+
+    Args:
+        usuario_id (str): El ID del usuario.
+
+    Returns:
+        dict | None: La notificación (ver `notificaciones.notificacion_de_evento`) o `None`.
+    """
+    evento = seguimiento.notificacion_pendiente(usuario_id)
+    if evento is None:
+        return None
+    notificacion = notificaciones.notificacion_de_evento(evento)
+    # Marca la notificación como "leída" para que no se envíe de nuevo. Si otra petición
+    # se adelantó (otra pestaña), no se devuelve para no mostrarla dos veces.
+    entregar = seguimiento.marcar_notificado(evento.id, usuario_id)
+    db.session.commit()
+    return notificacion if entregar else None
+
+
+def _marcar_leida(usuario_id, notificacion):
+    """
+    Marca como leído el evento que originó una notificación entregada por el stream.
+
+    Returns:
+        bool: False si el evento ya estaba leído (p. ej. lo entregó otra pestaña o la
+              consulta de respaldo), en cuyo caso no se vuelve a mostrar.
+    """
+    entregar = seguimiento.marcar_notificado(notificacion['evento_id'], usuario_id)
+    db.session.commit()
+    return entregar
+
+
+def _evento_sse(notificacion):
+    """Formatea una notificación como evento SSE `pedido`."""
+    return f"id: {notificacion['evento_id']}\nevent: pedido\ndata: {json.dumps(notificacion)}\n\n"
+
+
+@events_bp.route('/stream')
+@jwt_required
+def stream_notifications(usuario):
+    """
+    Canal Server-Sent Events con las notificaciones de pedidos del usuario.
+
+    Solo está disponible con `NOTIFICATIONS_SSE_ENABLED`. En cada conexión, también en
+    las reconexiones, entrega la notificación pendiente, igual que `check-notifications`:
+    los eventos publicados mientras el navegador reconectaba (o en otro proceso con un
+    broker en memoria) solo están en la base de datos. Después espera los eventos
+    publicados por el panel, enviando un comentario de latido cada
+    `NOTIFICATIONS_SSE_HEARTBEAT_SECONDS`. La conexión se cierra tras
+    `NOTIFICATIONS_SSE_TIMEOUT_SECONDS` y el navegador reconecta tras
+    `NOTIFICATIONS_SSE_RETRY_MS`.
+
+    Args:
+        usuario (Usuarios): El objeto de usuario inyectado por el decorador `@jwt_required`.
+
+    Returns:
+        Response: Un stream `text/event-stream`, o un JSON 404 si el canal está desactivado.
+    """
+    if not current_app.config.get('NOTIFICATIONS_SSE_ENABLED'):
+        return jsonify({'success': False, 'message': 'El canal de notificaciones en tiempo real no está habilitado.'}), 404
+
+    usuario_id = usuario.id
+    duracion = current_app.config.get('NOTIFICATIONS_SSE_TIMEOUT_SECONDS', 55)
+    latido = current_app.config.get('NOTIFICATIONS_SSE_HEARTBEAT_SECONDS', 15)
+    reintento = current_app.config.get('NOTIFICATIONS_SSE_RETRY_MS', 15000)
+
+    # Suscribirse antes de la consulta inicial para no perder eventos publicados entre ambas.
+    suscripcion = notificaciones.suscribir_usuario(usuario_id)
+    pendiente = None
+    try:
+        pendiente = _tomar_notificacion_pendiente(usuario_id)
+    except Exception as e:
+        current_app.logger.error(f"Error al comprobar notificaciones para el usuario {usuario_id}: {e}", exc_info=True)
+        db.session.rollback()
+    # La espera no debe retener una conexión del pool.
+    db.session.close()
+
+    def generar():
+        try:
+            yield f"retry: {reintento}\n\n"
+            if pendiente:
+                yield _evento_sse(pendiente)
+            fin = time.monotonic() + duracion
+            while True:
+                restante = fin - time.monotonic()
+                if restante <= 0:
+                    break
+                notificacion = suscripcion.obtener(timeout=min(latido, restante))
+                if notificacion is None:
+                    yield ": ping\n\n"
+                    continue
+                try:
+                    entregar = _marcar_leida(usuario_id, notificacion)
+                except Exception as e:
+                    current_app.logger.error(f"Error al marcar la notificación del pedido {notificacion.get('order_id')}: {e}", exc_info=True)
+                    db.session.rollback()
+                    entregar = False
+                finally:
+                    db.session.close()
+                if entregar:
+                    yield _evento_sse(notificacion)
+        finally:
+            suscripcion.cerrar()
+
+    return Response(
+        stream_with_context(generar()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
 @events_bp.route('/api/check-notifications')
 @jwt_required
 def check_notifications(usuario):
     """
     Endpoint para verificar si hay notificaciones de pedidos no leídas.
 
-    Este endpoint es consultado periódicamente por el frontend para simular notificaciones
-    en tiempo real. Revisa el historial de seguimiento de los pedidos recientes del usuario
-    en busca de entradas marcadas con `notified_to_client: false`.
-
-    Si encuentra una notificación no leída:
-    1. La marca como leída (`notified_to_client: true`) para evitar que se muestre de nuevo.
-    2. Devuelve la notificación más reciente encontrada en formato JSON.
+    El frontend la llama en cada carga de página; es el canal por defecto, y el respaldo
+    de `/events/stream` cuando este está habilitado pero el navegador no admite `EventSource`.
+    Si encuentra una notificación no leída la marca como leída
+    (`notified_to_client: true`) para evitar que se muestre de nuevo y la devuelve.
 
     Args:
         usuario (Usuarios): El objeto de usuario inyectado por el decorador `@jwt_required`.
@@ -44,52 +165,10 @@ def check_notifications(usuario):
         JSON: Un objeto de error en caso de fallo en la base de datos.
     """
     try:
-        # --- Optimización de Consulta ---
-        # Se buscan solo los 10 pedidos más recientes para evitar escanear toda la
-        # tabla de pedidos en cada verificación, mejorando significativamente el rendimiento.
-        pedidos = Pedido.query.filter_by(usuario_id=usuario.id).order_by(desc(Pedido.updated_at)).limit(10).all()
-        
-        notifications = []
-        
-        for pedido in pedidos:
-            if not pedido.seguimiento_historial:
-                continue
-            
-            history_changed = False
-            # Itera el historial en orden inverso para encontrar la notificación más
-            # reciente primero y procesarla.
-            for entry in reversed(pedido.seguimiento_historial):
-                if entry.get('notified_to_client') is False:
-                    # Encontramos una notificación no leída
-                    notifications.append({
-                        'title': f"Actualización de tu Pedido #{pedido.id[:8]}...",
-                        'message': entry.get('notas', 'Tu pedido ha sido actualizado.'),
-                        'status': entry.get('estado', 'recibido'),
-                        'order_id': str(pedido.id)
-                    })
-                    # Marca la notificación como "leída" para que no se envíe de nuevo.
-                    entry['notified_to_client'] = True
-                    history_changed = True
-                    # Se rompe el bucle para mostrar solo la notificación más reciente de este pedido.
-                    # Las más antiguas (si las hubiera) se mostrarán en la siguiente llamada a la API.
-                    break
-            
-            if history_changed:
-                # --- Persistencia de Cambios en JSON ---
-                # `flag_modified` es crucial para notificar a SQLAlchemy que el campo JSON
-                # `seguimiento_historial` ha sido modificado internamente y debe ser actualizado en la BD.
-                flag_modified(pedido, "seguimiento_historial")
-
-        if notifications:
-            # Guarda los cambios en la base de datos (marcar como leídas).
-            db.session.commit()
-            # Devuelve solo la notificación más reciente encontrada para no abrumar al usuario.
-            return jsonify({'success': True, 'notifications': [notifications[0]]})
-        else:
-            # No se encontraron notificaciones nuevas.
-            return jsonify({'success': True, 'notifications': []})
+        notificacion = _tomar_notificacion_pendiente(usuario.id)
+        return jsonify({'success': True, 'notifications': [notificacion] if notificacion else []})
 
     except Exception as e:
         current_app.logger.error(f"Error al comprobar notificaciones para el usuario {usuario.id}: {e}", exc_info=True)
         db.session.rollback()
-        return jsonify({'success': False, 'message': 'Error al buscar notificaciones'}), 500
\ No newline at end of file
+        return jsonify({'success': False, 'message': 'Error al buscar notificaciones'}), 500
@@ -23,7 +23,7 @@ from app.utils.jwt_utils import jwt_required
 from datetime import datetime
 from app.models.domains.product_models import Productos, CategoriasPrincipales, Subcategorias, Seudocategorias
 from app.models.domains.review_models import Likes
-from app.models.serializers import producto_to_dict, categoria_principal_to_dict, subcategoria_to_dict, seudocategoria_to_dict, like_to_dict
+from app.models.serializers import productos_to_dict_list, categoria_principal_to_dict, subcategoria_to_dict, seudocategoria_to_dict, like_to_dict
 from app.blueprints.cliente.cart import get_cart_items, get_or_create_cart
 
 # --- Creación del Blueprint ---
@@ -574,7 +574,8 @@ def favoritos(usuario):
             f"Se encontraron {len(likes)} registros de 'likes' activos.")
 
         # Serializa los productos encontrados a un formato de diccionario para la plantilla.
-        favoritos = [producto_to_dict(like.producto) for like in likes if like.producto]
+        # Las métricas de ventas de todos los favoritos se obtienen en una sola consulta.
+        favoritos = productos_to_dict_list([like.producto for like in likes if like.producto])
         app.logger.info(f"Se encontraron {len(favoritos)} productos favoritos para el usuario con ID {user_id}")
 
         app.logger.info("Renderizando la plantilla de favoritos.html con una lista única de favoritos.")
@@ -13,22 +13,26 @@ Sus responsabilidades incluyen:
 # --- Importaciones de Flask y Librerías Estándar ---
 from flask import Blueprint, request, jsonify, session, render_template, current_app, make_response, url_for
 from datetime import datetime, timedelta
+import math
 
 # --- Importaciones de Extensiones y Terceros ---
 from sqlalchemy import not_, and_
 
 # --- Importaciones Locales de la Aplicación ---
-from app.models.domains.product_models import Productos, Seudocategorias, Subcategorias, CategoriasPrincipales
-from app.models.domains.order_models import Pedido, PedidoProducto
+from app.models.domains.product_models import Seudocategorias, Subcategorias, CategoriasPrincipales
+from app.models.domains.order_models import Pedido
 from app.models.domains.cart_models import CartItem
 from app.extensions import db
 from app.models.enums import EstadoPedido, EstadoEnum
 from app.utils.jwt_utils import jwt_required
+from app.utils import analitica_clientes
 
 order_bp = Blueprint('order', __name__)
 
 # --- Importaciones de Serializadores ---
-from app.models.serializers import pedido_detalle_cliente_to_dict
+from app.models.serializers import (
+    opciones_pedido_detalle, pedido_detalle_cliente_to_dict, pedidos_detalle_cliente_to_dict_list
+)
 
 @order_bp.route('/mis-pedidos')
 @jwt_required
@@ -112,30 +116,35 @@ def view_orders(usuario):
             query = query.order_by(Pedido.created_at.desc())
         
         # --- Cálculos de Totales para la UI ---
-        # Se obtienen los conteos totales por estado para mostrarlos en las pestañas.
-        # Estas consultas se hacen por separado para no ser afectadas por los filtros de búsqueda.
-        total_pedidos_en_proceso = Pedido.query.filter(Pedido.usuario_id==usuario.id, Pedido.estado==EstadoEnum.ACTIVO.value, Pedido.estado_pedido==EstadoPedido.EN_PROCESO).count()
-        total_pedidos_completado = Pedido.query.filter(Pedido.usuario_id==usuario.id, Pedido.estado_pedido==EstadoPedido.COMPLETADO).count()
-        total_pedidos_cancelado = Pedido.query.filter(Pedido.usuario_id==usuario.id, Pedido.estado_pedido==EstadoPedido.CANCELADO).count()
-        total_pedidos_todos = total_pedidos_en_proceso + total_pedidos_completado + total_pedidos_cancelado
+        # MEJORA PROFESIONAL: Los conteos por estado de las pestañas (que no dependen de los
+        # filtros de búsqueda) salen de una única consulta agrupada, cacheada por usuario.
+        stats = analitica_clientes.estadisticas_pedidos(usuario.id)
+        total_pedidos_en_proceso = stats['en_proceso']
+        total_pedidos_completado = stats['completado']
+        total_pedidos_cancelado = stats['cancelado']
+        total_pedidos_todos = stats['todos']
 
         # --- Paginación ---
-        total_count = query.count()
+        # El total se cuenta siempre en la base de datos: los contadores de `stats` pueden
+        # venir de la caché en memoria de otro momento (o de otro proceso) y solo se usan
+        # para las pestañas.
+        total_count = query.order_by(None).count()
         show_pagination = total_count > 6
         
+        # Solo se piden los IDs de la página; los pedidos se cargan al serializarlos.
+        ids_query = query.with_entities(Pedido.id)
         if not show_pagination:
-            pedidos = query.all()
+            filas = ids_query.all()
+            total_pages = 0
         else:
             per_page = 6
-            pedidos_paginados = query.paginate(page=page, per_page=per_page, error_out=False)
-            pedidos = pedidos_paginados.items
+            filas = ids_query.paginate(page=page, per_page=per_page, error_out=False, count=False).items
+            total_pages = math.ceil(total_count / per_page)
         
         # --- Serialización y Renderizado ---
-        # Se convierten los objetos de pedido a diccionarios para pasarlos a la plantilla.
-        pedidos_dict = []
-        for pedido in pedidos:
-            print(f"Debug: Pedido ID before serialization: {pedido.id}") # Add this line
-            pedidos_dict.append(pedido_detalle_cliente_to_dict(pedido))
+        # MEJORA PROFESIONAL: Los pedidos de la página, sus líneas y sus productos se cargan
+        # en lote (número constante de consultas) en lugar de un `SELECT` por línea.
+        pedidos_dict = pedidos_detalle_cliente_to_dict_list(fila.id for fila in filas)
         
         return render_template('cliente/componentes/mis_pedidos.html', 
                                pedidos=pedidos_dict, 
@@ -148,7 +157,7 @@ def view_orders(usuario):
                                monto_max_actual=monto_max if monto_max != float('inf') else '',
                                show_pagination=show_pagination,
                                current_page=page,
-                               total_pages=pedidos_paginados.pages if show_pagination else 0,
+                               total_pages=total_pages,
                                total_items=total_count,
                                total_pedidos_todos=total_pedidos_todos,
                                total_pedidos_en_proceso=total_pedidos_en_proceso,
@@ -236,32 +245,31 @@ def buscar_pedidos(usuario):
             query = query.order_by(Pedido.created_at.desc())
         
         # Obtener conteos para cada estado de pedido (sin aplicar filtros de búsqueda o paginación)
-        total_pedidos_en_proceso = Pedido.query.filter(Pedido.usuario_id==usuario.id, Pedido.estado==EstadoEnum.ACTIVO.value, Pedido.estado_pedido==EstadoPedido.EN_PROCESO).count()
-        total_pedidos_completado = Pedido.query.filter(Pedido.usuario_id==usuario.id, Pedido.estado_pedido==EstadoPedido.COMPLETADO).count()
-        total_pedidos_cancelado = Pedido.query.filter(Pedido.usuario_id==usuario.id, Pedido.estado_pedido==EstadoPedido.CANCELADO).count()
-        total_pedidos_todos = total_pedidos_en_proceso + total_pedidos_completado + total_pedidos_cancelado
+        stats = analitica_clientes.estadisticas_pedidos(usuario.id)
+        total_pedidos_en_proceso = stats['en_proceso']
+        total_pedidos_completado = stats['completado']
+        total_pedidos_cancelado = stats['cancelado']
+        total_pedidos_todos = stats['todos']
 
         # Obtener el total de resultados para determinar si se necesita paginación
-        total_count = query.count()
+        total_count = query.order_by(None).count()
         
         # Determinar si se debe mostrar paginación (solo si hay más de 6 elementos)
         show_pagination = total_count > 6
         
         # Si no se necesita paginación, obtener todos los resultados
+        ids_query = query.with_entities(Pedido.id)
         if not show_pagination:
-            pedidos = query.all()
+            filas = ids_query.all()
             pages = 1
         else:
-            # Paginar los resultados
-            pedidos_paginados = query.paginate(page=page, per_page=per_page, error_out=False)
-            pedidos = pedidos_paginados.items
-            pages = pedidos_paginados.pages
+            # Paginar los resultados (el total ya se conoce, así que no se repite el COUNT)
+            filas = ids_query.paginate(page=page, per_page=per_page, error_out=False, count=False).items
+            pages = math.ceil(total_count / per_page) if per_page else 1
         
-        # Serializa los resultados a formato JSON para la respuesta de la API.
-        pedidos_dict = []
-        for pedido in pedidos:
-            print(f"Debug: Pedido ID before serialization (API): {pedido.id}") # Add this line
-            pedidos_dict.append(pedido_detalle_cliente_to_dict(pedido))
+        # Serializa los resultados a formato JSON para la respuesta de la API,
+        # cargando en lote las líneas y los productos de toda la página.
+        pedidos_dict = pedidos_detalle_cliente_to_dict_list(fila.id for fila in filas)
         
         return jsonify({
             'success': True,
@@ -296,7 +304,7 @@ def order_detail(usuario, order_id):
     try:
         # Busca el pedido por ID y usuario, sin filtrar por estado para que el cliente
         # pueda ver también sus pedidos completados y cancelados.
-        pedido = Pedido.query.filter_by(
+        pedido = Pedido.query.options(*opciones_pedido_detalle()).filter_by(
             id=str(order_id),
             usuario_id=usuario.id
         ).first()  # Quitamos el filtro por estado='activo'
@@ -332,7 +340,7 @@ def api_pedido_detalle(usuario, order_id):
     de un pedido sin recargar la página.
     """
     try:
-        pedido = Pedido.query.filter_by(
+        pedido = Pedido.query.options(*opciones_pedido_detalle()).filter_by(
             id=str(order_id),
             usuario_id=usuario.id
         ).first()
@@ -499,7 +507,7 @@ def generar_factura_pdf(usuario, order_id):
     Esta vista está diseñada para ser impresa o guardada como PDF desde el navegador.
     """
     try:
-        pedido = Pedido.query.filter_by(
+        pedido = Pedido.query.options(*opciones_pedido_detalle()).filter_by(
             id=str(order_id),
             usuario_id=usuario.id
         ).first()
@@ -572,21 +580,25 @@ def view_compras(usuario):
         # Ordena por defecto con las compras más recientes primero.
         query = query.order_by(Pedido.created_at.desc())
         
-        # Pagina los resultados.
+        # Pagina los resultados. Sin filtros, el total es el contador de pedidos
+        # completados del usuario y se evita el COUNT de la paginación.
         per_page = 6
-        pedidos_paginados = query.paginate(page=page, per_page=per_page, error_out=False)
-        pedidos = pedidos_paginados.items
+        ids_query = query.with_entities(Pedido.id)
+        if search or fecha_desde or fecha_hasta:
+            pedidos_paginados = ids_query.paginate(page=page, per_page=per_page, error_out=False)
+            total_items = pedidos_paginados.total
+        else:
+            pedidos_paginados = ids_query.paginate(page=page, per_page=per_page, error_out=False, count=False)
+            total_items = analitica_clientes.estadisticas_pedidos(usuario.id)['completado']
         
-        # Convertir a diccionarios para la vista
-        pedidos_dict = []
-        for pedido in pedidos:
-            pedidos_dict.append(pedido_detalle_cliente_to_dict(pedido))
+        # Convertir a diccionarios para la vista (carga en lote de líneas y productos)
+        pedidos_dict = pedidos_detalle_cliente_to_dict_list(fila.id for fila in pedidos_paginados.items)
         
         return render_template('cliente/componentes/mis_compras.html', 
                                pedidos=pedidos_dict,
                                current_page=page,
-                               total_pages=pedidos_paginados.pages,
-                               total_items=pedidos_paginados.total)
+                               total_pages=math.ceil(total_items / per_page),
+                               total_items=total_items)
     
     except Exception as e:
         current_app.logger.error(f"Error al cargar compras del usuario {usuario.id}: {str(e)}")
@@ -610,95 +622,40 @@ def estadisticas_compras(usuario):
         fecha_desde = request.args.get('fecha_desde', '')
         fecha_hasta = request.args.get('fecha_hasta', '')
 
-        # Construir la consulta base
-        query = Pedido.query.filter(Pedido.usuario_id == usuario.id)
-        query = query.filter(Pedido.estado_pedido == EstadoPedido.COMPLETADO)
-
-        # Aplicar filtros de fecha si se proporcionan
-        if fecha_desde:
-            fecha_desde_dt = datetime.strptime(fecha_desde, '%Y-%m-%d')
-            query = query.filter(Pedido.created_at >= fecha_desde_dt)
-
-        if fecha_hasta:
-            fecha_hasta_dt = datetime.strptime(fecha_hasta, '%Y-%m-%d') + timedelta(days=1)
-            query = query.filter(Pedido.created_at <= fecha_hasta_dt)
-
-        # Obtener todos los pedidos que cumplen los filtros
-        pedidos = query.all()
-
-        # Función para agrupar por período
-        def agrupar_por_periodo(pedidos, periodo):
-            grupos = {}
-            for pedido in pedidos:
-                fecha = pedido.created_at
-                if periodo == 'mes':
-                    clave = (fecha.year, fecha.month)
-                elif periodo == 'trimestre':
-                    trimestre = (fecha.month - 1) // 3 + 1
-                    clave = (fecha.year, trimestre)
-                else:  # año
-                    clave = fecha.year
-
-                if clave not in grupos:
-                    grupos[clave] = {'total': 0, 'count': 0}
-                grupos[clave]['total'] += pedido.total
-                grupos[clave]['count'] += 1
+        # MEJORA PROFESIONAL: Los totales se agrupan por año y mes en la base de datos
+        # (una consulta cacheada por usuario, ver `app.utils.analitica_clientes`) y se
+        # pliegan en el período pedido, en lugar de traer todos los pedidos a Python.
+        desde = datetime.strptime(fecha_desde, '%Y-%m-%d') if fecha_desde else None
+        hasta = datetime.strptime(fecha_hasta, '%Y-%m-%d') + timedelta(days=1) if fecha_hasta else None
 
-            return grupos
-
-        # Agrupar los pedidos
-        grupos_actuales = agrupar_por_periodo(pedidos, periodo)
+        grupos_actuales = analitica_clientes.agrupar_por_periodo(
+            analitica_clientes.compras_por_mes(usuario.id, desde, hasta), periodo
+        )
 
         # Si se solicita comparar, obtenemos el período anterior
         grupos_anteriores = {}
         if comparar:
-            # Calculamos el rango de fechas para el período anterior
-            if fecha_desde and fecha_hasta:
-                # Si se proporcionaron fechas, calculamos el mismo período del año anterior o el período anterior según la duración
-                fecha_desde_dt = datetime.strptime(fecha_desde, '%Y-%m-%d')
-                fecha_hasta_dt = datetime.strptime(fecha_hasta, '%Y-%m-%d') + timedelta(days=1)
-                duracion = fecha_hasta_dt - fecha_desde_dt
-
-                nueva_fecha_desde = fecha_desde_dt - duracion
-                nueva_fecha_hasta = fecha_desde_dt
-
-                query_anterior = Pedido.query.filter(
-                    Pedido.usuario_id == usuario.id,
-                    Pedido.estado_pedido == EstadoPedido.COMPLETADO,
-                    Pedido.created_at >= nueva_fecha_desde,
-                    Pedido.created_at < nueva_fecha_hasta
-                )
-                pedidos_anteriores = query_anterior.all()
-                grupos_anteriores = agrupar_por_periodo(pedidos_anteriores, periodo)
+            if desde and hasta:
+                # Si se proporcionaron fechas, se compara con el período inmediatamente anterior de igual duración.
+                duracion = hasta - desde
+                desde_anterior, hasta_anterior = desde - duracion, desde
             else:
-                # Si no se proporcionaron fechas, comparamos con el mismo período del año anterior
-                query_anterior = Pedido.query.filter(
-                    Pedido.usuario_id == usuario.id,
-                    Pedido.estado_pedido == EstadoPedido.COMPLETADO
-                )
-
-                # Ajustamos el filtro para el año anterior
+                # Si no se proporcionaron fechas, se compara con el mismo período del año anterior.
                 hoy = datetime.utcnow()
                 if periodo == 'mes':
-                    # Restar un año
-                    query_anterior = query_anterior.filter(
-                        db.extract('year', Pedido.created_at) == hoy.year - 1,
-                        db.extract('month', Pedido.created_at) == hoy.month
-                    )
+                    desde_anterior = datetime(hoy.year - 1, hoy.month, 1)
+                    hasta_anterior = datetime(hoy.year - 1 + hoy.month // 12, hoy.month % 12 + 1, 1)
                 elif periodo == 'trimestre':
-                    trimestre_actual = (hoy.month - 1) // 3 + 1
-                    query_anterior = query_anterior.filter(
-                        db.extract('year', Pedido.created_at) == hoy.year - 1,
-                        db.extract('month', Pedido.created_at) >= (trimestre_actual - 1) * 3 + 1,
-                        db.extract('month', Pedido.created_at) <= trimestre_actual * 3
-                    )
+                    primer_mes = ((hoy.month - 1) // 3) * 3 + 1
+                    desde_anterior = datetime(hoy.year - 1, primer_mes, 1)
+                    hasta_anterior = datetime(hoy.year - 1 + (primer_mes + 2) // 12, (primer_mes + 2) % 12 + 1, 1)
                 else:  # año
-                    query_anterior = query_anterior.filter(
-                        db.extract('year', Pedido.created_at) == hoy.year - 1
-                    )
+                    desde_anterior = datetime(hoy.year - 1, 1, 1)
+                    hasta_anterior = datetime(hoy.year, 1, 1)
 
-                pedidos_anteriores = query_anterior.all()
-                grupos_anteriores = agrupar_por_periodo(pedidos_anteriores, periodo)
+            grupos_anteriores = analitica_clientes.agrupar_por_periodo(
+                analitica_clientes.compras_por_mes(usuario.id, desde_anterior, hasta_anterior), periodo
+            )
 
         # Preparar los datos para la respuesta
         datos_actuales = []
@@ -763,71 +720,24 @@ def categorias_compras(usuario):
         search = request.args.get('search', '')
         fecha_desde = request.args.get('fecha_desde', '')
         fecha_hasta = request.args.get('fecha_hasta', '')
-        per_page = request.args.get('per_page', 1000, type=int)
-        
-        # Construir la consulta base
-        query = Pedido.query.filter_by(
-            usuario_id=usuario.id
-        )
-        
+
+        estado_enum = None
         if estado_pedido != 'todos':
             try:
                 estado_enum = EstadoPedido(estado_pedido)
-                query = query.filter(Pedido.estado_pedido == estado_enum)
             except ValueError:
                 pass # Ignorar si el estado no es válido
-        
-        if search:
-            query = query.filter(Pedido.id.ilike(f'%{search}%'))
-        
-        if fecha_desde:
-            fecha_desde_dt = datetime.strptime(fecha_desde, '%Y-%m-%d')
-            query = query.filter(Pedido.created_at >= fecha_desde_dt)
-        
-        if fecha_hasta:
-            fecha_hasta_dt = datetime.strptime(fecha_hasta, '%Y-%m-%d') + timedelta(days=1)
-            query = query.filter(Pedido.created_at <= fecha_hasta_dt)
-        
-        pedidos = query.all()
-        
-        # Agrega los datos de los productos por categoría principal.
-        categorias_data = {}
-        
-        for pedido in pedidos:
-            pedido_detalle = PedidoProducto.query.filter_by(pedido_id=pedido.id).all()
-            
-            for detalle in pedido_detalle:
-                producto = Productos.query.filter_by(id=detalle.producto_id).first()
-                
-                if producto and producto.seudocategoria:
-                    # Obtener la categoría principal
-                    seudocategoria = producto.seudocategoria
-                    subcategoria = seudocategoria.subcategoria
-                    categoria_principal = subcategoria.categoria_principal
-                    
-                    categoria_nombre = categoria_principal.nombre
-                    
-                    if categoria_nombre not in categorias_data:
-                        categorias_data[categoria_nombre] = {
-                            'total': 0,
-                            'cantidad': 0,
-                            'productos': set()
-                        }
-                    
-                    categorias_data[categoria_nombre]['total'] += detalle.precio_unitario * detalle.cantidad
-                    categorias_data[categoria_nombre]['cantidad'] += detalle.cantidad
-                    categorias_data[categoria_nombre]['productos'].add(producto.id)
-        
-        # Convierte el diccionario agregado a una lista para la respuesta JSON.
-        categorias_lista = []
-        for nombre, data in categorias_data.items():
-            categorias_lista.append({
-                'nombre': nombre,
-                'total': data['total'],
-                'cantidad': data['cantidad'],
-                'productos_count': len(data['productos'])
-            })
-        
+
+        desde = datetime.strptime(fecha_desde, '%Y-%m-%d') if fecha_desde else None
+        hasta = datetime.strptime(fecha_hasta, '%Y-%m-%d') + timedelta(days=1) if fecha_hasta else None
+
+        # MEJORA PROFESIONAL: Una única consulta agrupada por categoría principal (cacheada
+        # por usuario) en lugar de consultar las líneas de cada pedido y el producto y las
+        # categorías de cada línea.
+        categorias_lista = analitica_clientes.categorias_compras(
+            usuario.id, estado_pedido=estado_enum, search=search, desde=desde, hasta=hasta
+        )
+
         return jsonify({
             'success': True,
             'categorias': categorias_lista
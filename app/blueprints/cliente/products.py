@@ -17,45 +17,18 @@ from flask import Blueprint, render_template, request, jsonify, session, current
 from app.models.domains.product_models import Productos, CategoriasPrincipales, Subcategorias, Seudocategorias
 from app.models.domains.review_models import Reseñas, Likes
 from app.models.domains.search_models import BusquedaTermino
-from app.models.serializers import producto_to_dict, categoria_principal_to_dict, subcategoria_to_dict, seudocategoria_to_dict, busqueda_termino_to_dict
+from app.models.serializers import productos_to_dict_list, categoria_principal_to_dict, subcategoria_to_dict, seudocategoria_to_dict, busqueda_termino_to_dict
 from app.extensions import db
-from sqlalchemy import func, and_, case
+from sqlalchemy import func, and_
 from sqlalchemy.orm import joinedload
 from app.models.enums import EstadoEnum
 from app.blueprints.cliente.cart import get_cart_items, get_or_create_cart
 from app.utils.jwt_utils import jwt_required
+from app.utils import facet_index, keyset, product_search, recomendaciones
 from flask_login import current_user
 
 products_bp = Blueprint('products', __name__)
 
-def _build_active_spec_query(spec_expression):
-    """
-    Construye una consulta base para obtener valores de especificaciones de productos activos.
-
-    Esta función auxiliar centraliza la lógica para asegurar que solo se extraigan
-    especificaciones de productos que están completamente visibles para el cliente.
-    Un producto es visible si él y toda su jerarquía de categorías (principal,
-    subcategoría, seudocategoría) están activos y tiene stock.
-
-    Args:
-        spec_expression: La expresión de SQLAlchemy para extraer el valor de la especificación
-                         del campo JSON (ej. func.lower(func.json_extract_path_text(...))).
-
-    Returns:
-        Query: Un objeto de consulta de SQLAlchemy listo para ser filtrado y ejecutado.
-    """
-    return db.session.query(spec_expression).join(
-        Seudocategorias, Productos.seudocategoria_id == Seudocategorias.id
-    ).join(
-        Subcategorias, Seudocategorias.subcategoria_id == Subcategorias.id
-    ).join(
-        CategoriasPrincipales, Subcategorias.categoria_principal_id == CategoriasPrincipales.id
-    ).filter(
-        Productos.estado == EstadoEnum.ACTIVO, Productos._existencia > 0,
-        Seudocategorias.estado == EstadoEnum.ACTIVO, Subcategorias.estado == EstadoEnum.ACTIVO,
-        CategoriasPrincipales.estado == EstadoEnum.ACTIVO, spec_expression.isnot(None)
-    ).distinct()
-
 @products_bp.route('/')
 def index():
     """
@@ -69,68 +42,28 @@ def index():
     Returns:
         Response: La plantilla `index.html` renderizada con los datos de los productos y el carrito.
     """
-    # MEJORA PROFESIONAL: Consulta Unificada y Optimizada
-    # Se combinan las consultas para productos destacados y recomendados en una sola,
-    # reduciendo las llamadas a la base de datos y simplificando la lógica.
-    
+    # MEJORA PROFESIONAL: Muestreo sin ordenar por `random()`.
+    # Antes se cargaban todos los productos de las categorías con `ORDER BY random()`
+    # para quedarse con 12. Ahora se recorren solo los IDs de la categoría, se elige la
+    # muestra con muestreo de reservorio y se cargan únicamente los productos elegidos.
+
     # 1. Definir los nombres de las categorías de interés.
     nombre_cat_destacada = 'insumos para uñas acrilicas'
     nombre_cat_recomendada = 'insumos para uñas acrilicas'
 
-    # 2. Construir una consulta única para obtener todos los productos relevantes.
-    #    - Se usa `joinedload` para cargar eficientemente la jerarquía de categorías y evitar el problema N+1.
-    #    - Se usa `case` para asignar una prioridad de ordenamiento: 1 para destacados, 2 para recomendados.
-    query = db.session.query(Productos).options(
-        joinedload(Productos.seudocategoria)
-        .joinedload(Seudocategorias.subcategoria)
-        .joinedload(Subcategorias.categoria_principal)
-    ).join(
-        Seudocategorias, Productos.seudocategoria_id == Seudocategorias.id
-    ).join(
-        Subcategorias, Seudocategorias.subcategoria_id == Subcategorias.id
-    ).join(
-        CategoriasPrincipales, Subcategorias.categoria_principal_id == CategoriasPrincipales.id
-    ).filter(
-        func.lower(CategoriasPrincipales.nombre).in_([nombre_cat_destacada, nombre_cat_recomendada]),
-        Productos.estado == EstadoEnum.ACTIVO,
-        Productos._existencia > 0,
-        Seudocategorias.estado == EstadoEnum.ACTIVO,
-        Subcategorias.estado == EstadoEnum.ACTIVO,
-        CategoriasPrincipales.estado == EstadoEnum.ACTIVO
-    ).order_by(
-        case(
-            (func.lower(CategoriasPrincipales.nombre) == nombre_cat_destacada, 1),
-            (func.lower(CategoriasPrincipales.nombre) == nombre_cat_recomendada, 2),
-            else_=3
-        ),
-        func.random() # Orden aleatorio dentro de cada grupo
-    )
-
-    # 3. Ejecutar la consulta y separar los productos en sus respectivas listas.
-    all_products = query.all()
-    
-    productos_destacados = []
+    # 2. Elegir las muestras. Cada producto pertenece a un solo grupo: si ambas
+    #    categorías coinciden, todos los productos van a destacados.
+    productos_destacados = recomendaciones.muestra_de_categoria(nombre_cat_destacada, 12)
     productos_recomendados = []
-    
-    # Usamos sets para evitar duplicados y limitar a 12 por categoría.
-    ids_destacados = set()
-    ids_recomendados = set()
-
-    for p in all_products:
-        cat_nombre_lower = p.seudocategoria.subcategoria.categoria_principal.nombre.lower()
-        if cat_nombre_lower == nombre_cat_destacada and len(ids_destacados) < 12 and p.id not in ids_destacados:
-            productos_destacados.append(p)
-            ids_destacados.add(p.id)
-        elif cat_nombre_lower == nombre_cat_recomendada and len(ids_recomendados) < 12 and p.id not in ids_recomendados:
-            productos_recomendados.append(p)
-            ids_recomendados.add(p.id)
-
-    # 4. Serializar los datos para la plantilla.
-    #    El `producto_to_dict` ahora será mucho más rápido gracias al `joinedload`.
-    productos_data = [producto_to_dict(p) for p in productos_destacados]
-    productos_recomendados_data = [producto_to_dict(p) for p in productos_recomendados]
-
-    # 5. Obtener la categoría destacada para el título de la página.
+    if nombre_cat_recomendada != nombre_cat_destacada:
+        productos_recomendados = recomendaciones.muestra_de_categoria(nombre_cat_recomendada, 12)
+
+    # 3. Serializar los datos para la plantilla.
+    #    Las métricas de ventas se cargan en lote para no consultar producto por producto.
+    productos_data = productos_to_dict_list(productos_destacados)
+    productos_recomendados_data = productos_to_dict_list(productos_recomendados)
+
+    # 4. Obtener la categoría destacada para el título de la página.
     categoria_destacada = CategoriasPrincipales.query.filter(func.lower(CategoriasPrincipales.nombre) == nombre_cat_destacada).first()
     categoria_actual_nombre = categoria_destacada.nombre if categoria_destacada else "Destacados"
 
@@ -262,7 +195,7 @@ def productos_por_categoria(slug_categoria):
         .order_by(Productos.nombre.asc())\
         .all()
     
-    productos_data = [producto_to_dict(p) for p in productos]
+    productos_data = productos_to_dict_list(productos)
 
     marcas_obj = db.session.query(Productos.marca).filter(
         Productos.seudocategoria_id.in_(seudocategoria_ids),
@@ -381,7 +314,7 @@ def productos_por_subcategoria(slug_categoria_principal, slug_subcategoria):
             Productos._existencia > 0
         ).order_by(Productos.nombre.asc()).all()
 
-    productos_data = [producto_to_dict(p) for p in productos]
+    productos_data = productos_to_dict_list(productos)
 
     marcas_obj = []
     if seudocategoria_ids:
@@ -573,553 +506,7 @@ def productos_por_seudocategoria(slug_categoria_principal, slug_subcategoria, sl
         resistente_al_agua=resistente_al_agua,
         title=f"{seudocategoria.nombre} - YE & Ci Cosméticos",
     )
-    
-@products_bp.route('/api/filtros/categorias')
-def get_categorias_filtradas():
-    """
-    API: Devuelve las categorías principales disponibles según los filtros aplicados.
-
-    Este endpoint es utilizado por el frontend para actualizar dinámicamente las opciones
-    del filtro de "Categoría Principal" cuando el usuario selecciona otros filtros
-    (como marca, subcategoría, etc.), mostrando solo las opciones relevantes.
-    """
-    try:
-        current_app.logger.info("API: Solicitud recibida en /api/filtros/categorias")
-        marca = request.args.get('marca')
-        subcategoria_nombre = request.args.get('subcategoria')
-        seudocategoria_nombre = request.args.get('seudocategoria')
-
-        query = db.session.query(CategoriasPrincipales).filter(CategoriasPrincipales.estado == EstadoEnum.ACTIVO).distinct()
-
-        needs_join = (marca and marca != 'all') or \
-                     (subcategoria_nombre and subcategoria_nombre != 'all') or \
-                     (seudocategoria_nombre and seudocategoria_nombre != 'all')
-
-        if needs_join:
-            query = query.join(Subcategorias).join(Seudocategorias).join(Productos)
-
-        if marca and marca != 'all':
-            query = query.filter(Productos.marca == marca, Productos.estado == EstadoEnum.ACTIVO, Productos._existencia > 0)
-        if subcategoria_nombre and subcategoria_nombre != 'all':
-            query = query.filter(func.lower(Subcategorias.nombre) == func.lower(subcategoria_nombre))
-        if seudocategoria_nombre and seudocategoria_nombre != 'all':
-            query = query.filter(func.lower(Seudocategorias.nombre) == func.lower(seudocategoria_nombre))
-
-        categorias = query.order_by(CategoriasPrincipales.nombre.asc()).all()
-        return jsonify([categoria_principal_to_dict(c) for c in categorias])
-    except Exception as e:
-        current_app.logger.error(f"Error en get_categorias_filtradas: {str(e)}", exc_info=True)
-        return jsonify({'error': str(e)}), 500
-
-@products_bp.route('/api/filtros/subcategorias')
-def get_subcategorias_filtradas():
-    """
-    API: Devuelve las subcategorías disponibles según los filtros aplicados.
-
-    Similar a `get_categorias_filtradas`, este endpoint actualiza dinámicamente
-    las opciones del filtro de "Subcategoría" basándose en las selecciones
-    actuales del usuario en otros filtros.
-    """
-    try:
-        current_app.logger.info("API: Solicitud recibida en /api/filtros/subcategorias")
-        categoria_principal_nombre = request.args.get('categoria_principal')
-        marca = request.args.get('marca')
-        seudocategoria_nombre = request.args.get('seudocategoria')
 
-        query = db.session.query(Subcategorias).filter(Subcategorias.estado == EstadoEnum.ACTIVO).distinct()
-
-        needs_seudocategorias_join = (marca and marca != 'all') or (seudocategoria_nombre and seudocategoria_nombre != 'all')
-        needs_productos_join = (marca and marca != 'all')
-
-        if categoria_principal_nombre and categoria_principal_nombre != 'all':
-            query = query.join(CategoriasPrincipales)
-            query = query.filter(func.lower(CategoriasPrincipales.nombre) == func.lower(categoria_principal_nombre))
-
-        if needs_seudocategorias_join:
-            query = query.join(Seudocategorias, Subcategorias.id == Seudocategorias.subcategoria_id)
-
-        if needs_productos_join:
-            query = query.join(Productos, Seudocategorias.id == Productos.seudocategoria_id)
-
-        if marca and marca != 'all':
-            query = query.filter(Productos.marca == marca, Productos.estado == EstadoEnum.ACTIVO, Productos._existencia > 0)
-
-        if seudocategoria_nombre and seudocategoria_nombre != 'all':
-            query = query.filter(func.lower(Seudocategorias.nombre) == func.lower(seudocategoria_nombre))
-
-        subcategorias = query.all()
-        return jsonify([subcategoria_to_dict(s) for s in subcategorias])
-    except Exception as e:
-        current_app.logger.error(f"Error en get_subcategorias_filtradas: {str(e)}", exc_info=True)
-        return jsonify({'error': str(e)}), 500
-
-@products_bp.route('/api/filtros/seudocategorias')
-def get_seudocategorias_filtradas():
-    """
-    API: Devuelve las seudocategorías disponibles según los filtros aplicados.
-
-    Endpoint para la actualización dinámica del filtro de "Seudocategoría",
-    mostrando solo las opciones que son relevantes según las selecciones
-    de categoría principal, subcategoría o marca.
-    """
-    try:
-        current_app.logger.info("API: Solicitud recibida en /api/filtros/seudocategorias")
-        categoria_principal_nombre = request.args.get('categoria_principal')
-        subcategoria_nombre = request.args.get('subcategoria')
-        marca = request.args.get('marca')
-
-        query = db.session.query(Seudocategorias).filter(Seudocategorias.estado == EstadoEnum.ACTIVO).distinct()
-
-        if (categoria_principal_nombre and categoria_principal_nombre != 'all') or \
-           (subcategoria_nombre and subcategoria_nombre != 'all'):
-            query = query.join(Subcategorias, Seudocategorias.subcategoria_id == Subcategorias.id)
-            query = query.join(CategoriasPrincipales, Subcategorias.categoria_principal_id == CategoriasPrincipales.id)
-
-        if marca and marca != 'all':
-            query = query.join(Productos, Seudocategorias.id == Productos.seudocategoria_id)
-
-        if categoria_principal_nombre and categoria_principal_nombre != 'all':
-            query = query.filter(func.lower(CategoriasPrincipales.nombre) == func.lower(categoria_principal_nombre))
-
-        if subcategoria_nombre and subcategoria_nombre != 'all':
-            query = query.filter(func.lower(Subcategorias.nombre) == func.lower(subcategoria_nombre))
-
-        if marca and marca != 'all':
-            query = query.filter(Productos.marca == marca, Productos.estado == EstadoEnum.ACTIVO, Productos._existencia > 0)
-
-        seudocategorias = query.all()
-        return jsonify([seudocategoria_to_dict(s) for s in seudocategorias])
-    except Exception as e:
-        current_app.logger.error(f"Error en get_seudocategorias_filtradas: {str(e)}", exc_info=True)
-        return jsonify({'error': str(e)}), 500
-
-@products_bp.route('/api/filtros/marcas')
-def get_marcas_filtradas():
-    """
-    API: Devuelve las marcas disponibles según los filtros aplicados.
-
-    Endpoint para la actualización dinámica del filtro de "Marca", mostrando solo
-    las marcas que tienen productos dentro de las categorías seleccionadas
-    por el usuario.
-    """
-    try:
-        current_app.logger.info("API: Solicitud recibida en /api/filtros/marcas")
-        categoria_principal_nombre = request.args.get('categoria_principal')
-        subcategoria_nombre = request.args.get('subcategoria')
-        seudocategoria_nombre = request.args.get('seudocategoria')
-        ingrediente_clave = request.args.get('ingrediente_clave')
-        resistente_al_agua = request.args.get('resistente_al_agua')
-
-        query = db.session.query(Productos.marca).filter(
-            Productos.estado == EstadoEnum.ACTIVO,
-            Productos._existencia > 0,
-            Productos.marca.isnot(None),
-            Productos.marca != ''
-        ).distinct()
-
-        if (categoria_principal_nombre and categoria_principal_nombre != 'all') or \
-           (subcategoria_nombre and subcategoria_nombre != 'all') or \
-           (seudocategoria_nombre and seudocategoria_nombre != 'all') or \
-           (ingrediente_clave and ingrediente_clave != 'all') or \
-           (resistente_al_agua and resistente_al_agua != 'all'):
-            query = query.join(Seudocategorias, Productos.seudocategoria_id == Seudocategorias.id)
-            query = query.join(Subcategorias, Seudocategorias.subcategoria_id == Subcategorias.id)
-            query = query.join(CategoriasPrincipales, Subcategorias.categoria_principal_id == CategoriasPrincipales.id)
-
-        if categoria_principal_nombre and categoria_principal_nombre != 'all':
-            query = query.filter(func.lower(CategoriasPrincipales.nombre) == func.lower(categoria_principal_nombre))
-
-        if subcategoria_nombre and subcategoria_nombre != 'all':
-            query = query.filter(func.lower(Subcategorias.nombre) == func.lower(subcategoria_nombre))
-
-        if seudocategoria_nombre and seudocategoria_nombre != 'all':
-            query = query.filter(func.lower(Seudocategorias.nombre) == func.lower(seudocategoria_nombre))
-
-        if ingrediente_clave and ingrediente_clave != 'all':
-            ingrediente_expression = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Ingrediente Clave'))
-            query = query.filter(ingrediente_expression == func.lower(ingrediente_clave))
-        
-        if resistente_al_agua and resistente_al_agua != 'all':
-            resistente_expression = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Resistente al agua'))
-            query = query.filter(resistente_expression == func.lower(resistente_al_agua))
-
-        marcas = [row[0] for row in query.order_by(Productos.marca.asc()).all() if row[0]]
-        return jsonify(marcas)
-    except Exception as e:
-        current_app.logger.error(f"Error en get_marcas_filtradas: {str(e)}", exc_info=True)
-        return jsonify({'error': str(e)}), 500
-
-@products_bp.route('/api/filtros/colores')
-def get_colores_filtrados():
-    """
-    API: Devuelve los colores disponibles según los filtros aplicados.
-    Utiliza COALESCE para buscar en las claves 'Color' o 'Tono'.
-    """
-    try:
-        current_app.logger.info("API: Solicitud recibida en /api/filtros/colores")
-        categoria_principal_nombre = request.args.get('categoria_principal')
-        subcategoria_nombre = request.args.get('subcategoria')
-        seudocategoria_nombre = request.args.get('seudocategoria')
-        marca = request.args.get('marca')
-        genero = request.args.get('genero')
-        funcion = request.args.get('funcion')
-        tono = request.args.get('tono')
-        ingrediente_clave = request.args.get('ingrediente_clave')
-        resistente_al_agua = request.args.get('resistente_al_agua')
-
-        color_expression = func.lower(func.coalesce(func.json_extract_path_text(Productos.especificaciones, 'Color'), func.json_extract_path_text(Productos.especificaciones, 'Tono')))
-        
-        # Usar la función auxiliar para construir la consulta base.
-        query = _build_active_spec_query(color_expression)
-
-        if categoria_principal_nombre and categoria_principal_nombre != 'all':
-            query = query.filter(func.lower(CategoriasPrincipales.nombre) == func.lower(categoria_principal_nombre))
-        if subcategoria_nombre and subcategoria_nombre != 'all':
-            query = query.filter(func.lower(Subcategorias.nombre) == func.lower(subcategoria_nombre))
-        if seudocategoria_nombre and seudocategoria_nombre != 'all':
-            query = query.filter(func.lower(Seudocategorias.nombre) == func.lower(seudocategoria_nombre))
-        if marca and marca != 'all':
-            query = query.filter(func.lower(Productos.marca) == func.lower(marca))
-        if genero and genero != 'all':
-            genero_expression_filter = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Genero'))
-            query = query.filter(genero_expression_filter == func.lower(genero))
-        if tono and tono != 'all':
-            tono_expression_filter = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Tono'))
-            query = query.filter(tono_expression_filter == func.lower(tono))
-
-        colores_obj = query.order_by(color_expression).all()
-        colores = [row[0] for row in colores_obj if row[0]]
-        return jsonify(colores)
-    except Exception as e:
-        current_app.logger.error(f"Error en get_colores_filtrados: {str(e)}", exc_info=True)
-        return jsonify({'error': str(e)}), 500
-
-@products_bp.route('/api/filtros/generos')
-def get_generos_filtrados():
-    """
-    API: Devuelve los géneros disponibles según los filtros aplicados.
-
-    Este endpoint es utilizado por el frontend para actualizar dinámicamente las opciones
-    del filtro de "Género", mostrando solo las opciones relevantes.
-    """
-    try:
-        current_app.logger.info("API: Solicitud recibida en /api/filtros/generos")
-        categoria_principal_nombre = request.args.get('categoria_principal')
-        subcategoria_nombre = request.args.get('subcategoria')
-        seudocategoria_nombre = request.args.get('seudocategoria')
-        marca = request.args.get('marca')
-        color = request.args.get('color')
-        tono = request.args.get('tono')
-        ingrediente_clave = request.args.get('ingrediente_clave')
-        resistente_al_agua = request.args.get('resistente_al_agua')
-
-        # LOG DE DEPURACIÓN: Mostrar los filtros recibidos por la API de géneros.
-        current_app.logger.info(f"[API /api/filtros/generos] Filtros recibidos: categoria='{categoria_principal_nombre}', "
-                                f"subcategoria='{subcategoria_nombre}', seudocategoria='{seudocategoria_nombre}', "
-                                f"marca='{marca}'")
-
-        # MEJORA PROFESIONAL: Usar json_extract_path_text para ser insensible a mayúsculas en la clave 'Genero'.
-        genero_expression = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Genero'))
-
-        # Usar la función auxiliar para construir la consulta base.
-        query = _build_active_spec_query(genero_expression)
-        
-        if categoria_principal_nombre and categoria_principal_nombre != 'all':
-            query = query.filter(func.lower(CategoriasPrincipales.nombre) == func.lower(categoria_principal_nombre))
-        if subcategoria_nombre and subcategoria_nombre != 'all':
-            query = query.filter(func.lower(Subcategorias.nombre) == func.lower(subcategoria_nombre))
-        if seudocategoria_nombre and seudocategoria_nombre != 'all':
-            query = query.filter(func.lower(Seudocategorias.nombre) == func.lower(seudocategoria_nombre))
-        if marca and marca != 'all':
-            query = query.filter(func.lower(Productos.marca) == func.lower(marca))
-        if color and color != 'all':
-            color_expression_filter = func.lower(func.coalesce(func.json_extract_path_text(Productos.especificaciones, 'Color'), func.json_extract_path_text(Productos.especificaciones, 'Tono')))
-            query = query.filter(color_expression_filter == func.lower(color))
-        if tono and tono != 'all':
-            tono_expression_filter = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Tono'))
-            query = query.filter(tono_expression_filter == func.lower(tono))
-        
-        if ingrediente_clave and ingrediente_clave != 'all':
-            ingrediente_expression = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Ingrediente Clave'))
-            query = query.filter(ingrediente_expression == func.lower(ingrediente_clave))
-        
-        if resistente_al_agua and resistente_al_agua != 'all':
-            resistente_expression = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Resistente al agua'))
-            query = query.filter(resistente_expression == func.lower(resistente_al_agua))
-
-        generos_obj = query.order_by(genero_expression).all()
-        generos = [row[0] for row in generos_obj if row[0]]
-
-        # LOG DE DEPURACIÓN: Mostrar los géneros encontrados por la consulta.
-        current_app.logger.info(f"[API /api/filtros/generos] Géneros encontrados (crudo): {generos_obj}")
-        current_app.logger.info(f"[API /api/filtros/generos] Lista de géneros a enviar: {generos}")
-
-        return jsonify(generos)
-    except Exception as e:
-        current_app.logger.error(f"Error en get_generos_filtrados: {str(e)}", exc_info=True)
-        return jsonify({'error': str(e)}), 500
-    
-@products_bp.route('/api/filtros/funciones')
-def get_funciones_filtradas():
-    """
-    API: Devuelve las funciones disponibles según los filtros aplicados.
-
-    Endpoint para la actualización dinámica del filtro de "Función", mostrando solo
-    las opciones relevantes según las selecciones de categoría, marca, etc.
-    """
-    try:
-        current_app.logger.info("API: Solicitud recibida en /api/filtros/funciones")
-        categoria_principal_nombre = request.args.get('categoria_principal')
-        subcategoria_nombre = request.args.get('subcategoria')
-        seudocategoria_nombre = request.args.get('seudocategoria')
-        marca = request.args.get('marca')
-        genero = request.args.get('genero')
-        color = request.args.get('color')
-        tono = request.args.get('tono')
-        ingrediente_clave = request.args.get('ingrediente_clave')
-        resistente_al_agua = request.args.get('resistente_al_agua')
-
-        # Usar json_extract_path_text para ser insensible a mayúsculas en la clave 'Funcion'.
-        funcion_expression = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Funcion'))
-
-        # Usar la función auxiliar para construir la consulta base.
-        query = _build_active_spec_query(funcion_expression)
-        
-        if categoria_principal_nombre and categoria_principal_nombre != 'all':
-            query = query.filter(func.lower(CategoriasPrincipales.nombre) == func.lower(categoria_principal_nombre))
-        if subcategoria_nombre and subcategoria_nombre != 'all':
-            query = query.filter(func.lower(Subcategorias.nombre) == func.lower(subcategoria_nombre))
-        if seudocategoria_nombre and seudocategoria_nombre != 'all':
-            query = query.filter(func.lower(Seudocategorias.nombre) == func.lower(seudocategoria_nombre))
-        if marca and marca != 'all':
-            query = query.filter(func.lower(Productos.marca) == func.lower(marca))
-        if color and color != 'all':
-            color_expression_filter = func.lower(func.coalesce(func.json_extract_path_text(Productos.especificaciones, 'Color'), func.json_extract_path_text(Productos.especificaciones, 'Tono')))
-            query = query.filter(color_expression_filter == func.lower(color))
-        if tono and tono != 'all':
-            tono_expression_filter = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Tono'))
-            query = query.filter(tono_expression_filter == func.lower(tono))
-        
-        if resistente_al_agua and resistente_al_agua != 'all':
-            resistente_expression = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Resistente al agua'))
-            query = query.filter(resistente_expression == func.lower(resistente_al_agua))
-
-        funciones_obj = query.order_by(funcion_expression).all()
-        funciones = [row[0] for row in funciones_obj if row[0]]
-        return jsonify(funciones)
-    except Exception as e:
-        current_app.logger.error(f"Error en get_funciones_filtradas: {str(e)}", exc_info=True)
-        return jsonify({'error': str(e)}), 500
-
-@products_bp.route('/api/filtros/ingredientes_clave')
-def get_ingredientes_clave_filtrados():
-    """
-    API: Devuelve los ingredientes clave disponibles según los filtros aplicados.
-
-    Endpoint para la actualización dinámica del filtro de "Ingrediente Clave".
-    """
-    try:
-        current_app.logger.info("API: Solicitud recibida en /api/filtros/ingredientes_clave")
-        categoria_principal_nombre = request.args.get('categoria_principal')
-        subcategoria_nombre = request.args.get('subcategoria')
-        seudocategoria_nombre = request.args.get('seudocategoria')
-        marca = request.args.get('marca')
-        genero = request.args.get('genero')
-        funcion = request.args.get('funcion')
-        color = request.args.get('color')
-        tono = request.args.get('tono')
-        resistente_al_agua = request.args.get('resistente_al_agua')
-
-        ingrediente_expression = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Ingrediente Clave'))
-
-        # Usar la función auxiliar para construir la consulta base.
-        query = _build_active_spec_query(ingrediente_expression)
-        
-        if categoria_principal_nombre and categoria_principal_nombre != 'all':
-            query = query.filter(func.lower(CategoriasPrincipales.nombre) == func.lower(categoria_principal_nombre))
-        if subcategoria_nombre and subcategoria_nombre != 'all':
-            query = query.filter(func.lower(Subcategorias.nombre) == func.lower(subcategoria_nombre))
-        if seudocategoria_nombre and seudocategoria_nombre != 'all':
-            query = query.filter(func.lower(Seudocategorias.nombre) == func.lower(seudocategoria_nombre))
-        if marca and marca != 'all':
-            query = query.filter(func.lower(Productos.marca) == func.lower(marca))
-        if genero and genero != 'all':
-            genero_expression_filter = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Genero'))
-            query = query.filter(genero_expression_filter == func.lower(genero))
-        if funcion and funcion != 'all':
-            funcion_expression_filter = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Funcion'))
-            query = query.filter(funcion_expression_filter == func.lower(funcion))
-        if color and color != 'all':
-            color_expression_filter = func.lower(func.coalesce(func.json_extract_path_text(Productos.especificaciones, 'Color'), func.json_extract_path_text(Productos.especificaciones, 'Tono')))
-            query = query.filter(color_expression_filter == func.lower(color))
-        if tono and tono != 'all':
-            tono_expression_filter = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Tono'))
-            query = query.filter(tono_expression_filter == func.lower(tono))
-        
-        if resistente_al_agua and resistente_al_agua != 'all':
-            resistente_expression = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Resistente al agua'))
-            query = query.filter(resistente_expression == func.lower(resistente_al_agua))
-
-        ingredientes_obj = query.order_by(ingrediente_expression).all()
-        ingredientes = [row[0] for row in ingredientes_obj if row[0]]
-        
-        current_app.logger.info(f"[API /api/filtros/ingredientes_clave] Ingredientes encontrados: {ingredientes}")
-
-        return jsonify(ingredientes)
-    except Exception as e:
-        current_app.logger.error(f"Error en get_ingredientes_clave_filtrados: {str(e)}", exc_info=True)
-        return jsonify({'error': str(e)}), 500
-
-@products_bp.route('/api/filtros/resistente_al_agua')
-def get_resistente_al_agua_filtrados():
-    """
-    API: Devuelve las opciones de "Resistente al agua" disponibles según los filtros.
-    """
-    try:
-        current_app.logger.info("API: Solicitud recibida en /api/filtros/resistente_al_agua")
-        categoria_principal_nombre = request.args.get('categoria_principal')
-        subcategoria_nombre = request.args.get('subcategoria')
-        seudocategoria_nombre = request.args.get('seudocategoria')
-        marca = request.args.get('marca')
-        genero = request.args.get('genero')
-        funcion = request.args.get('funcion')
-        color = request.args.get('color')
-        tono = request.args.get('tono')
-        ingrediente_clave = request.args.get('ingrediente_clave')
-
-        resistente_expression = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Resistente al agua'))
-
-        # Usar la función auxiliar para construir la consulta base.
-        query = _build_active_spec_query(resistente_expression)
-        
-        if categoria_principal_nombre and categoria_principal_nombre != 'all':
-            query = query.filter(func.lower(CategoriasPrincipales.nombre) == func.lower(categoria_principal_nombre))
-        if subcategoria_nombre and subcategoria_nombre != 'all':
-            query = query.filter(func.lower(Subcategorias.nombre) == func.lower(subcategoria_nombre))
-        if seudocategoria_nombre and seudocategoria_nombre != 'all':
-            query = query.filter(func.lower(Seudocategorias.nombre) == func.lower(seudocategoria_nombre))
-        if marca and marca != 'all':
-            query = query.filter(func.lower(Productos.marca) == func.lower(marca))
-        if genero and genero != 'all':
-            genero_expression_filter = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Genero'))
-            query = query.filter(genero_expression_filter == func.lower(genero))
-        if funcion and funcion != 'all':
-            funcion_expression_filter = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Funcion'))
-            query = query.filter(funcion_expression_filter == func.lower(funcion))
-        if color and color != 'all':
-            color_expression_filter = func.lower(func.coalesce(func.json_extract_path_text(Productos.especificaciones, 'Color'), func.json_extract_path_text(Productos.especificaciones, 'Tono')))
-            query = query.filter(color_expression_filter == func.lower(color))
-        if tono and tono != 'all':
-            tono_expression_filter = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Tono'))
-            query = query.filter(tono_expression_filter == func.lower(tono))
-        if ingrediente_clave and ingrediente_clave != 'all':
-            ingrediente_expression_filter = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Ingrediente Clave'))
-            query = query.filter(ingrediente_expression_filter == func.lower(ingrediente_clave))
-
-        resistente_obj = query.order_by(resistente_expression).all()
-        opciones = [row[0] for row in resistente_obj if row[0]]
-        
-        current_app.logger.info(f"[API /api/filtros/resistente_al_agua] Opciones encontradas: {opciones}")
-
-        return jsonify(opciones)
-    except Exception as e:
-        current_app.logger.error(f"Error en get_resistente_al_agua_filtrados: {str(e)}", exc_info=True)
-        return jsonify({'error': str(e)}), 500
-
-@products_bp.route('/api/filtros/tonos')
-def get_tonos_filtrados():
-    """
-    API: Devuelve los tonos disponibles según los filtros aplicados.
-    """
-    try:
-        current_app.logger.info("API: Solicitud recibida en /api/filtros/tonos")
-        categoria_principal_nombre = request.args.get('categoria_principal')
-        subcategoria_nombre = request.args.get('subcategoria')
-        seudocategoria_nombre = request.args.get('seudocategoria')
-        marca = request.args.get('marca')
-        genero = request.args.get('genero')
-        funcion = request.args.get('funcion')
-        color = request.args.get('color')
-        ingrediente_clave = request.args.get('ingrediente_clave')
-        resistente_al_agua = request.args.get('resistente_al_agua')
-
-        tono_expression = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Tono'))
-
-        # Usar la función auxiliar para construir la consulta base.
-        query = _build_active_spec_query(tono_expression)
-        
-        if categoria_principal_nombre and categoria_principal_nombre != 'all':
-            query = query.filter(func.lower(CategoriasPrincipales.nombre) == func.lower(categoria_principal_nombre))
-        if subcategoria_nombre and subcategoria_nombre != 'all':
-            query = query.filter(func.lower(Subcategorias.nombre) == func.lower(subcategoria_nombre))
-        if seudocategoria_nombre and seudocategoria_nombre != 'all':
-            query = query.filter(func.lower(Seudocategorias.nombre) == func.lower(seudocategoria_nombre))
-        if marca and marca != 'all':
-            query = query.filter(func.lower(Productos.marca) == func.lower(marca))
-        if genero and genero != 'all':
-            genero_expression_filter = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Genero'))
-            query = query.filter(genero_expression_filter == func.lower(genero))
-        if color and color != 'all':
-            color_expression_filter = func.lower(func.coalesce(func.json_extract_path_text(Productos.especificaciones, 'Color'), func.json_extract_path_text(Productos.especificaciones, 'Tono')))
-            query = query.filter(color_expression_filter == func.lower(color))
-
-        tonos_obj = query.order_by(tono_expression).all()
-        tonos = [row[0] for row in tonos_obj if row[0]]
-        return jsonify(tonos)
-    except Exception as e:
-        current_app.logger.error(f"Error en get_tonos_filtrados: {str(e)}", exc_info=True)
-        return jsonify({'error': str(e)}), 500
-
-@products_bp.route('/api/filtros/contenidos')
-def get_contenidos_filtrados():
-    """
-    API: Devuelve los contenidos disponibles según los filtros aplicados.
-    """
-    try:
-        current_app.logger.info("API: Solicitud recibida en /api/filtros/contenidos")
-        categoria_principal_nombre = request.args.get('categoria_principal')
-        subcategoria_nombre = request.args.get('subcategoria')
-        seudocategoria_nombre = request.args.get('seudocategoria')
-        marca = request.args.get('marca')
-        genero = request.args.get('genero')
-        funcion = request.args.get('funcion')
-        color = request.args.get('color')
-        tono = request.args.get('tono')
-        ingrediente_clave = request.args.get('ingrediente_clave')
-        resistente_al_agua = request.args.get('resistente_al_agua')
-
-        contenido_expression = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Contenido'))
-
-        # Usar la función auxiliar para construir la consulta base.
-        query = _build_active_spec_query(contenido_expression)
-        
-        if categoria_principal_nombre and categoria_principal_nombre != 'all':
-            query = query.filter(func.lower(CategoriasPrincipales.nombre) == func.lower(categoria_principal_nombre))
-        if subcategoria_nombre and subcategoria_nombre != 'all':
-            query = query.filter(func.lower(Subcategorias.nombre) == func.lower(subcategoria_nombre))
-        if seudocategoria_nombre and seudocategoria_nombre != 'all':
-            query = query.filter(func.lower(Seudocategorias.nombre) == func.lower(seudocategoria_nombre))
-        if marca and marca != 'all':
-            query = query.filter(func.lower(Productos.marca) == func.lower(marca))
-        if genero and genero != 'all':
-            genero_expression_filter = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Genero'))
-            query = query.filter(genero_expression_filter == func.lower(genero))
-        if color and color != 'all':
-            color_expression_filter = func.lower(func.coalesce(func.json_extract_path_text(Productos.especificaciones, 'Color'), func.json_extract_path_text(Productos.especificaciones, 'Tono')))
-            query = query.filter(color_expression_filter == func.lower(color))
-        if tono and tono != 'all':
-            tono_expression_filter = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Tono'))
-            query = query.filter(tono_expression_filter == func.lower(tono))
-        if funcion and funcion != 'all':
-            funcion_expression_filter = func.lower(func.json_extract_path_text(Productos.especificaciones, 'Funcion'))
-            query = query.filter(funcion_expression_filter == func.lower(funcion))
-
-        contenidos_obj = query.order_by(contenido_expression).all()
-        contenidos = [row[0] for row in contenidos_obj if row[0]]
-        return jsonify(contenidos)
-    except Exception as e:
-        current_app.logger.error(f"Error en get_contenidos_filtrados: {str(e)}", exc_info=True)
-        return jsonify({'error': str(e)}), 500
 
 @products_bp.route('/<slug_categoria_principal>/<slug_subcategoria>/<slug_seudocategoria>/<slug_producto>')
 def producto_detalle(slug_categoria_principal, slug_subcategoria, slug_seudocategoria, slug_producto):
@@ -1165,44 +552,16 @@ def producto_detalle(slug_categoria_principal, slug_subcategoria, slug_seudocate
         from flask import abort
         abort(404)
     
-    # --- MEJORA PROFESIONAL: Lógica de Productos Relacionados más Relevante ---
-    # 1. Prioridad: Productos de la misma Seudocategoría.
-    productos_relacionados = []
-    if producto.seudocategoria_id:
-        print(f"DEBUG: Buscando productos relacionados para seudocategoria_id: {producto.seudocategoria_id}")
-        productos_relacionados = Productos.query.filter(
-            Productos.seudocategoria_id == producto.seudocategoria_id,
-            Productos.id != producto.id,
-            Productos.estado == EstadoEnum.ACTIVO,
-            Productos._existencia > 0
-        ).order_by(func.random()).limit(8).all()
-
-    # 2. Fallback: Si no hay suficientes, buscar en la misma Subcategoría.
-    if len(productos_relacionados) < 4 and producto.seudocategoria and producto.seudocategoria.subcategoria:
-        print(f"DEBUG: No hay suficientes productos en la seudocategoría. Buscando en la subcategoría: {producto.seudocategoria.subcategoria.id}")
-        
-        # Obtener IDs de todas las seudocategorías de la misma subcategoría.
-        seudocategoria_ids_sub = [s.id for s in producto.seudocategoria.subcategoria.seudocategorias if s.estado == EstadoEnum.ACTIVO]
-        
-        # Obtener IDs de productos ya encontrados para no repetirlos.
-        productos_relacionados_ids = [p.id for p in productos_relacionados]
-        
-        # Buscar productos adicionales.
-        productos_adicionales = Productos.query.filter(
-            Productos.seudocategoria_id.in_(seudocategoria_ids_sub),
-            Productos.id != producto.id,
-            Productos.id.notin_(productos_relacionados_ids),
-            Productos.estado == EstadoEnum.ACTIVO,
-            Productos._existencia > 0
-        ).order_by(func.random()).limit(8 - len(productos_relacionados)).all()
-        
-        productos_relacionados.extend(productos_adicionales)
-
+    # --- MEJORA PROFESIONAL: Productos Relacionados Precalculados ---
+    # La lista de relacionados (compras y likes conjuntos, misma seudocategoría o
+    # subcategoría) se precalcula en segundo plano; aquí solo se lee por clave primaria
+    # y se elige una muestra con stock, sin `ORDER BY random()`.
+    productos_relacionados = recomendaciones.productos_relacionados(producto, k=8)
     print(f"DEBUG: Productos relacionados para {producto.nombre}: {len(productos_relacionados)} productos encontrados.")
     for p in productos_relacionados:
         print(f"  - {p.nombre} (ID: {p.id})")
     
-    productos_relacionados_data = [producto_to_dict(p) for p in productos_relacionados]
+    productos_relacionados_data = productos_to_dict_list(productos_relacionados)
     print(f"DEBUG: productos_relacionados_data (después de to_dict): {len(productos_relacionados_data)} elementos.")
     if productos_relacionados_data:
         print(f"DEBUG: Primer elemento de productos_relacionados_data: {productos_relacionados_data[0]}")
@@ -1273,8 +632,9 @@ def buscar():
     """
     API: Realiza una búsqueda de productos en tiempo real.
 
-    Busca productos por nombre, marca o descripción. Prioriza los resultados que
-    coinciden con el inicio del nombre o la marca. También devuelve una lista de
+    Busca productos por nombre, marca, descripción o categoría y los ordena por
+    relevancia (las coincidencias en el nombre pesan más que en la marca o la
+    descripción). Tolera errores de escritura. También devuelve una lista de
     los términos de búsqueda más populares como sugerencias.
 
     Query Params:
@@ -1302,28 +662,14 @@ def buscar():
         }), 400
 
     try:
-        productos = Productos.query.filter(
-            db.or_(
-                Productos.nombre.ilike(f'{query}%'),
-                Productos.marca.ilike(f'{query}%'),
-                Productos.descripcion.ilike(f'{query}%')
-            ),
-            Productos.estado == EstadoEnum.ACTIVO,
-            Productos._existencia  > 0
-        ).order_by(
-            # Prioriza las coincidencias que empiezan con el término de búsqueda.
-            db.case(
-                (Productos.nombre.ilike(f'{query}%'), 1),
-                (Productos.marca.ilike(f'{query}%'), 2),
-                else_=3
-            ),
-            Productos.nombre.asc()
-        ).limit(12).all()
+        # MEJORA PROFESIONAL: Búsqueda de texto completo con ranking por relevancia y
+        # tolerancia a errores de escritura (ver `app.utils.product_search`).
+        productos = product_search.buscar_productos(query, limite=12)
 
         sugerencias = BusquedaTermino.top_terminos(10)
 
         return jsonify({
-            'resultados': [producto_to_dict(p) for p in productos],
+            'resultados': productos_to_dict_list(productos),
             'sugerencias': [s.termino for s in sugerencias],
             'total': len(productos),
             'query': query
@@ -1430,6 +776,53 @@ def _extraer_terminos_de_producto(product_id, query):
                 
     return terminos
 
+# Criterios de orden de los listados de productos: `ordenar_por` -> (columna, descendente).
+# La calificación se normaliza con COALESCE para que la comparación keyset nunca vea NULL.
+_ORDENES_PRODUCTOS = {
+    'price_asc': (Productos.precio, False),
+    'price_desc': (Productos.precio, True),
+    'top_rated': (func.coalesce(Productos.calificacion_promedio_almacenada, 0.0), True),
+    'az': (Productos.nombre, False),
+    'za': (Productos.nombre, True),
+}
+_ORDEN_PRODUCTOS_POR_DEFECTO = 'az'
+
+
+def _responder_productos(query, sort_by):
+    """
+    Ordena, pagina y serializa un listado de productos.
+
+    Siempre se devuelve una sola página ordenada por `(columna de orden, id)` mediante
+    paginación keyset (`app.utils.keyset`). Sin `limit` se usa `keyset.DEFAULT_LIMIT`,
+    y el `limit` enviado se acota a `keyset.MAX_LIMIT`, de modo que ninguna petición
+    descarga el catálogo completo. `next_cursor` es `None` en la última página.
+
+    Args:
+        query (Query): La consulta de productos ya filtrada, sin `order_by`.
+        sort_by (str): El criterio de orden (`ordenar_por`).
+
+    Returns:
+        Response: La respuesta JSON.
+    """
+    if sort_by not in _ORDENES_PRODUCTOS:
+        sort_by = _ORDEN_PRODUCTOS_POR_DEFECTO
+    columna, descendente = _ORDENES_PRODUCTOS[sort_by]
+
+    limit = keyset.leer_limite(request.args.get('limit', type=int))
+    try:
+        productos, next_cursor = keyset.paginar_keyset(
+            query, columna, Productos.id, sort_by, descendente, limit, request.args.get('cursor')
+        )
+    except keyset.CursorInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    return jsonify({
+        'success': True,
+        'productos': productos_to_dict_list(productos),
+        'next_cursor': next_cursor,
+        'limit': limit
+    })
+
 @products_bp.route('/api/productos/filtrar')
 def filter_products():
     """
@@ -1438,9 +831,11 @@ def filter_products():
     Este es el endpoint principal para el filtrado dinámico de productos en la página
     de catálogo. Acepta una variedad de parámetros de consulta para filtrar por
     jerarquía de categorías, marca, rango de precios y para ordenar los resultados.
+    La respuesta se pagina por cursor con `limit` y `cursor` (ver `_responder_productos`).
 
     Returns:
-        JSON: Una lista de objetos de producto que coinciden con los filtros.
+        JSON: `{'success', 'productos', 'next_cursor', 'limit'}` con la página de productos
+              que coinciden con los filtros.
     """
     main_category_name = request.args.get('categoria_principal')
     subcategory_name = request.args.get('subcategoria')
@@ -1534,21 +929,70 @@ def filter_products():
         except ValueError:
             pass  
 
-    if sort_by == 'price_asc':
-        query = query.order_by(Productos.precio.asc())
-    elif sort_by == 'price_desc':
-        query = query.order_by(Productos.precio.desc())
-    elif sort_by == 'top_rated':
-        query = query.order_by(Productos.calificacion_promedio_almacenada.desc())
-    elif sort_by == 'az':
-        query = query.order_by(Productos.nombre.asc())
-    elif sort_by == 'za':
-        query = query.order_by(Productos.nombre.desc())
-    else:
-        query = query.order_by(Productos.nombre.asc())
-
-    productos = query.all()
-    return jsonify([producto_to_dict(p) for p in productos])
+    return _responder_productos(query, sort_by)
+
+@products_bp.route('/api/productos/buscar-facetado')
+def buscar_facetado():
+    """
+    API: Búsqueda facetada del catálogo en una sola llamada.
+
+    Devuelve en una misma respuesta la página de productos filtrados, los conteos de
+    cada faceta (marca y especificaciones), los conteos por categoría y el rango de
+    precios. Sustituye a la ráfaga de peticiones que la barra lateral hacía tras cada
+    clic (`/api/filtros/*`, `/api/productos/precios_rango` y `/api/productos/filtrar`).
+
+    Todo se calcula en una sola pasada sobre el índice de facetas en memoria; la base
+    de datos solo se consulta para cargar los productos de la página solicitada.
+
+    Query Params:
+        - Filtros: los mismos que `/api/productos/filtrar` (categorías, marca, especificaciones).
+        - min_price / max_price (float, opcional): Rango de precios.
+        - ordenar_por (str, opcional): 'price_asc', 'price_desc', 'top_rated', 'az', 'za' o 'featured'.
+        - page (int, opcional): Página solicitada. Default: 1.
+        - per_page (int, opcional): Productos por página. Default: 24, máximo 60.
+
+    Returns:
+        JSON: `{'success', 'productos', 'pagination', 'facetas', 'categorias', 'rango_precios'}`.
+    """
+    try:
+        filtros = facet_index.filtros_desde_args(request.args)
+        min_precio = request.args.get('min_price', type=float)
+        max_precio = request.args.get('max_price', type=float)
+        sort_by = request.args.get('ordenar_por', 'featured')
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', 24, type=int), 1), 60)
+
+        indice = facet_index.get_facet_index()
+        resultado = indice.buscar(filtros, min_precio, max_precio)
+        ids_ordenados = indice.ordenar(resultado['ids'], sort_by)
+
+        total = len(ids_ordenados)
+        ids_pagina = ids_ordenados[(page - 1) * per_page:page * per_page]
+        productos_por_id = {
+            p.id: p for p in Productos.query.filter(Productos.id.in_(ids_pagina)).all()
+        } if ids_pagina else {}
+        productos = [productos_por_id[pid] for pid in ids_pagina if pid in productos_por_id]
+
+        facetas = resultado['facetas']
+        pages = (total + per_page - 1) // per_page
+        return jsonify({
+            'success': True,
+            'productos': productos_to_dict_list(productos),
+            'pagination': {
+                'page': page,
+                'per_page': per_page,
+                'total': total,
+                'pages': pages,
+                'has_next': page < pages,
+                'has_prev': page > 1
+            },
+            'facetas': {f: v for f, v in facetas.items() if f not in facet_index.FACETAS_CATEGORIA},
+            'categorias': {f: facetas[f] for f in facet_index.FACETAS_CATEGORIA},
+            'rango_precios': resultado['rango_precios']
+        })
+    except Exception as e:
+        current_app.logger.error(f"Error en buscar_facetado: {str(e)}", exc_info=True)
+        return jsonify({'success': False, 'message': 'Error al realizar la búsqueda facetada'}), 500
 
 @products_bp.route('/api/productos')
 def get_all_products():
@@ -1556,16 +1000,19 @@ def get_all_products():
     API: Devuelve todos los productos activos.
 
     Un endpoint simple para obtener una lista completa de todos los productos
-    que están activos y tienen stock, sin ningún filtro.
+    que están activos y tienen stock, sin ningún filtro. La respuesta se pagina por
+    cursor con `limit` y `cursor` (ver `_responder_productos`).
     """
-    productos = Productos.query.filter_by(estado=EstadoEnum.ACTIVO).filter(Productos._existencia  > 0).all()
-    return jsonify([producto_to_dict(p) for p in productos])
+    query = Productos.query.filter_by(estado=EstadoEnum.ACTIVO).filter(Productos._existencia  > 0)
+    return _responder_productos(query, request.args.get('ordenar_por', 'featured'))
 
 @products_bp.route('/api/productos/categoria/<nombre_categoria>')
 def get_products_by_category(nombre_categoria):
     """
     API: Devuelve productos de una categoría principal específica.
 
+    La respuesta se pagina por cursor con `limit` y `cursor` (ver `_responder_productos`).
+
     Args:
         nombre_categoria (str): El nombre de la categoría principal.
     """
@@ -1580,55 +1027,11 @@ def get_products_by_category(nombre_categoria):
     
     seudocategoria_ids = [id[0] for id in seudocategoria_ids]
     
-    productos = Productos.query\
-        .filter(Productos.seudocategoria_id.in_(seudocategoria_ids), Productos.estado == EstadoEnum.ACTIVO, Productos._existencia  > 0)\
-        .all()
-        
-    return jsonify([producto_to_dict(p) for p in productos])
-
-
-@products_bp.route('/api/productos/precios_rango')
-def get_price_range():
-    """
-    API: Devuelve el rango de precios (mínimo y máximo) de los productos.
-
-    Este endpoint es utilizado por el control deslizante de precios en la UI de filtros.
-    Puede devolver el rango de precios global o un rango filtrado si se proporcionan
-    parámetros de categoría.
-    """
-    main_category_name = request.args.get('categoria_principal')
-    subcategory_name = request.args.get('subcategoria')
-    pseudocategory_name = request.args.get('seudocategoria')
-
-    query = db.session.query(Productos).filter(Productos.estado == EstadoEnum.ACTIVO, Productos._existencia  > 0)
-    
-    needs_join = main_category_name or subcategory_name or pseudocategory_name
-    
-    if needs_join:
-        query = query.join(Seudocategorias, and_(Productos.seudocategoria_id == Seudocategorias.id, Seudocategorias.estado == EstadoEnum.ACTIVO))
-    
-    if main_category_name or subcategory_name:
-        query = query.join(Subcategorias, and_(Seudocategorias.subcategoria_id == Subcategorias.id, Subcategorias.estado == EstadoEnum.ACTIVO))
-    
-    if main_category_name:
-        query = query.join(CategoriasPrincipales, and_(Subcategorias.categoria_principal_id == CategoriasPrincipales.id, CategoriasPrincipales.estado == EstadoEnum.ACTIVO))
-    
-    if main_category_name:
-        query = query.filter(func.lower(CategoriasPrincipales.nombre) == func.lower(main_category_name))
-    
-    if subcategory_name:
-        query = query.filter(func.lower(Subcategorias.nombre) == func.lower(subcategory_name))
-
-    if pseudocategory_name:
-        query = query.filter(func.lower(Seudocategorias.nombre) == func.lower(pseudocategory_name))
+    query = Productos.query\
+        .filter(Productos.seudocategoria_id.in_(seudocategoria_ids), Productos.estado == EstadoEnum.ACTIVO, Productos._existencia  > 0)
 
-    min_price = query.with_entities(func.min(Productos.precio)).scalar()
-    max_price = query.with_entities(func.max(Productos.precio)).scalar()
+    return _responder_productos(query, request.args.get('ordenar_por', 'featured'))
 
-    return jsonify({
-        'min_price': min_price if min_price is not None else 0,
-        'max_price': max_price if max_price is not None else 0
-    })
 
 @products_bp.route('/api/productos/recomendados')
 @jwt_required
@@ -1637,9 +1040,10 @@ def get_recomendaciones(usuario):
     API: Devuelve productos recomendados para el usuario autenticado.
 
     La lógica de recomendación se basa en los productos que le han gustado al usuario.
-    1.  Obtiene las seudocategorías de los productos que le gustan al usuario.
-    2.  Busca otros productos populares (basado en la cantidad de 'likes') dentro de esas mismas seudocategorías.
-    3.  Si no hay suficientes, rellena con productos populares de la tienda en general.
+    1.  Reúne las listas precalculadas de relacionados de los productos que le gustan
+        (compras y likes conjuntos, misma seudocategoría o subcategoría).
+    2.  Elige una muestra variada entre los candidatos que más se repiten.
+    3.  Si no hay suficientes, rellena con productos populares (likes y ventas) de la tienda.
 
     Args:
         usuario (Usuarios): El objeto de usuario inyectado por el decorador `@jwt_required`.
@@ -1648,37 +1052,11 @@ def get_recomendaciones(usuario):
         JSON: Una lista de objetos de producto recomendados.
     """
     try:
-        # Obtener los IDs de los productos que le gustan al usuario
-        liked_product_ids = db.session.query(Likes.producto_id).filter_by(usuario_id=usuario.id, estado=EstadoEnum.ACTIVO).all()
-        liked_product_ids = [pid[0] for pid in liked_product_ids]
-
-        recomendaciones = []
-        
-        if liked_product_ids:
-            # Obtener las seudocategorías de los productos que le gustan
-            liked_seudocategorias = db.session.query(Productos.seudocategoria_id).filter(Productos.id.in_(liked_product_ids)).distinct().all()
-            liked_seudocategorias_ids = [sid[0] for sid in liked_seudocategorias]
-
-            if liked_seudocategorias_ids:
-                # Buscar otros productos en esas seudocategorías, excluyendo los que ya le gustan
-                recomendaciones = Productos.query.filter(
-                    Productos.seudocategoria_id.in_(liked_seudocategorias_ids),
-                    Productos.id.notin_(liked_product_ids),
-                    Productos.estado == EstadoEnum.ACTIVO,
-                    Productos._existencia > 0
-                ).order_by(func.random()).limit(12).all()
-
-        # Si no hay suficientes recomendaciones, rellenar con productos populares generales
-        if len(recomendaciones) < 12:
-            ids_existentes = [p.id for p in recomendaciones] + liked_product_ids
-            productos_populares = Productos.query.filter(
-                Productos.id.notin_(ids_existentes),
-                Productos.estado == EstadoEnum.ACTIVO,
-                Productos._existencia > 0
-            ).order_by(func.random()).limit(12 - len(recomendaciones)).all()
-            recomendaciones.extend(productos_populares)
-
-        return jsonify([producto_to_dict(p) for p in recomendaciones])
+        # MEJORA PROFESIONAL: Se combinan las listas precalculadas de relacionados de los
+        # productos que le gustan al usuario y se completan con los más populares.
+        productos_recomendados = recomendaciones.recomendaciones_usuario(usuario.id, k=12)
+
+        return jsonify(productos_to_dict_list(productos_recomendados))
     except Exception as e:
         current_app.logger.error(f"Error al generar recomendaciones para el usuario {usuario.id}: {e}")
         return jsonify({'error': 'No se pudieron generar las recomendaciones'}), 500
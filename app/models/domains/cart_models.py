@@ -51,8 +51,11 @@ class CartItem(db.Model, TimestampMixin):
     user: Mapped[Optional['Usuarios']] = relationship('Usuarios', backref='cart_items')
 
     __table_args__ = (
-        db.Index('idx_user_product', 'user_id', 'product_id'),
-        db.Index('idx_session_product', 'session_id', 'product_id'),
+        # Un producto aparece una sola vez por carrito. Las restricciones (y sus índices)
+        # permiten `INSERT ... ON CONFLICT` en las operaciones en bloque de `app.utils.carrito`;
+        # los NULL no colisionan, así que cada una solo afecta a su tipo de carrito.
+        db.UniqueConstraint('user_id', 'product_id', name='uq_cart_user_product'),
+        db.UniqueConstraint('session_id', 'product_id', name='uq_cart_session_product'),
     )
 
     @property
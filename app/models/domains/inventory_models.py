@@ -0,0 +1,80 @@
+"""
+Módulo de Modelos de Dominio para el Inventario.
+
+Este archivo define el historial del stock de los productos:
+- `MovimientoStock`: El diario de movimientos, de solo inserción. Cada cambio de
+  existencias (pedido, venta, cancelación, ajuste) añade una fila con el delta y la
+  existencia resultante; nunca se actualiza ni se borra.
+- `SnapshotStock`: Fotografías periódicas de la existencia y el costo de cada producto,
+  que permiten calcular el inventario a una fecha leyendo un rango acotado del diario
+  en lugar de reproducirlo desde el principio.
+"""
+# --- Importaciones de Extensiones y Terceros ---
+from app.extensions import db
+from sqlalchemy import ForeignKey, Enum as SAEnum
+from sqlalchemy.orm import Mapped, mapped_column
+# --- Importaciones de la Librería Estándar ---
+from datetime import date, datetime
+from typing import Optional
+# --- Importaciones Locales de la Aplicación ---
+from app.models.enums import MotivoMovimientoStock
+
+
+class MovimientoStock(db.Model):
+    """
+    Representa un movimiento del diario de stock (solo inserción).
+
+    Attributes:
+        id (int): Identificador secuencial; ordena los movimientos de un mismo instante.
+        producto_id (str): Clave foránea al producto.
+        cantidad (int): El delta aplicado a la existencia (negativo = salida, positivo = entrada).
+        existencia_resultante (int): La existencia del producto tras el movimiento.
+        motivo (MotivoMovimientoStock): El origen del movimiento.
+        pedido_id (Optional[str]): El pedido que originó el movimiento, si aplica.
+        created_at (datetime): Fecha y hora del movimiento.
+    """
+    __tablename__ = 'movimientos_stock'
+
+    id: Mapped[int] = mapped_column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    producto_id: Mapped[str] = mapped_column(ForeignKey('productos.id', ondelete='CASCADE'), nullable=False)
+    cantidad: Mapped[int] = mapped_column(db.Integer, nullable=False)
+    existencia_resultante: Mapped[int] = mapped_column(db.Integer, nullable=False)
+    motivo: Mapped[MotivoMovimientoStock] = mapped_column(
+        SAEnum(MotivoMovimientoStock, name='motivo_movimiento_stock_enum', native_enum=True), nullable=False
+    )
+    pedido_id: Mapped[Optional[str]] = mapped_column(ForeignKey('pedidos.id', ondelete='SET NULL'), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Historial de un producto: sus movimientos en orden cronológico.
+        db.Index('idx_movimiento_stock_producto_fecha', 'producto_id', 'created_at'),
+        # Valoración del inventario: movimientos posteriores a un snapshot.
+        db.Index('idx_movimiento_stock_fecha', 'created_at'),
+        db.Index('idx_movimiento_stock_pedido', 'pedido_id'),
+    )
+
+
+class SnapshotStock(db.Model):
+    """
+    Fotografía de la existencia de un producto en una fecha.
+
+    Se genera una vez al día como tarea periódica (ver `app.utils.inventario`) o con
+    `flask snapshot-stock`.
+
+    Attributes:
+        fecha (date): El día de la fotografía (parte de la clave primaria).
+        producto_id (str): Clave foránea al producto (parte de la clave primaria).
+        existencia (int): La existencia del producto al tomar la fotografía.
+        costo (float): El costo unitario del producto en ese momento.
+        precio (float): El precio de venta del producto en ese momento.
+        tomado_en (datetime): El instante exacto de la fotografía; los movimientos
+                              posteriores a él no están incluidos.
+    """
+    __tablename__ = 'snapshots_stock'
+
+    fecha: Mapped[date] = mapped_column(db.Date, primary_key=True)
+    producto_id: Mapped[str] = mapped_column(ForeignKey('productos.id', ondelete='CASCADE'), primary_key=True)
+    existencia: Mapped[int] = mapped_column(db.Integer, nullable=False)
+    costo: Mapped[float] = mapped_column(db.Float, nullable=False)
+    precio: Mapped[float] = mapped_column(db.Float, nullable=False)
+    tomado_en: Mapped[datetime] = mapped_column(db.DateTime, nullable=False)
@@ -4,14 +4,19 @@ Módulo de Modelos de Dominio para Pedidos.
 Este archivo define las estructuras de datos que representan los pedidos de los clientes.
 Incluye el modelo `Pedido`, que almacena la información general de la orden, y
 `PedidoProducto`, que actúa como una tabla de asociación para registrar los
-productos específicos, cantidades y precios de cada pedido.
+productos específicos, cantidades y precios de cada pedido, `PedidoEvento`, el
+historial de seguimiento normalizado, `ProductoVentasResumen`, el resumen
+materializado de ventas por producto, y `VentasDiarias`, el acumulado de ventas por
+día y producto que alimenta las series temporales del panel.
 """
 # --- Importaciones de Extensiones y Terceros ---
 from app.extensions import db
-from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import ForeignKey, Enum as SAEnum
+from sqlalchemy.orm import Mapped, deferred, mapped_column, relationship
+from sqlalchemy import ForeignKey, Enum as SAEnum, inspect
+# --- Importaciones de la Librería Estándar ---
+from datetime import date, datetime, timezone
 # --- Importaciones Locales de la Aplicación ---
-from typing import TYPE_CHECKING, List
+from typing import TYPE_CHECKING, List, Optional
 from app.models.mixins import UUIDPrimaryKeyMixin, TimestampMixin, EstadoActivoInactivoMixin
 from app.models.enums import EstadoPedido, EstadoSeguimiento # Cambiado a EstadoSeguimiento
 
@@ -32,10 +37,16 @@ class Pedido(UUIDPrimaryKeyMixin, TimestampMixin, EstadoActivoInactivoMixin, db.
         total (float): El monto total del pedido.
         estado_pedido (EstadoPedido): El estado general del pedido (EN_PROCESO, COMPLETADO, CANCELADO).
         seguimiento_estado (EstadoSeguimiento): El estado actual en el proceso de seguimiento logístico.
-        seguimiento_historial (JSON): Un registro histórico de los cambios en el estado de seguimiento.
+        seguimiento_historial (List[dict]): El historial de seguimiento, en el formato de
+            las antiguas entradas JSON (`estado`, `notas`, `timestamp`, `notified_to_client`).
+            Es de solo lectura: se construye a partir de `eventos` o, en los pedidos
+            antiguos aún sin migrar, de `historial_legado`.
+        historial_legado (JSON): La antigua columna JSON `seguimiento_historial`. Ya no se
+            escribe; la migra `backfill_pedido_eventos` (en `flask preparar-despliegue`).
         notas_seguimiento (str): Notas adicionales relacionadas con el seguimiento del pedido.
         usuario (Usuarios): Relación con el modelo `Usuarios`.
         productos (List[PedidoProducto]): Relación con los productos incluidos en este pedido.
+        eventos (List[PedidoEvento]): Los eventos de seguimiento, en orden de registro.
     """
     __tablename__ = 'pedidos'
  
@@ -49,7 +60,7 @@ class Pedido(UUIDPrimaryKeyMixin, TimestampMixin, EstadoActivoInactivoMixin, db.
         SAEnum(EstadoSeguimiento, name='seguimiento_estado_enum', native_enum=True),
         nullable=False, default=EstadoSeguimiento.RECIBIDO
     )
-    seguimiento_historial = db.Column(db.JSON, nullable=True)
+    historial_legado = deferred(db.Column('seguimiento_historial', db.JSON, nullable=True))
     notas_seguimiento: Mapped[str] = mapped_column(db.Text, nullable=True)
     # MEJORA: Campo para controlar que la notificación de estado final (completado/cancelado) se envíe solo una vez.
     # Se resetea si el pedido vuelve a un estado 'en proceso'.
@@ -58,6 +69,117 @@ class Pedido(UUIDPrimaryKeyMixin, TimestampMixin, EstadoActivoInactivoMixin, db.
 
     usuario: Mapped["Usuarios"] = relationship(back_populates='pedidos')
     productos: Mapped[List["PedidoProducto"]] = relationship(back_populates='pedido', cascade="all, delete-orphan")
+    eventos: Mapped[List["PedidoEvento"]] = relationship(
+        back_populates='pedido', cascade="all, delete-orphan", order_by="PedidoEvento.id"
+    )
+
+    @property
+    def seguimiento_historial(self) -> List[dict]:
+        """
+        El historial de seguimiento con el formato de las antiguas entradas JSON.
+
+        Un pedido sin eventos puede ser uno antiguo cuyo historial aún no se migró a
+        `pedido_eventos`; entonces se lee la columna JSON (una consulta, por ser diferida).
+        """
+        if self.eventos:
+            return [evento.to_historial_dict() for evento in self.eventos]
+        return [entrada for entrada in (self.historial_legado or []) if isinstance(entrada, dict)]
+
+    def registrar_evento(self, estado, notas: str, notificado: bool = True,
+                         momento: Optional[datetime] = None) -> "PedidoEvento":
+        """
+        Añade un evento al historial de seguimiento (un INSERT; no reescribe el historial).
+
+        Si el historial del pedido no está cargado, el evento se añade a la sesión con
+        su `pedido_id` en lugar de a la colección: `self.eventos.append` leería antes
+        todos los eventos del pedido. En un pedido nuevo o con el historial ya cargado
+        se añade a la colección, que así sigue al día sin consultas.
+
+        Args:
+            estado (EstadoSeguimiento | str): El estado de seguimiento del evento.
+            notas (str): La nota visible para el cliente.
+            notificado (bool): False si el cliente debe recibir la notificación del evento.
+            momento (datetime, optional): Fecha del evento. Por defecto, ahora (UTC).
+
+        Returns:
+            PedidoEvento: El evento creado.
+        """
+        evento = PedidoEvento(
+            usuario_id=self.usuario_id,
+            estado=getattr(estado, 'value', estado),
+            notas=notas,
+            notificado=notificado,
+            created_at=_a_utc_naive(momento) if momento else datetime.utcnow(),
+        )
+        estado_instancia = inspect(self)
+        if estado_instancia.persistent and 'eventos' in estado_instancia.unloaded:
+            evento.pedido_id = self.id
+            db.session.add(evento)
+        else:
+            self.eventos.append(evento)
+        return evento
+
+
+def _a_utc_naive(momento: datetime) -> datetime:
+    """Normaliza un datetime a UTC sin zona horaria, como se guarda en `pedido_eventos`."""
+    if momento.tzinfo is not None:
+        momento = momento.astimezone(timezone.utc).replace(tzinfo=None)
+    return momento
+
+
+class PedidoEvento(db.Model):
+    """
+    Un evento del historial de seguimiento de un pedido.
+
+    Sustituye a las entradas de la columna JSON `pedidos.seguimiento_historial`, que se
+    reescribía completa en cada cambio de estado y se recorría en Python para encontrar
+    las notificaciones sin leer. Cada cambio es ahora un INSERT, y marcar una
+    notificación como leída es un UPDATE de una fila.
+
+    Attributes:
+        id (int): Identificador secuencial; ordena los eventos de un pedido.
+        pedido_id (str): Clave foránea al pedido.
+        usuario_id (str): El cliente del pedido (denormalizado para consultar sus
+                          notificaciones sin pasar por `pedidos`).
+        estado (str): El valor de `EstadoSeguimiento` del evento.
+        notas (str): La nota visible para el cliente.
+        notificado (bool): False mientras el cliente no haya visto la notificación.
+        created_at (datetime): Fecha del evento (UTC).
+    """
+    __tablename__ = 'pedido_eventos'
+
+    id: Mapped[int] = mapped_column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    pedido_id: Mapped[str] = mapped_column(ForeignKey('pedidos.id', ondelete='CASCADE'), nullable=False)
+    usuario_id: Mapped[str] = mapped_column(ForeignKey('usuarios.id'), nullable=False)
+    estado: Mapped[str] = mapped_column(db.String(30), nullable=False)
+    notas: Mapped[Optional[str]] = mapped_column(db.Text, nullable=True)
+    notificado: Mapped[bool] = mapped_column(db.Boolean, nullable=False, default=True, server_default='true')
+    created_at: Mapped[datetime] = mapped_column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    pedido: Mapped["Pedido"] = relationship(back_populates='eventos')
+
+    __table_args__ = (
+        db.Index('idx_pedido_evento_pedido', 'pedido_id', 'id'),
+        # Índice parcial: solo contiene las notificaciones sin leer, que son muy pocas.
+        # "Notificaciones sin leer del usuario X" se responde solo con el índice.
+        db.Index(
+            'idx_pedido_evento_no_leidos', 'usuario_id', 'created_at', 'id',
+            postgresql_where=db.text('notificado = false'),
+            postgresql_include=['pedido_id'],
+            sqlite_where=db.text('notificado = 0'),
+        ),
+    )
+
+    def to_historial_dict(self) -> dict:
+        """Devuelve el evento con el formato de una entrada del antiguo historial JSON."""
+        return {
+            'id': self.id,
+            'estado': self.estado,
+            'notas': self.notas,
+            'timestamp': self.created_at.isoformat() + "Z" if self.created_at else None,
+            'notified_to_client': self.notificado,
+        }
+
 
 class PedidoProducto(db.Model):
     """
@@ -99,3 +221,80 @@ class PedidoProducto(db.Model):
         self.producto_id = producto_id
         self.cantidad = cantidad
         self.precio_unitario = precio_unitario
+
+class ProductoVentasResumen(db.Model):
+    """
+    Resumen materializado de las ventas completadas de cada producto.
+
+    Mantiene, por producto, los acumulados de las líneas de pedidos en estado
+    `COMPLETADO`. Se actualiza de forma incremental cada vez que un pedido entra
+    o sale de ese estado (ver `app.utils.ventas_resumen`), de modo que las vistas
+    del catálogo y del panel leen O(productos) en lugar de recorrer todas las
+    líneas de pedido. Puede reconstruirse por completo con `flask rebuild-ventas-resumen`.
+
+    Attributes:
+        producto_id (str): Clave primaria y foránea al producto resumido.
+        unidades_vendidas (int): Total de unidades vendidas.
+        ingresos_totales (float): Suma de `cantidad * precio_unitario`.
+        costo_total (float): Suma de `cantidad * costo` del producto al registrar la venta.
+        ultima_venta (datetime): Fecha del pedido completado más reciente.
+        ventas_mensuales (JSON): Buckets por mes (`'YYYY-MM'`) con `unidades`, `ingresos` y `costo`.
+    """
+    __tablename__ = 'producto_ventas_resumen'
+
+    producto_id: Mapped[str] = mapped_column(ForeignKey('productos.id', ondelete='CASCADE'), primary_key=True)
+    unidades_vendidas: Mapped[int] = mapped_column(db.Integer, nullable=False, default=0, server_default='0')
+    ingresos_totales: Mapped[float] = mapped_column(db.Float, nullable=False, default=0.0, server_default='0')
+    costo_total: Mapped[float] = mapped_column(db.Float, nullable=False, default=0.0, server_default='0')
+    ultima_venta: Mapped[Optional[datetime]] = mapped_column(db.DateTime, nullable=True)
+    ventas_mensuales = db.Column(db.JSON, nullable=False, default=dict)
+    updated_at: Mapped[datetime] = mapped_column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __init__(self, producto_id):
+        """
+        Inicializa un resumen vacío para un producto.
+
+        Args:
+            producto_id (str): El ID del producto.
+        """
+        self.producto_id = producto_id
+        self.unidades_vendidas = 0
+        self.ingresos_totales = 0.0
+        self.costo_total = 0.0
+        self.ultima_venta = None
+        self.ventas_mensuales = {}
+
+
+class VentasDiarias(db.Model):
+    """
+    Acumulado de las ventas completadas por día y producto.
+
+    Los gráficos de evolución del panel (dashboard, ventas, tendencias de categoría)
+    agregaban las líneas de pedido por fecha en cada carga, con un costo proporcional al
+    número de pedidos. Esta tabla guarda una fila por día y producto vendido, mantenida
+    de forma incremental cuando un pedido entra o sale del estado `COMPLETADO` (ver
+    `app.utils.ventas_diarias`), de modo que una serie cuesta O(días × productos
+    vendidos por día). Puede reconstruirse con `flask rebuild-ventas-resumen`.
+
+    Attributes:
+        fecha (date): El día (UTC) de creación de los pedidos acumulados.
+        producto_id (str): El producto vendido.
+        seudocategoria_id (str): La seudocategoría del producto al registrar la venta;
+                                 permite agrupar por categoría sin pasar por `productos`.
+        unidades (int): Unidades vendidas.
+        ingresos (float): Suma de `cantidad * precio_unitario`.
+        costo (float): Suma de `cantidad * costo` del producto al registrar la venta.
+    """
+    __tablename__ = 'ventas_diarias'
+
+    fecha: Mapped[date] = mapped_column(db.Date, primary_key=True)
+    producto_id: Mapped[str] = mapped_column(ForeignKey('productos.id', ondelete='CASCADE'), primary_key=True)
+    seudocategoria_id: Mapped[Optional[str]] = mapped_column(ForeignKey('seudocategorias.id', ondelete='SET NULL'), nullable=True)
+    unidades: Mapped[int] = mapped_column(db.Integer, nullable=False, default=0, server_default='0')
+    ingresos: Mapped[float] = mapped_column(db.Float, nullable=False, default=0.0, server_default='0')
+    costo: Mapped[float] = mapped_column(db.Float, nullable=False, default=0.0, server_default='0')
+
+    __table_args__ = (
+        # Las series por categoría leen solo el rango de fechas de sus seudocategorías.
+        db.Index('idx_ventas_diarias_seudocategoria_fecha', 'seudocategoria_id', 'fecha'),
+    )
@@ -79,6 +79,8 @@ class CategoriasPrincipales(UUIDPrimaryKeyMixin, TimestampMixin, EstadoActivoIna
         slug (str): Versión del nombre optimizada para URLs.
         descripcion (str): Descripción detallada de la categoría.
         estado (EstadoEnum): Estado de la categoría (activo o inactivo).
+        total_productos / productos_activos (int): Contadores denormalizados de productos.
+        subcategorias_activas (int): Contador denormalizado de subcategorías activas.
         subcategorias (List['Subcategorias']): Relación con las subcategorías que pertenecen
                                                a esta categoría principal.
     """
@@ -89,6 +91,10 @@ class CategoriasPrincipales(UUIDPrimaryKeyMixin, TimestampMixin, EstadoActivoIna
     slug: Mapped[str] = mapped_column(db.String(120), nullable=False, unique=True) # Nuevo campo slug
     descripcion: Mapped[str] = mapped_column(db.String(500), nullable=False)
     # estado ya está en el mixin
+    # Contadores denormalizados, mantenidos por `app.utils.category_counters`.
+    total_productos: Mapped[int] = mapped_column(db.Integer, nullable=False, default=0, server_default='0')
+    productos_activos: Mapped[int] = mapped_column(db.Integer, nullable=False, default=0, server_default='0')
+    subcategorias_activas: Mapped[int] = mapped_column(db.Integer, nullable=False, default=0, server_default='0')
     subcategorias: Mapped[List['Subcategorias']] = relationship('Subcategorias', back_populates='categoria_principal', lazy=True)
 
     # Restricciones
@@ -98,30 +104,14 @@ class CategoriasPrincipales(UUIDPrimaryKeyMixin, TimestampMixin, EstadoActivoIna
 
     def check_and_update_status(self):
         """
-        Verifica el estado de todas las subcategorías asociadas a esta categoría principal.
-        Si todas las subcategorías están inactivas, desactiva la categoría principal.
-        Si hay al menos una subcategoría activa, asegura que la categoría principal esté activa.
-        """
-        from app.models.enums import EstadoEnum # Importar aquí para evitar circular
-        
-        # Contar subcategorías activas asociadas a esta categoría principal
-        active_subcategories_count = Subcategorias.query.filter_by(
-            categoria_principal_id=self.id,
-            estado=EstadoEnum.ACTIVO.value
-        ).count()
-
-        with db.session.no_autoflush:
-            original_estado = self.estado # Store original state
-            if active_subcategories_count == 0:
-                if self.estado != EstadoEnum.INACTIVO.value:
-                    self.estado = EstadoEnum.INACTIVO.value
-            # No activar si ya está inactivo por una acción explícita del usuario
-            # Solo se activa si estaba inactivo y ahora tiene subcategorías activas
-            elif self.estado == EstadoEnum.INACTIVO.value:
-                self.estado = EstadoEnum.ACTIVO.value
+        Solicita el recálculo del estado de esta categoría principal.
 
-            if self.estado != original_estado: # Only add if status changed
-                pass
+        Si todas sus subcategorías están inactivas, se desactiva; si hay al menos una
+        activa y estaba inactiva, se reactiva. El recálculo se hace en el próximo flush,
+        junto con el de las demás categorías afectadas (ver `app.utils.category_status`).
+        """
+        from app.utils import category_status # Importar aquí para evitar circular
+        category_status.solicitar_recalculo(db.session, category_status.CATEGORIA_PRINCIPAL, self.id)
 
     def __init__(self, nombre, descripcion, estado='activo', id=None):
         """
@@ -161,6 +151,8 @@ class Subcategorias(UUIDPrimaryKeyMixin, TimestampMixin, EstadoActivoInactivoMix
         descripcion (str): Descripción detallada de la subcategoría.
         categoria_principal_id (str): Clave foránea a la categoría principal a la que pertenece.
         estado (EstadoEnum): Estado de la subcategoría (activo o inactivo).
+        total_productos / productos_activos (int): Contadores denormalizados de productos.
+        seudocategorias_activas (int): Contador denormalizado de seudocategorías activas.
         seudocategorias (List['Seudocategorias']): Relación con las seudocategorías hijas.
         categoria_principal (CategoriasPrincipales): Relación con la categoría principal padre.
     """
@@ -172,6 +164,10 @@ class Subcategorias(UUIDPrimaryKeyMixin, TimestampMixin, EstadoActivoInactivoMix
     descripcion: Mapped[str] = mapped_column(db.String(500), nullable=False)
     categoria_principal_id: Mapped[str] = mapped_column(db.String(36), db.ForeignKey('categorias_principales.id'), nullable=False)
     # estado ya está en el mixin
+    # Contadores denormalizados, mantenidos por `app.utils.category_counters`.
+    total_productos: Mapped[int] = mapped_column(db.Integer, nullable=False, default=0, server_default='0')
+    productos_activos: Mapped[int] = mapped_column(db.Integer, nullable=False, default=0, server_default='0')
+    seudocategorias_activas: Mapped[int] = mapped_column(db.Integer, nullable=False, default=0, server_default='0')
     seudocategorias: Mapped[List['Seudocategorias']] = relationship('Seudocategorias', back_populates='subcategoria', lazy=True)
     categoria_principal: Mapped['CategoriasPrincipales'] = relationship('CategoriasPrincipales', back_populates='subcategorias')
 
@@ -184,37 +180,14 @@ class Subcategorias(UUIDPrimaryKeyMixin, TimestampMixin, EstadoActivoInactivoMix
 
     def check_and_update_status(self):
         """
-        Verifica el estado de todas las pseudocategorías asociadas a esta subcategoría.
-        Si todas las pseudocategorías están inactivas, desactiva la subcategoría.
-        Si hay al menos una pseudocategoría activa, asegura que la subcategoría esté activa.
-        """
-        from app.models.enums import EstadoEnum # Importar aquí para evitar circular
-        
-        # Contar pseudocategorías activas asociadas a esta subcategoría
-        active_pseudocategories_count = Seudocategorias.query.filter_by(
-            subcategoria_id=self.id,
-            estado=EstadoEnum.ACTIVO.value
-        ).count()
-
-        with db.session.no_autoflush:
-            original_estado = self.estado # Store original state
-            if active_pseudocategories_count == 0:
-                if self.estado != EstadoEnum.INACTIVO.value:
-                    self.estado = EstadoEnum.INACTIVO.value
-            # No activar si ya está inactivo por una acción explícita del usuario
-            # Solo se activa si estaba inactivo y ahora tiene seudocategorías activas
-            elif self.estado == EstadoEnum.INACTIVO.value:
-                self.estado = EstadoEnum.ACTIVO.value
+        Solicita el recálculo del estado de esta subcategoría y de su categoría principal.
 
-            if self.estado != original_estado: # Only add if status changed
-                pass
-            
-            
-            
-            # Always check parent status, regardless of own status change
-            # The parent's check_and_update_status will handle its own status change logic
-            if self.categoria_principal:
-                self.categoria_principal.check_and_update_status()
+        Si todas sus pseudocategorías están inactivas, se desactiva; si hay al menos una
+        activa y estaba inactiva, se reactiva. El recálculo se hace en el próximo flush
+        (ver `app.utils.category_status`).
+        """
+        from app.utils import category_status # Importar aquí para evitar circular
+        category_status.solicitar_recalculo(db.session, category_status.SUBCATEGORIA, self.id)
 
     def __init__(self, nombre, descripcion, categoria_principal_id, estado='activo', id=None):
         """
@@ -260,6 +233,7 @@ class Seudocategorias(UUIDPrimaryKeyMixin, TimestampMixin, EstadoActivoInactivoM
         descripcion (str): Descripción detallada de la seudocategoría.
         subcategoria_id (str): Clave foránea a la subcategoría a la que pertenece.
         estado (EstadoEnum): Estado de la seudocategoría (activo o inactivo).
+        total_productos / productos_activos (int): Contadores denormalizados de productos.
         productos (List['Productos']): Relación con los productos que pertenecen a esta seudocategoría.
         subcategoria (Subcategorias): Relación con la subcategoría padre.
     """
@@ -271,6 +245,9 @@ class Seudocategorias(UUIDPrimaryKeyMixin, TimestampMixin, EstadoActivoInactivoM
     descripcion: Mapped[str] = mapped_column(db.String(500), nullable=False)
     subcategoria_id: Mapped[str] = mapped_column(db.String(36), db.ForeignKey('subcategorias.id'), nullable=False)
     # estado ya está en el mixin
+    # Contadores denormalizados, mantenidos por `app.utils.category_counters`.
+    total_productos: Mapped[int] = mapped_column(db.Integer, nullable=False, default=0, server_default='0')
+    productos_activos: Mapped[int] = mapped_column(db.Integer, nullable=False, default=0, server_default='0')
     productos: Mapped[List['Productos']] = relationship('Productos', back_populates='seudocategoria', lazy=True)
     subcategoria: Mapped['Subcategorias'] = relationship('Subcategorias', back_populates='seudocategorias')
 
@@ -282,36 +259,14 @@ class Seudocategorias(UUIDPrimaryKeyMixin, TimestampMixin, EstadoActivoInactivoM
 
     def check_and_update_status(self):
         """
-        Verifica el estado de todos los productos asociados a esta pseudocategoría.
-        Si todos los productos están inactivos, desactiva la pseudocategoría.
-        Si hay al menos un producto activo, asegura que la pseudocategoría esté activa.
-        """
-        from app.models.enums import EstadoEnum # Importar aquí para evitar circular
-        
-        # Contar productos activos asociados a esta pseudocategoría
-        active_products_count = Productos.query.filter_by(
-            seudocategoria_id=self.id,
-            estado=EstadoEnum.ACTIVO.value
-        ).count()
-
-        with db.session.no_autoflush:
-            original_estado = self.estado # Store original state
-            if active_products_count == 0:
-                if self.estado != EstadoEnum.INACTIVO.value:
-                    self.estado = EstadoEnum.INACTIVO.value
-            # No activar si ya está inactivo por una acción explícita del usuario
-            # Solo se activa si estaba inactivo y ahora tiene productos activos
-            elif self.estado == EstadoEnum.INACTIVO.value:
-                self.estado = EstadoEnum.ACTIVO.value
-
-            if self.estado != original_estado: # Only add if status changed
-                pass
-            
+        Solicita el recálculo del estado de esta pseudocategoría y de sus ancestros.
 
-            # Always check parent status, regardless of own status change
-            # The parent's check_and_update_status will handle its own status change logic
-            if self.subcategoria:
-                self.subcategoria.check_and_update_status()
+        Si todos sus productos están inactivos, se desactiva; si hay al menos uno activo
+        y estaba inactiva, se reactiva. El recálculo se hace en el próximo flush
+        (ver `app.utils.category_status`).
+        """
+        from app.utils import category_status # Importar aquí para evitar circular
+        category_status.solicitar_recalculo(db.session, category_status.SEUDOCATEGORIA, self.id)
 
     def __init__(self, nombre, descripcion, subcategoria_id, estado='activo', id=None):
         """
@@ -343,6 +298,36 @@ class Seudocategorias(UUIDPrimaryKeyMixin, TimestampMixin, EstadoActivoInactivoM
         if id:
             self.id = id
 
+# Configuración de texto de PostgreSQL usada por la búsqueda de productos (stemming en español).
+CONFIGURACION_BUSQUEDA = 'spanish'
+
+
+def documento_busqueda_producto(nombre, marca, descripcion):
+    """
+    Construye la expresión `tsvector` ponderada con la que se indexa y busca un producto.
+
+    El nombre pesa más que la marca y esta más que la descripción ('A' > 'B' > 'C'), lo
+    que `ts_rank` usa para ordenar. Los literales se incrustan en el SQL (no como
+    parámetros) para que la expresión de las consultas coincida exactamente con la del
+    índice GIN `idx_producto_busqueda_fts` y PostgreSQL pueda usarlo.
+
+    Args:
+        nombre, marca, descripcion: Las columnas (o expresiones) a indexar.
+
+    Returns:
+        ColumnElement: La expresión `tsvector` resultante.
+    """
+    configuracion = db.literal_column(f"'{CONFIGURACION_BUSQUEDA}'")
+    vacio = db.literal_column("''")
+
+    def _campo(columna, peso):
+        return db.func.setweight(
+            db.func.to_tsvector(configuracion, db.func.coalesce(columna, vacio)),
+            db.literal_column(f"'{peso}'")
+        )
+
+    return _campo(nombre, 'A').op('||')(_campo(marca, 'B')).op('||')(_campo(descripcion, 'C'))
+
 class Productos(UUIDPrimaryKeyMixin, TimestampMixin, EstadoActivoInactivoMixin, db.Model):
     """
     Representa un producto vendible en la tienda.
@@ -408,9 +393,11 @@ class Productos(UUIDPrimaryKeyMixin, TimestampMixin, EstadoActivoInactivoMixin,
             if self.estado == EstadoEnum.ACTIVO.value:
                 self.estado = EstadoEnum.ACTIVO.value
                 db.session.add(self)
-                # Después de actualizar el producto, verificar el estado de la pseudocategoría
-                if self.seudocategoria:
-                    self.seudocategoria.check_and_update_status()
+                # MEJORA PROFESIONAL: En lugar de recorrer la jerarquía con un COUNT por nivel,
+                # se anota la pseudocategoría; su estado y el de sus ancestros se recalculan
+                # en lote al hacer flush. Se usa el ID para no cargar la relación.
+                from app.utils import category_status
+                category_status.solicitar_recalculo(db.session, category_status.SEUDOCATEGORIA, self.seudocategoria_id)
     stock_minimo: Mapped[int] = mapped_column(db.Integer, default=10, nullable=False)
     stock_maximo: Mapped[int] = mapped_column(db.Integer, default=100, nullable=False)
     seudocategoria_id: Mapped[str] = mapped_column(db.String(36), db.ForeignKey('seudocategorias.id'), nullable=False)
@@ -472,6 +459,14 @@ class Productos(UUIDPrimaryKeyMixin, TimestampMixin, EstadoActivoInactivoMixin,
         db.Index('idx_producto_estado', 'estado'),
         db.Index('idx_producto_marca', 'marca'),
         db.Index('idx_producto_nombre_lower', db.func.lower(nombre)),
+        # Índices de búsqueda de texto (solo PostgreSQL): GIN sobre el documento `tsvector`
+        # ponderado y GIN de trigramas (extensión `pg_trgm`) para tolerar errores de escritura.
+        db.Index('idx_producto_busqueda_fts', documento_busqueda_producto(nombre, marca, descripcion),
+                 postgresql_using='gin').ddl_if(dialect='postgresql'),
+        db.Index('idx_producto_nombre_trgm', nombre, postgresql_using='gin',
+                 postgresql_ops={'nombre': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        db.Index('idx_producto_marca_trgm', marca, postgresql_using='gin',
+                 postgresql_ops={'marca': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
         db.Index('idx_producto_stock_minimo', 'stock_minimo'),
         db.Index('idx_producto_stock_maximo', 'stock_maximo'),
     )
@@ -0,0 +1,40 @@
+"""
+Módulo de Modelos de Dominio para las Recomendaciones de Productos.
+
+Este archivo define `ProductoRecomendaciones`, la lista precalculada de productos
+relacionados de cada producto. La genera un trabajo en segundo plano
+(`app.utils.recomendaciones`) y las vistas del catálogo solo la leen por clave primaria.
+"""
+# --- Importaciones de Extensiones y Terceros ---
+from app.extensions import db
+from sqlalchemy import ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column
+# --- Importaciones de la Librería Estándar ---
+from datetime import datetime
+
+
+class ProductoRecomendaciones(db.Model):
+    """
+    Productos relacionados precalculados de un producto.
+
+    Una fila por producto: la lista de relacionados se guarda como un arreglo JSON de
+    IDs ordenado por relevancia, en lugar de una fila por pareja.
+
+    Attributes:
+        producto_id (str): Clave primaria y foránea al producto.
+        relacionados (JSON): IDs de los productos relacionados, del más al menos relevante.
+        popularidad (float): Likes activos más unidades vendidas; ordena el relleno de
+                             las recomendaciones personalizadas.
+        calculado_en (datetime): Fecha y hora del cálculo.
+    """
+    __tablename__ = 'producto_recomendaciones'
+
+    producto_id: Mapped[str] = mapped_column(ForeignKey('productos.id', ondelete='CASCADE'), primary_key=True)
+    relacionados = db.Column(db.JSON, nullable=False, default=list)
+    popularidad: Mapped[float] = mapped_column(db.Float, nullable=False, default=0.0, server_default='0')
+    calculado_en: Mapped[datetime] = mapped_column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # "Productos más populares": lectura del índice en orden descendente, sin ordenar la tabla.
+        db.Index('idx_producto_recomendaciones_popularidad', 'popularidad'),
+    )
@@ -24,6 +24,7 @@ from sqlalchemy.orm import Mapped, mapped_column, relationship
 # --- Importaciones de Extensiones y Terceros ---
 from app.extensions import bcrypt, db
 from app.models.serializers import admin_to_dict, usuario_to_dict
+from app.utils import presence
 
 if TYPE_CHECKING:
     from app.models.domains.order_models import Pedido
@@ -185,15 +186,13 @@ class Usuarios(
         #  Definir el umbral de "en línea" como una constante para fácil mantenimiento.
         ONLINE_THRESHOLD_MINUTES = 5
 
-        if not self.last_seen:
-            return False
-        # Asegurarse de que last_seen tenga timezone para una comparación correcta.
-        # Si la BD guarda naive datetimes (sin tz), asumimos que es UTC.
-        last_seen_utc = (
-            self.last_seen.replace(tzinfo=timezone.utc)
-            if self.last_seen.tzinfo is None
-            else self.last_seen
+        # Se lee a través del buffer de presencia: la actividad reciente puede no
+        # haberse volcado todavía a la base de datos. El valor ya viene en UTC.
+        last_seen_utc = presence.get_last_seen_efectivo(
+            presence.USUARIO, self.id, self.last_seen
         )
+        if not last_seen_utc:
+            return False
         return (datetime.now(timezone.utc) - last_seen_utc) < timedelta(
             minutes=ONLINE_THRESHOLD_MINUTES
         )
@@ -204,15 +203,13 @@ class Usuarios(
         Formatea el timestamp de 'last_seen' en un formato legible para humanos.
         Ej: "Última vez hoy a las 10:30", "Última vez ayer a las 20:15", "Última vez el 15 de mayo".
         """
-        if not self.last_seen:
+        # Se lee a través del buffer de presencia (valor en UTC).
+        last_seen_aware = presence.get_last_seen_efectivo(
+            presence.USUARIO, self.id, self.last_seen
+        )
+        if not last_seen_aware:
             return "Nunca"
 
-        # Asegurarse de que last_seen tenga timezone para una comparación correcta
-        last_seen_aware = (
-            self.last_seen.replace(tzinfo=timezone.utc)
-            if self.last_seen.tzinfo is None
-            else self.last_seen
-        )
         now_aware = datetime.now(timezone.utc)
 
         # Convertir a la zona horaria local (ej. Colombia) para la visualización
@@ -512,15 +509,13 @@ class Admins(
         #  Definir el umbral de "en línea" como una constante para fácil mantenimiento.
         ONLINE_THRESHOLD_MINUTES = 5
 
-        if not self.last_seen:
-            return False
-        # Asegurarse de que last_seen tenga timezone para una comparación correcta.
-        # Si la BD guarda naive datetimes (sin tz), asumimos que es UTC.
-        last_seen_utc = (
-            self.last_seen.replace(tzinfo=timezone.utc)
-            if self.last_seen.tzinfo is None
-            else self.last_seen
+        # Se lee a través del buffer de presencia: la actividad reciente puede no
+        # haberse volcado todavía a la base de datos. El valor ya viene en UTC.
+        last_seen_utc = presence.get_last_seen_efectivo(
+            presence.ADMIN, self.id, self.last_seen
         )
+        if not last_seen_utc:
+            return False
         return (datetime.now(timezone.utc) - last_seen_utc) < timedelta(
             minutes=ONLINE_THRESHOLD_MINUTES
         )
@@ -531,15 +526,13 @@ class Admins(
         Formatea el timestamp de 'last_seen' en un formato legible para humanos.
         Ej: "Última vez hoy a las 10:30", "Última vez ayer a las 20:15", "Última vez el 15 de mayo".
         """
-        if not self.last_seen:
+        # Se lee a través del buffer de presencia (valor en UTC).
+        last_seen_aware = presence.get_last_seen_efectivo(
+            presence.ADMIN, self.id, self.last_seen
+        )
+        if not last_seen_aware:
             return "Nunca"
 
-        # Asegurarse de que last_seen tenga timezone para una comparación correcta
-        last_seen_aware = (
-            self.last_seen.replace(tzinfo=timezone.utc)
-            if self.last_seen.tzinfo is None
-            else self.last_seen
-        )
         now_aware = datetime.now(timezone.utc)
 
         # Convertir a la zona horaria local (ej. Colombia) para la visualización
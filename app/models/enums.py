@@ -40,4 +40,20 @@ class EstadoSeguimiento(str, Enum):
     EN_PREPARACION = 'en preparacion'
     EN_CAMINO = 'en camino'
     ENTREGADO = 'entregado'
-    CANCELADO = 'cancelado'
\ No newline at end of file
+    CANCELADO = 'cancelado'
+
+
+class MotivoMovimientoStock(str, Enum):
+    """
+    Enumeración para el motivo de cada movimiento del diario de stock.
+
+    Permite conciliar el inventario por origen (pedidos, ventas, cancelaciones o
+    ajustes del administrador) sin recorrer los pedidos.
+    """
+    PEDIDO = 'pedido'
+    VENTA = 'venta'
+    AJUSTE_PEDIDO = 'ajuste pedido'
+    CANCELACION = 'cancelacion'
+    REACTIVACION = 'reactivacion'
+    ALTA_PRODUCTO = 'alta producto'
+    AJUSTE_MANUAL = 'ajuste manual'
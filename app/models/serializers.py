@@ -10,11 +10,10 @@ al frontend o a otros servicios.
 # --- Importaciones de la Librería Estándar ---
 from datetime import datetime
 
-from sqlalchemy import func
+from sqlalchemy.orm import joinedload, selectinload
 
 from app.extensions import db
-from app.models.domains.order_models import Pedido, PedidoProducto
-from app.models.enums import EstadoPedido
+from app.models.domains.order_models import Pedido, PedidoProducto, ProductoVentasResumen
 
 
 def format_currency_cop(value):
@@ -91,9 +90,9 @@ def categoria_principal_to_dict(cat):
     Serializa un objeto CategoriaPrincipal a un diccionario.
 
     Este serializador es recursivo: invoca a `subcategoria_to_dict` para cada una de
-    sus subcategorías, construyendo un árbol de datos completo. Además, calcula
-    métricas agregadas como el conteo de subcategorías activas y el total de productos
-    en toda la categoría principal.
+    sus subcategorías, construyendo un árbol de datos completo. Las métricas agregadas
+    (subcategorías activas y total de productos) se leen de los contadores
+    denormalizados de la categoría, sin cargar los productos.
 
     Returns:
         dict: Un diccionario que representa la categoría principal, sus subcategorías
@@ -102,17 +101,9 @@ def categoria_principal_to_dict(cat):
     if not cat:
         return None
 
-    active_subcategories_count = 0
-    total_products_in_main_category = 0
     subcategorias_data = []
-
     if hasattr(cat, "subcategorias") and cat.subcategorias is not None:
-        for sub in cat.subcategorias:
-            sub_dict = subcategoria_to_dict(sub)
-            subcategorias_data.append(sub_dict)
-            if sub.estado == "activo":
-                active_subcategories_count += 1
-            total_products_in_main_category += sub_dict.get("total_productos", 0)
+        subcategorias_data = [subcategoria_to_dict(sub) for sub in cat.subcategorias]
 
     return {
         "id": cat.id,
@@ -123,8 +114,9 @@ def categoria_principal_to_dict(cat):
         "created_at": cat.created_at.isoformat() if cat.created_at else None,
         "updated_at": cat.updated_at.isoformat() if cat.updated_at else None,
         "subcategorias": subcategorias_data,
-        "active_subcategorias_count": active_subcategories_count,
-        "total_productos": total_products_in_main_category,
+        "active_subcategorias_count": cat.subcategorias_activas or 0,
+        "total_productos": cat.total_productos or 0,
+        "productos_activos": cat.productos_activos or 0,
     }
 
 
@@ -134,8 +126,8 @@ def subcategoria_to_dict(sub):
 
     De forma similar a `categoria_principal_to_dict`, este serializador es recursivo
     y construye parte del árbol de categorías. Obtiene información del padre
-    (nombre de la categoría principal) y calcula métricas agregadas de sus hijos,
-    como el conteo de seudocategorías activas y el total de productos.
+    (nombre de la categoría principal) y expone las métricas agregadas de sus hijos
+    (seudocategorías activas y total de productos) desde sus contadores denormalizados.
 
     Returns:
         dict: Un diccionario que representa la subcategoría, sus seudocategorías,
@@ -148,17 +140,9 @@ def subcategoria_to_dict(sub):
     if hasattr(sub, "categoria_principal") and sub.categoria_principal is not None:
         categoria_principal_nombre = sub.categoria_principal.nombre
 
-    active_pseudocategories_count = 0
-    total_products_in_subcategory = 0
     seudocategorias_data = []
-
     if hasattr(sub, "seudocategorias") and sub.seudocategorias is not None:
-        for seudo in sub.seudocategorias:
-            seudo_dict = seudocategoria_to_dict(seudo)
-            seudocategorias_data.append(seudo_dict)
-            if seudo.estado == "activo":
-                active_pseudocategories_count += 1
-            total_products_in_subcategory += seudo_dict.get("total_productos", 0)
+        seudocategorias_data = [seudocategoria_to_dict(seudo) for seudo in sub.seudocategorias]
 
     return {
         "id": sub.id,
@@ -171,8 +155,9 @@ def subcategoria_to_dict(sub):
         "created_at": sub.created_at.isoformat() if sub.created_at else None,
         "updated_at": sub.updated_at.isoformat() if sub.updated_at else None,
         "seudocategorias": seudocategorias_data,
-        "active_seudocategorias_count": active_pseudocategories_count,
-        "total_productos": total_products_in_subcategory,
+        "active_seudocategorias_count": sub.seudocategorias_activas or 0,
+        "total_productos": sub.total_productos or 0,
+        "productos_activos": sub.productos_activos or 0,
     }
 
 
@@ -182,8 +167,8 @@ def seudocategoria_to_dict(seudo):
 
     Este es el nivel más bajo de la jerarquía de categorías. El serializador enriquece
     el objeto con los nombres de sus ancestros (subcategoría y categoría principal)
-    para facilitar la navegación y la presentación en la UI. También calcula el
-    número total de productos que pertenecen directamente a ella.
+    para facilitar la navegación y la presentación en la UI. El número de productos
+    que pertenecen directamente a ella se lee de sus contadores denormalizados.
 
     Returns:
         dict: Un diccionario que representa la seudocategoría y su contexto jerárquico.
@@ -193,7 +178,6 @@ def seudocategoria_to_dict(seudo):
 
     subcategoria_nombre = None
     categoria_principal_nombre = None
-    total_products_in_pseudocategory = 0
 
     if hasattr(seudo, "subcategoria") and seudo.subcategoria is not None:
         subcategoria_nombre = seudo.subcategoria.nombre
@@ -203,13 +187,6 @@ def seudocategoria_to_dict(seudo):
         ):
             categoria_principal_nombre = seudo.subcategoria.categoria_principal.nombre
 
-    if hasattr(seudo, "productos") and seudo.productos is not None:
-        # NOTA PROFESIONAL: Esta línea es la que causa el problema N+1 si los productos
-        # no se cargan de forma ansiosa (eager loading) con subqueryload o joinedload
-        # en la consulta principal. La solución se aplica en la vista que llama a este
-        # serializador, no aquí directamente.
-        total_products_in_pseudocategory = len(seudo.productos)
-
     return {
         "id": seudo.id,
         "nombre": seudo.nombre,
@@ -221,11 +198,12 @@ def seudocategoria_to_dict(seudo):
         "estado": seudo.estado,
         "created_at": seudo.created_at.isoformat() if seudo.created_at else None,
         "updated_at": seudo.updated_at.isoformat() if seudo.updated_at else None,
-        "total_productos": total_products_in_pseudocategory,
+        "total_productos": seudo.total_productos or 0,
+        "productos_activos": seudo.productos_activos or 0,
     }
 
 
-def producto_to_dict(prod):
+def producto_to_dict(prod, sales_stats=None):
     """
     Serializa un objeto Producto para la vista pública del cliente.
 
@@ -238,7 +216,12 @@ def producto_to_dict(prod):
     - **Navegación de Categorías**: Extrae los nombres y slugs de toda la jerarquía
       de categorías (principal, sub, seudo) para construir breadcrumbs y URLs.
     - **Datos Enriquecidos**: Calcula métricas de negocio como `margen_ganancia`,
-      `antiguedad_dias`, `ventas_unidades` (simulado) y `existencia_porcentaje`.
+      `antiguedad_dias`, `ventas_unidades` y `existencia_porcentaje`.
+
+    Args:
+        prod (Productos): El producto a serializar.
+        sales_stats (Optional[dict]): Métricas de ventas precalculadas con
+            `get_product_sales_stats`. Si es `None`, se consultan solo para este producto.
 
     Returns:
         Optional[dict]: Un diccionario con los datos completos y enriquecidos del producto,
@@ -278,31 +261,14 @@ def producto_to_dict(prod):
     if prod.created_at:
         antiguedad_dias = (datetime.utcnow() - prod.created_at).days
 
-    # --- Datos adicionales ---
     # --- Ventas Reales ---
-    # Se realiza una subconsulta para obtener las ventas y los ingresos de forma eficiente.
-    # Se filtran solo los pedidos que han sido completados.
-    sales_data = (
-        db.session.query(
-            func.sum(PedidoProducto.cantidad).label("unidades_vendidas"),
-            func.sum(PedidoProducto.cantidad * PedidoProducto.precio_unitario).label(
-                "ingresos_totales"
-            ),
-        )
-        .join(Pedido, Pedido.id == PedidoProducto.pedido_id)
-        .filter(
-            PedidoProducto.producto_id == prod.id,
-            Pedido.estado_pedido == EstadoPedido.COMPLETADO,
-        )
-        .first()
-    )
+    # Si la vista ya precalculó las métricas en lote (ver `get_product_sales_stats`),
+    # se reutilizan; de lo contrario se consulta solo este producto.
+    if sales_stats is None:
+        sales_stats = get_product_sales_stats([prod.id]).get(prod.id, EMPTY_SALES_STATS)
 
-    ventas_unidades = (
-        int(sales_data.unidades_vendidas) if sales_data.unidades_vendidas else 0
-    )
-    ingresos_totales = (
-        float(sales_data.ingresos_totales) if sales_data.ingresos_totales else 0.0
-    )
+    ventas_unidades = sales_stats["ventas_unidades"]
+    ingresos_totales = sales_stats["ingresos_totales"]
 
     existencia_porcentaje = 0
     if (
@@ -352,7 +318,7 @@ def producto_to_dict(prod):
     }
 
 
-def admin_producto_to_dict(prod):
+def admin_producto_to_dict(prod, sales_stats=None):
     """
     Serializa un objeto Producto para la vista de administrador.
 
@@ -360,6 +326,11 @@ def admin_producto_to_dict(prod):
     **no filtra por estado**. Esto permite que el panel de administración muestre
     y gestione tanto productos activos como inactivos.
 
+    Args:
+        prod (Productos): El producto a serializar.
+        sales_stats (Optional[dict]): Métricas de ventas precalculadas con
+            `get_product_sales_stats`. Si es `None`, se consultan solo para este producto.
+
     Returns:
         Optional[dict]: Un diccionario con los datos completos y enriquecidos del producto,
                         independientemente de su estado. `None` si el producto no existe.
@@ -399,29 +370,13 @@ def admin_producto_to_dict(prod):
         antiguedad_dias = (datetime.utcnow() - prod.created_at).days
 
     # --- Ventas Reales ---
-    # Se realiza una subconsulta para obtener las ventas y los ingresos de forma eficiente.
-    # Se filtran solo los pedidos que han sido completados.
-    sales_data = (
-        db.session.query(
-            func.sum(PedidoProducto.cantidad).label("unidades_vendidas"),
-            func.sum(PedidoProducto.cantidad * PedidoProducto.precio_unitario).label(
-                "ingresos_totales"
-            ),
-        )
-        .join(Pedido, Pedido.id == PedidoProducto.pedido_id)
-        .filter(
-            PedidoProducto.producto_id == prod.id,
-            Pedido.estado_pedido == EstadoPedido.COMPLETADO,
-        )
-        .first()
-    )
+    # Si la vista ya precalculó las métricas en lote (ver `get_product_sales_stats`),
+    # se reutilizan; de lo contrario se consulta solo este producto.
+    if sales_stats is None:
+        sales_stats = get_product_sales_stats([prod.id]).get(prod.id, EMPTY_SALES_STATS)
 
-    ventas_unidades = (
-        int(sales_data.unidades_vendidas) if sales_data.unidades_vendidas else 0
-    )
-    ingresos_totales = (
-        float(sales_data.ingresos_totales) if sales_data.ingresos_totales else 0.0
-    )
+    ventas_unidades = sales_stats["ventas_unidades"]
+    ingresos_totales = sales_stats["ingresos_totales"]
 
     existencia_porcentaje = 0
     if (
@@ -471,6 +426,82 @@ def admin_producto_to_dict(prod):
     }
 
 
+# Métricas por defecto para productos que aún no registran ventas completadas.
+EMPTY_SALES_STATS = {"ventas_unidades": 0, "ingresos_totales": 0.0}
+
+
+def get_product_sales_stats(producto_ids):
+    """
+    Obtiene las métricas de ventas de varios productos en una sola consulta.
+
+    Evita el problema N+1 de los serializadores de productos. Los acumulados se
+    leen de la tabla materializada `producto_ventas_resumen` (mantenida por
+    `app.utils.ventas_resumen`), por lo que el costo es O(productos) y no depende
+    del número de líneas de pedido.
+
+    Args:
+        producto_ids (Iterable[str]): Los IDs de los productos a consultar.
+
+    Returns:
+        dict: Un diccionario `{producto_id: {"ventas_unidades": int, "ingresos_totales": float}}`.
+              Los productos sin ventas no aparecen; usar `EMPTY_SALES_STATS` como valor por defecto.
+    """
+    producto_ids = {pid for pid in producto_ids if pid}
+    if not producto_ids:
+        return {}
+
+    rows = (
+        db.session.query(
+            ProductoVentasResumen.producto_id,
+            ProductoVentasResumen.unidades_vendidas,
+            ProductoVentasResumen.ingresos_totales,
+        )
+        .filter(ProductoVentasResumen.producto_id.in_(producto_ids))
+        .all()
+    )
+
+    return {
+        row.producto_id: {
+            "ventas_unidades": int(row.unidades_vendidas or 0),
+            "ingresos_totales": float(row.ingresos_totales or 0.0),
+        }
+        for row in rows
+    }
+
+
+def productos_to_dict_list(productos):
+    """
+    Serializa una lista de productos para el cliente con una única consulta de ventas.
+
+    Los productos que `producto_to_dict` descarta (inactivos) se omiten del resultado.
+
+    Returns:
+        list[dict]: Los productos serializados, en el mismo orden de entrada.
+    """
+    stats = get_product_sales_stats(p.id for p in productos if p)
+    return [
+        prod_dict
+        for p in productos
+        if (prod_dict := producto_to_dict(p, stats.get(p.id, EMPTY_SALES_STATS)))
+        is not None
+    ]
+
+
+def admin_productos_to_dict_list(productos):
+    """
+    Serializa una lista de productos para el administrador con una única consulta de ventas.
+
+    Returns:
+        list[dict]: Los productos serializados, en el mismo orden de entrada.
+    """
+    stats = get_product_sales_stats(p.id for p in productos if p)
+    return [
+        admin_producto_to_dict(p, stats.get(p.id, EMPTY_SALES_STATS))
+        for p in productos
+        if p
+    ]
+
+
 def producto_list_to_dict(prod):
     """
     Serializa un objeto Producto a un diccionario optimizado para listas.
@@ -828,3 +859,54 @@ def pedido_detalle_cliente_to_dict(pedido):
         "productos": productos_info,
         "productos_count": len(productos_info),
     }
+
+
+def opciones_pedido_detalle():
+    """
+    Opciones de carga de un pedido con todo lo que leen `pedido_detalle_to_dict` y
+    `pedido_detalle_cliente_to_dict`: el usuario en el mismo `SELECT` y, para toda la
+    página a la vez, las líneas con sus productos y el historial de seguimiento con un
+    `SELECT ... IN` cada uno.
+
+    Se construyen al consultar y no al importar el módulo: crear las opciones configura
+    los mappers, y a esa altura no todos los modelos relacionados están registrados.
+    """
+    return (
+        joinedload(Pedido.usuario),
+        selectinload(Pedido.productos).selectinload(PedidoProducto.producto),
+        selectinload(Pedido.eventos),
+    )
+
+
+def pedidos_detalle_cliente_to_dict_list(pedido_ids):
+    """
+    Serializa una página de pedidos para el cliente con un número constante de consultas.
+
+    Antes, cada pedido de "Mis pedidos" cargaba sus líneas y luego, línea a línea, su
+    producto (1 + N + N·M consultas). Aquí los pedidos, sus líneas y los productos se
+    cargan con `opciones_pedido_detalle` junto con el historial de seguimiento (4
+    consultas, sea cual sea el tamaño de la página) y la serialización ya no toca la
+    base de datos.
+
+    Args:
+        pedido_ids (Iterable[str]): Los IDs de los pedidos, en el orden en que se muestran.
+
+    Returns:
+        list[dict]: Los pedidos serializados con `pedido_detalle_cliente_to_dict`, en el
+                    mismo orden de entrada. Los IDs inexistentes se omiten.
+    """
+    pedido_ids = list(dict.fromkeys(pid for pid in pedido_ids if pid))
+    if not pedido_ids:
+        return []
+
+    pedidos = (
+        Pedido.query.options(*opciones_pedido_detalle())
+        .filter(Pedido.id.in_(pedido_ids))
+        # Los pedidos pueden estar ya en la sesión con las relaciones sin cargar.
+        .populate_existing()
+        .all()
+    )
+    por_id = {pedido.id: pedido for pedido in pedidos}
+    return [
+        pedido_detalle_cliente_to_dict(por_id[pid]) for pid in pedido_ids if pid in por_id
+    ]
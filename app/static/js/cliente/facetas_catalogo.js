@@ -0,0 +1,100 @@
+/**
+ * facetas_catalogo.js
+ *
+ * Cliente compartido de la búsqueda facetada del catálogo. Las páginas de todos los
+ * productos, categoría, subcategoría y seudocategoría pedían cada grupo de filtros a su
+ * propio endpoint (`/api/filtros/*`), el rango de precios a `/api/productos/precios_rango`
+ * y los productos a `/api/productos/filtrar`: unas diez peticiones por cada clic.
+ *
+ * `/api/productos/buscar-facetado` devuelve en una sola respuesta la página de productos,
+ * los conteos de cada faceta y categoría y el rango de precios. Este módulo guarda la
+ * última petición, de modo que todas las funciones de una página que se ejecutan para un
+ * mismo estado de filtros (grupos de la barra lateral, cuadrícula y rango de precios)
+ * comparten una única llamada.
+ */
+
+window.FacetasCatalogo = (function () {
+  const ENDPOINT = '/api/productos/buscar-facetado';
+
+  // Productos por página de la cuadrícula ("Cargar más" pide la siguiente página).
+  const POR_PAGINA = 12;
+
+  // Parámetros del estado de las páginas que entiende el endpoint. `pseudocategoria`
+  // es el nombre usado por las páginas; el servidor lo acepta como alias de `seudocategoria`.
+  const PARAMETROS = [
+    'categoria_principal', 'subcategoria', 'pseudocategoria', 'marca', 'genero', 'color',
+    'tono', 'funcion', 'contenido', 'ingrediente_clave', 'resistente_al_agua',
+    'min_price', 'max_price', 'ordenar_por'
+  ];
+
+  let ultimaConsulta = null;
+  let ultimaPromesa = null;
+
+  /**
+   * Construye la cadena de consulta a partir del estado de filtros de una página.
+   * Se omiten los valores vacíos y 'all'.
+   */
+  function construirConsulta(filtros, pagina) {
+    const params = new URLSearchParams();
+    PARAMETROS.forEach(clave => {
+      const valor = filtros[clave];
+      if (valor !== undefined && valor !== null && valor !== '' && valor !== 'all') {
+        params.append(clave, valor);
+      }
+    });
+    params.append('page', pagina);
+    params.append('per_page', POR_PAGINA);
+    return params.toString();
+  }
+
+  /**
+   * Devuelve la respuesta de la búsqueda facetada para un estado de filtros y una página.
+   * Las llamadas repetidas con la misma consulta reutilizan la misma petición.
+   *
+   * @param {Object} filtros - El estado de filtros de la página (`currentFilters`).
+   * @param {number} pagina - La página de productos solicitada (por defecto, 1).
+   * @returns {Promise<Object>} `{productos, pagination, facetas, categorias, rango_precios}`.
+   */
+  function buscar(filtros, pagina = 1) {
+    const consulta = construirConsulta(filtros, pagina);
+    if (consulta === ultimaConsulta && ultimaPromesa) {
+      return ultimaPromesa;
+    }
+
+    ultimaConsulta = consulta;
+    ultimaPromesa = fetch(`${ENDPOINT}?${consulta}`)
+      .then(response => {
+        if (!response.ok) throw new Error(`Error ${response.status}`);
+        return response.json();
+      })
+      .then(data => {
+        if (!data.success) throw new Error(data.message || 'Error en la búsqueda facetada');
+        return data;
+      });
+
+    // Una petición fallida no se reutiliza: el siguiente intento vuelve a llamar al servidor.
+    const promesa = ultimaPromesa;
+    promesa.catch(() => {
+      if (ultimaPromesa === promesa) {
+        ultimaConsulta = null;
+        ultimaPromesa = null;
+      }
+    });
+    return promesa;
+  }
+
+  /**
+   * Devuelve los valores disponibles de una faceta (ej. 'marca', 'genero') o de un
+   * nivel de categoría ('categoria_principal', 'subcategoria', 'seudocategoria').
+   *
+   * @param {Object} data - La respuesta de `buscar`.
+   * @param {string} faceta - El nombre de la faceta.
+   * @returns {string[]} Los valores, ordenados alfabéticamente.
+   */
+  function valores(data, faceta) {
+    const grupo = (data.categorias && data.categorias[faceta]) || (data.facetas && data.facetas[faceta]) || [];
+    return grupo.map(item => item.valor);
+  }
+
+  return { POR_PAGINA, buscar, valores };
+})();
@@ -44,7 +44,14 @@ class PageLoadNotifier {
 
         const isAuthenticated = document.body.getAttribute('data-is-authenticated') === 'true';
         if (isAuthenticated) {
-            this.checkForNotifications();
+            // MEJORA PROFESIONAL: El canal push (SSE) solo se usa si el servidor lo habilita,
+            // porque requiere workers asíncronos. Por defecto se consulta en cada carga de página.
+            const streamEnabled = document.body.getAttribute('data-notifications-stream') === 'true';
+            if (streamEnabled && window.EventSource) {
+                this.connectStream();
+            } else {
+                this.checkForNotifications();
+            }
         }
 
         this.closeBtn.addEventListener('click', () => this.hideModal());
@@ -55,6 +62,26 @@ class PageLoadNotifier {
         });
     }
 
+    connectStream() {
+        // El servidor entrega la notificación pendiente al conectar y luego las que publique
+        // el panel. Cierra la conexión periódicamente y EventSource reconecta solo.
+        this.eventSource = new EventSource('/events/stream');
+        this.eventSource.addEventListener('error', () => {
+            // Si el canal deja de estar disponible, EventSource no reconecta: se vuelve a la consulta.
+            if (this.eventSource.readyState === EventSource.CLOSED) {
+                this.checkForNotifications();
+            }
+        });
+        this.eventSource.addEventListener('pedido', (event) => {
+            try {
+                this.showModal(JSON.parse(event.data));
+            } catch (error) {
+                console.error('Notificación con formato inválido:', error);
+            }
+        });
+        window.addEventListener('beforeunload', () => this.eventSource.close());
+    }
+
     async checkForNotifications() {
         // console.log('Buscando notificaciones de pedidos...');
         try {
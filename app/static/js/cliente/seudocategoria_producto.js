@@ -63,8 +63,11 @@ document.addEventListener("DOMContentLoaded", function () {
   const appliedFiltersContainer = document.getElementById("applied-filters");
   
   let allProducts = [];
-  const productsPerPage = 12;
+  const productsPerPage = FacetasCatalogo.POR_PAGINA;
   let currentDisplayedProducts = 0;
+  let currentPage = 1;
+  let totalProducts = 0;
+  let hasMoreProducts = false;
   let isFetching = false;
   let isUpdatingFilters = false;
 
@@ -252,25 +255,8 @@ document.addEventListener("DOMContentLoaded", function () {
 
   async function updateBrandFilters() {
     try {
-      const params = new URLSearchParams();
-      if (currentFilters.categoria_principal) params.append('categoria_principal', currentFilters.categoria_principal);
-      if (currentFilters.subcategoria) params.append('subcategoria', currentFilters.subcategoria);
-      if (currentFilters.pseudocategoria) params.append('seudocategoria', currentFilters.pseudocategoria);
-      if (currentFilters.genero !== 'all') params.append('genero', currentFilters.genero);
-      if (currentFilters.color !== 'all') params.append('color', currentFilters.color);
-      if (currentFilters.tono !== 'all') params.append('tono', currentFilters.tono);
-      if (currentFilters.funcion !== 'all') params.append('funcion', currentFilters.funcion);
-      if (currentFilters.contenido !== 'all') params.append('contenido', currentFilters.contenido);
-      if (currentFilters.ingrediente_clave !== 'all') params.append('ingrediente_clave', currentFilters.ingrediente_clave);
-      if (currentFilters.resistente_al_agua !== 'all') params.append('resistente_al_agua', currentFilters.resistente_al_agua);
-      
-      const response = await fetch(`/api/filtros/marcas?${params.toString()}`);
-      
-      if (!response.ok) {
-        throw new Error(`Error ${response.status}: ${response.statusText}`);
-      }
-      
-      const marcas = await response.json();
+      const data = await FacetasCatalogo.buscar(currentFilters);
+      const marcas = FacetasCatalogo.valores(data, 'marca');
       
       const targetElement = brandFilters;
       targetElement.innerHTML = "";
@@ -363,20 +349,11 @@ document.addEventListener("DOMContentLoaded", function () {
 
   // --- Funciones para actualizar filtros de especificaciones ---
 
-  async function updateDynamicFilter(filterName, filterKey, endpoint, sectionElement, contentElement) {
+  async function updateDynamicFilter(filterName, filterKey, faceta, sectionElement, contentElement) {
     try {
-      const params = new URLSearchParams();
-      // Añadir todos los filtros excepto el que se está actualizando
-      Object.entries(currentFilters).forEach(([key, value]) => {
-        if (key !== filterKey && value !== 'all' && value !== '') {
-          params.append(key, value);
-        }
-      });
-
-      const response = await fetch(`${endpoint}?${params.toString()}`);
-      if (!response.ok) throw new Error(`Error ${response.status}`);
-      
-      const options = await response.json();
+      // Los conteos de cada faceta ya excluyen su propia selección en el servidor.
+      const data = await FacetasCatalogo.buscar(currentFilters);
+      const options = FacetasCatalogo.valores(data, faceta);
       
       if (options.length > 0) {
         sectionElement.classList.remove('hidden');
@@ -415,31 +392,31 @@ document.addEventListener("DOMContentLoaded", function () {
   }
 
   function updateGenderFilters() {
-    return updateDynamicFilter('gender', 'genero', '/api/filtros/generos', genderFilterSection, genderFilters);
+    return updateDynamicFilter('gender', 'genero', 'genero', genderFilterSection, genderFilters);
   }
 
   function updateColorFilters() {
-    return updateDynamicFilter('color', 'color', '/api/filtros/colores', colorFilterSection, colorFilters);
+    return updateDynamicFilter('color', 'color', 'color', colorFilterSection, colorFilters);
   }
 
   function updateToneFilters() {
-    return updateDynamicFilter('tone', 'tono', '/api/filtros/tonos', toneFilterSection, toneFilters);
+    return updateDynamicFilter('tone', 'tono', 'tono', toneFilterSection, toneFilters);
   }
 
   function updateFunctionFilters() {
-    return updateDynamicFilter('function', 'funcion', '/api/filtros/funciones', functionFilterSection, functionFilters);
+    return updateDynamicFilter('function', 'funcion', 'funcion', functionFilterSection, functionFilters);
   }
 
   function updateContentFilters() {
-    return updateDynamicFilter('content', 'contenido', '/api/filtros/contenidos', contentFilterSection, contentFilters);
+    return updateDynamicFilter('content', 'contenido', 'contenido', contentFilterSection, contentFilters);
   }
 
   function updateIngredientFilters() {
-    return updateDynamicFilter('ingredient', 'ingrediente_clave', '/api/filtros/ingredientes_clave', ingredientFilterSection, ingredientFilters);
+    return updateDynamicFilter('ingredient', 'ingrediente_clave', 'ingrediente_clave', ingredientFilterSection, ingredientFilters);
   }
 
   function updateWaterproofFilters() {
-    return updateDynamicFilter('waterproof', 'resistente_al_agua', '/api/filtros/resistente_al_agua', waterproofFilterSection, waterproofFilters);
+    return updateDynamicFilter('waterproof', 'resistente_al_agua', 'resistente_al_agua', waterproofFilterSection, waterproofFilters);
   }
 
   function updateAppliedFiltersTags() {
@@ -596,18 +573,8 @@ document.addEventListener("DOMContentLoaded", function () {
 
   async function fetchAndSetPriceRange() {
     try {
-      const seudocategoriaNombre = window.appData.seudocategoriaActual.nombre;
-      const params = new URLSearchParams();
-      if (seudocategoriaNombre) {
-        params.append("seudocategoria", seudocategoriaNombre);
-      }
-      const url = `/api/productos/precios_rango?${params.toString()}`;
-
-      const response = await fetch(url);
-      if (!response.ok) {
-        throw new Error('Error al obtener el rango de precios');
-      }
-      const data = await response.json();
+      // El rango llega en la misma respuesta de la búsqueda facetada.
+      const data = (await FacetasCatalogo.buscar(currentFilters)).rango_precios;
       
       if (minPriceInput) {
         minPriceInput.placeholder = data.min_price ? `Mín. ${data.min_price}` : 'Mín. 0';
@@ -628,29 +595,19 @@ document.addEventListener("DOMContentLoaded", function () {
     showLoader();
     await new Promise(resolve => setTimeout(resolve, 300));
 
-    const params = new URLSearchParams();
-    
-    Object.keys(currentFilters).forEach(key => {
-      if (currentFilters[key] !== 'all' && currentFilters[key] !== '') {
-        params.append(key, currentFilters[key]);
-      }
-    });
-
-    const url = `/api/productos/filtrar?${params.toString()}`;
-
     try {
-      const response = await fetch(url);
-      if (!response.ok) {
-        throw new Error("Error al cargar los productos");
-      }
-      const products = await response.json();
-      allProducts = products;
+      // Primera página de la búsqueda facetada (la misma respuesta que usan los filtros).
+      const data = await FacetasCatalogo.buscar(currentFilters);
+      allProducts = data.productos;
+      currentPage = data.pagination.page;
+      totalProducts = data.pagination.total;
+      hasMoreProducts = data.pagination.has_next;
       
       hideLoader();
-      if (products.length === 0) {
+      if (allProducts.length === 0) {
         displayDynamicNoResultsMessage();
       } else {
-        renderProducts(allProducts.slice(0, productsPerPage), true);
+        renderProducts(allProducts, true);
       }
     } catch (error) {
       console.error(error);
@@ -737,22 +694,36 @@ document.addEventListener("DOMContentLoaded", function () {
 
     currentDisplayedProducts = productGrid.children.length;
     productCount.textContent = currentDisplayedProducts;
-    totalProductCount.textContent = allProducts.length;
+    totalProductCount.textContent = totalProducts;
 
-    loadMoreBtn.style.display = currentDisplayedProducts < allProducts.length ? "block" : "none";
+    loadMoreBtn.style.display = hasMoreProducts ? "block" : "none";
     showLessBtn.style.display = currentDisplayedProducts > productsPerPage ? "block" : "none";
   }
 
-  function loadMoreProducts() {
-    const nextBatch = allProducts.slice(
-      currentDisplayedProducts,
-      currentDisplayedProducts + productsPerPage
-    );
-    renderProducts(nextBatch, false); 
+  // MEJORA PROFESIONAL: "Cargar más" pide la siguiente página al servidor en lugar de
+  // recortar una lista completa descargada de antemano.
+  async function loadMoreProducts() {
+    if (isFetching || !hasMoreProducts) return;
+    isFetching = true;
+    try {
+      const data = await FacetasCatalogo.buscar(currentFilters, currentPage + 1);
+      currentPage = data.pagination.page;
+      hasMoreProducts = data.pagination.has_next;
+      allProducts = allProducts.concat(data.productos);
+      renderProducts(data.productos, false);
+    } catch (error) {
+      console.error('Error al cargar más productos:', error);
+    } finally {
+      isFetching = false;
+    }
   }
 
+  // Función para mostrar menos productos
   function showLessProducts() {
-    renderProducts(allProducts.slice(0, productsPerPage), true);
+    allProducts = allProducts.slice(0, productsPerPage);
+    currentPage = 1;
+    hasMoreProducts = totalProducts > productsPerPage;
+    renderProducts(allProducts, true);
     window.scrollTo({ top: 0, behavior: "smooth" });
   }
 
@@ -64,8 +64,11 @@ document.addEventListener("DOMContentLoaded", function () {
   const appliedFiltersContainer = document.getElementById("applied-filters");
   
   let allProducts = [];
-  const productsPerPage = 12;
+  const productsPerPage = FacetasCatalogo.POR_PAGINA;
   let currentDisplayedProducts = 0;
+  let currentPage = 1;
+  let totalProducts = 0;
+  let hasMoreProducts = false;
   let isFetching = false;
   let isUpdatingFilters = false;
 
@@ -264,24 +267,8 @@ document.addEventListener("DOMContentLoaded", function () {
 
   async function updatePseudocategoryFilters() {
     try {
-      const params = new URLSearchParams();
-      if (currentFilters.categoria_principal) params.append('categoria_principal', currentFilters.categoria_principal);
-      if (currentFilters.subcategoria && currentFilters.subcategoria !== 'all') params.append('subcategoria', currentFilters.subcategoria);
-      if (currentFilters.genero && currentFilters.genero !== 'all') params.append('genero', currentFilters.genero);
-      if (currentFilters.color && currentFilters.color !== 'all') params.append('color', currentFilters.color);
-      if (currentFilters.tono && currentFilters.tono !== 'all') params.append('tono', currentFilters.tono);
-      if (currentFilters.funcion && currentFilters.funcion !== 'all') params.append('funcion', currentFilters.funcion);
-      if (currentFilters.ingrediente_clave && currentFilters.ingrediente_clave !== 'all') params.append('ingrediente_clave', currentFilters.ingrediente_clave);
-      if (currentFilters.resistente_al_agua && currentFilters.resistente_al_agua !== 'all') params.append('resistente_al_agua', currentFilters.resistente_al_agua);
-      if (currentFilters.marca && currentFilters.marca !== 'all') params.append('marca', currentFilters.marca);
-      
-      const response = await fetch(`/api/filtros/seudocategorias?${params.toString()}`);
-      
-      if (!response.ok) {
-        throw new Error(`Error ${response.status}: ${response.statusText}`);
-      }
-      
-      const seudocategorias = await response.json();
+      const data = await FacetasCatalogo.buscar(currentFilters);
+      const seudocategorias = FacetasCatalogo.valores(data, 'seudocategoria').map(nombre => ({ nombre }));
       
       const targetElement = pseudocategoryFilters;
       targetElement.innerHTML = "";
@@ -374,24 +361,8 @@ document.addEventListener("DOMContentLoaded", function () {
 
   async function updateBrandFilters() {
     try {
-      const params = new URLSearchParams();
-      if (currentFilters.categoria_principal) params.append('categoria_principal', currentFilters.categoria_principal);
-      if (currentFilters.subcategoria && currentFilters.subcategoria !== 'all') params.append('subcategoria', currentFilters.subcategoria);
-      if (currentFilters.color && currentFilters.color !== 'all') params.append('color', currentFilters.color);
-      if (currentFilters.genero && currentFilters.genero !== 'all') params.append('genero', currentFilters.genero);
-      if (currentFilters.tono && currentFilters.tono !== 'all') params.append('tono', currentFilters.tono);
-      if (currentFilters.funcion && currentFilters.funcion !== 'all') params.append('funcion', currentFilters.funcion);
-      if (currentFilters.ingrediente_clave && currentFilters.ingrediente_clave !== 'all') params.append('ingrediente_clave', currentFilters.ingrediente_clave);
-      if (currentFilters.resistente_al_agua && currentFilters.resistente_al_agua !== 'all') params.append('resistente_al_agua', currentFilters.resistente_al_agua);
-      if (currentFilters.pseudocategoria && currentFilters.pseudocategoria !== 'all') params.append('seudocategoria', currentFilters.pseudocategoria);
-      
-      const response = await fetch(`/api/filtros/marcas?${params.toString()}`);
-      
-      if (!response.ok) {
-        throw new Error(`Error ${response.status}: ${response.statusText}`);
-      }
-      
-      const marcas = await response.json();
+      const data = await FacetasCatalogo.buscar(currentFilters);
+      const marcas = FacetasCatalogo.valores(data, 'marca');
       
       const targetElement = brandFilters;
       targetElement.innerHTML = "";
@@ -485,21 +456,8 @@ document.addEventListener("DOMContentLoaded", function () {
   // Función para actualizar las opciones de género
   async function updateGenderFilters() {
     try {
-      const params = new URLSearchParams();
-      if (currentFilters.categoria_principal) params.append('categoria_principal', currentFilters.categoria_principal);
-      if (currentFilters.subcategoria && currentFilters.subcategoria !== 'all') params.append('subcategoria', currentFilters.subcategoria);
-      if (currentFilters.pseudocategoria && currentFilters.pseudocategoria !== 'all') params.append('seudocategoria', currentFilters.pseudocategoria);
-      if (currentFilters.marca && currentFilters.marca !== 'all') params.append('marca', currentFilters.marca);
-      if (currentFilters.color && currentFilters.color !== 'all') params.append('color', currentFilters.color);
-      if (currentFilters.tono && currentFilters.tono !== 'all') params.append('tono', currentFilters.tono);
-      if (currentFilters.funcion && currentFilters.funcion !== 'all') params.append('funcion', currentFilters.funcion);
-      if (currentFilters.ingrediente_clave && currentFilters.ingrediente_clave !== 'all') params.append('ingrediente_clave', currentFilters.ingrediente_clave);
-      if (currentFilters.resistente_al_agua && currentFilters.resistente_al_agua !== 'all') params.append('resistente_al_agua', currentFilters.resistente_al_agua);
-
-      const response = await fetch(`/api/filtros/generos?${params.toString()}`);
-      if (!response.ok) throw new Error(`Error ${response.status}`);
-      
-      const generos = await response.json();
+      const data = await FacetasCatalogo.buscar(currentFilters);
+      const generos = FacetasCatalogo.valores(data, 'genero');
       
       genderFilterSection.classList.toggle('hidden', generos.length === 0);
 
@@ -536,21 +494,8 @@ document.addEventListener("DOMContentLoaded", function () {
   // Función para actualizar las opciones de color
   async function updateColorFilters() {
     try {
-      const params = new URLSearchParams();
-      if (currentFilters.categoria_principal) params.append('categoria_principal', currentFilters.categoria_principal);
-      if (currentFilters.subcategoria && currentFilters.subcategoria !== 'all') params.append('subcategoria', currentFilters.subcategoria);
-      if (currentFilters.pseudocategoria && currentFilters.pseudocategoria !== 'all') params.append('seudocategoria', currentFilters.pseudocategoria);
-      if (currentFilters.marca && currentFilters.marca !== 'all') params.append('marca', currentFilters.marca);
-      if (currentFilters.genero && currentFilters.genero !== 'all') params.append('genero', currentFilters.genero);
-      if (currentFilters.tono && currentFilters.tono !== 'all') params.append('tono', currentFilters.tono);
-      if (currentFilters.funcion && currentFilters.funcion !== 'all') params.append('funcion', currentFilters.funcion);
-      if (currentFilters.ingrediente_clave && currentFilters.ingrediente_clave !== 'all') params.append('ingrediente_clave', currentFilters.ingrediente_clave);
-      if (currentFilters.resistente_al_agua && currentFilters.resistente_al_agua !== 'all') params.append('resistente_al_agua', currentFilters.resistente_al_agua);
-
-      const response = await fetch(`/api/filtros/colores?${params.toString()}`);
-      if (!response.ok) throw new Error(`Error ${response.status}`);
-      
-      const colores = await response.json();
+      const data = await FacetasCatalogo.buscar(currentFilters);
+      const colores = FacetasCatalogo.valores(data, 'color');
       
       colorFilterSection.classList.toggle('hidden', colores.length === 0);
 
@@ -587,21 +532,8 @@ document.addEventListener("DOMContentLoaded", function () {
   // Función para actualizar las opciones de tono
   async function updateToneFilters() {
     try {
-      const params = new URLSearchParams();
-      if (currentFilters.categoria_principal) params.append('categoria_principal', currentFilters.categoria_principal);
-      if (currentFilters.subcategoria && currentFilters.subcategoria !== 'all') params.append('subcategoria', currentFilters.subcategoria);
-      if (currentFilters.pseudocategoria && currentFilters.pseudocategoria !== 'all') params.append('seudocategoria', currentFilters.pseudocategoria);
-      if (currentFilters.marca && currentFilters.marca !== 'all') params.append('marca', currentFilters.marca);
-      if (currentFilters.genero && currentFilters.genero !== 'all') params.append('genero', currentFilters.genero);
-      if (currentFilters.color && currentFilters.color !== 'all') params.append('color', currentFilters.color);
-      if (currentFilters.funcion && currentFilters.funcion !== 'all') params.append('funcion', currentFilters.funcion);
-      if (currentFilters.ingrediente_clave && currentFilters.ingrediente_clave !== 'all') params.append('ingrediente_clave', currentFilters.ingrediente_clave);
-      if (currentFilters.resistente_al_agua && currentFilters.resistente_al_agua !== 'all') params.append('resistente_al_agua', currentFilters.resistente_al_agua);
-
-      const response = await fetch(`/api/filtros/tonos?${params.toString()}`);
-      if (!response.ok) throw new Error(`Error ${response.status}`);
-      
-      const tonos = await response.json();
+      const data = await FacetasCatalogo.buscar(currentFilters);
+      const tonos = FacetasCatalogo.valores(data, 'tono');
       
       toneFilterSection.classList.toggle('hidden', tonos.length === 0);
 
@@ -637,21 +569,8 @@ document.addEventListener("DOMContentLoaded", function () {
   // Función para actualizar las opciones de función
   async function updateFunctionFilters() {
     try {
-      const params = new URLSearchParams();
-      if (currentFilters.categoria_principal) params.append('categoria_principal', currentFilters.categoria_principal);
-      if (currentFilters.subcategoria && currentFilters.subcategoria !== 'all') params.append('subcategoria', currentFilters.subcategoria);
-      if (currentFilters.pseudocategoria && currentFilters.pseudocategoria !== 'all') params.append('seudocategoria', currentFilters.pseudocategoria);
-      if (currentFilters.marca && currentFilters.marca !== 'all') params.append('marca', currentFilters.marca);
-      if (currentFilters.genero && currentFilters.genero !== 'all') params.append('genero', currentFilters.genero);
-      if (currentFilters.color && currentFilters.color !== 'all') params.append('color', currentFilters.color);
-      if (currentFilters.tono && currentFilters.tono !== 'all') params.append('tono', currentFilters.tono);
-      if (currentFilters.ingrediente_clave && currentFilters.ingrediente_clave !== 'all') params.append('ingrediente_clave', currentFilters.ingrediente_clave);
-      if (currentFilters.resistente_al_agua && currentFilters.resistente_al_agua !== 'all') params.append('resistente_al_agua', currentFilters.resistente_al_agua);
-
-      const response = await fetch(`/api/filtros/funciones?${params.toString()}`);
-      if (!response.ok) throw new Error(`Error ${response.status}`);
-
-      const funciones = await response.json();
+      const data = await FacetasCatalogo.buscar(currentFilters);
+      const funciones = FacetasCatalogo.valores(data, 'funcion');
 
       functionFilterSection.classList.toggle('hidden', funciones.length === 0);
 
@@ -688,21 +607,8 @@ document.addEventListener("DOMContentLoaded", function () {
   // Función para actualizar las opciones de ingrediente clave
   async function updateIngredientFilters() {
     try {
-      const params = new URLSearchParams();
-      if (currentFilters.categoria_principal) params.append('categoria_principal', currentFilters.categoria_principal);
-      if (currentFilters.subcategoria && currentFilters.subcategoria !== 'all') params.append('subcategoria', currentFilters.subcategoria);
-      if (currentFilters.pseudocategoria && currentFilters.pseudocategoria !== 'all') params.append('seudocategoria', currentFilters.pseudocategoria);
-      if (currentFilters.marca && currentFilters.marca !== 'all') params.append('marca', currentFilters.marca);
-      if (currentFilters.genero && currentFilters.genero !== 'all') params.append('genero', currentFilters.genero);
-      if (currentFilters.color && currentFilters.color !== 'all') params.append('color', currentFilters.color);
-      if (currentFilters.tono && currentFilters.tono !== 'all') params.append('tono', currentFilters.tono);
-      if (currentFilters.funcion && currentFilters.funcion !== 'all') params.append('funcion', currentFilters.funcion);
-      if (currentFilters.resistente_al_agua && currentFilters.resistente_al_agua !== 'all') params.append('resistente_al_agua', currentFilters.resistente_al_agua);
-
-      const response = await fetch(`/api/filtros/ingredientes_clave?${params.toString()}`);
-      if (!response.ok) throw new Error(`Error ${response.status}`);
-
-      const ingredientes = await response.json();
+      const data = await FacetasCatalogo.buscar(currentFilters);
+      const ingredientes = FacetasCatalogo.valores(data, 'ingrediente_clave');
 
       ingredientFilterSection.classList.toggle('hidden', ingredientes.length === 0);
 
@@ -739,21 +645,8 @@ document.addEventListener("DOMContentLoaded", function () {
   // Función para actualizar las opciones de resistente al agua
   async function updateWaterproofFilters() {
     try {
-      const params = new URLSearchParams();
-      if (currentFilters.categoria_principal) params.append('categoria_principal', currentFilters.categoria_principal);
-      if (currentFilters.subcategoria && currentFilters.subcategoria !== 'all') params.append('subcategoria', currentFilters.subcategoria);
-      if (currentFilters.pseudocategoria && currentFilters.pseudocategoria !== 'all') params.append('seudocategoria', currentFilters.pseudocategoria);
-      if (currentFilters.marca && currentFilters.marca !== 'all') params.append('marca', currentFilters.marca);
-      if (currentFilters.genero && currentFilters.genero !== 'all') params.append('genero', currentFilters.genero);
-      if (currentFilters.color && currentFilters.color !== 'all') params.append('color', currentFilters.color);
-      if (currentFilters.tono && currentFilters.tono !== 'all') params.append('tono', currentFilters.tono);
-      if (currentFilters.funcion && currentFilters.funcion !== 'all') params.append('funcion', currentFilters.funcion);
-      if (currentFilters.ingrediente_clave && currentFilters.ingrediente_clave !== 'all') params.append('ingrediente_clave', currentFilters.ingrediente_clave);
-
-      const response = await fetch(`/api/filtros/resistente_al_agua?${params.toString()}`);
-      if (!response.ok) throw new Error(`Error ${response.status}`);
-
-      const opciones = await response.json();
+      const data = await FacetasCatalogo.buscar(currentFilters);
+      const opciones = FacetasCatalogo.valores(data, 'resistente_al_agua');
 
       waterproofFilterSection.classList.toggle('hidden', opciones.length === 0);
 
@@ -940,22 +833,8 @@ document.addEventListener("DOMContentLoaded", function () {
 
   async function fetchAndSetPriceRange() {
     try {
-      const categoriaPrincipalNombre = window.appData.categoriaPrincipal.nombre;
-      const subcategoriaNombre = window.appData.subcategoriaActual.nombre;
-      const params = new URLSearchParams();
-      if (categoriaPrincipalNombre) {
-        params.append("categoria_principal", categoriaPrincipalNombre);
-      }
-      if (subcategoriaNombre) {
-        params.append("subcategoria", subcategoriaNombre);
-      }
-      const url = `/api/productos/precios_rango?${params.toString()}`;
-
-      const response = await fetch(url);
-      if (!response.ok) {
-        throw new Error('Error al obtener el rango de precios');
-      }
-      const data = await response.json();
+      // El rango llega en la misma respuesta de la búsqueda facetada.
+      const data = (await FacetasCatalogo.buscar(currentFilters)).rango_precios;
       
       if (minPriceInput) {
         minPriceInput.placeholder = data.min_price ? `Mín. ${data.min_price}` : 'Mín. 0';
@@ -976,29 +855,19 @@ document.addEventListener("DOMContentLoaded", function () {
     showLoader();
     await new Promise(resolve => setTimeout(resolve, 300));
 
-    const params = new URLSearchParams();
-    
-    Object.keys(currentFilters).forEach(key => {
-      if (currentFilters[key] !== 'all' && currentFilters[key] !== '') {
-        params.append(key, currentFilters[key]);
-      }
-    });
-
-    const url = `/api/productos/filtrar?${params.toString()}`;
-
     try {
-      const response = await fetch(url);
-      if (!response.ok) {
-        throw new Error("Error al cargar los productos");
-      }
-      const products = await response.json();
-      allProducts = products;
+      // Primera página de la búsqueda facetada (la misma respuesta que usan los filtros).
+      const data = await FacetasCatalogo.buscar(currentFilters);
+      allProducts = data.productos;
+      currentPage = data.pagination.page;
+      totalProducts = data.pagination.total;
+      hasMoreProducts = data.pagination.has_next;
       
       hideLoader();
-      if (products.length === 0) {
+      if (allProducts.length === 0) {
         displayDynamicNoResultsMessage();
       } else {
-        renderProducts(allProducts.slice(0, productsPerPage), true);
+        renderProducts(allProducts, true);
         updateCategoryInfo();
       }
     } catch (error) {
@@ -1120,22 +989,36 @@ document.addEventListener("DOMContentLoaded", function () {
 
     currentDisplayedProducts = productGrid.children.length;
     productCount.textContent = currentDisplayedProducts;
-    totalProductCount.textContent = allProducts.length;
+    totalProductCount.textContent = totalProducts;
 
-    loadMoreBtn.style.display = currentDisplayedProducts < allProducts.length ? "block" : "none";
+    loadMoreBtn.style.display = hasMoreProducts ? "block" : "none";
     showLessBtn.style.display = currentDisplayedProducts > productsPerPage ? "block" : "none";
   }
 
-  function loadMoreProducts() {
-    const nextBatch = allProducts.slice(
-      currentDisplayedProducts,
-      currentDisplayedProducts + productsPerPage
-    );
-    renderProducts(nextBatch, false); 
+  // MEJORA PROFESIONAL: "Cargar más" pide la siguiente página al servidor en lugar de
+  // recortar una lista completa descargada de antemano.
+  async function loadMoreProducts() {
+    if (isFetching || !hasMoreProducts) return;
+    isFetching = true;
+    try {
+      const data = await FacetasCatalogo.buscar(currentFilters, currentPage + 1);
+      currentPage = data.pagination.page;
+      hasMoreProducts = data.pagination.has_next;
+      allProducts = allProducts.concat(data.productos);
+      renderProducts(data.productos, false);
+    } catch (error) {
+      console.error('Error al cargar más productos:', error);
+    } finally {
+      isFetching = false;
+    }
   }
 
+  // Función para mostrar menos productos
   function showLessProducts() {
-    renderProducts(allProducts.slice(0, productsPerPage), true);
+    allProducts = allProducts.slice(0, productsPerPage);
+    currentPage = 1;
+    hasMoreProducts = totalProducts > productsPerPage;
+    renderProducts(allProducts, true);
     window.scrollTo({ top: 0, behavior: "smooth" });
   }
   init();
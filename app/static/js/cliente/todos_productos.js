@@ -53,8 +53,11 @@ document.addEventListener("DOMContentLoaded", function () {
   const appliedFiltersContainer = document.getElementById("applied-filters");
 
   let allProducts = [];
-  const productsPerPage = 12;
+  const productsPerPage = FacetasCatalogo.POR_PAGINA;
   let currentDisplayedProducts = 0;
+  let currentPage = 1;
+  let totalProducts = 0;
+  let hasMoreProducts = false;
   let isFetching = false;
   let isUpdatingFilters = false; // Bandera para evitar actualizaciones simultáneas
 
@@ -187,25 +190,17 @@ document.addEventListener("DOMContentLoaded", function () {
     `;
   }
 
-  // Función genérica para actualizar un tipo de filtro
-  async function updateFilterGroup(endpoint, container, filterKey, allLabel) {
+  // Función genérica para actualizar un tipo de filtro.
+  // MEJORA PROFESIONAL: Los valores salen de la respuesta de la búsqueda facetada, que
+  // todos los grupos comparten (una sola petición en lugar de una por grupo).
+  async function updateFilterGroup(faceta, container, filterKey, allLabel) {
     try {
-      const params = new URLSearchParams();
-      if (currentFilters.categoria_principal && currentFilters.categoria_principal !== 'all') params.append('categoria_principal', currentFilters.categoria_principal);
-      if (currentFilters.subcategoria && currentFilters.subcategoria !== 'all') params.append('subcategoria', currentFilters.subcategoria);
-      if (currentFilters.pseudocategoria && currentFilters.pseudocategoria !== 'all') params.append('seudocategoria', currentFilters.pseudocategoria);
-      if (currentFilters.marca && currentFilters.marca !== 'all') params.append('marca', currentFilters.marca);
-      if (currentFilters.genero && currentFilters.genero !== 'all') params.append('genero', currentFilters.genero);
-
-      const response = await fetch(`${endpoint}?${params.toString()}`);
-      if (!response.ok) throw new Error(`Error ${response.status}`);
-      
-      const items = await response.json();
+      const data = await FacetasCatalogo.buscar(currentFilters);
+      const items = FacetasCatalogo.valores(data, faceta);
       
       container.innerHTML = createFilterOption(filterKey, 'all', allLabel, currentFilters[filterKey] === 'all', true);
 
-      items.forEach(item => {
-        const name = typeof item === 'string' ? item : item.nombre;
+      items.forEach(name => {
         container.innerHTML += createFilterOption(filterKey, name, name, currentFilters[filterKey] === name);
       });
 
@@ -234,32 +229,32 @@ document.addEventListener("DOMContentLoaded", function () {
 
   // Funciones específicas para cada filtro
   function updateCategoryFilters() {
-    return updateFilterGroup('/api/filtros/categorias', categoryFilters, 'categoria_principal', 'Todas las categorías');
+    return updateFilterGroup('categoria_principal', categoryFilters, 'categoria_principal', 'Todas las categorías');
   }
 
   // Función para popular los filtros de subcategoría
   function updateSubcategoryFilters() {
-    return updateFilterGroup('/api/filtros/subcategorias', subcategoryFilters, 'subcategoria', 'Todas las subcategorías');
+    return updateFilterGroup('subcategoria', subcategoryFilters, 'subcategoria', 'Todas las subcategorías');
   }
 
   // Función para popular los filtros de pseudocategoría
   function updatePseudocategoryFilters() {
-    return updateFilterGroup('/api/filtros/seudocategorias', pseudocategoryFilters, 'pseudocategoria', 'Todas las pseudocategorías');
+    return updateFilterGroup('seudocategoria', pseudocategoryFilters, 'pseudocategoria', 'Todas las pseudocategorías');
   }
 
   // Función para actualizar las opciones de marcas
   function updateBrandFilters() {
-    return updateFilterGroup('/api/filtros/marcas', brandFilters, 'marca', 'Todas las marcas');
+    return updateFilterGroup('marca', brandFilters, 'marca', 'Todas las marcas');
   }
 
   // Función para actualizar las opciones de género
   function updateGenderFilters() {
-    return updateFilterGroup('/api/filtros/generos', genderFilters, 'genero', 'Todos los géneros');
+    return updateFilterGroup('genero', genderFilters, 'genero', 'Todos los géneros');
   }
 
   // MEJORA: Función para actualizar las opciones de función
   function updateFunctionFilters() {
-    return updateFilterGroup('/api/filtros/funciones', functionFilters, 'funcion', 'Todas las funciones');
+    return updateFilterGroup('funcion', functionFilters, 'funcion', 'Todas las funciones');
   }
 
   // Función para actualizar las etiquetas de filtros aplicados
@@ -376,32 +371,22 @@ document.addEventListener("DOMContentLoaded", function () {
     showLoader();
     await new Promise(resolve => setTimeout(resolve, 300));
 
-    const params = new URLSearchParams();
-    
-    // Agregar todos los filtros actuales
     currentFilters.ordenar_por = sortSelect.value;
-    Object.keys(currentFilters).forEach(key => {
-      if (currentFilters[key] !== 'all' && currentFilters[key] !== '') {
-        params.append(key, currentFilters[key]);
-      }
-    });
-
-    const url = `/api/productos/filtrar?${params.toString()}`;
 
     try {
-      const response = await fetch(url);
-      if (!response.ok) {
-        throw new Error("Error al cargar los productos");
-      }
-      const products = await response.json();
-      allProducts = products;
+      // Primera página de la búsqueda facetada (la misma respuesta que usan los filtros).
+      const data = await FacetasCatalogo.buscar(currentFilters);
+      allProducts = data.productos;
+      currentPage = data.pagination.page;
+      totalProducts = data.pagination.total;
+      hasMoreProducts = data.pagination.has_next;
       
       hideLoader();
 
-      if (products.length === 0) {
+      if (allProducts.length === 0) {
         displayDynamicNoResultsMessage();
       } else {
-        renderProducts(allProducts.slice(0, productsPerPage), true);
+        renderProducts(allProducts, true);
         updateCategoryInfo();
       }
     } catch (error) {
@@ -597,30 +582,43 @@ document.addEventListener("DOMContentLoaded", function () {
 
     currentDisplayedProducts = productGrid.children.length;
     productCount.textContent = currentDisplayedProducts;
-    totalProductCount.textContent = allProducts.length;
+    totalProductCount.textContent = totalProducts;
 
-    loadMoreBtn.style.display = currentDisplayedProducts < allProducts.length ? "block" : "none";
+    loadMoreBtn.style.display = hasMoreProducts ? "block" : "none";
     showLessBtn.style.display = currentDisplayedProducts > productsPerPage ? "block" : "none";
   }
 
-  function loadMoreProducts() {
-    const nextBatch = allProducts.slice(currentDisplayedProducts, currentDisplayedProducts + productsPerPage);
-    renderProducts(nextBatch, false);
+  // MEJORA PROFESIONAL: "Cargar más" pide la siguiente página al servidor en lugar de
+  // recortar una lista completa descargada de antemano.
+  async function loadMoreProducts() {
+    if (isFetching || !hasMoreProducts) return;
+    isFetching = true;
+    try {
+      const data = await FacetasCatalogo.buscar(currentFilters, currentPage + 1);
+      currentPage = data.pagination.page;
+      hasMoreProducts = data.pagination.has_next;
+      allProducts = allProducts.concat(data.productos);
+      renderProducts(data.productos, false);
+    } catch (error) {
+      console.error('Error al cargar más productos:', error);
+    } finally {
+      isFetching = false;
+    }
   }
 
   function showLessProducts() {
-    renderProducts(allProducts.slice(0, productsPerPage), true);
+    allProducts = allProducts.slice(0, productsPerPage);
+    currentPage = 1;
+    hasMoreProducts = totalProducts > productsPerPage;
+    renderProducts(allProducts, true);
     window.scrollTo({ top: 0, behavior: "smooth" });
   }
 
   // Función para obtener y establecer el rango de precios
   async function fetchAndSetPriceRange() {
     try {
-      const response = await fetch('/api/productos/precios_rango');
-      if (!response.ok) {
-        throw new Error('Error al obtener el rango de precios');
-      }
-      const data = await response.json();
+      // El rango llega en la misma respuesta de la búsqueda facetada.
+      const data = (await FacetasCatalogo.buscar(currentFilters)).rango_precios;
       
       if (minPriceInput) {
         // MEJORA: No establecer el valor, sino el placeholder para evitar el filtrado automático.
@@ -17,6 +17,7 @@ Funcionalidades principales:
 import functools
 from flask import request, jsonify, current_app, redirect, url_for, flash
 from app.models.domains.user_models import Admins
+from app.utils.identity import decode_token_cached, get_admin_por_id
 from typing import Callable, TypeVar, cast, Any
 import jwt
 from jwt import ExpiredSignatureError, InvalidTokenError
@@ -86,7 +87,8 @@ def admin_jwt_required(f: F) -> F:
     2. Si no hay token, redirige al login de administrador con un mensaje de error.
     3. Decodifica el token. Si es inválido o ha expirado, redirige al login.
     4. Verifica que el payload contenga `user_id` y el flag `is_admin`.
-    5. Recupera el objeto `Admins` de la base de datos.
+    5. Recupera el objeto `Admins` mediante el resolutor de identidad por petición,
+       reutilizando el que ya cargó el middleware `before_request`.
     6. Si el administrador es válido, lo inyecta como primer argumento en la función
        de la ruta decorada.
     7. Si algún paso falla, redirige al login y muestra un mensaje flash apropiado.
@@ -104,7 +106,7 @@ def admin_jwt_required(f: F) -> F:
 
         try:
 
-            payload = decode_admin_jwt_token(token)
+            payload = decode_token_cached('admin', token, decode_admin_jwt_token)
             if not payload:
                 flash('Tu sesión de administrador ha expirado o es inválida. Por favor, inicia sesión de nuevo.', 'warning')
                 return redirect(url_for('admin_auth.login'))
@@ -116,7 +118,7 @@ def admin_jwt_required(f: F) -> F:
                 flash('Acceso denegado. Credenciales de administrador inválidas.', 'danger')
                 return redirect(url_for('admin_auth.login'))
 
-            admin_user = Admins.query.get(user_id)
+            admin_user = get_admin_por_id(user_id)
             if not admin_user:
                 current_app.logger.error(f'Usuario administrador no encontrado para el ID: {user_id}')
                 flash('Acceso denegado. Usuario no autorizado.', 'danger')
@@ -0,0 +1,295 @@
+"""
+Módulo de Analíticas de Compras por Cliente.
+
+`order.categorias_compras` cargaba todos los pedidos del usuario y, por cada uno,
+consultaba sus líneas (`PedidoProducto`) y, por cada línea, el producto y sus tres
+niveles de categoría: O(pedidos × líneas) consultas. `order.estadisticas_compras`
+traía todos los pedidos completados a Python para agruparlos por mes, trimestre o año.
+
+Ahora cada analítica es una única consulta agrupada:
+- `categorias_compras`: Sube por la jerarquía de categorías con `joins` y agrupa por
+  categoría principal (total gastado, unidades y productos distintos).
+- `estadisticas_pedidos`: Contadores de pedidos por estado, gasto total y fecha del
+  último pedido, con un único `GROUP BY estado_pedido, estado`.
+- `compras_por_mes`: Agrupa los pedidos completados por año y mes (`EXTRACT`, que
+  funciona igual en PostgreSQL y SQLite). `agrupar_por_periodo` pliega esas filas
+  (a lo sumo doce por año) en trimestres o años sin volver a la base de datos.
+
+Los resultados se guardan por usuario en una caché versionada con TTL, como la del
+árbol de navegación: cada consulta se cachea con la versión vigente del usuario en el
+`VersionStore`, y un listener de la sesión incrementa esa versión tras el `commit` que
+crea, elimina o modifica un pedido del usuario (p. ej. un cambio de `estado_pedido`).
+El `VersionStore` se selecciona con `CUSTOMER_ANALYTICS_CACHE_BACKEND` (ver `app.utils.backends`).
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.models.domains.order_models import Pedido, PedidoProducto
+from app.models.domains.product_models import CategoriasPrincipales, Productos, Seudocategorias, Subcategorias
+from app.models.enums import EstadoEnum, EstadoPedido
+from app.utils.backends import VERSION_STORES, InMemoryVersionStore, VersionStore
+from app.utils.invalidacion import InvalidacionTrasCommit
+
+_listeners_registrados = False
+
+# Número máximo de consultas cacheadas por proceso (se descartan las menos usadas).
+_MAX_ENTRADAS = 5000
+
+_store: VersionStore = InMemoryVersionStore()
+_ttl_segundos = 600
+_lock = threading.Lock()
+# {(usuario_id, consulta): (versión, expiración, datos)}, en orden de uso.
+_entradas: 'OrderedDict[Tuple[str, Hashable], Tuple[int, float, object]]' = OrderedDict()
+
+
+def init_analitica_clientes(app) -> None:
+    """
+    Configura la caché de analíticas por cliente y registra los listeners de invalidación.
+
+    Args:
+        app (Flask): La aplicación Flask.
+    """
+    global _store, _ttl_segundos
+    _store = VERSION_STORES.crear(app, 'CUSTOMER_ANALYTICS_CACHE_BACKEND')
+    _ttl_segundos = app.config.get('CUSTOMER_ANALYTICS_CACHE_TTL_SECONDS', 600)
+    with _lock:
+        _entradas.clear()
+    _registrar_listeners()
+
+
+def _clave_version(usuario_id: str) -> str:
+    return f'analitica_cliente:{usuario_id}'
+
+
+def _cacheado(usuario_id: str, consulta: Hashable, calcular: Callable[[], object]):
+    """
+    Devuelve el resultado cacheado de una consulta del usuario o lo calcula y lo guarda.
+
+    La versión se lee antes de calcular: si un `commit` la incrementa mientras tanto, el
+    resultado queda guardado con la versión anterior y se descarta en la siguiente lectura.
+    """
+    clave = (usuario_id, consulta)
+    version = _store.get(_clave_version(usuario_id))
+    with _lock:
+        entrada = _entradas.get(clave)
+        if entrada and entrada[0] == version and entrada[1] > time.monotonic():
+            _entradas.move_to_end(clave)
+            return entrada[2]
+    datos = calcular()
+    with _lock:
+        _entradas[clave] = (version, time.monotonic() + _ttl_segundos, datos)
+        _entradas.move_to_end(clave)
+        while len(_entradas) > _MAX_ENTRADAS:
+            _entradas.popitem(last=False)
+    return datos
+
+
+def invalidar_usuario(usuario_id: str) -> None:
+    """
+    Invalida las analíticas cacheadas de un usuario en todos los workers.
+
+    Debe llamarse después del `commit`; los cambios hechos con el ORM sobre `Pedido`
+    ya lo hacen solos (ver `_registrar_listeners`).
+
+    Args:
+        usuario_id (str): El ID del usuario.
+    """
+    _store.bump(_clave_version(usuario_id))
+
+
+_INVALIDACION = InvalidacionTrasCommit('analíticas de clientes', invalidar_usuario)
+
+
+def _rango(consulta, desde: Optional[datetime], hasta: Optional[datetime]):
+    """Aplica el rango `[desde, hasta)` sobre `Pedido.created_at`."""
+    if desde is not None:
+        consulta = consulta.where(Pedido.created_at >= desde)
+    if hasta is not None:
+        consulta = consulta.where(Pedido.created_at < hasta)
+    return consulta
+
+
+def categorias_compras(usuario_id: str, estado_pedido: Optional[EstadoPedido] = EstadoPedido.COMPLETADO,
+                       search: str = '', desde: Optional[datetime] = None,
+                       hasta: Optional[datetime] = None) -> List[dict]:
+    """
+    Agrega las compras de un usuario por categoría principal.
+
+    Args:
+        usuario_id (str): El ID del usuario.
+        estado_pedido (EstadoPedido, optional): Filtra por estado; None incluye todos.
+        search (str): Fragmento del ID del pedido.
+        desde (datetime, optional): Inicio del rango (inclusive).
+        hasta (datetime, optional): Fin del rango (exclusivo).
+
+    Returns:
+        List[dict]: Por categoría, `nombre`, `total`, `cantidad` y `productos_count`,
+        de mayor a menor gasto.
+    """
+    def calcular():
+        total = func.sum(PedidoProducto.precio_unitario * PedidoProducto.cantidad)
+        consulta = (
+            select(
+                CategoriasPrincipales.nombre,
+                total,
+                func.sum(PedidoProducto.cantidad),
+                func.count(func.distinct(PedidoProducto.producto_id)),
+            )
+            .select_from(Pedido)
+            .join(PedidoProducto, PedidoProducto.pedido_id == Pedido.id)
+            .join(Productos, Productos.id == PedidoProducto.producto_id)
+            .join(Seudocategorias, Seudocategorias.id == Productos.seudocategoria_id)
+            .join(Subcategorias, Subcategorias.id == Seudocategorias.subcategoria_id)
+            .join(CategoriasPrincipales, CategoriasPrincipales.id == Subcategorias.categoria_principal_id)
+            .where(Pedido.usuario_id == usuario_id)
+            .group_by(CategoriasPrincipales.nombre)
+            .order_by(total.desc())
+        )
+        if estado_pedido is not None:
+            consulta = consulta.where(Pedido.estado_pedido == estado_pedido)
+        if search:
+            consulta = consulta.where(Pedido.id.ilike(f'%{search}%'))
+        consulta = _rango(consulta, desde, hasta)
+        return [
+            {'nombre': nombre, 'total': float(total or 0), 'cantidad': int(cantidad or 0),
+             'productos_count': productos}
+            for nombre, total, cantidad, productos in db.session.execute(consulta)
+        ]
+
+    estado = estado_pedido.value if estado_pedido is not None else None
+    return _cacheado(usuario_id, ('categorias', estado, search, desde, hasta), calcular)
+
+
+def compras_por_mes(usuario_id: str, desde: Optional[datetime] = None,
+                    hasta: Optional[datetime] = None) -> Dict[Tuple[int, int], dict]:
+    """
+    Agrupa los pedidos completados de un usuario por año y mes.
+
+    Args:
+        usuario_id (str): El ID del usuario.
+        desde (datetime, optional): Inicio del rango (inclusive).
+        hasta (datetime, optional): Fin del rango (exclusivo).
+
+    Returns:
+        Dict[Tuple[int, int], dict]: `{(año, mes): {'total': float, 'count': int}}`.
+    """
+    def calcular():
+        anio = db.extract('year', Pedido.created_at)
+        mes = db.extract('month', Pedido.created_at)
+        consulta = _rango(
+            select(anio, mes, func.sum(Pedido.total), func.count(Pedido.id))
+            .where(Pedido.usuario_id == usuario_id, Pedido.estado_pedido == EstadoPedido.COMPLETADO)
+            .group_by(anio, mes),
+            desde, hasta,
+        )
+        return {
+            (int(a), int(m)): {'total': float(total or 0), 'count': count}
+            for a, m, total, count in db.session.execute(consulta)
+        }
+
+    return _cacheado(usuario_id, ('mensual', desde, hasta), calcular)
+
+
+def estadisticas_pedidos(usuario_id: str) -> dict:
+    """
+    Devuelve los contadores de pedidos por estado y el gasto total de un usuario.
+
+    Una única consulta agrupada por `(estado_pedido, estado)` alimenta el perfil, las
+    pestañas de "Mis pedidos" y "Mis compras" y el detalle del cliente en el panel.
+
+    Args:
+        usuario_id (str): El ID del usuario.
+
+    Returns:
+        dict: Con las claves:
+            - `en_proceso`: Pedidos en proceso activos (los que ve el cliente).
+            - `en_proceso_inactivos`: Pedidos en proceso desactivados por un administrador.
+            - `completado`, `cancelado`: Pedidos en esos estados (activos e inactivos).
+            - `todos`: Los pedidos visibles para el cliente (`en_proceso + completado + cancelado`).
+            - `total_gastado`: Suma de `total` de los pedidos completados.
+            - `ultimo_pedido_en`: Fecha del pedido más reciente (o None).
+    """
+    def calcular():
+        filas = db.session.execute(
+            select(Pedido.estado_pedido, Pedido.estado, func.count(Pedido.id),
+                   func.sum(Pedido.total), func.max(Pedido.created_at))
+            .where(Pedido.usuario_id == usuario_id)
+            .group_by(Pedido.estado_pedido, Pedido.estado)
+        ).all()
+        stats = {'en_proceso': 0, 'en_proceso_inactivos': 0, 'completado': 0, 'cancelado': 0,
+                 'total_gastado': 0.0, 'ultimo_pedido_en': None}
+        for estado_pedido, estado, cantidad, total, ultimo in filas:
+            if estado_pedido == EstadoPedido.EN_PROCESO:
+                clave = 'en_proceso' if estado == EstadoEnum.ACTIVO else 'en_proceso_inactivos'
+            elif estado_pedido == EstadoPedido.COMPLETADO:
+                clave = 'completado'
+                stats['total_gastado'] += float(total or 0)
+            else:
+                clave = 'cancelado'
+            stats[clave] += cantidad
+            if ultimo and (stats['ultimo_pedido_en'] is None or ultimo > stats['ultimo_pedido_en']):
+                stats['ultimo_pedido_en'] = ultimo
+        stats['todos'] = stats['en_proceso'] + stats['completado'] + stats['cancelado']
+        return stats
+
+    return dict(_cacheado(usuario_id, ('estadisticas_pedidos',), calcular))
+
+
+def agrupar_por_periodo(mensual: Dict[Tuple[int, int], dict], periodo: str) -> Dict[Hashable, dict]:
+    """
+    Pliega los totales mensuales en meses, trimestres o años.
+
+    Args:
+        mensual (dict): El resultado de `compras_por_mes`.
+        periodo (str): 'mes', 'trimestre' o 'año'.
+
+    Returns:
+        dict: `{clave: {'total', 'count'}}`, con clave `(año, mes)`, `(año, trimestre)` o `año`.
+    """
+    grupos: Dict[Hashable, dict] = {}
+    for (anio, mes), datos in mensual.items():
+        if periodo == 'mes':
+            clave = (anio, mes)
+        elif periodo == 'trimestre':
+            clave = (anio, (mes - 1) // 3 + 1)
+        else:  # año
+            clave = anio
+        grupo = grupos.setdefault(clave, {'total': 0, 'count': 0})
+        grupo['total'] += datos['total']
+        grupo['count'] += datos['count']
+    return grupos
+
+
+def _usuarios_afectados(pedido: Pedido):
+    """Usuarios cuyas analíticas cambian con un pedido, incluido su dueño anterior."""
+    historial = inspect(pedido).attrs.usuario_id.history
+    for usuario_id in (*historial.deleted, pedido.usuario_id):
+        if usuario_id:
+            yield usuario_id
+
+
+def _registrar_listeners() -> None:
+    global _listeners_registrados
+    if _listeners_registrados:
+        return
+
+    @event.listens_for(Session, 'after_flush')
+    def _after_flush(session, flush_context):
+        usuarios = set()
+        for pedido in (*session.new, *session.deleted):
+            if isinstance(pedido, Pedido):
+                usuarios.update(_usuarios_afectados(pedido))
+        for pedido in session.dirty:
+            if isinstance(pedido, Pedido) and session.is_modified(pedido, include_collections=False):
+                usuarios.update(_usuarios_afectados(pedido))
+        _INVALIDACION.anotar(session, *usuarios)
+
+    _INVALIDACION.registrar()
+    _listeners_registrados = True
@@ -0,0 +1,99 @@
+"""
+Módulo de Backends Intercambiables.
+
+Varias utilidades guardan estado fuera de la base de datos: las versiones de las
+cachés (navegación, facetas, analíticas de clientes, dashboard), los resúmenes de
+carrito, el buffer de presencia, el broker de notificaciones y el motor de búsqueda.
+Todas siguen el mismo esquema, que este módulo centraliza:
+- Un backend 'memory' por proceso, suficiente con un solo worker. Con varios workers
+  de gunicorn cada proceso ve su propio estado (una invalidación o una notificación
+  no llega a los demás), por lo que se debe registrar un backend compartido (ej.
+  Redis) y seleccionarlo con la clave `*_BACKEND` / `*_BROKER` de `config.py`.
+- `RegistroBackends`: Registro nombre → fábrica de un tipo de backend. Cada módulo
+  expone el suyo (ej. `presence.BUFFERS`) y lo resuelve en su `init_*(app)`.
+- `VersionStore` / `InMemoryVersionStore` y el registro compartido `VERSION_STORES`:
+  un mismo almacén de versiones registrado una vez sirve a todas las cachés versionadas.
+
+Ejemplo:
+    VERSION_STORES.registrar('redis', lambda app: RedisVersionStore(app.config['REDIS_URL']))
+"""
+import threading
+from typing import Callable, Dict, Generic, Protocol, TypeVar
+
+T = TypeVar('T')
+
+
+class RegistroBackends(Generic[T]):
+    """
+    Registro de las implementaciones disponibles de un tipo de backend.
+
+    Las fábricas reciben la aplicación Flask, de modo que pueden leer su configuración.
+
+    Attributes:
+        tipo (str): Descripción del tipo de backend, usada en los mensajes de error.
+    """
+
+    def __init__(self, tipo: str, **fabricas: Callable[..., T]):
+        self.tipo = tipo
+        self._fabricas: Dict[str, Callable[..., T]] = dict(fabricas)
+
+    def registrar(self, nombre: str, fabrica: Callable[..., T]) -> None:
+        """
+        Registra un backend adicional.
+
+        Args:
+            nombre (str): El nombre del backend en la configuración.
+            fabrica (Callable): Función que recibe la aplicación y crea el backend.
+        """
+        self._fabricas[nombre] = fabrica
+
+    def crear(self, app, clave_config: str, por_defecto: str = 'memory') -> T:
+        """
+        Crea el backend seleccionado en la configuración de la aplicación.
+
+        Args:
+            app (Flask): La aplicación Flask.
+            clave_config (str): La clave de configuración que nombra el backend.
+            por_defecto (str): El backend usado si la clave no está definida.
+
+        Raises:
+            ValueError: Si el nombre configurado no está registrado.
+        """
+        nombre = app.config.get(clave_config, por_defecto)
+        if nombre not in self._fabricas:
+            raise ValueError(f"Backend de {self.tipo} desconocido en {clave_config}: '{nombre}'")
+        return self._fabricas[nombre](app)
+
+
+class VersionStore(Protocol):
+    """
+    Almacén de versiones.
+
+    `get` devuelve la versión actual de una clave (0 si no existe) y `bump` la
+    incrementa de forma atómica. Un backend compartido debe respetar esa semántica.
+    """
+
+    def get(self, clave: str) -> int: ...
+
+    def bump(self, clave: str) -> int: ...
+
+
+class InMemoryVersionStore(VersionStore):
+    """Almacén de versiones por proceso. Es el backend por defecto."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versiones: Dict[str, int] = {}
+
+    def get(self, clave):
+        return self._versiones.get(clave, 0)
+
+    def bump(self, clave):
+        with self._lock:
+            self._versiones[clave] = self._versiones.get(clave, 0) + 1
+            return self._versiones[clave]
+
+
+VERSION_STORES: RegistroBackends[VersionStore] = RegistroBackends(
+    'almacén de versiones', memory=lambda app: InMemoryVersionStore()
+)
@@ -0,0 +1,370 @@
+"""
+Módulo de Operaciones en Bloque sobre el Carrito (`cart_items`).
+
+`cart.sync_cart` recorría el carrito enviado por el frontend artículo por artículo:
+un `Productos.query.get`, una nueva lectura del `CartItem` ("current_db_item") y un
+`flush` por cada inserción. Un carrito de 30 artículos costaba unas 90 consultas.
+
+Este módulo reconcilia el carrito completo con un número fijo de sentencias:
+1. Una consulta `IN` con los productos (activos) del carrito.
+2. Una consulta con los artículos que el usuario ya tiene guardados.
+3. Un único `INSERT ... ON CONFLICT (user_id, product_id) DO UPDATE` con todas las líneas.
+4. Un único `DELETE` de las líneas que ya no están en el carrito (si no es una fusión).
+
+El `ON CONFLICT` se apoya en las restricciones únicas `(user_id, product_id)` y
+`(session_id, product_id)` de `CartItem`. Como `NULL` no colisiona en un índice
+único, las líneas de invitados (`user_id` nulo) y las de usuarios (`session_id`
+nulo) conviven en la misma tabla sin interferir.
+
+Además:
+- `fusionar_carrito_invitado`: Al iniciar sesión, traslada el carrito de invitado
+  (`session_id`) al usuario con un único `INSERT ... SELECT ... ON CONFLICT` que suma
+  las cantidades a las ya guardadas y las limita a la existencia, seguido del borrado
+  de las líneas de invitado.
+- `deduplicar_lineas`: Fusiona las líneas repetidas de un mismo producto en un carrito
+  (sumando las cantidades, limitadas a la existencia), que impedirían crear las
+  restricciones únicas. Expuesto en `flask deduplicar-carritos`.
+- `purgar_carritos_abandonados`: Borra por lotes los carritos de invitado sin
+  actividad desde hace `CART_GUEST_TTL_DAYS` días. `init_carrito` la registra como
+  tarea periódica (`app.utils.tareas`) cada `CART_SWEEP_INTERVAL_SECONDS`; también
+  está disponible como `flask purgar-carritos`.
+
+Salvo la purga, que usa su propia conexión y confirma cada lote, las funciones no
+hacen `commit`; el llamador confirma la transacción. Las sentencias en bloque anotan
+los carritos afectados con `cart_summary.invalidar_carrito`, de modo que su resumen
+cacheado se invalida al confirmar.
+"""
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Mapping
+
+from flask import current_app
+from sqlalchemy import String, and_, cast, delete, func, literal, null, or_, select, update
+from sqlalchemy.orm import aliased
+
+from app.extensions import db
+from app.utils import cart_summary, tareas
+from app.utils.upsert import insert_con_conflicto
+from app.models.domains.cart_models import CartItem
+from app.models.domains.product_models import Productos
+from app.models.enums import EstadoEnum
+
+
+def guardar_lineas_usuario(user_id: str, cantidades: Mapping[str, int]) -> None:
+    """
+    Inserta o actualiza, en una sola sentencia, las líneas del carrito de un usuario.
+
+    Args:
+        user_id (str): El ID del usuario.
+        cantidades (Mapping[str, int]): `{product_id: cantidad final}`.
+    """
+    if not cantidades:
+        return
+    ahora = datetime.utcnow()
+    filas = [
+        {'id': str(uuid.uuid4()), 'user_id': user_id, 'session_id': None, 'product_id': product_id,
+         'quantity': cantidad, 'created_at': ahora, 'updated_at': ahora}
+        for product_id, cantidad in cantidades.items()
+    ]
+
+    cart_summary.invalidar_carrito(db.session, user_id=user_id)
+    insert = insert_con_conflicto()
+    if insert is not None:
+        stmt = insert(CartItem).values(filas)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CartItem.user_id, CartItem.product_id],
+            set_={'quantity': stmt.excluded.quantity, 'updated_at': stmt.excluded.updated_at},
+        )
+        db.session.execute(stmt)
+        return
+
+    # Motores sin `ON CONFLICT`: se actualizan las líneas existentes y se insertan las nuevas.
+    existentes = {
+        item.product_id: item
+        for item in CartItem.query.filter(CartItem.user_id == user_id,
+                                          CartItem.product_id.in_(list(cantidades)))
+    }
+    for fila in filas:
+        item = existentes.get(fila['product_id'])
+        if item is None:
+            db.session.add(CartItem(id=fila['id'], user_id=user_id, product_id=fila['product_id'],
+                                    quantity=fila['quantity']))
+        else:
+            item.quantity = fila['quantity']
+            item.updated_at = ahora
+
+
+def sincronizar_carrito(user_id: str, lineas: Iterable[dict], merge: bool = False) -> List[str]:
+    """
+    Reconcilia el carrito enviado por el frontend con el carrito guardado del usuario.
+
+    Las cantidades se limitan a la existencia de cada producto; los productos que no
+    existen o están inactivos se ignoran.
+
+    Args:
+        user_id (str): El ID del usuario.
+        lineas (Iterable[dict]): Los artículos del frontend (`product_id`, `quantity`).
+        merge (bool): Si es True, suma las cantidades a las ya guardadas en lugar de
+            sustituir el carrito (y no elimina las líneas ausentes del payload).
+
+    Returns:
+        List[str]: Avisos para el cliente sobre cantidades ajustadas por disponibilidad.
+    """
+    solicitadas: Dict[str, int] = {}
+    for item_data in lineas:
+        product_id = item_data.get('product_id')
+        quantity = item_data.get('quantity')
+        if not product_id or not isinstance(quantity, int) or quantity <= 0:
+            current_app.logger.warning(f"Invalid cart item data received: {item_data}")
+            continue
+        product_id = str(product_id)
+        # Un mismo producto repetido en el payload: se suma al fusionar y prevalece el último al sustituir.
+        solicitadas[product_id] = solicitadas.get(product_id, 0) + quantity if merge else quantity
+
+    productos = {
+        fila.id: fila for fila in db.session.execute(
+            select(Productos.id, Productos.nombre, Productos._existencia.label('existencia'))
+            .where(Productos.id.in_(list(solicitadas)), Productos.estado == EstadoEnum.ACTIVO.value)
+        )
+    } if solicitadas else {}
+    guardadas = dict(db.session.execute(
+        select(CartItem.product_id, CartItem.quantity).where(CartItem.user_id == user_id)
+    ).all())
+
+    warnings = []
+    cantidades: Dict[str, int] = {}
+    for product_id, quantity in solicitadas.items():
+        producto = productos.get(product_id)
+        if producto is None:
+            current_app.logger.warning(f"Product {product_id} not found or inactive during sync.")
+            continue
+        existencia = producto.existencia
+        if quantity > existencia:
+            warnings.append(f'La cantidad de {producto.nombre} se ajustó a {existencia} debido a la disponibilidad.')
+            quantity = existencia
+        if merge and product_id in guardadas:
+            quantity += guardadas[product_id]
+            if quantity > existencia:
+                warnings.append(f'La cantidad de {producto.nombre} se ajustó a {existencia} debido a la disponibilidad.')
+                quantity = existencia
+        if quantity > 0:
+            cantidades[product_id] = quantity
+
+    guardar_lineas_usuario(user_id, cantidades)
+
+    # Si no es una fusión, se eliminan las líneas que ya no están en el carrito del frontend.
+    obsoletas = set(guardadas) - set(cantidades)
+    if not merge and obsoletas:
+        cart_summary.invalidar_carrito(db.session, user_id=user_id)
+        db.session.execute(
+            delete(CartItem).where(
+                CartItem.user_id == user_id,
+                or_(CartItem.product_id.in_([p for p in obsoletas if p]), CartItem.product_id.is_(None)),
+            ),
+            execution_options={'synchronize_session': False},
+        )
+    return warnings
+
+
+def _menor(a, b):
+    """`LEAST(a, b)` en PostgreSQL; `MIN(a, b)` (escalar) en SQLite."""
+    if db.session.get_bind().dialect.name == 'sqlite':
+        return func.min(a, b)
+    return func.least(a, b)
+
+
+def _nuevo_id():
+    """Genera en SQL el ID de una línea nueva del carrito."""
+    if db.session.get_bind().dialect.name == 'sqlite':
+        return func.lower(func.hex(func.randomblob(16)))
+    return cast(func.gen_random_uuid(), String)
+
+
+def fusionar_carrito_invitado(session_id: str, user_id: str) -> int:
+    """
+    Traslada el carrito de un invitado al usuario que acaba de iniciar sesión.
+
+    Las cantidades se suman a las líneas que el usuario ya tenía y se limitan a la
+    existencia del producto; las líneas de productos inactivos o agotados se descartan.
+    Las líneas de invitado se eliminan al terminar.
+
+    Args:
+        session_id (str): El `cart_id` del carrito de invitado (guardado en la sesión).
+        user_id (str): El ID del usuario.
+
+    Returns:
+        int: El número de líneas trasladadas.
+    """
+    invitado = aliased(CartItem, name='invitado')
+    guardado = aliased(CartItem, name='guardado')
+    ahora = datetime.utcnow()
+    cantidad_final = _menor(func.coalesce(guardado.quantity, 0) + invitado.quantity, Productos._existencia)
+    condiciones = (
+        invitado.session_id == session_id,
+        Productos.estado == EstadoEnum.ACTIVO.value,
+        Productos._existencia > 0,
+    )
+
+    insert = insert_con_conflicto()
+    if insert is None:
+        # Motores sin `ON CONFLICT`: se calculan las cantidades y se guardan con el camino general.
+        cantidades = dict(db.session.execute(
+            select(invitado.product_id, cantidad_final)
+            .join(Productos, Productos.id == invitado.product_id)
+            .outerjoin(guardado, and_(guardado.user_id == user_id, guardado.product_id == invitado.product_id))
+            .where(*condiciones)
+        ).all())
+        guardar_lineas_usuario(user_id, cantidades)
+        trasladadas = len(cantidades)
+    else:
+        origen = (
+            select(_nuevo_id(), literal(user_id), null(), invitado.product_id, cantidad_final,
+                   literal(ahora), literal(ahora))
+            .select_from(invitado)
+            .join(Productos, Productos.id == invitado.product_id)
+            .outerjoin(guardado, and_(guardado.user_id == user_id, guardado.product_id == invitado.product_id))
+            .where(*condiciones)
+        )
+        stmt = insert(CartItem).from_select(
+            ['id', 'user_id', 'session_id', 'product_id', 'quantity', 'created_at', 'updated_at'], origen
+        )
+        # La cantidad ya viene sumada y limitada desde el SELECT.
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CartItem.user_id, CartItem.product_id],
+            set_={'quantity': stmt.excluded.quantity, 'updated_at': stmt.excluded.updated_at},
+        )
+        trasladadas = db.session.execute(stmt).rowcount
+
+    cart_summary.invalidar_carrito(db.session, user_id=user_id, session_id=session_id)
+    db.session.execute(
+        delete(CartItem).where(CartItem.session_id == session_id, CartItem.user_id.is_(None)),
+        execution_options={'synchronize_session': False},
+    )
+    return max(trasladadas, 0)
+
+
+def deduplicar_lineas() -> int:
+    """
+    Fusiona las líneas repetidas de un mismo producto en un mismo carrito.
+
+    Antes de las restricciones únicas `uq_cart_user_product` y `uq_cart_session_product`
+    nada impedía que un carrito tuviera varias líneas del mismo producto, y con ellas
+    la migración que crea las restricciones falla. De cada grupo repetido se conserva
+    la línea modificada más recientemente, con la suma de las cantidades limitada a la
+    existencia del producto, y se eliminan las demás; si el producto está agotado se
+    elimina el grupo entero, como al fusionar el carrito de un invitado.
+
+    Las líneas se leen con una consulta por tipo de carrito (usuario e invitado) y se
+    corrigen con un `UPDATE` y un `DELETE` en bloque. Es idempotente y no hace `commit`.
+
+    Returns:
+        int: El número de líneas eliminadas.
+    """
+    eliminadas = 0
+    ahora = datetime.utcnow()
+    for dueno in (CartItem.user_id, CartItem.session_id):
+        repetidos = (
+            select(dueno.label('dueno'), CartItem.product_id.label('product_id'))
+            .where(dueno.isnot(None), CartItem.product_id.isnot(None))
+            .group_by(dueno, CartItem.product_id)
+            .having(func.count() > 1)
+            .subquery()
+        )
+        filas = db.session.execute(
+            select(CartItem.id, dueno, CartItem.product_id, CartItem.quantity, Productos._existencia)
+            .join(repetidos, and_(dueno == repetidos.c.dueno, CartItem.product_id == repetidos.c.product_id))
+            .join(Productos, Productos.id == CartItem.product_id)
+            .order_by(CartItem.updated_at.desc(), CartItem.id)
+        ).all()
+
+        grupos: Dict[tuple, dict] = {}
+        for item_id, dueno_id, product_id, cantidad, existencia in filas:
+            grupo = grupos.setdefault((dueno_id, product_id), {
+                'id': item_id, 'cantidad': 0, 'existencia': existencia or 0, 'sobrantes': []
+            })
+            grupo['cantidad'] += cantidad or 0
+            if grupo['id'] != item_id:
+                grupo['sobrantes'].append(item_id)
+        if not grupos:
+            continue
+
+        conservadas = []
+        sobrantes = []
+        for (dueno_id, _), grupo in grupos.items():
+            cantidad = min(grupo['cantidad'], grupo['existencia'])
+            sobrantes.extend(grupo['sobrantes'])
+            if cantidad > 0:
+                conservadas.append({'id': grupo['id'], 'quantity': cantidad, 'updated_at': ahora})
+            else:
+                sobrantes.append(grupo['id'])
+            if dueno is CartItem.user_id:
+                cart_summary.invalidar_carrito(db.session, user_id=dueno_id)
+            else:
+                cart_summary.invalidar_carrito(db.session, session_id=dueno_id)
+
+        if conservadas:
+            db.session.execute(update(CartItem), conservadas)
+        db.session.execute(
+            delete(CartItem).where(CartItem.id.in_(sobrantes)),
+            execution_options={'synchronize_session': False},
+        )
+        eliminadas += len(sobrantes)
+    return eliminadas
+
+
+# --- Purga de carritos de invitado abandonados ---
+_ttl_dias = 30
+_tamano_lote = 500
+
+
+def init_carrito(app) -> None:
+    """
+    Configura la purga de carritos de invitado abandonados y la registra como tarea periódica.
+
+    Args:
+        app (Flask): La aplicación Flask.
+    """
+    global _ttl_dias, _tamano_lote
+    _ttl_dias = app.config.get('CART_GUEST_TTL_DAYS', 30)
+    _tamano_lote = app.config.get('CART_SWEEP_BATCH_SIZE', 500)
+    tareas.registrar_periodica('purga-carritos', app.config.get('CART_SWEEP_INTERVAL_SECONDS', 3600),
+                               _purgar_periodicamente)
+
+
+def purgar_carritos_abandonados(dias: int = None, tamano_lote: int = None) -> int:
+    """
+    Elimina por lotes las líneas de carritos de invitado sin actividad reciente.
+
+    Cada lote se borra y confirma en su propia transacción, de modo que la purga nunca
+    mantiene bloqueada una porción grande de la tabla.
+
+    Args:
+        dias (int, optional): Antigüedad mínima (por `updated_at`). Por defecto, `CART_GUEST_TTL_DAYS`.
+        tamano_lote (int, optional): Filas por lote. Por defecto, `CART_SWEEP_BATCH_SIZE`.
+
+    Returns:
+        int: El número de líneas eliminadas.
+    """
+    dias = _ttl_dias if dias is None else dias
+    tamano_lote = tamano_lote or _tamano_lote
+    limite = datetime.utcnow() - timedelta(days=dias)
+    lote = (
+        select(CartItem.id)
+        .where(CartItem.session_id.isnot(None), CartItem.user_id.is_(None), CartItem.updated_at < limite)
+        .limit(tamano_lote)
+        .scalar_subquery()
+    )
+    eliminadas = 0
+    while True:
+        with db.engine.begin() as conn:
+            borradas = conn.execute(delete(CartItem).where(CartItem.id.in_(lote))).rowcount
+        eliminadas += borradas
+        if borradas < tamano_lote:
+            return eliminadas
+
+
+def _purgar_periodicamente() -> None:
+    """Tarea periódica de purga (ver `app.utils.tareas`)."""
+    eliminadas = purgar_carritos_abandonados()
+    if eliminadas:
+        current_app.logger.info(f"Purga de carritos: {eliminadas} líneas de invitado abandonadas eliminadas.")
@@ -0,0 +1,213 @@
+"""
+Módulo de Caché del Resumen del Carrito.
+
+El total del carrito de las plantillas (`inject_global_data`), `/api/cart_count` y las
+respuestas de `/api/add_to_cart` necesitaban el par `(total_items, total_price)` del carrito.
+`get_cart_summary` ya lo calcula con una sola consulta agregada, pero esa consulta
+(con los `joins` de toda la jerarquía de categorías) se repetía en cada página vista,
+aunque el carrito casi nunca cambia entre dos páginas.
+
+Ahora el resumen se guarda por carrito (`user:<id>` o `session:<cart_id>`) en un
+`SummaryStore` con TTL:
+- `obtener_resumen`: Devuelve el resumen cacheado o lo calcula y lo guarda.
+- Invalidación transaccional: un listener `after_flush` anota los carritos de los
+  `CartItem` creados, modificados o eliminados por el ORM, e `invalidar_carrito` anota
+  los que cambian con sentencias en bloque (upsert, `DELETE`). Las claves anotadas se
+  borran en el `after_commit` de la sesión y se descartan en el `after_rollback` (ver
+  `app.utils.invalidacion`).
+- Para que una lectura concurrente no vuelva a guardar el resumen anterior a un
+  `commit`, el almacén rechaza los valores calculados antes de la última invalidación
+  de la clave.
+- El TTL (`CART_SUMMARY_CACHE_TTL_SECONDS`) acota la obsolescencia ante cambios que no
+  pasan por el carrito (ej. un cambio de precio o la desactivación de un producto).
+
+El almacén se registra en `ALMACENES` y se selecciona con `CART_SUMMARY_CACHE_BACKEND`
+(ver `app.utils.backends`).
+"""
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Protocol, Tuple
+
+from flask import g, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.models.domains.cart_models import CartItem
+from app.utils.backends import RegistroBackends
+from app.utils.invalidacion import InvalidacionTrasCommit
+
+_listeners_registrados = False
+
+Resumen = Tuple[int, float]
+
+
+class SummaryStore(Protocol):
+    """
+    Almacén de resúmenes de carrito.
+
+    `get` devuelve el resumen vigente de una clave (o None); `set` lo guarda durante
+    `ttl` segundos, salvo que la clave se haya invalidado después del instante `desde`
+    (epoch) en que empezó el cálculo; `delete` lo invalida. Un backend compartido debe
+    respetar esa semántica.
+    """
+
+    def get(self, clave: str) -> Optional[Resumen]: ...
+
+    def set(self, clave: str, resumen: Resumen, ttl: int, desde: float) -> None: ...
+
+    def delete(self, clave: str) -> None: ...
+
+
+class InMemorySummaryStore(SummaryStore):
+    """Almacén por proceso, protegido con un lock y acotado en entradas. Es el backend por defecto."""
+
+    def __init__(self, max_entradas: int = 10000):
+        self._lock = threading.Lock()
+        self._max_entradas = max_entradas
+        # {clave: (expira, resumen)}
+        self._entradas: Dict[str, Tuple[float, Resumen]] = {}
+        # {clave: instante de la última invalidación}, necesario solo mientras dura un cálculo.
+        self._invalidadas: Dict[str, float] = {}
+
+    def get(self, clave):
+        entrada = self._entradas.get(clave)
+        if entrada is None or entrada[0] <= time.time():
+            return None
+        return entrada[1]
+
+    def set(self, clave, resumen, ttl, desde):
+        ahora = time.time()
+        with self._lock:
+            if self._invalidadas.get(clave, 0) >= desde:
+                return
+            if len(self._entradas) >= self._max_entradas:
+                self._liberar(ahora)
+            self._entradas[clave] = (ahora + ttl, resumen)
+
+    def delete(self, clave):
+        with self._lock:
+            self._entradas.pop(clave, None)
+            self._invalidadas[clave] = time.time()
+            if len(self._invalidadas) >= self._max_entradas:
+                # Ningún cálculo dura un minuto: las marcas anteriores ya no protegen nada.
+                limite = time.time() - 60
+                self._invalidadas = {c: t for c, t in self._invalidadas.items() if t > limite}
+
+    def _liberar(self, ahora):
+        self._entradas = {c: e for c, e in self._entradas.items() if e[0] > ahora}
+        # Si todas siguen vigentes, se descarta la más antigua (orden de inserción).
+        while len(self._entradas) >= self._max_entradas:
+            self._entradas.pop(next(iter(self._entradas)))
+
+
+ALMACENES: RegistroBackends[SummaryStore] = RegistroBackends(
+    'resúmenes de carrito', memory=lambda app: InMemorySummaryStore()
+)
+_store: SummaryStore = InMemorySummaryStore()
+_ttl_segundos = 120
+
+
+def init_cart_summary(app) -> None:
+    """
+    Configura la caché de resúmenes de carrito y registra los listeners de invalidación.
+
+    Args:
+        app (Flask): La aplicación Flask.
+    """
+    global _store, _ttl_segundos
+    _store = ALMACENES.crear(app, 'CART_SUMMARY_CACHE_BACKEND')
+    _ttl_segundos = app.config.get('CART_SUMMARY_CACHE_TTL_SECONDS', 120)
+    _registrar_listeners()
+
+
+def clave_carrito(cart_info: dict) -> str:
+    """
+    Devuelve la clave de caché de un carrito.
+
+    Args:
+        cart_info (dict): Diccionario con `user_id` o `session_id` (ver `get_or_create_cart`).
+
+    Returns:
+        str: `user:<id>` o `session:<cart_id>`.
+    """
+    if cart_info.get('user_id'):
+        return f"user:{cart_info['user_id']}"
+    return f"session:{cart_info['session_id']}"
+
+
+def obtener_resumen(cart_info: dict, calcular: Callable[[], Resumen]) -> Resumen:
+    """
+    Devuelve el resumen `(total_items, total_price)` de un carrito, calculándolo solo si hace falta.
+
+    Args:
+        cart_info (dict): Diccionario con `user_id` o `session_id`.
+        calcular (Callable): Función que consulta el resumen en la base de datos.
+
+    Returns:
+        Resumen: `(total_items, total_price)`.
+    """
+    clave = clave_carrito(cart_info)
+    resumen = _store.get(clave)
+    if resumen is not None:
+        return tuple(resumen)
+    desde = time.time()
+    resumen = calcular()
+    _store.set(clave, resumen, _ttl_segundos, desde)
+    return resumen
+
+
+def invalidar_carrito(session: Session, user_id: Optional[str] = None, session_id: Optional[str] = None) -> None:
+    """
+    Anota un carrito modificado con una sentencia en bloque para invalidarlo tras el `commit`.
+
+    Los cambios hechos a través de instancias de `CartItem` se detectan solos en el
+    `after_flush`; esta función solo es necesaria para `INSERT`/`UPDATE`/`DELETE` en bloque.
+
+    Args:
+        session (Session): La sesión del cambio.
+        user_id (str, optional): El usuario dueño del carrito.
+        session_id (str, optional): El `cart_id` de un carrito de invitado.
+    """
+    if user_id:
+        _INVALIDACION.anotar(session, clave_carrito({'user_id': user_id}))
+    if session_id:
+        _INVALIDACION.anotar(session, clave_carrito({'session_id': session_id}))
+
+
+def _borrar_clave(clave: str) -> None:
+    """Borra un resumen del almacén y de la memoria de la petición, tras el `commit`."""
+    # La memoria de la petición (`get_cart_summary`) tampoco debe servir el valor anterior.
+    memoria = g.get('_cart_summary') if has_app_context() else None
+    if memoria:
+        memoria.pop(clave, None)
+    _store.delete(clave)
+
+
+_INVALIDACION = InvalidacionTrasCommit('resúmenes de carrito', _borrar_clave)
+
+
+def _claves_de(item: CartItem) -> Iterable[str]:
+    """Claves de los carritos afectados por un `CartItem`, incluidas las de sus dueños anteriores."""
+    estado = inspect(item)
+    for campo, prefijo in (('user_id', 'user'), ('session_id', 'session')):
+        historial = estado.attrs[campo].history
+        for valor in (*historial.deleted, getattr(item, campo)):
+            if valor:
+                yield f'{prefijo}:{valor}'
+
+
+def _registrar_listeners() -> None:
+    global _listeners_registrados
+    if _listeners_registrados:
+        return
+
+    @event.listens_for(Session, 'after_flush')
+    def _after_flush(session, flush_context):
+        claves = set()
+        for item in (*session.new, *session.dirty, *session.deleted):
+            if isinstance(item, CartItem):
+                claves.update(_claves_de(item))
+        _INVALIDACION.anotar(session, *claves)
+
+    _INVALIDACION.registrar()
+    _listeners_registrados = True
@@ -0,0 +1,289 @@
+"""
+Módulo de Contadores Denormalizados de la Jerarquía de Categorías.
+
+`seudocategoria_to_dict` calculaba `total_productos` con `len(seudo.productos)`, por
+lo que serializar una categoría principal cargaba todas las filas de productos de
+la categoría solo para contarlas. Eso ocurría en cada renderizado de la tienda y en
+cada listado de categorías del panel.
+
+Ahora cada nivel guarda sus contadores:
+- `Seudocategorias`: `total_productos`, `productos_activos`.
+- `Subcategorias`: `total_productos`, `productos_activos`, `seudocategorias_activas`.
+- `CategoriasPrincipales`: `total_productos`, `productos_activos`, `subcategorias_activas`.
+
+Se mantienen de forma transaccional con un listener `after_flush` de la sesión:
+por cada producto o categoría creado, eliminado, movido de padre o con cambio de
+`estado`, se calculan los deltas y se aplican con `UPDATE ... SET c = c + :delta`
+en la misma transacción del cambio. Los incrementos atómicos evitan que dos
+transacciones concurrentes se pisen los contadores.
+
+`reconstruir_contadores` recalcula todos los contadores desde cero (comando CLI
+`rebuild-contadores-categorias`), útil tras una carga masiva. Tras la migración que
+añade las columnas, `backfill_contadores_si_vacios` los rellena en el despliegue
+(`flask preparar-despliegue`).
+"""
+from collections import Counter, defaultdict
+from typing import Dict, Tuple
+
+from sqlalchemy import event, func, inspect, select, update
+from sqlalchemy.orm import Session, attributes
+
+from app.extensions import db
+from app.models.domains.product_models import (
+    CategoriasPrincipales,
+    Productos,
+    Seudocategorias,
+    Subcategorias,
+)
+from app.models.enums import EstadoEnum
+
+_PENDIENTES_KEY = '_contadores_categorias_pendientes'
+_listeners_registrados = False
+
+# Campos de conteo de productos, compartidos por los tres niveles.
+TOTAL = 'total_productos'
+ACTIVOS = 'productos_activos'
+
+
+def _es_activo(estado) -> bool:
+    return estado == EstadoEnum.ACTIVO.value
+
+
+def _valor_anterior(obj, campo):
+    """Devuelve el valor de un atributo antes de los cambios pendientes del flush."""
+    historial = attributes.get_history(obj, campo)
+    if historial.deleted:
+        return historial.deleted[0]
+    if historial.unchanged:
+        return historial.unchanged[0]
+    return getattr(obj, campo)
+
+
+def _estado_anterior_y_actual(obj, campo_padre) -> Tuple[Tuple, Tuple]:
+    """Devuelve `(padre, activo)` antes y después de los cambios del flush."""
+    anterior = (_valor_anterior(obj, campo_padre), _es_activo(_valor_anterior(obj, 'estado')))
+    actual = (getattr(obj, campo_padre), _es_activo(obj.estado))
+    return anterior, actual
+
+
+def _calcular_deltas(session) -> Dict[Tuple[type, str], Counter]:
+    """
+    Recorre los objetos del flush y acumula los deltas de cada contador.
+
+    Returns:
+        Dict: `{(Modelo, id): Counter({campo: delta})}`.
+    """
+    deltas: Dict[Tuple[type, str], Counter] = defaultdict(Counter)
+    # Deltas de productos por seudocategoría; se propagan después a sus ancestros.
+    por_seudo: Dict[str, Counter] = defaultdict(Counter)
+    # Contadores de productos que cambian de padre junto con una seudo/subcategoría movida.
+    movimientos = []
+
+    def _producto(seudo_id, activo, signo):
+        if seudo_id:
+            por_seudo[seudo_id][TOTAL] += signo
+            if activo:
+                por_seudo[seudo_id][ACTIVOS] += signo
+
+    for obj in session.new:
+        if isinstance(obj, Productos):
+            _producto(obj.seudocategoria_id, _es_activo(obj.estado), 1)
+        elif isinstance(obj, Seudocategorias) and _es_activo(obj.estado):
+            deltas[(Subcategorias, obj.subcategoria_id)]['seudocategorias_activas'] += 1
+        elif isinstance(obj, Subcategorias) and _es_activo(obj.estado):
+            deltas[(CategoriasPrincipales, obj.categoria_principal_id)]['subcategorias_activas'] += 1
+
+    for obj in session.deleted:
+        if isinstance(obj, Productos):
+            anterior, _ = _estado_anterior_y_actual(obj, 'seudocategoria_id')
+            _producto(anterior[0], anterior[1], -1)
+        elif isinstance(obj, Seudocategorias):
+            (sub_id, activo), _ = _estado_anterior_y_actual(obj, 'subcategoria_id')
+            if activo:
+                deltas[(Subcategorias, sub_id)]['seudocategorias_activas'] -= 1
+            movimientos.append((Seudocategorias, obj, sub_id, None))
+        elif isinstance(obj, Subcategorias):
+            (cat_id, activo), _ = _estado_anterior_y_actual(obj, 'categoria_principal_id')
+            if activo:
+                deltas[(CategoriasPrincipales, cat_id)]['subcategorias_activas'] -= 1
+            movimientos.append((Subcategorias, obj, cat_id, None))
+
+    for obj in session.dirty:
+        if not session.is_modified(obj, include_collections=False):
+            continue
+        if isinstance(obj, Productos):
+            anterior, actual = _estado_anterior_y_actual(obj, 'seudocategoria_id')
+            if anterior != actual:
+                _producto(anterior[0], anterior[1], -1)
+                _producto(actual[0], actual[1], 1)
+        elif isinstance(obj, (Seudocategorias, Subcategorias)):
+            es_seudo = isinstance(obj, Seudocategorias)
+            padre, campo_padre, campo_activos = (
+                (Subcategorias, 'subcategoria_id', 'seudocategorias_activas') if es_seudo
+                else (CategoriasPrincipales, 'categoria_principal_id', 'subcategorias_activas')
+            )
+            anterior, actual = _estado_anterior_y_actual(obj, campo_padre)
+            if anterior[1]:
+                deltas[(padre, anterior[0])][campo_activos] -= 1
+            if actual[1]:
+                deltas[(padre, actual[0])][campo_activos] += 1
+            if anterior[0] != actual[0]:
+                movimientos.append((type(obj), obj, anterior[0], actual[0]))
+
+    # Propagar los deltas de productos a la seudocategoría, su subcategoría y su categoría principal.
+    if por_seudo:
+        conn = session.connection()
+        ancestros = conn.execute(
+            select(Seudocategorias.id, Seudocategorias.subcategoria_id, Subcategorias.categoria_principal_id)
+            .join(Subcategorias, Seudocategorias.subcategoria_id == Subcategorias.id)
+            .where(Seudocategorias.id.in_(list(por_seudo)))
+        ).all()
+        for seudo_id, sub_id, cat_id in ancestros:
+            for modelo, pk in ((Seudocategorias, seudo_id), (Subcategorias, sub_id), (CategoriasPrincipales, cat_id)):
+                deltas[(modelo, pk)].update(por_seudo[seudo_id])
+
+    # Una seudo/subcategoría que cambia de padre (o se elimina) se lleva sus productos consigo.
+    for modelo, obj, padre_anterior, padre_nuevo in movimientos:
+        conteo = Counter({
+            TOTAL: _valor_anterior(obj, TOTAL) or 0,
+            ACTIVOS: _valor_anterior(obj, ACTIVOS) or 0,
+        })
+        for padre_id, signo in ((padre_anterior, -1), (padre_nuevo, 1)):
+            if not padre_id:
+                continue
+            for destino in _cadena_ancestros(session, modelo, padre_id):
+                deltas[destino].update({campo: signo * n for campo, n in conteo.items()})
+
+    return {clave: c for clave, c in deltas.items() if clave[1] and any(c.values())}
+
+
+def _cadena_ancestros(session, modelo, padre_id):
+    """Devuelve las claves `(Modelo, id)` del padre indicado y de sus ancestros."""
+    if modelo is Subcategorias:
+        return [(CategoriasPrincipales, padre_id)]
+    cat_id = session.connection().execute(
+        select(Subcategorias.categoria_principal_id).where(Subcategorias.id == padre_id)
+    ).scalar()
+    return [(Subcategorias, padre_id)] + ([(CategoriasPrincipales, cat_id)] if cat_id else [])
+
+
+def aplicar_deltas(session, deltas) -> None:
+    """
+    Aplica los deltas con incrementos atómicos en la conexión de la sesión.
+
+    Las instancias afectadas ya cargadas se expiran al final del flush en curso.
+
+    Args:
+        session (Session): La sesión en la que se aplican.
+        deltas (Dict): `{(Modelo, id): Counter({campo: delta})}`.
+    """
+    conn = session.connection()
+    for (modelo, pk), conteo in deltas.items():
+        valores = {campo: getattr(modelo, campo) + n for campo, n in conteo.items() if n}
+        if not valores:
+            continue
+        # Se conserva `updated_at`: un contador no es una modificación de la categoría.
+        conn.execute(update(modelo).where(modelo.id == pk).values(updated_at=modelo.updated_at, **valores))
+    session.info.setdefault(_PENDIENTES_KEY, set()).update(deltas)
+
+
+def _registrar_listeners() -> None:
+    global _listeners_registrados
+    if _listeners_registrados:
+        return
+
+    @event.listens_for(Session, 'after_flush')
+    def _after_flush(session, flush_context):
+        deltas = _calcular_deltas(session)
+        if deltas:
+            aplicar_deltas(session, deltas)
+
+    @event.listens_for(Session, 'after_flush_postexec')
+    def _after_flush_postexec(session, flush_context):
+        # Las instancias ya cargadas tienen contadores obsoletos: se expiran para releerlos.
+        for modelo, pk in session.info.pop(_PENDIENTES_KEY, ()):
+            clave = inspect(modelo).identity_key_from_primary_key((pk,))
+            obj = session.identity_map.get(clave)
+            if obj is not None:
+                campos = [TOTAL, ACTIVOS]
+                if modelo is Subcategorias:
+                    campos.append('seudocategorias_activas')
+                elif modelo is CategoriasPrincipales:
+                    campos.append('subcategorias_activas')
+                session.expire(obj, campos)
+
+    _listeners_registrados = True
+
+
+def init_category_counters(app) -> None:
+    """
+    Registra los listeners que mantienen los contadores de la jerarquía de categorías.
+
+    Args:
+        app (Flask): La aplicación Flask.
+    """
+    _registrar_listeners()
+
+
+def reconstruir_contadores() -> None:
+    """
+    Recalcula todos los contadores de la jerarquía con sentencias `UPDATE` set-based.
+
+    No confirma la transacción; el llamador debe hacer `db.session.commit()`.
+    """
+    activo = EstadoEnum.ACTIVO.value
+
+    def _conteo(*condiciones):
+        return select(func.count(Productos.id)).where(*condiciones).scalar_subquery()
+
+    db.session.execute(update(Seudocategorias).values(
+        updated_at=Seudocategorias.updated_at,
+        total_productos=_conteo(Productos.seudocategoria_id == Seudocategorias.id),
+        productos_activos=_conteo(Productos.seudocategoria_id == Seudocategorias.id, Productos.estado == activo),
+    ))
+
+    def _suma(columna, *condiciones):
+        return select(func.coalesce(func.sum(columna), 0)).where(*condiciones).scalar_subquery()
+
+    db.session.execute(update(Subcategorias).values(
+        updated_at=Subcategorias.updated_at,
+        total_productos=_suma(Seudocategorias.total_productos, Seudocategorias.subcategoria_id == Subcategorias.id),
+        productos_activos=_suma(Seudocategorias.productos_activos, Seudocategorias.subcategoria_id == Subcategorias.id),
+        seudocategorias_activas=select(func.count(Seudocategorias.id)).where(
+            Seudocategorias.subcategoria_id == Subcategorias.id, Seudocategorias.estado == activo
+        ).scalar_subquery(),
+    ))
+    db.session.execute(update(CategoriasPrincipales).values(
+        updated_at=CategoriasPrincipales.updated_at,
+        total_productos=_suma(Subcategorias.total_productos, Subcategorias.categoria_principal_id == CategoriasPrincipales.id),
+        productos_activos=_suma(Subcategorias.productos_activos, Subcategorias.categoria_principal_id == CategoriasPrincipales.id),
+        subcategorias_activas=select(func.count(Subcategorias.id)).where(
+            Subcategorias.categoria_principal_id == CategoriasPrincipales.id, Subcategorias.estado == activo
+        ).scalar_subquery(),
+    ))
+
+
+def backfill_contadores_si_vacios() -> bool:
+    """
+    Reconstruye los contadores si nunca se han rellenado.
+
+    Las columnas nacen a 0 (`server_default`), de modo que tras la migración todas las
+    categorías mostraban "0 productos" hasta reconstruirlas a mano. Se considera que no
+    se han rellenado si hay seudocategorías y ningún nivel tiene un contador distinto de
+    cero. Se ejecuta en cada despliegue (`flask preparar-despliegue`); con los contadores
+    ya rellenos solo hace tres lecturas. No confirma la transacción.
+
+    Returns:
+        bool: True si se reconstruyeron los contadores.
+    """
+    if db.session.query(Seudocategorias.id).first() is None:
+        return False
+    rellenos = (
+        db.session.query(Seudocategorias.id).filter(Seudocategorias.total_productos > 0).first() is not None
+        or db.session.query(Subcategorias.id).filter(Subcategorias.seudocategorias_activas > 0).first() is not None
+        or db.session.query(CategoriasPrincipales.id).filter(CategoriasPrincipales.subcategorias_activas > 0).first() is not None
+    )
+    if rellenos:
+        return False
+    reconstruir_contadores()
+    return True
@@ -0,0 +1,186 @@
+"""
+Módulo de Propagación del Estado de la Jerarquía de Categorías.
+
+Antes, cada `Productos.existencia = ...` llamaba en cascada a
+`Seudocategorias.check_and_update_status` → `Subcategorias.check_and_update_status`
+→ `CategoriasPrincipales.check_and_update_status`, con un `COUNT` por nivel y por
+producto. Un pedido de diez líneas disparaba treinta consultas, más la carga perezosa
+de cada relación padre.
+
+Ahora los métodos `check_and_update_status` y el setter de `existencia` solo anotan
+el ID afectado en la sesión (`solicitar_recalculo`). Al terminar el flush, todas las
+categorías anotadas se recalculan de una vez, nivel por nivel, con dos sentencias
+set-based por nivel:
+
+    UPDATE seudocategorias SET estado = 'inactivo'
+     WHERE id IN (:ids) AND estado = 'activo'
+       AND NOT EXISTS (SELECT 1 FROM productos
+                        WHERE seudocategoria_id = seudocategorias.id AND estado = 'activo')
+
+y su simétrica para reactivar (`estado = 'inactivo' AND EXISTS (...)`). Los padres de
+los IDs procesados pasan al nivel siguiente, igual que hacía la cascada original.
+
+Las filas que cambian de estado se devuelven con `RETURNING` para ajustar los
+contadores `seudocategorias_activas` / `subcategorias_activas` de `category_counters`,
+expirar las instancias cargadas e invalidar el árbol de navegación tras el `commit`.
+"""
+from collections import Counter, defaultdict
+
+from sqlalchemy import event, exists, inspect, select, update
+from sqlalchemy.orm import Session
+
+from app.utils import category_counters, navigation_cache
+
+_PENDIENTES_KEY = '_estado_categorias_pendientes'
+_CAMBIADAS_KEY = '_estado_categorias_cambiadas'
+_NAVEGACION_KEY = '_estado_categorias_navegacion'
+_listeners_registrados = False
+
+# Niveles de la jerarquía, de abajo hacia arriba.
+SEUDOCATEGORIA = 'seudocategoria'
+SUBCATEGORIA = 'subcategoria'
+CATEGORIA_PRINCIPAL = 'categoria_principal'
+
+
+def _niveles():
+    """
+    Describe cada nivel: `(nombre, modelo, modelo hijo, FK del hijo, FK al padre,
+    modelo padre, contador de hijos activos del padre, siguiente nivel)`.
+    """
+    from app.models.domains.product_models import (
+        CategoriasPrincipales,
+        Productos,
+        Seudocategorias,
+        Subcategorias,
+    )
+    return (
+        (SEUDOCATEGORIA, Seudocategorias, Productos, Productos.seudocategoria_id,
+         Seudocategorias.subcategoria_id, Subcategorias, 'seudocategorias_activas', SUBCATEGORIA),
+        (SUBCATEGORIA, Subcategorias, Seudocategorias, Seudocategorias.subcategoria_id,
+         Subcategorias.categoria_principal_id, CategoriasPrincipales, 'subcategorias_activas', CATEGORIA_PRINCIPAL),
+        (CATEGORIA_PRINCIPAL, CategoriasPrincipales, Subcategorias, Subcategorias.categoria_principal_id,
+         None, None, None, None),
+    )
+
+
+def solicitar_recalculo(session, nivel: str, *ids) -> None:
+    """
+    Anota categorías cuyo estado debe recalcularse en el próximo flush de la sesión.
+
+    Args:
+        session (Session): La sesión en la que se hacen los cambios (normalmente `db.session`).
+        nivel (str): `SEUDOCATEGORIA`, `SUBCATEGORIA` o `CATEGORIA_PRINCIPAL`.
+        *ids (str): Los IDs de las categorías afectadas. Se ignoran los vacíos.
+    """
+    pendientes = session.info.setdefault(_PENDIENTES_KEY, defaultdict(set))
+    pendientes[nivel].update(i for i in ids if i)
+
+
+def _cambiar_estado(conn, modelo, hijo, fk_hijo, fk_padre, ids, activar: bool):
+    """Activa o desactiva, en una sola sentencia, las categorías de `ids` que lo requieran."""
+    from app.models.enums import EstadoEnum
+
+    activo, inactivo = EstadoEnum.ACTIVO.value, EstadoEnum.INACTIVO.value
+    tiene_hijos_activos = exists().where(fk_hijo == modelo.id, hijo.estado == activo)
+    condiciones = (
+        modelo.id.in_(ids),
+        modelo.estado == (inactivo if activar else activo),
+        tiene_hijos_activos if activar else ~tiene_hijos_activos,
+    )
+    nuevo_estado = activo if activar else inactivo
+    columnas = (modelo.id,) if fk_padre is None else (modelo.id, fk_padre)
+
+    if conn.dialect.update_returning:
+        return conn.execute(
+            update(modelo).where(*condiciones).values(estado=nuevo_estado).returning(*columnas)
+        ).all()
+    # Motores sin `UPDATE ... RETURNING`: se leen primero las filas que cumplen la condición.
+    filas = conn.execute(select(*columnas).where(*condiciones)).all()
+    if filas:
+        conn.execute(update(modelo).where(modelo.id.in_([f[0] for f in filas])).values(estado=nuevo_estado))
+    return filas
+
+
+def propagar_estados(session) -> None:
+    """
+    Recalcula el estado de todas las categorías anotadas y de sus ancestros.
+
+    Se ejecuta automáticamente tras cada flush; puede llamarse a mano para forzar el
+    recálculo antes de leer los estados en la misma transacción.
+
+    Args:
+        session (Session): La sesión con las categorías anotadas.
+    """
+    pendientes = session.info.pop(_PENDIENTES_KEY, None)
+    if not pendientes:
+        return
+
+    conn = session.connection()
+    cambiadas = set()
+    deltas = defaultdict(Counter)
+
+    for nivel, modelo, hijo, fk_hijo, fk_padre, padre, contador, siguiente in _niveles():
+        ids = list(pendientes.get(nivel, ()))
+        if not ids:
+            continue
+        for activar, signo in ((False, -1), (True, 1)):
+            for fila in _cambiar_estado(conn, modelo, hijo, fk_hijo, fk_padre, ids, activar):
+                cambiadas.add((modelo, fila[0]))
+                if padre is not None and fila[1]:
+                    deltas[(padre, fila[1])][contador] += signo
+        # La cascada original revisaba siempre al padre, cambiara o no el estado del hijo.
+        if siguiente:
+            padres = conn.execute(select(fk_padre).where(modelo.id.in_(ids)).distinct()).scalars()
+            pendientes[siguiente].update(p for p in padres if p)
+
+    if deltas:
+        category_counters.aplicar_deltas(session, deltas)
+    if cambiadas:
+        session.info.setdefault(_CAMBIADAS_KEY, set()).update(cambiadas)
+        session.info[_NAVEGACION_KEY] = True
+
+
+def _registrar_listeners() -> None:
+    global _listeners_registrados
+    if _listeners_registrados:
+        return
+
+    @event.listens_for(Session, 'after_flush')
+    def _after_flush(session, flush_context):
+        propagar_estados(session)
+
+    @event.listens_for(Session, 'before_commit')
+    def _before_commit(session):
+        # Anotaciones hechas sin cambios pendientes no disparan un flush; se aplican aquí.
+        if session.info.get(_PENDIENTES_KEY) and not (session.new or session.dirty or session.deleted):
+            propagar_estados(session)
+
+    @event.listens_for(Session, 'after_flush_postexec')
+    def _after_flush_postexec(session, flush_context):
+        for modelo, pk in session.info.pop(_CAMBIADAS_KEY, ()):
+            obj = session.identity_map.get(inspect(modelo).identity_key_from_primary_key((pk,)))
+            if obj is not None:
+                session.expire(obj, ['estado', 'updated_at'])
+
+    @event.listens_for(Session, 'after_commit')
+    def _after_commit(session):
+        session.info.pop(_CAMBIADAS_KEY, None)
+        if session.info.pop(_NAVEGACION_KEY, False):
+            navigation_cache.invalidate_navigation_tree()
+
+    @event.listens_for(Session, 'after_rollback')
+    def _after_rollback(session):
+        for clave in (_PENDIENTES_KEY, _CAMBIADAS_KEY, _NAVEGACION_KEY):
+            session.info.pop(clave, None)
+
+    _listeners_registrados = True
+
+
+def init_category_status(app) -> None:
+    """
+    Registra los listeners que propagan el estado de la jerarquía de categorías.
+
+    Args:
+        app (Flask): La aplicación Flask.
+    """
+    _registrar_listeners()
@@ -0,0 +1,80 @@
+"""
+Módulo de Conteo de Consultas SQL.
+
+Los problemas N+1 (una consulta por cada fila de una lista) no se ven en el código:
+un acceso a `pedido.productos` o a `linea.producto` dentro de un bucle parece una
+lectura de atributo, pero con carga perezosa es un `SELECT`. Este módulo permite
+medirlos y fijar un tope:
+
+- `contar_consultas()`: Context manager que cuenta las sentencias que ejecuta el
+  engine de la aplicación dentro del bloque.
+- `assert_max_consultas(maximo)`: Igual, pero lanza `AssertionError` al salir si se
+  superó el tope. Sirve para comprobar que el costo de una página no crece con su
+  tamaño (ver el comando `flask verificar-consultas-pedidos`).
+
+Ambos requieren un contexto de aplicación.
+"""
+from contextlib import contextmanager
+from typing import Iterator, List
+
+from sqlalchemy import event
+
+from app.extensions import db
+
+
+class ContadorConsultas:
+    """
+    Resultado de `contar_consultas`.
+
+    Attributes:
+        sentencias (list[str]): El SQL de cada sentencia ejecutada, en orden.
+    """
+
+    def __init__(self):
+        self.sentencias: List[str] = []
+
+    @property
+    def total(self) -> int:
+        """Número de sentencias ejecutadas."""
+        return len(self.sentencias)
+
+
+@contextmanager
+def contar_consultas() -> Iterator[ContadorConsultas]:
+    """
+    Cuenta las sentencias SQL ejecutadas dentro del bloque `with`.
+
+    Yields:
+        ContadorConsultas: El contador, que se sigue llenando hasta salir del bloque.
+    """
+    contador = ContadorConsultas()
+    engine = db.engine
+
+    def _antes_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+        contador.sentencias.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', _antes_de_ejecutar)
+    try:
+        yield contador
+    finally:
+        event.remove(engine, 'before_cursor_execute', _antes_de_ejecutar)
+
+
+@contextmanager
+def assert_max_consultas(maximo: int) -> Iterator[ContadorConsultas]:
+    """
+    Como `contar_consultas`, pero falla si el bloque ejecuta más de `maximo` sentencias.
+
+    Args:
+        maximo (int): El número máximo de sentencias permitido.
+
+    Raises:
+        AssertionError: Si se superó el tope, con el SQL ejecutado en el mensaje.
+    """
+    with contar_consultas() as contador:
+        yield contador
+    if contador.total > maximo:
+        detalle = '\n'.join(f'  {i}. {sql}' for i, sql in enumerate(contador.sentencias, 1))
+        raise AssertionError(
+            f'Se esperaban como máximo {maximo} consultas y se ejecutaron {contador.total}:\n{detalle}'
+        )
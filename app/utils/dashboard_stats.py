@@ -0,0 +1,393 @@
+"""
+Módulo de Instantáneas de las Estadísticas del Dashboard.
+
+`admin/dashboard.get_dashboard_stats` ejecutaba en cada carga una docena de agregados
+pesados (métricas financieras, utilidad por día con `date_trunc`, unidades por
+categoría, productos y clientes top, valoración de todo el inventario, ingresos del
+período anterior...). Con varios administradores refrescando el dashboard, la carga
+se multiplicaba sin que los datos cambiaran entre dos refrescos.
+
+Ahora las estadísticas se sirven desde una instantánea por período ('7d', '30d',
+'90d', '1y'):
+- `calcular_estadisticas`: Calcula todos los paneles de un período. `_calcular_instantanea`
+  la ejecuta en una sesión propia y en una única transacción de solo lectura
+  (`REPEATABLE READ` en PostgreSQL), de modo que todos los paneles ven el mismo estado.
+  Los paneles de ventas (métricas financieras, evolución de la utilidad, categorías y
+  productos top, período anterior) leen el acumulado diario `ventas_diarias`.
+- `obtener_estadisticas`: Devuelve la instantánea vigente (TTL corto,
+  `DASHBOARD_STATS_CACHE_TTL_SECONDS`). Si está caducada o invalidada, la sirve igual
+  y encola el recálculo en el hilo de fondo de `app.utils.tareas`
+  (stale-while-revalidate); solo se calcula en la petición si no hay instantánea o
+  es más antigua que `DASHBOARD_STATS_MAX_STALE_SECONDS`.
+- Invalidación: un listener de la sesión detecta los pedidos que entran o salen del
+  estado `COMPLETADO` (o que se modifican estando completados) e incrementa la versión
+  de las estadísticas tras el `commit`. Los cambios de stock que no pasan por un pedido
+  (las métricas de inventario) quedan acotados por el TTL.
+
+Las instantáneas se guardan por proceso; la versión vive en un `VersionStore`, de modo
+que con un backend compartido (`DASHBOARD_STATS_CACHE_BACKEND`, ver `app.utils.backends`)
+un pedido completado invalida todos los workers.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Tuple
+
+from flask import current_app
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.models.domains.order_models import Pedido, VentasDiarias
+from app.models.domains.product_models import CategoriasPrincipales, Productos, Seudocategorias, Subcategorias
+from app.models.domains.user_models import Usuarios
+from app.models.enums import EstadoPedido
+from app.utils import tareas, ventas_diarias
+from app.utils.inventario import valoracion_inventario
+from app.utils.backends import VERSION_STORES, InMemoryVersionStore, VersionStore
+from app.utils.invalidacion import InvalidacionTrasCommit
+
+PERIODOS = ('7d', '30d', '90d', '1y')
+PERIODO_POR_DEFECTO = '30d'
+
+_CLAVE_VERSION = 'dashboard_stats'
+_listeners_registrados = False
+
+_store: VersionStore = InMemoryVersionStore()
+_ttl_segundos = 60
+_max_obsoleto_segundos = 900
+_lock = threading.Lock()
+# {período: (versión, instante del cálculo, estadísticas)}
+_instantaneas: Dict[str, Tuple[int, float, dict]] = {}
+
+
+def init_dashboard_stats(app) -> None:
+    """
+    Configura la caché de estadísticas del dashboard y registra los listeners de invalidación.
+
+    Args:
+        app (Flask): La aplicación Flask.
+    """
+    global _store, _ttl_segundos, _max_obsoleto_segundos
+    _store = VERSION_STORES.crear(app, 'DASHBOARD_STATS_CACHE_BACKEND')
+    _ttl_segundos = app.config.get('DASHBOARD_STATS_CACHE_TTL_SECONDS', 60)
+    _max_obsoleto_segundos = app.config.get('DASHBOARD_STATS_MAX_STALE_SECONDS', 900)
+    with _lock:
+        _instantaneas.clear()
+    _registrar_listeners()
+
+
+def invalidar_estadisticas() -> None:
+    """
+    Marca como obsoletas las instantáneas de todos los períodos, en todos los workers.
+
+    Debe llamarse después del `commit`; los pedidos completados con el ORM ya lo hacen
+    solos (ver `_registrar_listeners`).
+    """
+    _store.bump(_CLAVE_VERSION)
+
+
+# La única clave anotada es la versión de las estadísticas, común a todos los períodos.
+_INVALIDACION = InvalidacionTrasCommit('estadísticas del dashboard', lambda _clave: invalidar_estadisticas())
+
+
+def obtener_estadisticas(period: str) -> dict:
+    """
+    Devuelve las estadísticas del dashboard de un período desde su instantánea.
+
+    Args:
+        period (str): '7d', '30d', '90d' o '1y'; cualquier otro valor se trata como '30d'.
+
+    Returns:
+        dict: Las estadísticas con la forma de `calcular_estadisticas`.
+    """
+    if period not in PERIODOS:
+        period = PERIODO_POR_DEFECTO
+    app = current_app._get_current_object()
+    version = _store.get(_CLAVE_VERSION)
+    with _lock:
+        instantanea = _instantaneas.get(period)
+    if instantanea is not None:
+        version_guardada, calculado_en, datos = instantanea
+        edad = time.monotonic() - calculado_en
+        if version_guardada == version and edad < _ttl_segundos:
+            return datos
+        if edad < _max_obsoleto_segundos:
+            _recalcular_en_segundo_plano(app, period)
+            return datos
+    return _calcular_instantanea(app, period)
+
+
+def _calcular_instantanea(app, period: str) -> dict:
+    """
+    Calcula y guarda la instantánea de un período en una sesión y una transacción propias.
+
+    La versión se lee antes de calcular: si un pedido se completa mientras tanto, la
+    instantánea queda guardada con la versión anterior y se recalcula en la siguiente lectura.
+    """
+    version = _store.get(_CLAVE_VERSION)
+    inicio = time.monotonic()
+    # Un contexto de aplicación nuevo tiene su propia sesión (y su propia transacción),
+    # también cuando se llama desde una petición.
+    with app.app_context():
+        try:
+            if db.engine.dialect.name == 'postgresql':
+                # Todas las consultas de la instantánea leen el mismo estado de la base de datos.
+                db.session.connection(execution_options={'isolation_level': 'REPEATABLE READ',
+                                                         'postgresql_readonly': True})
+            datos = calcular_estadisticas(period)
+        finally:
+            db.session.rollback()
+    with _lock:
+        _instantaneas[period] = (version, inicio, datos)
+    return datos
+
+
+def _recalcular_en_segundo_plano(app, period: str) -> None:
+    """Encola el recálculo de un período, salvo que ya haya uno pendiente."""
+    tareas.lanzar(f'estadisticas-dashboard-{period}', lambda: _calcular_instantanea(app, period))
+
+
+def calcular_estadisticas(period: str) -> dict:
+    """
+    Calcula todas las estadísticas y datos de los gráficos del dashboard para un período.
+
+    Args:
+        period (str): El período de tiempo para los cálculos ('7d', '30d', '90d', '1y').
+
+    Returns:
+        dict: Con las claves `stats`, `profits_chart`, `categories_chart`, `top_products`,
+              `new_products`, `top_customers` y `new_categories`.
+    """
+    end_date = datetime.utcnow()
+
+    if period == '7d':
+        start_date = end_date - timedelta(days=7)
+        date_trunc_format = 'day'
+    elif period == '90d':
+        start_date = end_date - timedelta(days=90)
+        date_trunc_format = 'week'
+    elif period == '1y':
+        start_date = end_date - timedelta(days=365)
+        date_trunc_format = 'month'
+    else:  # '30d' por defecto
+        start_date = end_date - timedelta(days=30)
+        date_trunc_format = 'day'
+
+    # MEJORA PROFESIONAL: Calcular el número de días para el promedio.
+    num_days = (end_date - start_date).days
+
+    # MEJORA PROFESIONAL: Los agregados de ventas se leen del acumulado diario
+    # (`ventas_diarias`), cuyo tamaño depende de los días del período y no de los pedidos.
+    # El período son los `num_days` días (UTC) que terminan hoy.
+    hasta = end_date.date()
+    desde = hasta - timedelta(days=num_days - 1)
+    ventas_en_rango = VentasDiarias.fecha.between(desde, hasta)
+    pedidos_en_rango = Pedido.created_at >= datetime.combine(desde, datetime.min.time())
+
+    # --- 1. Métricas Financieras ---
+    financials = ventas_diarias.totales_ventas(desde, hasta)
+
+    # --- 2. Gráfico de Evolución de Ganancias ---
+    # Un punto por día, semana o mes del período, incluidos los que no tuvieron ventas.
+    profits_data = ventas_diarias.serie_ventas(desde, hasta, date_trunc_format)
+
+    # --- 3. Gráfico de Distribución por Categoría ---
+    category_data = db.session.query(
+        Subcategorias.nombre,
+        func.sum(VentasDiarias.unidades).label('unidades_vendidas')
+    ).join(Seudocategorias, Seudocategorias.id == VentasDiarias.seudocategoria_id)\
+     .join(Subcategorias, Subcategorias.id == Seudocategorias.subcategoria_id)\
+     .filter(ventas_en_rango)\
+     .group_by(Subcategorias.nombre).order_by(func.sum(VentasDiarias.unidades).desc()).limit(6).all()
+
+
+    # --- 4. Productos Más Vendidos ---
+    top_products_data = db.session.query(
+        Productos.id,
+        Productos.nombre,
+        Productos.marca,
+        Productos.slug,
+        Productos.imagen_url,
+        func.sum(VentasDiarias.unidades).label('unidades_vendidas')
+    ).join(Productos, Productos.id == VentasDiarias.producto_id)\
+     .filter(ventas_en_rango)\
+     .group_by(Productos.id).order_by(func.sum(VentasDiarias.unidades).desc()).limit(5).all()
+
+    # --- 5. Productos Nuevos ---
+    new_products_data = db.session.query(
+        Productos.id,
+        Productos.nombre,
+        Productos.marca,
+        Productos.slug,
+        Productos.imagen_url,
+        Productos.created_at
+    ).filter(Productos.estado == 'activo').order_by(Productos.created_at.desc()).limit(3).all()
+
+    # --- 6. Clientes Top ---
+    top_customers_data = db.session.query(
+        Usuarios.id.label('usuario_id'),
+        Usuarios.nombre.label('usuario_nombre'),
+        Usuarios.apellido.label('usuario_apellido'),
+        func.sum(Pedido.total).label('total_gastado'),
+        func.count(Pedido.id).label('total_pedidos'),
+        func.max(Pedido.created_at).label('ultima_compra')
+    ).join(Usuarios, Usuarios.id == Pedido.usuario_id)\
+     .filter(
+        Pedido.estado_pedido == EstadoPedido.COMPLETADO,
+        pedidos_en_rango
+    ).group_by(Usuarios.id, Usuarios.nombre, Usuarios.apellido)\
+     .order_by(func.sum(Pedido.total).desc()).limit(3).all()
+
+    # --- 7. Categorías Nuevas ---
+    new_categories_data = db.session.query(
+        CategoriasPrincipales.nombre,
+        CategoriasPrincipales.slug,
+        CategoriasPrincipales.created_at,
+        func.count(Productos.id).label('product_count')
+    ).outerjoin(Subcategorias, Subcategorias.categoria_principal_id == CategoriasPrincipales.id)\
+     .outerjoin(Seudocategorias, Seudocategorias.subcategoria_id == Subcategorias.id)\
+     .outerjoin(Productos, Productos.seudocategoria_id == Seudocategorias.id)\
+     .filter(CategoriasPrincipales.estado == 'activo')\
+     .group_by(CategoriasPrincipales.id)\
+     .order_by(CategoriasPrincipales.created_at.desc()).limit(3).all()
+
+    # --- 8. CORRECCIÓN PROFESIONAL: Procesamiento de datos y manejo de nulos ---
+    total_ingresos = financials['ingresos']
+    total_inversion = financials['costo']
+    # MEJORA PROFESIONAL: Calcular la utilidad explícitamente para mayor claridad.
+    total_utilidad = total_ingresos - total_inversion
+
+    margen_ganancia = (total_utilidad / total_ingresos * 100) if total_ingresos > 0 else 0
+
+    # Procesar datos de gráficos
+    # La serie ya trae todos los días/semanas/meses del período (generada en SQL), incluso
+    # los que no tuvieron ventas, así que no hay que rellenar huecos.
+    formato_etiqueta = {'day': '%d/%m', 'week': 'Sem %W', 'month': '%b %Y'}[date_trunc_format]
+    profits_chart = {
+        'labels': [punto['periodo'].strftime(formato_etiqueta) for punto in profits_data],
+        'values': [punto['ingresos'] - punto['costo'] for punto in profits_data],
+    }
+
+    categories_chart = {'labels': [], 'values': []}
+    for row in category_data:
+        categories_chart['labels'].append(row.nombre)
+        categories_chart['values'].append(int(row.unidades_vendidas or 0))
+
+    # Procesar listas
+    top_products = [dict(row._mapping) for row in top_products_data]
+    new_products = [dict(row._mapping) for row in new_products_data]
+    top_customers = [dict(row._mapping) for row in top_customers_data]
+    new_categories = [dict(row._mapping) for row in new_categories_data]
+
+    # --- 9. CORRECCIÓN PROFESIONAL: Calcular métricas adicionales de forma segura ---
+    # Total de pedidos en el período
+    total_pedidos = db.session.query(func.count(Pedido.id)).filter(
+        Pedido.estado_pedido == EstadoPedido.COMPLETADO,
+        pedidos_en_rango
+    ).scalar() or 0
+
+    ticket_promedio = total_ingresos / total_pedidos if total_pedidos > 0 else 0
+    promedio_diario = total_ingresos / num_days if num_days > 0 else 0
+
+    # CORRECCIÓN PROFESIONAL: El valor del mejor día debe ser la utilidad de ese día, no los ingresos.
+    # El gráfico `profits_chart` ya contiene la utilidad diaria, por lo que `max(profits_chart['values'])` es correcto.
+    mejor_dia_utilidad = max(profits_chart['values']) if profits_chart['values'] else 0
+
+    # Tendencia de INGRESOS vs. Período Anterior
+    ingresos_periodo_anterior = ventas_diarias.totales_ventas(
+        desde - timedelta(days=num_days), desde - timedelta(days=1)
+    )['ingresos']
+
+    tendencia = 0
+    if ingresos_periodo_anterior > 0:
+        tendencia = ((total_ingresos - ingresos_periodo_anterior) / ingresos_periodo_anterior) * 100
+    elif total_ingresos > 0:
+        tendencia = 100.0
+
+    # --- 10. CORRECCIÓN PROFESIONAL: Nuevas métricas de inventario y ventas ---
+    # Estas métricas son independientes del período y reflejan el estado actual del negocio.
+
+    # Total de unidades vendidas en el período seleccionado.
+    total_unidades_vendidas = financials['unidades']
+
+    # Métricas globales de inventario (no dependen del período)
+    inventory_stats = db.session.query(
+        func.sum(Productos._existencia).label('total_existencias'),
+        func.sum(Productos.costo * Productos._existencia).label('inversion_inventario_total'),
+        func.sum(Productos.precio * Productos._existencia).label('ingresos_potenciales_totales'),
+        # MEJORA PROFESIONAL: Añadir el conteo de SKUs (productos únicos) activos.
+        func.count(Productos.id).label('total_skus_activos')
+    ).filter(Productos.estado == 'activo').first()
+
+    total_existencias = int(inventory_stats.total_existencias or 0)
+    inversion_inventario_total = float(inventory_stats.inversion_inventario_total or 0)
+    ingresos_potenciales_totales = float(inventory_stats.ingresos_potenciales_totales or 0)
+    total_skus_activos = int(inventory_stats.total_skus_activos or 0)
+
+    # MEJORA PROFESIONAL: Calcular métricas derivadas para las nuevas tarjetas.
+    utilidad_potencial_total = ingresos_potenciales_totales - inversion_inventario_total
+    costo_promedio_unidad = (inversion_inventario_total / total_existencias) if total_existencias > 0 else 0
+
+    # Valoración del inventario al inicio y al final del período, desde el último snapshot
+    # de stock más los movimientos del diario (lecturas por rango, sin reproducir pedidos).
+    inventario_inicio = valoracion_inventario(start_date)
+    inventario_fin = valoracion_inventario(end_date)
+    variacion_inventario = inventario_fin['inversion'] - inventario_inicio['inversion']
+
+
+    return {
+        'stats': {
+            'total_ingresos': total_ingresos,
+            'total_inversion': total_inversion,
+            'total_utilidad': total_utilidad,
+            'margen_ganancia': margen_ganancia,
+            'total_pedidos': total_pedidos,
+            'ticket_promedio': ticket_promedio,
+            'promedio_diario': promedio_diario,
+            'mejor_dia': mejor_dia_utilidad,
+            'tendencia': tendencia,
+            'total_unidades_vendidas': total_unidades_vendidas,
+            'total_existencias': total_existencias,
+            'inversion_inventario_total': inversion_inventario_total,
+            'ingresos_potenciales_totales': ingresos_potenciales_totales,
+            'utilidad_potencial_total': utilidad_potencial_total,
+            'total_skus_activos': total_skus_activos,
+            'costo_promedio_unidad': costo_promedio_unidad,
+            'inversion_inventario_inicio_periodo': inventario_inicio['inversion'],
+            'existencias_inicio_periodo': inventario_inicio['existencias'],
+            'variacion_inventario': variacion_inventario
+        },
+        'profits_chart': profits_chart,
+        'categories_chart': categories_chart,
+        'top_products': top_products,
+        'new_products': new_products,
+        'top_customers': top_customers,
+        'new_categories': new_categories
+    }
+
+def _afecta_ventas(pedido: Pedido) -> bool:
+    """Indica si un cambio en un pedido modifica las ventas completadas."""
+    historial = inspect(pedido).attrs.estado_pedido.history
+    return EstadoPedido.COMPLETADO in (*historial.added, *historial.deleted, pedido.estado_pedido)
+
+
+def _registrar_listeners() -> None:
+    global _listeners_registrados
+    if _listeners_registrados:
+        return
+
+    @event.listens_for(Session, 'after_flush')
+    def _after_flush(session, flush_context):
+        for pedido in (*session.new, *session.deleted):
+            if isinstance(pedido, Pedido) and pedido.estado_pedido == EstadoPedido.COMPLETADO:
+                _INVALIDACION.anotar(session, _CLAVE_VERSION)
+                return
+        for pedido in session.dirty:
+            if (isinstance(pedido, Pedido) and session.is_modified(pedido, include_collections=False)
+                    and _afecta_ventas(pedido)):
+                _INVALIDACION.anotar(session, _CLAVE_VERSION)
+                return
+
+    _INVALIDACION.registrar()
+    _listeners_registrados = True
@@ -0,0 +1,371 @@
+"""
+Módulo del Índice de Facetas del Catálogo.
+
+Los antiguos endpoints `/api/filtros/*` de `cliente/products.py` ejecutaban, en
+cada petición, un `SELECT DISTINCT lower(json_extract_path_text(especificaciones, ...))`
+sobre la unión de `productos`, `seudocategorias`, `subcategorias` y
+`categorias_principales`, y las páginas de categoría lanzaban varios a la vez. Hoy
+la barra lateral hace una sola llamada a `/api/productos/buscar-facetado`, que
+responde desde este índice (ver `IndiceFacetas.buscar`).
+
+Este módulo mantiene en memoria un índice invertido de los productos visibles
+para el cliente (producto activo, con stock y con toda su jerarquía activa):
+- `postings[faceta][valor]` es el conjunto de IDs de producto con ese valor.
+- `etiquetas[faceta][valor]` guarda el texto a mostrar para cada valor normalizado.
+- `precios[id]` permite calcular el rango de precios sin volver a la base de datos.
+
+Los valores se normalizan con `lower()`, igual que hacían las consultas SQL, de
+modo que los filtros siguen siendo insensibles a mayúsculas.
+
+El índice se reconstruye con una sola consulta y solo cuando hace falta:
+- Cada worker guarda `(versión, expiración, índice)` en su propia memoria.
+- Un listener de la sesión de SQLAlchemy detecta los `commit` que modifican
+  productos o categorías e incrementa la versión en el `VersionStore`.
+- El TTL (`FACET_INDEX_TTL_SECONDS`) acota la obsolescencia de los cambios que no
+  pasan por el ORM (ej. SQL manual).
+
+Al igual que en la caché de navegación, el `VersionStore` se selecciona con
+`FACET_INDEX_BACKEND` (ver `app.utils.backends`).
+"""
+import json
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from app.utils.backends import VERSION_STORES, InMemoryVersionStore, VersionStore
+
+# Clave de la versión del índice de facetas en el `VersionStore`.
+FACET_INDEX_KEY = 'facet_index'
+
+# Facetas derivadas del campo JSON `especificaciones`. Si hay varias claves, se usa la
+# primera que exista (equivalente al `COALESCE` de las consultas originales).
+FACETAS_ESPECIFICACION = {
+    'genero': ('Genero',),
+    'color': ('Color', 'Tono'),
+    'tono': ('Tono',),
+    'funcion': ('Funcion',),
+    'contenido': ('Contenido',),
+    'ingrediente_clave': ('Ingrediente Clave',),
+    'resistente_al_agua': ('Resistente al agua',),
+}
+
+# Facetas derivadas de columnas del producto y de su jerarquía de categorías.
+FACETAS_CATEGORIA = ('categoria_principal', 'subcategoria', 'seudocategoria')
+FACETAS = FACETAS_CATEGORIA + ('marca',) + tuple(FACETAS_ESPECIFICACION)
+
+# Modelos cuyos cambios invalidan el índice.
+_MODELOS_INDEXADOS = ('Productos', 'Seudocategorias', 'Subcategorias', 'CategoriasPrincipales')
+_SESION_SUCIA_KEY = '_facet_index_sucio'
+
+
+def _texto_json(valor) -> Optional[str]:
+    """Convierte un valor JSON a texto como lo haría `json_extract_path_text`."""
+    if valor is None:
+        return None
+    if isinstance(valor, str):
+        return valor
+    if isinstance(valor, bool):
+        return 'true' if valor else 'false'
+    if isinstance(valor, (int, float)):
+        return str(valor)
+    return json.dumps(valor, ensure_ascii=False)
+
+
+def filtros_desde_args(args, claves: Iterable[str] = FACETAS) -> Dict[str, str]:
+    """
+    Extrae los filtros de facetas de los parámetros de una petición.
+
+    Ignora los valores vacíos y 'all', igual que los endpoints originales. Acepta
+    `pseudocategoria` como alias de `seudocategoria`, que es el nombre usado por
+    `/api/productos/filtrar`.
+
+    Args:
+        args (MultiDict): Los parámetros de la petición (`request.args`).
+        claves (Iterable[str]): Las facetas a considerar.
+
+    Returns:
+        Dict[str, str]: Un diccionario `{faceta: valor}` con los filtros activos.
+    """
+    filtros = {}
+    for clave in claves:
+        valor = args.get(clave)
+        if clave == 'seudocategoria' and not valor:
+            valor = args.get('pseudocategoria')
+        if valor and valor != 'all':
+            filtros[clave] = valor
+    return filtros
+
+
+class IndiceFacetas:
+    """
+    Índice invertido inmutable de los productos visibles del catálogo.
+
+    Se construye una vez y solo se lee; una reconstrucción crea una instancia
+    nueva, así que las lecturas concurrentes no necesitan locks.
+    """
+
+    def __init__(self):
+        self.todos: Set[str] = set()
+        self.precios: Dict[str, float] = {}
+        # Claves de ordenamiento y valores normalizados de cada producto (para `buscar`).
+        self.nombres: Dict[str, str] = {}
+        self.calificaciones: Dict[str, float] = {}
+        self.documentos: Dict[str, Dict[str, str]] = {}
+        self.postings: Dict[str, Dict[str, Set[str]]] = {faceta: {} for faceta in FACETAS}
+        self.etiquetas: Dict[str, Dict[str, str]] = {faceta: {} for faceta in FACETAS}
+
+    def agregar(self, producto_id: str, precio: float, valores: Dict[str, Optional[str]],
+                nombre: str = '', calificacion: float = 0.0) -> None:
+        """Añade un producto con sus valores de faceta (texto sin normalizar)."""
+        self.todos.add(producto_id)
+        self.precios[producto_id] = precio
+        self.nombres[producto_id] = (nombre or '').lower()
+        self.calificaciones[producto_id] = calificacion or 0.0
+        documento = self.documentos.setdefault(producto_id, {})
+        for faceta, texto in valores.items():
+            if not texto:
+                continue
+            clave = texto.lower()
+            documento[faceta] = clave
+            self.postings[faceta].setdefault(clave, set()).add(producto_id)
+            self.etiquetas[faceta].setdefault(clave, texto)
+
+    def buscar(self, filtros: Dict[str, str], min_precio: float = None, max_precio: float = None) -> dict:
+        """
+        Calcula en una sola pasada los candidatos, los conteos de cada faceta y el rango de precios.
+
+        Cada producto se evalúa contra todos los filtros una sola vez:
+        - Si los cumple todos (y está dentro del rango de precio) es candidato y suma
+          en todas las facetas.
+        - Si falla exactamente un filtro de faceta, solo suma en esa faceta (conteos
+          disyuntivos: cada faceta ignora su propia selección).
+        - El rango de precios se calcula sobre los productos que cumplen los filtros de
+          faceta, sin aplicar el propio filtro de precio, para no encoger el control deslizante.
+
+        Args:
+            filtros (Dict[str, str]): Filtros `{faceta: valor}`.
+            min_precio (float, optional): Precio mínimo (inclusive).
+            max_precio (float, optional): Precio máximo (inclusive).
+
+        Returns:
+            dict: `{'ids', 'facetas', 'rango_precios'}`, donde `ids` es la lista de candidatos.
+        """
+        activos = {f: str(v).lower() for f, v in filtros.items() if f in self.postings}
+        contadores: Dict[str, Dict[str, int]] = {faceta: {} for faceta in FACETAS}
+        ids, precios_rango = [], []
+
+        for pid, documento in self.documentos.items():
+            fallido = None
+            descartado = False
+            for faceta, valor in activos.items():
+                if documento.get(faceta) != valor:
+                    if fallido is not None:
+                        descartado = True
+                        break
+                    fallido = faceta
+            if descartado:
+                continue
+
+            precio = self.precios[pid]
+            if fallido is None:
+                precios_rango.append(precio)
+            if (min_precio is not None and precio < min_precio) or (max_precio is not None and precio > max_precio):
+                continue
+
+            if fallido is None:
+                ids.append(pid)
+                a_contar = documento.items()
+            else:
+                a_contar = ((fallido, documento[fallido]),) if fallido in documento else ()
+            for faceta, clave in a_contar:
+                contadores[faceta][clave] = contadores[faceta].get(clave, 0) + 1
+
+        facetas = {
+            faceta: sorted(
+                ({'valor': self.etiquetas[faceta][clave], 'conteo': conteo} for clave, conteo in valores.items()),
+                key=lambda v: v['valor'].lower()
+            )
+            for faceta, valores in contadores.items()
+        }
+        return {
+            'ids': ids,
+            'facetas': facetas,
+            'rango_precios': {
+                'min_price': min(precios_rango) if precios_rango else 0,
+                'max_price': max(precios_rango) if precios_rango else 0,
+            },
+        }
+
+    def ordenar(self, ids: Iterable[str], orden: str = 'featured') -> List[str]:
+        """
+        Ordena IDs de producto con los mismos criterios que `/api/productos/filtrar`.
+
+        El ID se usa como criterio de desempate para que la paginación sea estable.
+
+        Args:
+            ids (Iterable[str]): Los IDs a ordenar.
+            orden (str): 'price_asc', 'price_desc', 'top_rated', 'az', 'za' o 'featured'.
+
+        Returns:
+            List[str]: Los IDs ordenados.
+        """
+        if orden == 'price_asc':
+            return sorted(ids, key=lambda pid: (self.precios[pid], pid))
+        if orden == 'price_desc':
+            return sorted(ids, key=lambda pid: (-self.precios[pid], pid))
+        if orden == 'top_rated':
+            return sorted(ids, key=lambda pid: (-self.calificaciones[pid], pid))
+        if orden == 'za':
+            return sorted(ids, key=lambda pid: (self.nombres[pid], pid), reverse=True)
+        return sorted(ids, key=lambda pid: (self.nombres[pid], pid))
+
+
+def construir_indice() -> IndiceFacetas:
+    """
+    Construye el índice a partir de la base de datos con una sola consulta.
+
+    Returns:
+        IndiceFacetas: El índice de los productos visibles del catálogo.
+    """
+    from sqlalchemy import and_
+
+    from app.extensions import db
+    from app.models.domains.product_models import (
+        CategoriasPrincipales,
+        Productos,
+        Seudocategorias,
+        Subcategorias,
+    )
+    from app.models.enums import EstadoEnum
+
+    filas = db.session.query(
+        Productos.id, Productos.precio, Productos.marca, Productos.especificaciones,
+        Productos.nombre, Productos.calificacion_promedio_almacenada,
+        CategoriasPrincipales.nombre, Subcategorias.nombre, Seudocategorias.nombre
+    ).join(
+        Seudocategorias, and_(Productos.seudocategoria_id == Seudocategorias.id, Seudocategorias.estado == EstadoEnum.ACTIVO)
+    ).join(
+        Subcategorias, and_(Seudocategorias.subcategoria_id == Subcategorias.id, Subcategorias.estado == EstadoEnum.ACTIVO)
+    ).join(
+        CategoriasPrincipales, and_(Subcategorias.categoria_principal_id == CategoriasPrincipales.id, CategoriasPrincipales.estado == EstadoEnum.ACTIVO)
+    ).filter(
+        Productos.estado == EstadoEnum.ACTIVO, Productos._existencia > 0
+    ).all()
+
+    indice = IndiceFacetas()
+    for pid, precio, marca, especificaciones, nombre, calificacion, categoria, subcategoria, seudocategoria in filas:
+        especificaciones = especificaciones if isinstance(especificaciones, dict) else {}
+        valores = {
+            'categoria_principal': categoria,
+            'subcategoria': subcategoria,
+            'seudocategoria': seudocategoria,
+            'marca': marca,
+        }
+        # Las especificaciones se exponen en minúsculas, como devolvían las consultas SQL.
+        for faceta, claves in FACETAS_ESPECIFICACION.items():
+            texto = next(
+                (_texto_json(especificaciones[c]) for c in claves if especificaciones.get(c) is not None),
+                None
+            )
+            valores[faceta] = texto.lower() if texto else None
+        indice.agregar(pid, precio, valores, nombre=nombre, calificacion=calificacion)
+    return indice
+
+
+_store: VersionStore = InMemoryVersionStore()
+_ttl_segundos = 300
+_lock = threading.Lock()
+# Entrada local: {'version': int, 'expira': float, 'indice': IndiceFacetas}
+_entrada: dict | None = None
+_listeners_registrados = False
+
+
+def _marcar_si_afecta(session, instancias) -> None:
+    if any(type(obj).__name__ in _MODELOS_INDEXADOS for obj in instancias):
+        session.info[_SESION_SUCIA_KEY] = True
+
+
+def _registrar_listeners() -> None:
+    """Invalida el índice tras cada `commit` que modifica productos o categorías."""
+    global _listeners_registrados
+    if _listeners_registrados:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    @event.listens_for(Session, 'after_flush')
+    def _after_flush(session, flush_context):
+        _marcar_si_afecta(session, list(session.new) + list(session.dirty) + list(session.deleted))
+
+    @event.listens_for(Session, 'after_bulk_update')
+    def _after_bulk_update(update_context):
+        if update_context.mapper.class_.__name__ in _MODELOS_INDEXADOS:
+            update_context.session.info[_SESION_SUCIA_KEY] = True
+
+    @event.listens_for(Session, 'after_commit')
+    def _after_commit(session):
+        if session.info.pop(_SESION_SUCIA_KEY, False):
+            invalidate_facet_index()
+
+    @event.listens_for(Session, 'after_rollback')
+    def _after_rollback(session):
+        session.info.pop(_SESION_SUCIA_KEY, None)
+
+    _listeners_registrados = True
+
+
+def init_facet_index(app) -> None:
+    """
+    Configura el índice de facetas a partir de la configuración de la aplicación.
+
+    Args:
+        app (Flask): La aplicación Flask.
+    """
+    global _store, _ttl_segundos, _entrada
+    _store = VERSION_STORES.crear(app, 'FACET_INDEX_BACKEND')
+    _ttl_segundos = app.config.get('FACET_INDEX_TTL_SECONDS', 300)
+    _entrada = None
+    _registrar_listeners()
+
+
+def version_catalogo() -> int:
+    """
+    Devuelve la versión actual del catálogo (se incrementa tras cada cambio de productos o categorías).
+
+    Otros índices en memoria derivados del catálogo (ej. el backend 'memory' de la
+    búsqueda de productos) la usan para saber cuándo deben reconstruirse.
+
+    Returns:
+        int: La versión vigente en el `VersionStore`.
+    """
+    return _store.get(FACET_INDEX_KEY)
+
+
+def get_facet_index() -> IndiceFacetas:
+    """
+    Devuelve el índice de facetas vigente, reconstruyéndolo solo si hace falta.
+
+    Returns:
+        IndiceFacetas: El índice de los productos visibles del catálogo.
+    """
+    global _entrada
+    version = _store.get(FACET_INDEX_KEY)
+    entrada = _entrada
+    if entrada and entrada['version'] == version and entrada['expira'] > time.monotonic():
+        return entrada['indice']
+
+    with _lock:
+        # Otro hilo pudo haberlo reconstruido mientras se esperaba el lock.
+        entrada = _entrada
+        if entrada and entrada['version'] == version and entrada['expira'] > time.monotonic():
+            return entrada['indice']
+        indice = construir_indice()
+        _entrada = {'version': version, 'expira': time.monotonic() + _ttl_segundos, 'indice': indice}
+        return indice
+
+
+def invalidate_facet_index() -> None:
+    """Invalida el índice en todos los workers que comparten el `VersionStore`."""
+    global _entrada
+    _store.bump(FACET_INDEX_KEY)
+    _entrada = None
@@ -0,0 +1,151 @@
+"""
+Módulo de Resolución de Identidad por Petición.
+
+Centraliza la obtención del usuario cliente y del administrador autenticados
+durante una petición. Antes, cada capa (middleware `before_request`, procesador
+de contexto `inject_admin_user`, decoradores `jwt_required` / `admin_jwt_required`
+y `restore_session_from_jwt`) decodificaba los mismos tokens y volvía a cargar
+los mismos registros de `Usuarios` y `Admins`.
+
+Este módulo guarda en `g` (que vive exactamente una petición):
+- Los payloads ya decodificados, indexados por tipo y valor del token.
+- Los principales ya cargados, indexados por ID (incluyendo los no encontrados).
+- Un contador de consultas de identidad emitidas, para detectar regresiones.
+
+Funcionalidades principales:
+- `decode_token_cached`: Decodifica un token una sola vez por petición.
+- `get_usuario_por_id` / `get_admin_por_id`: Cargan cada principal una sola vez.
+- `resolver_usuario_actual` / `resolver_admin_actual`: Resuelven la identidad
+  a partir de las cookies `token` y `admin_jwt`.
+- `get_identity_query_count`: Número de consultas de identidad de la petición.
+"""
+from typing import Callable
+
+from flask import g, request
+
+from app.models.domains.user_models import Admins, Usuarios
+
+# Claves internas en `g`.
+_TOKENS_KEY = '_identity_tokens'
+_USUARIOS_KEY = '_identity_usuarios'
+_ADMINS_KEY = '_identity_admins'
+_QUERY_COUNT_KEY = '_identity_query_count'
+
+
+def _incrementar_contador() -> None:
+    """Registra una consulta de identidad emitida en la petición actual."""
+    setattr(g, _QUERY_COUNT_KEY, getattr(g, _QUERY_COUNT_KEY, 0) + 1)
+
+
+def get_identity_query_count() -> int:
+    """
+    Devuelve cuántas consultas de identidad (`Usuarios`/`Admins`) emitió la petición.
+
+    Returns:
+        int: El número de consultas realizadas. Lo normal es 0, 1 o 2.
+    """
+    return getattr(g, _QUERY_COUNT_KEY, 0)
+
+
+def decode_token_cached(tipo: str, token: str, decoder: Callable[[str], dict | None]) -> dict | None:
+    """
+    Decodifica un token JWT una sola vez por petición.
+
+    Args:
+        tipo (str): Espacio de nombres del token (ej. 'cliente', 'admin').
+        token (str): El token JWT.
+        decoder (Callable): La función de decodificación a usar la primera vez.
+
+    Returns:
+        dict | None: El payload decodificado, o None si el token es inválido.
+    """
+    if not token:
+        return None
+    cache = g.setdefault(_TOKENS_KEY, {})
+    clave = (tipo, token)
+    if clave not in cache:
+        cache[clave] = decoder(token)
+    return cache[clave]
+
+
+def _get_principal(modelo, cache_key: str, principal_id):
+    """Carga un principal por ID una sola vez por petición, recordando también los ausentes."""
+    if not principal_id:
+        return None
+    cache = g.setdefault(cache_key, {})
+    if principal_id not in cache:
+        _incrementar_contador()
+        cache[principal_id] = modelo.query.get(principal_id)
+    return cache[principal_id]
+
+
+def get_usuario_por_id(user_id) -> Usuarios | None:
+    """
+    Obtiene un `Usuarios` por su ID, consultando la base de datos como máximo una vez por petición.
+
+    Args:
+        user_id (str): El ID del usuario.
+
+    Returns:
+        Usuarios | None: El usuario, o None si no existe.
+    """
+    return _get_principal(Usuarios, _USUARIOS_KEY, user_id)
+
+
+def get_admin_por_id(admin_id) -> Admins | None:
+    """
+    Obtiene un `Admins` por su ID, consultando la base de datos como máximo una vez por petición.
+
+    Args:
+        admin_id (str): El ID del administrador.
+
+    Returns:
+        Admins | None: El administrador, o None si no existe.
+    """
+    return _get_principal(Admins, _ADMINS_KEY, admin_id)
+
+
+def resolver_usuario_desde_token(token: str) -> Usuarios | None:
+    """
+    Resuelve el usuario cliente asociado a un token JWT de cliente.
+
+    Args:
+        token (str): El token JWT de cliente.
+
+    Returns:
+        Usuarios | None: El usuario si el token es válido y el usuario existe.
+    """
+    from app.utils.jwt_utils import decode_jwt_token
+
+    payload = decode_token_cached('cliente', token, decode_jwt_token)
+    if not payload:
+        return None
+    return get_usuario_por_id(payload.get('user_id'))
+
+
+def resolver_usuario_actual() -> Usuarios | None:
+    """
+    Resuelve el usuario cliente a partir de la cookie `token` de la petición.
+
+    Returns:
+        Usuarios | None: El usuario autenticado, o None.
+    """
+    token = request.cookies.get('token')
+    if not token or not token.strip():
+        return None
+    return resolver_usuario_desde_token(token)
+
+
+def resolver_admin_actual() -> Admins | None:
+    """
+    Resuelve el administrador a partir de la cookie `admin_jwt` de la petición.
+
+    Returns:
+        Admins | None: El administrador autenticado, o None.
+    """
+    from app.utils.admin_jwt_utils import decode_admin_jwt_token
+
+    payload = decode_token_cached('admin', request.cookies.get('admin_jwt'), decode_admin_jwt_token)
+    if not payload:
+        return None
+    return get_admin_por_id(payload.get('user_id'))
@@ -0,0 +1,77 @@
+"""
+Módulo de Invalidación de Cachés tras el `commit`.
+
+Las cachés de resúmenes de carrito, analíticas de clientes y estadísticas del
+dashboard repetían el mismo esquema de listeners: anotar en `session.info` lo que un
+flush deja obsoleto, invalidarlo en `after_commit` (antes no: otra petición podría
+volver a cachear el estado anterior) y descartarlo en `after_rollback`. Este módulo
+lo centraliza en `InvalidacionTrasCommit`.
+
+Un fallo del almacén al invalidar no se propaga (la transacción ya está confirmada y
+el TTL de cada caché acota la obsolescencia), pero se registra como advertencia: un
+backend compartido caído no debe pasar desapercibido.
+
+Ejemplo:
+    _INVALIDACION = InvalidacionTrasCommit('analíticas de clientes', invalidar_usuario)
+    _INVALIDACION.anotar(session, usuario_id)   # en un listener `after_flush`
+"""
+import logging
+from typing import Callable, Hashable
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class InvalidacionTrasCommit:
+    """
+    Claves de caché pendientes de invalidar, por sesión, hasta que la transacción termina.
+
+    Attributes:
+        nombre (str): Descripción de la caché, usada en los registros.
+    """
+
+    def __init__(self, nombre: str, invalidar: Callable[[Hashable], None]):
+        """
+        Args:
+            nombre (str): Descripción de la caché, usada en los registros.
+            invalidar (Callable): Función que invalida una clave. Se llama tras el `commit`.
+        """
+        self.nombre = nombre
+        self._invalidar = invalidar
+        self._clave_info = f'_invalidacion_pendiente:{nombre}'
+        self._registrada = False
+
+    def anotar(self, session: Session, *claves: Hashable) -> None:
+        """Anota claves para invalidarlas cuando la sesión confirme la transacción."""
+        if claves:
+            session.info.setdefault(self._clave_info, set()).update(claves)
+
+    def registrar(self) -> None:
+        """Registra los listeners `after_commit` y `after_rollback` (una sola vez)."""
+        if self._registrada:
+            return
+        event.listen(Session, 'after_commit', self._after_commit)
+        event.listen(Session, 'after_rollback', self._after_rollback)
+        self._registrada = True
+
+    def _after_commit(self, session: Session) -> None:
+        claves = session.info.pop(self._clave_info, None)
+        if not claves:
+            return
+        fallos = []
+        for clave in claves:
+            try:
+                self._invalidar(clave)
+            except Exception as e:
+                fallos.append(e)
+        if fallos:
+            logger = current_app.logger if has_app_context() else logging.getLogger(__name__)
+            logger.warning(
+                f"No se pudieron invalidar {len(fallos)} de {len(claves)} entradas de {self.nombre}; "
+                f"se servirán obsoletas hasta que caduque su TTL.",
+                exc_info=fallos[0]
+            )
+
+    def _after_rollback(self, session: Session) -> None:
+        session.info.pop(self._clave_info, None)
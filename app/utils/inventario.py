@@ -0,0 +1,156 @@
+"""
+Módulo de Consultas Históricas del Inventario.
+
+Lee el diario `movimientos_stock` (escrito por `app.utils.stock`) y las fotografías
+`snapshots_stock` para responder preguntas sobre el inventario en el pasado sin
+recorrer los pedidos:
+
+- `valoracion_inventario`: Unidades, inversión (costo) e ingresos potenciales (precio)
+  del inventario en un instante. Parte de la fotografía más reciente anterior a la
+  fecha y suma solo los movimientos entre la fotografía y la fecha, un rango del
+  índice `created_at`.
+- `tomar_snapshot`: Genera la fotografía del día con un único `INSERT ... SELECT`.
+  Se expone como el comando `flask snapshot-stock`. `init_inventario` registra
+  `snapshot_diario_si_falta` como tarea periódica (`app.utils.tareas`), de modo que
+  se toma una fotografía al día sin un cron aparte.
+
+Salvo la tarea periódica, las funciones no hacen `commit`; `tomar_snapshot` debe
+confirmarse por el llamador.
+"""
+from datetime import date, datetime
+from typing import Dict, Optional
+
+from flask import current_app
+from sqlalchemy import Date, DateTime, delete, func, insert, literal, select
+
+from app.extensions import db
+from app.models.domains.inventory_models import MovimientoStock, SnapshotStock
+from app.models.domains.product_models import Productos
+from app.utils import tareas
+
+
+def init_inventario(app) -> None:
+    """
+    Registra la fotografía diaria del inventario como tarea periódica.
+
+    La tarea se lanza cada `STOCK_SNAPSHOT_CHECK_INTERVAL_SECONDS` y solo fotografía si
+    aún no hay fotografía del día, de modo que con varios workers se toma una al día.
+
+    Args:
+        app (Flask): La aplicación Flask.
+    """
+    tareas.registrar_periodica('snapshot-stock', app.config.get('STOCK_SNAPSHOT_CHECK_INTERVAL_SECONDS', 3600),
+                               snapshot_diario_si_falta, al_arrancar=True)
+
+
+def tomar_snapshot(fecha: Optional[date] = None) -> int:
+    """
+    Fotografía la existencia, el costo y el precio de todos los productos.
+
+    Si ya existe una fotografía para la fecha, se reemplaza.
+
+    Args:
+        fecha (date, optional): El día de la fotografía. Por defecto, hoy (UTC).
+
+    Returns:
+        int: El número de productos fotografiados.
+    """
+    ahora = datetime.utcnow()
+    fecha = fecha or ahora.date()
+    db.session.execute(delete(SnapshotStock).where(SnapshotStock.fecha == fecha))
+    resultado = db.session.execute(
+        insert(SnapshotStock).from_select(
+            ['fecha', 'producto_id', 'existencia', 'costo', 'precio', 'tomado_en'],
+            select(
+                literal(fecha, Date), Productos.id, Productos._existencia,
+                Productos.costo, Productos.precio, literal(ahora, DateTime)
+            )
+        )
+    )
+    return resultado.rowcount
+
+
+def snapshot_diario_si_falta() -> Optional[int]:
+    """
+    Toma y confirma la fotografía de hoy (UTC) si aún no existe. Es la tarea periódica del módulo.
+
+    Returns:
+        int | None: El número de productos fotografiados, o `None` si ya había fotografía.
+    """
+    hoy = datetime.utcnow().date()
+    if db.session.query(SnapshotStock.producto_id).filter(SnapshotStock.fecha == hoy).first() is not None:
+        return None
+    try:
+        total = tomar_snapshot(hoy)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    current_app.logger.info(f"Snapshot de stock registrado para {total} productos.")
+    return total
+
+
+def _totales_movimientos(desde: Optional[datetime], hasta: Optional[datetime]):
+    """Suma los deltas del diario (en unidades, costo y precio) en el rango `(desde, hasta]`."""
+    condiciones = []
+    if desde is not None:
+        condiciones.append(MovimientoStock.created_at > desde)
+    if hasta is not None:
+        condiciones.append(MovimientoStock.created_at <= hasta)
+    return db.session.execute(
+        select(
+            func.coalesce(func.sum(MovimientoStock.cantidad), 0),
+            func.coalesce(func.sum(MovimientoStock.cantidad * Productos.costo), 0),
+            func.coalesce(func.sum(MovimientoStock.cantidad * Productos.precio), 0),
+        ).join(Productos, Productos.id == MovimientoStock.producto_id).where(*condiciones)
+    ).one()
+
+
+def valoracion_inventario(momento: datetime) -> Dict[str, float]:
+    """
+    Calcula el valor del inventario completo en un instante dado.
+
+    Los movimientos posteriores a la fotografía se valoran con el costo y el precio
+    actuales de cada producto.
+
+    Args:
+        momento (datetime): El instante a consultar (UTC).
+
+    Returns:
+        Dict[str, float]: `existencias`, `inversion` (costo) e `ingresos_potenciales` (precio).
+    """
+    snapshot = db.session.execute(
+        select(SnapshotStock.fecha, SnapshotStock.tomado_en)
+        .where(SnapshotStock.tomado_en <= momento)
+        .order_by(SnapshotStock.fecha.desc())
+        .limit(1)
+    ).first()
+
+    if snapshot is not None:
+        base = db.session.execute(
+            select(
+                func.coalesce(func.sum(SnapshotStock.existencia), 0),
+                func.coalesce(func.sum(SnapshotStock.existencia * SnapshotStock.costo), 0),
+                func.coalesce(func.sum(SnapshotStock.existencia * SnapshotStock.precio), 0),
+            ).where(SnapshotStock.fecha == snapshot.fecha)
+        ).one()
+        delta = _totales_movimientos(snapshot.tomado_en, momento)
+        totales = [b + d for b, d in zip(base, delta)]
+    else:
+        # Sin fotografías anteriores: se parte del inventario actual y se deshacen
+        # los movimientos posteriores a la fecha.
+        actual = db.session.execute(
+            select(
+                func.coalesce(func.sum(Productos._existencia), 0),
+                func.coalesce(func.sum(Productos._existencia * Productos.costo), 0),
+                func.coalesce(func.sum(Productos._existencia * Productos.precio), 0),
+            )
+        ).one()
+        delta = _totales_movimientos(momento, None)
+        totales = [a - d for a, d in zip(actual, delta)]
+
+    return {
+        'existencias': int(totales[0]),
+        'inversion': float(totales[1]),
+        'ingresos_potenciales': float(totales[2]),
+    }
@@ -12,7 +12,7 @@ Funcionalidades principales:
 """
 import functools
 from flask import request, jsonify, current_app, session, redirect, url_for, flash
-from app.models.domains.user_models import Usuarios
+from app.utils.identity import decode_token_cached, get_usuario_por_id
 from typing import Callable, TypeVar, cast, Any
 import jwt
 from jwt import ExpiredSignatureError, InvalidTokenError
@@ -61,7 +61,8 @@ def jwt_required(f: F) -> F:
        encabezado `Authorization` (formato 'Bearer <token>').
     3. **Validación y Decodificación**: Si encuentra un token, lo decodifica y valida.
     4. **Recuperación de Usuario**: Extrae el `user_id` del payload del token y
-       recupera el objeto `Usuarios` de la base de datos.
+       recupera el objeto `Usuarios` a través del resolutor de identidad por petición
+       (`app.utils.identity`), que evita decodificar y consultar dos veces lo mismo.
     5. **Inyección de Usuario**: Si el usuario es válido, lo inyecta como primer
        argumento en la función de la ruta decorada.
     6. **Manejo de Fallos**: Si en cualquier punto la autenticación falla (token
@@ -74,7 +75,7 @@ def jwt_required(f: F) -> F:
         if 'user' in session:
             user_id = session['user'].get('id')
             if user_id:
-                usuario = Usuarios.query.get(user_id)
+                usuario = get_usuario_por_id(user_id)
                 if usuario:
                     return f(usuario, *args, **kwargs)
 
@@ -89,7 +90,7 @@ def jwt_required(f: F) -> F:
             if not token:
                 raise ValueError('Token vacío')
 
-            payload = decode_jwt_token(token)
+            payload = decode_token_cached('cliente', token, decode_jwt_token)
             if not payload:
                 flash('Tu sesión ha expirado o es inválida. Por favor, inicia sesión de nuevo.', 'warning')
                 return redirect(url_for('products.index'))
@@ -100,7 +101,7 @@ def jwt_required(f: F) -> F:
                 flash('Tu sesión es inválida. Por favor, inicia sesión de nuevo.', 'warning')
                 return redirect(url_for('products.index'))
 
-            usuario = Usuarios.query.get(user_id)
+            usuario = get_usuario_por_id(user_id)
             if not usuario:
                 current_app.logger.error(f'Usuario no encontrado para el ID: {user_id}')
                 flash('Usuario no encontrado. Por favor, inicia sesión de nuevo.', 'warning')
@@ -0,0 +1,134 @@
+"""
+Módulo de Paginación por Cursor (Keyset).
+
+La paginación con `OFFSET` obliga a la base de datos a recorrer y descartar todas
+las filas anteriores a la página pedida, y se desordena si se insertan productos
+entre dos peticiones. La paginación keyset, en cambio, recuerda los valores de la
+última fila entregada (columna de orden + ID como desempate) y pide "las siguientes
+a esa", lo que se resuelve con el índice de la columna sin importar la profundidad.
+
+Funcionalidades principales:
+- `encode_cursor` / `decode_cursor`: Serializan la posición en un token opaco (base64 de JSON).
+- `paginar_keyset`: Aplica el filtro y el orden keyset a una consulta y devuelve la página
+  junto con el `next_cursor`.
+- `leer_limite`: Normaliza el parámetro `limit` aplicando el tope máximo.
+"""
+import base64
+import binascii
+import json
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+
+# Tamaño de página por defecto y tope máximo del parámetro `limit`.
+DEFAULT_LIMIT = 24
+MAX_LIMIT = 100
+
+
+class CursorInvalido(ValueError):
+    """El cursor recibido no se puede decodificar o no corresponde al orden solicitado."""
+
+
+def encode_cursor(orden: str, valor: Any, ultimo_id: str) -> str:
+    """
+    Codifica la posición de la última fila entregada en un cursor opaco.
+
+    Args:
+        orden (str): El criterio de orden de la consulta (se valida al decodificar).
+        valor (Any): El valor de la columna de orden en la última fila.
+        ultimo_id (str): El ID de la última fila (desempate).
+
+    Returns:
+        str: El cursor, seguro para usar en una URL.
+    """
+    datos = json.dumps({'o': orden, 'v': valor, 'id': ultimo_id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(datos.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str, orden: str) -> Tuple[Any, str]:
+    """
+    Decodifica un cursor generado por `encode_cursor`.
+
+    Args:
+        cursor (str): El cursor recibido del cliente.
+        orden (str): El criterio de orden de la petición actual.
+
+    Returns:
+        Tuple[Any, str]: El valor de la columna de orden y el ID de la última fila.
+
+    Raises:
+        CursorInvalido: Si el cursor está corrupto o se generó con otro orden.
+    """
+    try:
+        datos = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        valor, ultimo_id, orden_cursor = datos['v'], datos['id'], datos['o']
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError) as e:
+        raise CursorInvalido('El cursor de paginación no es válido') from e
+    if orden_cursor != orden:
+        raise CursorInvalido('El cursor de paginación no corresponde al orden solicitado')
+    return valor, ultimo_id
+
+
+def leer_limite(valor: Optional[int], por_defecto: int = DEFAULT_LIMIT, maximo: int = MAX_LIMIT) -> int:
+    """
+    Normaliza el tamaño de página solicitado.
+
+    Args:
+        valor (int | None): El `limit` recibido (None si no se envió o no es un entero).
+        por_defecto (int): El tamaño a usar si no se envió.
+        maximo (int): El tope máximo permitido.
+
+    Returns:
+        int: Un tamaño entre 1 y `maximo`.
+    """
+    if valor is None:
+        return por_defecto
+    return max(1, min(valor, maximo))
+
+
+def paginar_keyset(query, columna, columna_id, orden: str, descendente: bool,
+                   limit: int, cursor: Optional[str] = None) -> Tuple[List[Any], Optional[str]]:
+    """
+    Devuelve una página de resultados ordenada por `(columna, columna_id)`.
+
+    El ID actúa como desempate para que el orden sea total y estable: dos productos
+    con el mismo precio nunca se repiten ni se pierden entre páginas.
+
+    Args:
+        query (Query): La consulta ya filtrada, sin `order_by`.
+        columna: La expresión de orden (ej. `Productos.precio`). No debe producir NULL.
+        columna_id: La columna de ID del modelo (ej. `Productos.id`).
+        orden (str): El nombre del criterio de orden (se guarda en el cursor).
+        descendente (bool): Si el orden es descendente.
+        limit (int): El tamaño de la página.
+        cursor (str, optional): El cursor devuelto por la página anterior.
+
+    Returns:
+        Tuple[List, str | None]: Las filas de la página y el cursor de la siguiente
+        (None si no hay más resultados).
+
+    Raises:
+        CursorInvalido: Si el cursor no es válido.
+    """
+    if cursor:
+        valor, ultimo_id = decode_cursor(cursor, orden)
+        if descendente:
+            query = query.filter(or_(columna < valor, and_(columna == valor, columna_id < ultimo_id)))
+        else:
+            query = query.filter(or_(columna > valor, and_(columna == valor, columna_id > ultimo_id)))
+
+    if descendente:
+        query = query.order_by(columna.desc(), columna_id.desc())
+    else:
+        query = query.order_by(columna.asc(), columna_id.asc())
+
+    # Se pide una fila extra para saber si existe una página siguiente sin un COUNT(*).
+    filas = query.add_columns(columna.label('_keyset_valor')).limit(limit + 1).all()
+    hay_mas = len(filas) > limit
+    filas = filas[:limit]
+
+    next_cursor = None
+    if hay_mas and filas:
+        ultima, valor_ultima = filas[-1][0], filas[-1][1]
+        next_cursor = encode_cursor(orden, valor_ultima, ultima.id)
+    return [fila[0] for fila in filas], next_cursor
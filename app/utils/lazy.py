@@ -0,0 +1,35 @@
+"""
+Módulo de Valores Perezosos para Plantillas.
+
+Los procesadores de contexto se ejecutan en cada `render_template`, aunque la
+plantilla no use lo que inyectan (ej. páginas del panel de administración o de
+error que nunca muestran el carrito). `lazy_value` envuelve un cálculo en un
+proxy de Werkzeug que solo lo ejecuta la primera vez que la plantilla lo usa
+(al iterarlo, imprimirlo, compararlo, etc.) y reutiliza el resultado después.
+"""
+from typing import Any, Callable
+
+from werkzeug.local import LocalProxy
+
+_SIN_CALCULAR = object()
+
+
+def lazy_value(factory: Callable[[], Any]) -> LocalProxy:
+    """
+    Crea un proxy que calcula `factory()` una sola vez, en el primer acceso.
+
+    Args:
+        factory (Callable): Función sin argumentos que produce el valor.
+
+    Returns:
+        LocalProxy: Un proxy que se comporta como el valor calculado.
+    """
+    resultado = _SIN_CALCULAR
+
+    def _resolver():
+        nonlocal resultado
+        if resultado is _SIN_CALCULAR:
+            resultado = factory()
+        return resultado
+
+    return LocalProxy(_resolver)
@@ -0,0 +1,86 @@
+"""
+Módulo de Caché del Árbol de Navegación.
+
+El procesador de contexto `inject_global_data` construía en cada renderizado
+(incluida la página 404) el árbol `CategoriasPrincipales → Subcategorias →
+Seudocategorias` con un `joinedload` y lo serializaba con
+`categoria_principal_to_dict`. Ese árbol solo cambia cuando un administrador
+edita categorías, así que se guarda en memoria ya serializado.
+
+La caché es versionada y tiene TTL:
+- Cada worker guarda `(versión, expiración, árbol)` en su propia memoria.
+- La versión vigente vive en un `VersionStore`. Invalidar incrementa la versión,
+  y en la siguiente lectura cada worker detecta el cambio y reconstruye el árbol.
+- El TTL (`NAVIGATION_CACHE_TTL_SECONDS`) acota la obsolescencia cuando un cambio
+  no pasa por una invalidación explícita (ej. cascadas de estado desde productos).
+
+El `VersionStore` se selecciona con `NAVIGATION_CACHE_BACKEND` (ver `app.utils.backends`).
+"""
+import threading
+import time
+from typing import Callable, List
+
+from app.utils.backends import VERSION_STORES, InMemoryVersionStore, VersionStore
+
+# Clave de la versión del árbol de navegación en el `VersionStore`.
+NAVIGATION_KEY = 'navigation_tree'
+
+_store: VersionStore = InMemoryVersionStore()
+_ttl_segundos = 300
+_lock = threading.Lock()
+# Entrada local: {'version': int, 'expira': float, 'datos': list}
+_entrada: dict | None = None
+
+
+def init_navigation_cache(app) -> None:
+    """
+    Configura la caché de navegación a partir de la configuración de la aplicación.
+
+    Args:
+        app (Flask): La aplicación Flask.
+    """
+    global _store, _ttl_segundos, _entrada
+    _store = VERSION_STORES.crear(app, 'NAVIGATION_CACHE_BACKEND')
+    _ttl_segundos = app.config.get('NAVIGATION_CACHE_TTL_SECONDS', 300)
+    _entrada = None
+
+
+def get_navigation_tree(builder: Callable[[], List[dict]]) -> List[dict]:
+    """
+    Devuelve el árbol de navegación serializado, reconstruyéndolo solo si hace falta.
+
+    Se reconstruye cuando no hay entrada local, cuando expiró el TTL o cuando la
+    versión del `VersionStore` cambió (otra petición o worker lo invalidó).
+
+    Args:
+        builder (Callable): Función que consulta y serializa el árbol.
+
+    Returns:
+        List[dict]: El árbol de categorías principales serializado.
+    """
+    global _entrada
+    version = _store.get(NAVIGATION_KEY)
+    entrada = _entrada
+    if entrada and entrada['version'] == version and entrada['expira'] > time.monotonic():
+        return entrada['datos']
+
+    with _lock:
+        # Otro hilo pudo haberlo reconstruido mientras se esperaba el lock.
+        entrada = _entrada
+        if entrada and entrada['version'] == version and entrada['expira'] > time.monotonic():
+            return entrada['datos']
+        datos = builder()
+        _entrada = {'version': version, 'expira': time.monotonic() + _ttl_segundos, 'datos': datos}
+        return datos
+
+
+def invalidate_navigation_tree() -> None:
+    """
+    Invalida el árbol de navegación en todos los workers que comparten el `VersionStore`.
+
+    Debe llamarse después del `commit` que modifica categorías, para que ninguna
+    petición concurrente vuelva a cachear el estado anterior bajo la nueva versión.
+    """
+    global _entrada
+    _store.bump(NAVIGATION_KEY)
+    _entrada = None
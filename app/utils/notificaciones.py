@@ -0,0 +1,237 @@
+"""
+Módulo de Notificaciones en Tiempo Real (Publicación/Suscripción).
+
+Antes, el frontend consultaba `/events/api/check-notifications` en cada carga de
+página: una lectura de los diez pedidos más recientes del usuario (con todo su
+`seguimiento_historial` JSON) por cada página vista, hubiera o no novedades.
+
+Esa consulta es hoy una lectura indexada de `pedido_eventos` y sigue siendo el canal
+por defecto. Opcionalmente (`NOTIFICATIONS_SSE_ENABLED`), los endpoints del panel que
+registran eventos de seguimiento publican la notificación en un canal por usuario, y
+el cliente la recibe por un stream Server-Sent Events (`/events/stream`) que no
+consulta la base de datos mientras espera. Cada stream retiene una conexión abierta,
+por lo que el canal requiere workers asíncronos (`gunicorn -k gevent`).
+
+Funcionalidades principales:
+- `publicar_pedido`: Anota en la sesión la notificación pendiente de un pedido. Se
+  publica en el `after_commit` de la sesión (nunca se notifica un cambio revertido).
+- `suscribir_usuario`: Abre una suscripción al canal de un usuario; el stream SSE
+  la consume con `obtener(timeout)` y la cierra con `cerrar()`.
+- `BROKERS`: Registro de brokers (ver `app.utils.backends`). Un broker compartido (ej.
+  Redis Pub/Sub) hace que un evento publicado en un worker llegue a los streams abiertos
+  en otros; se selecciona con `NOTIFICATIONS_BROKER`.
+"""
+import queue
+import threading
+from typing import Dict, Optional, Protocol, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.utils.backends import RegistroBackends
+
+_PENDIENTES_KEY = '_notificaciones_pendientes'
+_listeners_registrados = False
+
+
+class Suscripcion(Protocol):
+    """
+    Suscripción a un canal.
+
+    `obtener` espera hasta `timeout` segundos el siguiente mensaje y devuelve `None`
+    si no llega ninguno; `cerrar` libera la suscripción en el broker.
+    """
+
+    def obtener(self, timeout: float) -> Optional[dict]: ...
+
+    def cerrar(self) -> None: ...
+
+
+class NotificationBroker(Protocol):
+    """
+    Broker de notificaciones.
+
+    Un backend compartido debe implementar estos dos métodos con la misma semántica:
+    `publicar` entrega el mensaje a todas las suscripciones abiertas del canal (y lo
+    descarta si no hay ninguna) y `suscribir` devuelve una `Suscripcion` nueva.
+    """
+
+    def publicar(self, canal: str, mensaje: dict) -> None: ...
+
+    def suscribir(self, canal: str) -> Suscripcion: ...
+
+
+class _SuscripcionEnMemoria(Suscripcion):
+    """Suscripción del broker en memoria: una cola acotada por stream abierto."""
+
+    def __init__(self, broker: 'InMemoryBroker', canal: str, capacidad: int):
+        self._broker = broker
+        self._canal = canal
+        self.cola: 'queue.Queue[dict]' = queue.Queue(maxsize=capacidad)
+
+    def obtener(self, timeout):
+        try:
+            return self.cola.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def cerrar(self):
+        self._broker._desuscribir(self._canal, self)
+
+
+class InMemoryBroker(NotificationBroker):
+    """Broker en memoria del proceso, protegido con un lock. Es el backend por defecto."""
+
+    # Un stream que no consume sus mensajes no debe acumular memoria sin límite.
+    CAPACIDAD_COLA = 100
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._canales: Dict[str, Set[_SuscripcionEnMemoria]] = {}
+
+    def publicar(self, canal, mensaje):
+        with self._lock:
+            suscripciones = list(self._canales.get(canal, ()))
+        for suscripcion in suscripciones:
+            try:
+                suscripcion.cola.put_nowait(mensaje)
+            except queue.Full:
+                # El mensaje no se pierde: sigue sin leer en el historial del pedido.
+                pass
+
+    def suscribir(self, canal):
+        suscripcion = _SuscripcionEnMemoria(self, canal, self.CAPACIDAD_COLA)
+        with self._lock:
+            self._canales.setdefault(canal, set()).add(suscripcion)
+        return suscripcion
+
+    def _desuscribir(self, canal, suscripcion):
+        with self._lock:
+            suscripciones = self._canales.get(canal)
+            if suscripciones is not None:
+                suscripciones.discard(suscripcion)
+                if not suscripciones:
+                    del self._canales[canal]
+
+
+BROKERS: RegistroBackends[NotificationBroker] = RegistroBackends(
+    'notificaciones', memory=lambda app: InMemoryBroker()
+)
+_broker: NotificationBroker = InMemoryBroker()
+
+
+def init_notificaciones(app) -> None:
+    """
+    Configura el broker de notificaciones y registra los listeners de publicación.
+
+    Args:
+        app (Flask): La aplicación Flask.
+    """
+    global _broker
+    _broker = BROKERS.crear(app, 'NOTIFICATIONS_BROKER')
+    _registrar_listeners()
+    if app.config.get('NOTIFICATIONS_SSE_ENABLED') and not _worker_asincrono():
+        app.logger.warning(
+            "NOTIFICATIONS_SSE_ENABLED está activo pero el proceso no usa workers asíncronos "
+            "(gevent): cada stream SSE abierto bloqueará un worker."
+        )
+
+
+def _worker_asincrono() -> bool:
+    """Indica si el proceso usa sockets cooperativos (p. ej. el worker gevent de gunicorn)."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+
+def canal_usuario(usuario_id: str) -> str:
+    """Devuelve el nombre del canal de notificaciones de un usuario."""
+    return f'usuario:{usuario_id}'
+
+
+def notificacion_de_evento(evento) -> dict:
+    """
+    Construye la notificación de un evento del historial de seguimiento.
+
+    Tiene el mismo formato que devuelve `/events/api/check-notifications`, más el
+    `evento_id`, que identifica qué evento marcar como notificado al entregarla.
+
+    Args:
+        evento (PedidoEvento): El evento.
+
+    Returns:
+        dict: La notificación (`title`, `message`, `status`, `order_id`, `evento_id`, `timestamp`).
+    """
+    return {
+        'title': f"Actualización de tu Pedido #{evento.pedido_id[:8]}...",
+        'message': evento.notas or 'Tu pedido ha sido actualizado.',
+        'status': evento.estado or 'recibido',
+        'order_id': str(evento.pedido_id),
+        'evento_id': evento.id,
+        'timestamp': evento.created_at.isoformat() + "Z" if evento.created_at else None,
+    }
+
+
+def publicar_pedido(pedido, session=None) -> None:
+    """
+    Anota la notificación pendiente de un pedido para publicarla tras el `commit`.
+
+    Se llama después de registrar eventos de seguimiento. Vuelca la sesión (los eventos
+    necesitan su ID) y busca el evento sin notificar más reciente del pedido; si no hay
+    ninguno, no hace nada. Igual que el endpoint de consulta, solo se publica el más
+    reciente.
+
+    Args:
+        pedido (Pedido): El pedido actualizado.
+        session (Session, optional): La sesión del cambio. Por defecto, `db.session`.
+    """
+    from app.utils import seguimiento
+
+    if not pedido.usuario_id:
+        return
+    if session is None:
+        from app.extensions import db
+        session = db.session
+    session.flush()
+    evento = seguimiento.notificacion_pendiente(pedido.usuario_id, pedido_id=pedido.id)
+    if evento is None:
+        return
+    pendientes = session.info.setdefault(_PENDIENTES_KEY, {})
+    pendientes[str(pedido.id)] = (canal_usuario(pedido.usuario_id), notificacion_de_evento(evento))
+
+
+def suscribir_usuario(usuario_id: str) -> Suscripcion:
+    """
+    Abre una suscripción al canal de notificaciones de un usuario.
+
+    Args:
+        usuario_id (str): El ID del usuario.
+
+    Returns:
+        Suscripcion: La suscripción; debe cerrarse con `cerrar()`.
+    """
+    return _broker.suscribir(canal_usuario(usuario_id))
+
+
+def _registrar_listeners() -> None:
+    global _listeners_registrados
+    if _listeners_registrados:
+        return
+
+    @event.listens_for(Session, 'after_commit')
+    def _after_commit(session):
+        for canal, mensaje in session.info.pop(_PENDIENTES_KEY, {}).values():
+            try:
+                _broker.publicar(canal, mensaje)
+            except Exception:
+                # Un fallo del broker no debe afectar a la petición: el cliente verá la
+                # notificación al reconectar, pues sigue sin leer en el historial.
+                pass
+
+    @event.listens_for(Session, 'after_rollback')
+    def _after_rollback(session):
+        session.info.pop(_PENDIENTES_KEY, None)
+
+    _listeners_registrados = True
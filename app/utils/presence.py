@@ -0,0 +1,216 @@
+"""
+Módulo de Presencia (`last_seen`) con Escritura Diferida.
+
+Antes, cada petición de un administrador y cada heartbeat de un cliente
+actualizaba `last_seen` y hacía `db.session.commit()`: una transacción de
+escritura por petición solo para saber quién está "En línea".
+
+Este módulo guarda los últimos accesos en un buffer y los vuelca a la base de
+datos en lote cada `PRESENCE_FLUSH_INTERVAL_SECONDS` segundos con una sola
+sentencia por tabla (`UPDATE ... FROM (VALUES ...)` en PostgreSQL).
+
+Funcionalidades principales:
+- `touch`: Registra actividad de un usuario o administrador (sin tocar la BD).
+- `get_last_seen_efectivo`: Devuelve el `last_seen` más reciente entre el buffer y la BD.
+  Lo usan `Usuarios.is_online` / `Admins.is_online` para leer a través del buffer.
+- `flush_presence`: Vuelca el buffer a la base de datos.
+- `maybe_flush_presence`: Vuelca solo si ya pasó el intervalo configurado. Se invoca
+  al final de cada petición. Con `PRESENCE_FLUSH_INTERVAL_SECONDS = 0` vuelca al final
+  de cada petición que registró actividad (escritura inmediata); es el valor por
+  defecto en despliegues serverless, donde una instancia puede congelarse o
+  descartarse con el buffer aún pendiente.
+- `BUFFERS`: Registro de backends (ver `app.utils.backends`). Un buffer compartido (ej.
+  Redis) permite que varios workers vean la misma presencia; se selecciona con
+  `PRESENCE_BACKEND`.
+"""
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Protocol, Tuple
+
+from app.utils.backends import RegistroBackends
+
+# Tipos de principal soportados.
+USUARIO = 'usuario'
+ADMIN = 'admin'
+
+Entrada = Tuple[str, str, datetime]
+
+
+class PresenceBuffer(Protocol):
+    """
+    Buffer de presencia.
+
+    Un backend compartido debe implementar estos tres métodos con la misma
+    semántica: `touch` conserva el timestamp más reciente, `get` lo consulta
+    y `drain` devuelve y elimina todas las entradas pendientes.
+    """
+
+    def touch(self, tipo: str, principal_id: str, momento: datetime) -> None: ...
+
+    def get(self, tipo: str, principal_id: str) -> datetime | None: ...
+
+    def drain(self) -> List[Entrada]: ...
+
+
+class InMemoryPresenceBuffer(PresenceBuffer):
+    """Buffer en memoria del proceso, protegido con un lock. Es el backend por defecto."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pendientes: Dict[Tuple[str, str], datetime] = {}
+
+    def touch(self, tipo, principal_id, momento):
+        with self._lock:
+            actual = self._pendientes.get((tipo, principal_id))
+            if actual is None or momento > actual:
+                self._pendientes[(tipo, principal_id)] = momento
+
+    def get(self, tipo, principal_id):
+        with self._lock:
+            return self._pendientes.get((tipo, principal_id))
+
+    def drain(self):
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, {}
+        return [(tipo, pid, momento) for (tipo, pid), momento in pendientes.items()]
+
+
+BUFFERS: RegistroBackends[PresenceBuffer] = RegistroBackends(
+    'presencia', memory=lambda app: InMemoryPresenceBuffer()
+)
+_buffer: PresenceBuffer = InMemoryPresenceBuffer()
+_intervalo_segundos = 60
+_ultimo_flush = time.monotonic()
+_flush_lock = threading.Lock()
+
+
+def init_presence(app) -> None:
+    """
+    Configura el buffer de presencia a partir de la configuración de la aplicación.
+
+    Args:
+        app (Flask): La aplicación Flask.
+    """
+    global _buffer, _intervalo_segundos
+    _buffer = BUFFERS.crear(app, 'PRESENCE_BACKEND')
+    _intervalo_segundos = app.config.get('PRESENCE_FLUSH_INTERVAL_SECONDS', 60)
+
+
+def _a_utc(momento: datetime | None) -> datetime | None:
+    """Normaliza un datetime a UTC consciente de zona horaria (asume UTC si es naive)."""
+    if momento is None:
+        return None
+    return momento.replace(tzinfo=timezone.utc) if momento.tzinfo is None else momento
+
+
+def touch(tipo: str, principal_id: str, momento: datetime | None = None) -> None:
+    """
+    Registra actividad de un principal sin escribir en la base de datos.
+
+    Args:
+        tipo (str): `USUARIO` o `ADMIN`.
+        principal_id (str): El ID del usuario o administrador.
+        momento (datetime, optional): El instante de la actividad. Por defecto, ahora (UTC).
+    """
+    if principal_id:
+        _buffer.touch(tipo, principal_id, momento or datetime.now(timezone.utc))
+
+
+def get_last_seen_efectivo(tipo: str, principal_id: str, last_seen_bd: datetime | None) -> datetime | None:
+    """
+    Combina el `last_seen` persistido con el pendiente en el buffer.
+
+    Args:
+        tipo (str): `USUARIO` o `ADMIN`.
+        principal_id (str): El ID del principal.
+        last_seen_bd (datetime | None): El valor almacenado en la base de datos.
+
+    Returns:
+        datetime | None: El más reciente de ambos, en UTC, o None si no hay ninguno.
+    """
+    pendiente = _a_utc(_buffer.get(tipo, principal_id)) if principal_id else None
+    persistido = _a_utc(last_seen_bd)
+    if pendiente is None or (persistido is not None and persistido >= pendiente):
+        return persistido
+    return pendiente
+
+
+def _volcar_tabla(conn, modelo, entradas: List[Tuple[str, datetime]]) -> None:
+    """Actualiza `last_seen` de varias filas de una tabla en una sola sentencia."""
+    from sqlalchemy import DateTime, String, bindparam, column, or_, update, values
+
+    if conn.dialect.name == 'postgresql':
+        # UPDATE <tabla> SET last_seen = v.last_seen FROM (VALUES ...) AS v(id, last_seen)
+        v = values(column('id', String), column('last_seen', DateTime), name='v').data(entradas)
+        stmt = update(modelo).where(
+            modelo.id == v.c.id,
+            or_(modelo.last_seen.is_(None), modelo.last_seen < v.c.last_seen)
+        ).values(last_seen=v.c.last_seen)
+        conn.execute(stmt)
+    else:
+        # Otros motores (ej. SQLite en desarrollo): un único executemany.
+        stmt = update(modelo).where(
+            modelo.id == bindparam('b_id'),
+            or_(modelo.last_seen.is_(None), modelo.last_seen < bindparam('b_last_seen'))
+        ).values(last_seen=bindparam('b_last_seen'))
+        conn.execute(stmt, [{'b_id': pid, 'b_last_seen': momento} for pid, momento in entradas])
+
+
+def flush_presence() -> int:
+    """
+    Vuelca todas las entradas pendientes a la base de datos.
+
+    Usa una conexión y transacción propias (no `db.session`), de modo que el volcado
+    nunca confirma cambios pendientes de la petición en curso. Si falla, las
+    entradas se devuelven al buffer para el siguiente intento.
+
+    Returns:
+        int: El número de principales actualizados.
+    """
+    from flask import current_app
+
+    from app.extensions import db
+    from app.models.domains.user_models import Admins, Usuarios
+
+    entradas = _buffer.drain()
+    if not entradas:
+        return 0
+
+    por_tabla = {Usuarios: [], Admins: []}
+    for tipo, principal_id, momento in entradas:
+        por_tabla[Admins if tipo == ADMIN else Usuarios].append((principal_id, momento))
+
+    try:
+        with db.engine.begin() as conn:
+            for modelo, filas in por_tabla.items():
+                if filas:
+                    _volcar_tabla(conn, modelo, filas)
+    except Exception as e:
+        for tipo, principal_id, momento in entradas:
+            _buffer.touch(tipo, principal_id, momento)
+        current_app.logger.error(f"Error al volcar el buffer de presencia: {e}", exc_info=True)
+        return 0
+    return len(entradas)
+
+
+def maybe_flush_presence() -> int:
+    """
+    Vuelca el buffer si ya transcurrió el intervalo configurado desde el último volcado.
+
+    Con un intervalo de 0 vuelca siempre; si el buffer está vacío no toca la base de datos.
+
+    Returns:
+        int: El número de principales actualizados (0 si no tocaba volcar).
+    """
+    global _ultimo_flush
+    if time.monotonic() - _ultimo_flush < _intervalo_segundos:
+        return 0
+    # Solo un hilo por proceso realiza el volcado; los demás siguen sin esperar.
+    if not _flush_lock.acquire(blocking=False):
+        return 0
+    try:
+        _ultimo_flush = time.monotonic()
+        return flush_presence()
+    finally:
+        _flush_lock.release()
@@ -0,0 +1,312 @@
+"""
+Módulo de Búsqueda de Productos por Texto Completo.
+
+`/buscar` filtraba con `ilike('q%')` sobre `nombre`, `marca` y `descripcion`
+unidos por OR: solo encontraba coincidencias al inicio del texto, no podía usar
+el índice `idx_producto_nombre_lower` y no ordenaba por relevancia.
+
+Este módulo ofrece un motor de búsqueda con backends intercambiables:
+- 'postgres': Usa el documento `tsvector` ponderado de `documento_busqueda_producto`
+  (nombre > marca > descripción, con stemming en español) y su índice GIN, ordena
+  con `ts_rank` y suma relevancia si el término coincide con el nombre de alguna
+  categoría del producto. Si no hay resultados (ej. errores de escritura), recurre
+  a la similitud de trigramas de `pg_trgm` sobre nombre y marca.
+- 'memory': Índice invertido en Python puro para SQLite en desarrollo. Replica la
+  ponderación por campo, la coincidencia por prefijo y la tolerancia a errores
+  (con `difflib`). Se reconstruye cuando cambia la versión del catálogo
+  (`facet_index.version_catalogo`).
+
+El backend se elige con `PRODUCT_SEARCH_BACKEND`. El valor 'auto' usa 'postgres' si
+la base de datos es PostgreSQL y 'memory' en cualquier otro caso. Se pueden registrar
+backends adicionales en `MOTORES` (ver `app.utils.backends`).
+"""
+import difflib
+import re
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Protocol
+
+from app.utils.backends import RegistroBackends
+
+# Pesos por campo del backend en memoria, equivalentes a los pesos 'A'/'B'/'C' de PostgreSQL.
+PESOS_CAMPOS = {'nombre': 1.0, 'marca': 0.4, 'categorias': 0.2, 'descripcion': 0.1}
+
+_PATRON_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenizar(texto: str, quitar_tildes: bool = True) -> List[str]:
+    """
+    Divide un texto en términos normalizados (minúsculas y, opcionalmente, sin tildes).
+
+    Args:
+        texto (str): El texto a tokenizar.
+        quitar_tildes (bool): Si se eliminan las tildes. El backend de PostgreSQL las
+            conserva porque la configuración 'spanish' indexa las palabras con tilde.
+
+    Returns:
+        List[str]: Los términos encontrados.
+    """
+    if not texto:
+        return []
+    texto = texto.lower()
+    if quitar_tildes:
+        texto = ''.join(c for c in unicodedata.normalize('NFKD', texto) if not unicodedata.combining(c))
+    return _PATRON_TOKEN.findall(texto)
+
+
+def _raiz(termino: str) -> str:
+    """Stemming mínimo en español: elimina los plurales regulares ('labiales' -> 'labial')."""
+    if len(termino) > 4 and termino.endswith('es'):
+        return termino[:-2]
+    if len(termino) > 3 and termino.endswith('s'):
+        return termino[:-1]
+    return termino
+
+
+class SearchBackend(Protocol):
+    """
+    Backend de búsqueda.
+
+    `buscar` devuelve los IDs de los productos visibles (activos y con stock) que
+    coinciden con el texto, ordenados de mayor a menor relevancia.
+    """
+
+    def buscar(self, texto: str, limite: int) -> List[str]: ...
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Búsqueda con `tsvector`/`ts_rank` e índice GIN, con respaldo de trigramas (`pg_trgm`)."""
+
+    def __init__(self, umbral_trigramas: float = 0.3):
+        self.umbral_trigramas = umbral_trigramas
+
+    @staticmethod
+    def _tsquery(texto: str):
+        """Convierte el texto del usuario en un `tsquery` con coincidencia por prefijo ('lab:* & roj:*')."""
+        from app.extensions import db
+        from app.models.domains.product_models import CONFIGURACION_BUSQUEDA
+
+        terminos = tokenizar(texto, quitar_tildes=False)
+        if not terminos:
+            return None
+        consulta = ' & '.join(f'{t}:*' for t in terminos)
+        return db.func.to_tsquery(db.literal_column(f"'{CONFIGURACION_BUSQUEDA}'"), consulta)
+
+    def buscar(self, texto, limite):
+        from sqlalchemy import case, func, or_
+
+        from app.extensions import db
+        from app.models.domains.product_models import (
+            CONFIGURACION_BUSQUEDA,
+            CategoriasPrincipales,
+            Productos,
+            Seudocategorias,
+            Subcategorias,
+            documento_busqueda_producto,
+        )
+        from app.models.enums import EstadoEnum
+
+        tsquery = self._tsquery(texto)
+        if tsquery is None:
+            return []
+
+        documento = documento_busqueda_producto(Productos.nombre, Productos.marca, Productos.descripcion)
+        # Las tablas de categorías son pequeñas: se resuelven primero las seudocategorías cuyo
+        # nombre (o el de su subcategoría o categoría principal) coincide con la búsqueda.
+        categorias_coincidentes = db.session.query(Seudocategorias.id).join(
+            Subcategorias, Seudocategorias.subcategoria_id == Subcategorias.id
+        ).join(
+            CategoriasPrincipales, Subcategorias.categoria_principal_id == CategoriasPrincipales.id
+        ).filter(
+            func.to_tsvector(
+                db.literal_column(f"'{CONFIGURACION_BUSQUEDA}'"),
+                func.concat_ws(' ', CategoriasPrincipales.nombre, Subcategorias.nombre, Seudocategorias.nombre)
+            ).op('@@')(tsquery)
+        ).scalar_subquery()
+
+        visibles = (Productos.estado == EstadoEnum.ACTIVO, Productos._existencia > 0)
+        relevancia = func.ts_rank(documento, tsquery) + case(
+            (Productos.seudocategoria_id.in_(categorias_coincidentes), 0.1), else_=0.0
+        )
+        ids = [fila[0] for fila in db.session.query(Productos.id).filter(
+            *visibles,
+            or_(documento.op('@@')(tsquery), Productos.seudocategoria_id.in_(categorias_coincidentes))
+        ).order_by(relevancia.desc(), Productos.nombre.asc()).limit(limite).all()]
+        if ids:
+            return ids
+
+        # Respaldo para errores de escritura: similitud de trigramas sobre nombre y marca.
+        # El operador `%` usa los índices GIN `gin_trgm_ops`; `similarity` ordena los resultados.
+        similitud = func.greatest(
+            func.similarity(Productos.nombre, texto),
+            func.similarity(func.coalesce(Productos.marca, ''), texto)
+        )
+        return [fila[0] for fila in db.session.query(Productos.id).filter(
+            *visibles,
+            or_(Productos.nombre.op('%')(texto), Productos.marca.op('%')(texto)),
+            similitud >= self.umbral_trigramas
+        ).order_by(similitud.desc(), Productos.nombre.asc()).limit(limite).all()]
+
+
+class InMemorySearchBackend(SearchBackend):
+    """
+    Índice invertido en memoria para desarrollo con SQLite.
+
+    Cada término indexado apunta a `{producto_id: peso}`, donde el peso es el del
+    campo más relevante en el que aparece. Se reconstruye con una sola consulta
+    cuando cambia la versión del catálogo o expira el TTL.
+    """
+
+    def __init__(self, ttl_segundos: int = 300):
+        self.ttl_segundos = ttl_segundos
+        self._lock = threading.Lock()
+        # Entrada local: {'version', 'expira', 'terminos', 'nombres'}
+        self._entrada: dict | None = None
+
+    def _construir(self) -> dict:
+        from app.extensions import db
+        from app.models.domains.product_models import (
+            CategoriasPrincipales,
+            Productos,
+            Seudocategorias,
+            Subcategorias,
+        )
+        from app.models.enums import EstadoEnum
+
+        filas = db.session.query(
+            Productos.id, Productos.nombre, Productos.marca, Productos.descripcion,
+            Seudocategorias.nombre, Subcategorias.nombre, CategoriasPrincipales.nombre
+        ).outerjoin(
+            Seudocategorias, Productos.seudocategoria_id == Seudocategorias.id
+        ).outerjoin(
+            Subcategorias, Seudocategorias.subcategoria_id == Subcategorias.id
+        ).outerjoin(
+            CategoriasPrincipales, Subcategorias.categoria_principal_id == CategoriasPrincipales.id
+        ).filter(
+            Productos.estado == EstadoEnum.ACTIVO, Productos._existencia > 0
+        ).all()
+
+        terminos: Dict[str, Dict[str, float]] = {}
+        nombres: Dict[str, str] = {}
+        for pid, nombre, marca, descripcion, seudo, sub, principal in filas:
+            nombres[pid] = (nombre or '').lower()
+            campos = {
+                'nombre': nombre,
+                'marca': marca,
+                'categorias': ' '.join(n for n in (seudo, sub, principal) if n),
+                'descripcion': descripcion,
+            }
+            for campo, texto in campos.items():
+                peso = PESOS_CAMPOS[campo]
+                for termino in tokenizar(texto):
+                    postings = terminos.setdefault(_raiz(termino), {})
+                    if postings.get(pid, 0.0) < peso:
+                        postings[pid] = peso
+        return {'terminos': terminos, 'vocabulario': sorted(terminos), 'nombres': nombres}
+
+    def _indice(self) -> dict:
+        from app.utils.facet_index import version_catalogo
+
+        version = version_catalogo()
+        entrada = self._entrada
+        if entrada and entrada['version'] == version and entrada['expira'] > time.monotonic():
+            return entrada
+        with self._lock:
+            entrada = self._entrada
+            if entrada and entrada['version'] == version and entrada['expira'] > time.monotonic():
+                return entrada
+            entrada = self._construir()
+            entrada.update(version=version, expira=time.monotonic() + self.ttl_segundos)
+            self._entrada = entrada
+            return entrada
+
+    @staticmethod
+    def _coincidencias(indice: dict, termino: str) -> Dict[str, float]:
+        """Productos cuyo algún término empieza por `termino` (coincidencia por prefijo)."""
+        resultado: Dict[str, float] = {}
+        for clave in indice['vocabulario']:
+            if clave.startswith(termino):
+                for pid, peso in indice['terminos'][clave].items():
+                    if resultado.get(pid, 0.0) < peso:
+                        resultado[pid] = peso
+        return resultado
+
+    def _puntuar(self, indice: dict, terminos: List[str]) -> Dict[str, float]:
+        """Intersección de los términos (todos deben aparecer), sumando sus pesos."""
+        puntuaciones: Dict[str, float] | None = None
+        for termino in terminos:
+            coincidencias = self._coincidencias(indice, termino)
+            if puntuaciones is None:
+                puntuaciones = coincidencias
+            else:
+                puntuaciones = {
+                    pid: total + coincidencias[pid]
+                    for pid, total in puntuaciones.items() if pid in coincidencias
+                }
+            if not puntuaciones:
+                return {}
+        return puntuaciones or {}
+
+    def buscar(self, texto, limite):
+        terminos = [_raiz(t) for t in tokenizar(texto)]
+        if not terminos:
+            return []
+        indice = self._indice()
+        puntuaciones = self._puntuar(indice, terminos)
+        if not puntuaciones:
+            # Respaldo para errores de escritura: se corrige cada término con el más parecido.
+            corregidos = []
+            for termino in terminos:
+                parecidos = difflib.get_close_matches(termino, indice['vocabulario'], n=1, cutoff=0.75)
+                corregidos.append(parecidos[0] if parecidos else termino)
+            puntuaciones = self._puntuar(indice, corregidos)
+        orden = sorted(puntuaciones, key=lambda pid: (-puntuaciones[pid], indice['nombres'][pid], pid))
+        return orden[:limite]
+
+
+def _backend_auto(app) -> SearchBackend:
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+    if uri.startswith('postgres'):
+        return PostgresSearchBackend(app.config.get('PRODUCT_SEARCH_TRGM_THRESHOLD', 0.3))
+    return InMemorySearchBackend(app.config.get('FACET_INDEX_TTL_SECONDS', 300))
+
+
+MOTORES: RegistroBackends[SearchBackend] = RegistroBackends(
+    'búsqueda de productos',
+    postgres=lambda app: PostgresSearchBackend(app.config.get('PRODUCT_SEARCH_TRGM_THRESHOLD', 0.3)),
+    memory=lambda app: InMemorySearchBackend(app.config.get('FACET_INDEX_TTL_SECONDS', 300)),
+    auto=_backend_auto,
+)
+_backend: SearchBackend = InMemorySearchBackend()
+
+
+def init_product_search(app) -> None:
+    """
+    Configura el motor de búsqueda a partir de la configuración de la aplicación.
+
+    Args:
+        app (Flask): La aplicación Flask.
+    """
+    global _backend
+    _backend = MOTORES.crear(app, 'PRODUCT_SEARCH_BACKEND', por_defecto='auto')
+
+
+def buscar_productos(texto: str, limite: int = 12) -> list:
+    """
+    Busca productos visibles por texto y los devuelve ordenados por relevancia.
+
+    Args:
+        texto (str): El texto introducido por el usuario.
+        limite (int): El número máximo de resultados.
+
+    Returns:
+        List[Productos]: Los productos encontrados, del más al menos relevante.
+    """
+    from app.models.domains.product_models import Productos
+
+    ids = _backend.buscar(texto, limite)
+    if not ids:
+        return []
+    por_id = {p.id: p for p in Productos.query.filter(Productos.id.in_(ids)).all()}
+    return [por_id[pid] for pid in ids if pid in por_id]
@@ -0,0 +1,395 @@
+"""
+Módulo de Recomendaciones de Productos Precalculadas.
+
+`producto_detalle` elegía los productos relacionados con dos consultas
+`ORDER BY random()` (misma seudocategoría y, como respaldo, misma subcategoría),
+`get_recomendaciones` hacía otras dos, e `index()` ordenaba por `random()` todo el
+conjunto de productos destacados. Cada una ordenaba el conjunto completo de
+candidatos en cada página vista.
+
+Ahora un trabajo en segundo plano precalcula, por producto, su lista de relacionados
+(`ProductoRecomendaciones`), puntuando cada candidato por:
+- Compras conjuntas: pedidos no cancelados que contienen ambos productos (`PedidoProducto`).
+- Likes conjuntos: usuarios con like activo en ambos productos (`Likes`).
+- Cercanía en el catálogo: misma seudocategoría o misma subcategoría.
+
+Las vistas leen la lista por clave primaria, descartan los productos sin stock con
+una consulta `IN` y eligen la muestra con muestreo de reservorio (`muestreo_reservorio`),
+que da variedad entre visitas sin ordenar nada en la base de datos.
+
+Funcionalidades principales:
+- `reconstruir_recomendaciones`: Recalcula todas las listas. Se expone como el
+  comando `flask rebuild-recomendaciones`; `init_recomendaciones` registra
+  `reconstruir_si_vencidas` como tarea periódica (`app.utils.tareas`) cada
+  `RECOMMENDATIONS_REFRESH_INTERVAL_SECONDS`.
+- `productos_relacionados`: Relacionados de un producto (página de detalle).
+- `recomendaciones_usuario`: Relacionados de los productos que le gustan al usuario,
+  completados con los más populares.
+- `muestra_de_categoria`: Muestra aleatoria de una categoría principal (página de inicio).
+
+Salvo la tarea periódica, las funciones no hacen `commit`.
+"""
+import random
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from flask import current_app
+from sqlalchemy import and_, delete, func, insert, select
+from sqlalchemy.orm import aliased, joinedload
+
+from app.extensions import db
+from app.models.domains.order_models import Pedido, PedidoProducto, ProductoVentasResumen
+from app.models.domains.product_models import CategoriasPrincipales, Productos, Seudocategorias, Subcategorias
+from app.models.domains.recommendation_models import ProductoRecomendaciones
+from app.models.domains.review_models import Likes
+from app.models.enums import EstadoEnum, EstadoPedido
+from app.utils import tareas
+
+# Pesos de la puntuación de un candidato.
+PESO_COMPRA_CONJUNTA = 3.0
+PESO_LIKE_CONJUNTO = 2.0
+PESO_SEUDOCATEGORIA = 1.0
+PESO_SUBCATEGORIA = 0.5
+
+# Cuántos candidatos se leen por cada producto que se va a mostrar.
+_FACTOR_MUESTREO = 3
+
+_max_relacionados = 24
+_intervalo_refresco = 21600
+
+
+def init_recomendaciones(app) -> None:
+    """
+    Configura el tamaño de las listas y registra su recálculo como tarea periódica.
+
+    Args:
+        app (Flask): La aplicación Flask.
+    """
+    global _max_relacionados, _intervalo_refresco
+    _max_relacionados = app.config.get('RECOMMENDATIONS_MAX_RELATED', 24)
+    _intervalo_refresco = app.config.get('RECOMMENDATIONS_REFRESH_INTERVAL_SECONDS', 21600)
+    tareas.registrar_periodica('recalculo-recomendaciones', _intervalo_refresco, reconstruir_si_vencidas,
+                               al_arrancar=True)
+
+
+def muestreo_reservorio(elementos: Iterable, k: int, rng: random.Random = random) -> list:
+    """
+    Elige `k` elementos uniformemente al azar en una sola pasada (algoritmo R).
+
+    No necesita conocer el tamaño de la entrada ni ordenarla, por lo que sirve
+    directamente sobre el resultado de una consulta.
+
+    Args:
+        elementos (Iterable): Los candidatos.
+        k (int): El tamaño de la muestra.
+        rng (random.Random, optional): Generador de números aleatorios.
+
+    Returns:
+        list: Hasta `k` elementos, en el orden relativo en que aparecían.
+    """
+    if k <= 0:
+        return []
+    muestra = []
+    posiciones = []
+    for i, elemento in enumerate(elementos):
+        if i < k:
+            muestra.append(elemento)
+            posiciones.append(i)
+        else:
+            j = rng.randrange(i + 1)
+            if j < k:
+                muestra[j] = elemento
+                posiciones[j] = i
+    return [elemento for _, elemento in sorted(zip(posiciones, muestra), key=lambda par: par[0])]
+
+
+# --- Cálculo de las listas ---
+
+def _pares_conjuntos(columna_grupo, columna_producto, *condiciones):
+    """
+    Cuenta, para cada par de productos, cuántos grupos (pedidos o usuarios) los contienen a ambos.
+
+    Returns:
+        list: Filas `(producto_a, producto_b, veces)`.
+    """
+    tabla = columna_grupo.class_
+    a = aliased(tabla, name='a')
+    b = aliased(tabla, name='b')
+    grupo_a, grupo_b = getattr(a, columna_grupo.key), getattr(b, columna_grupo.key)
+    producto_a, producto_b = getattr(a, columna_producto.key), getattr(b, columna_producto.key)
+    consulta = (
+        select(producto_a, producto_b, func.count(func.distinct(grupo_a)))
+        .join(b, and_(grupo_b == grupo_a, producto_b != producto_a))
+        .group_by(producto_a, producto_b)
+    )
+    for condicion in condiciones:
+        consulta = condicion(consulta, a, b)
+    return db.session.execute(consulta).all()
+
+
+def _compras_conjuntas():
+    """Pares de productos comprados en un mismo pedido no cancelado."""
+    def _no_cancelados(consulta, a, b):
+        return consulta.join(Pedido, Pedido.id == a.pedido_id).where(Pedido.estado_pedido != EstadoPedido.CANCELADO)
+    return _pares_conjuntos(PedidoProducto.pedido_id, PedidoProducto.producto_id, _no_cancelados)
+
+
+def _likes_conjuntos():
+    """Pares de productos con like activo de un mismo usuario."""
+    def _activos(consulta, a, b):
+        return consulta.where(a.estado == EstadoEnum.ACTIVO, b.estado == EstadoEnum.ACTIVO)
+    return _pares_conjuntos(Likes.usuario_id, Likes.producto_id, _activos)
+
+
+def calcular_recomendaciones(max_relacionados: Optional[int] = None, rng: random.Random = random) -> Dict[str, dict]:
+    """
+    Calcula la lista de relacionados y la popularidad de cada producto activo.
+
+    Los empates (habituales entre productos de la misma categoría sin compras ni
+    likes en común) se deshacen al azar, de modo que cada recálculo rota qué
+    productos de la categoría entran en la lista.
+
+    Args:
+        max_relacionados (int, optional): Longitud máxima de cada lista. Por defecto,
+            `RECOMMENDATIONS_MAX_RELATED`.
+        rng (random.Random, optional): Generador para deshacer empates.
+
+    Returns:
+        Dict[str, dict]: `{producto_id: {'relacionados': [...], 'popularidad': float}}`.
+    """
+    max_relacionados = max_relacionados or _max_relacionados
+    catalogo = db.session.execute(
+        select(Productos.id, Productos.seudocategoria_id, Seudocategorias.subcategoria_id)
+        .join(Seudocategorias, Seudocategorias.id == Productos.seudocategoria_id)
+        .where(Productos.estado == EstadoEnum.ACTIVO)
+    ).all()
+    seudocategoria_de = {fila.id: fila.seudocategoria_id for fila in catalogo}
+    por_subcategoria = defaultdict(list)
+    for fila in catalogo:
+        por_subcategoria[fila.subcategoria_id].append(fila.id)
+
+    conjuntos: Dict[str, Counter] = defaultdict(Counter)
+    for pares, peso in ((_compras_conjuntas(), PESO_COMPRA_CONJUNTA), (_likes_conjuntos(), PESO_LIKE_CONJUNTO)):
+        for producto_a, producto_b, veces in pares:
+            if producto_b in seudocategoria_de:
+                conjuntos[producto_a][producto_b] += peso * veces
+
+    likes = dict(db.session.execute(
+        select(Likes.producto_id, func.count()).where(Likes.estado == EstadoEnum.ACTIVO).group_by(Likes.producto_id)
+    ).all())
+    vendidas = dict(db.session.execute(
+        select(ProductoVentasResumen.producto_id, ProductoVentasResumen.unidades_vendidas)
+    ).all())
+
+    resultado = {}
+    for fila in catalogo:
+        puntuacion = Counter(conjuntos.get(fila.id, ()))
+        for candidato in por_subcategoria[fila.subcategoria_id]:
+            if candidato != fila.id:
+                mismo_seudo = seudocategoria_de[candidato] == fila.seudocategoria_id
+                puntuacion[candidato] += PESO_SEUDOCATEGORIA if mismo_seudo else PESO_SUBCATEGORIA
+        puntuacion.pop(fila.id, None)
+        ordenados = sorted(puntuacion, key=lambda candidato: (-puntuacion[candidato], rng.random()))
+        resultado[fila.id] = {
+            'relacionados': ordenados[:max_relacionados],
+            'popularidad': float(likes.get(fila.id, 0) + (vendidas.get(fila.id) or 0)),
+        }
+    return resultado
+
+
+def reconstruir_recomendaciones(max_relacionados: Optional[int] = None) -> int:
+    """
+    Recalcula y reemplaza todas las listas de relacionados.
+
+    El llamador confirma la transacción; hasta entonces las vistas siguen leyendo las
+    listas anteriores.
+
+    Args:
+        max_relacionados (int, optional): Longitud máxima de cada lista.
+
+    Returns:
+        int: El número de productos con lista.
+    """
+    ahora = datetime.utcnow()
+    filas = [
+        {'producto_id': producto_id, 'relacionados': datos['relacionados'],
+         'popularidad': datos['popularidad'], 'calculado_en': ahora}
+        for producto_id, datos in calcular_recomendaciones(max_relacionados).items()
+    ]
+    db.session.execute(delete(ProductoRecomendaciones))
+    if filas:
+        db.session.execute(insert(ProductoRecomendaciones), filas)
+    return len(filas)
+
+
+def reconstruir_si_vencidas() -> Optional[int]:
+    """
+    Recalcula y confirma las listas si el último cálculo guardado es más antiguo que
+    `RECOMMENDATIONS_REFRESH_INTERVAL_SECONDS`.
+
+    Al comprobar la fecha guardada, con varios workers (o tras un reinicio) no se
+    recalcula más de una vez por intervalo. Es la tarea periódica del módulo.
+
+    Returns:
+        int | None: El número de productos con lista, o `None` si no hacía falta.
+    """
+    ultimo = db.session.execute(select(func.max(ProductoRecomendaciones.calculado_en))).scalar()
+    if ultimo is not None and datetime.utcnow() - ultimo < timedelta(seconds=_intervalo_refresco):
+        return None
+    try:
+        total = reconstruir_recomendaciones()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    current_app.logger.info(f"Recomendaciones recalculadas para {total} productos.")
+    return total
+
+
+# --- Lectura ---
+
+def _productos_disponibles(ids: Sequence[str]) -> List[Productos]:
+    """
+    Carga, en el orden de `ids`, los productos activos y con stock, con su jerarquía de categorías.
+    """
+    if not ids:
+        return []
+    productos = {
+        p.id: p for p in Productos.query.options(
+            joinedload(Productos.seudocategoria).joinedload(Seudocategorias.subcategoria)
+            .joinedload(Subcategorias.categoria_principal)
+        ).filter(
+            Productos.id.in_(list(ids)),
+            Productos.estado == EstadoEnum.ACTIVO,
+            Productos._existencia > 0
+        )
+    }
+    return [productos[pid] for pid in ids if pid in productos]
+
+
+def _relleno_por_categoria(producto: Productos, n: int, excluir: set) -> List[Productos]:
+    """
+    Completa con productos de la misma seudocategoría y, después, de la misma subcategoría.
+
+    Se usa para productos aún sin lista (creados después del último cálculo) o cuyos
+    relacionados se agotaron. Cada nivel lee como mucho `n * _FACTOR_MUESTREO` filas.
+    """
+    elegidos: List[Productos] = []
+    subcategoria_id = producto.seudocategoria.subcategoria_id if producto.seudocategoria else None
+    niveles = [Productos.seudocategoria_id == producto.seudocategoria_id]
+    if subcategoria_id:
+        niveles.append(Seudocategorias.subcategoria_id == subcategoria_id)
+    for condicion in niveles:
+        faltan = n - len(elegidos)
+        if faltan <= 0:
+            break
+        vistos = excluir | {p.id for p in elegidos}
+        candidatos = Productos.query.join(Productos.seudocategoria).options(
+            joinedload(Productos.seudocategoria).joinedload(Seudocategorias.subcategoria)
+            .joinedload(Subcategorias.categoria_principal)
+        ).filter(
+            condicion,
+            Productos.id.notin_(vistos),
+            Productos.estado == EstadoEnum.ACTIVO,
+            Seudocategorias.estado == EstadoEnum.ACTIVO,
+            Productos._existencia > 0
+        ).limit(faltan * _FACTOR_MUESTREO)
+        elegidos.extend(muestreo_reservorio(candidatos, faltan))
+    return elegidos
+
+
+def productos_relacionados(producto: Productos, k: int = 8) -> List[Productos]:
+    """
+    Devuelve hasta `k` productos relacionados con un producto, con variedad entre visitas.
+
+    Args:
+        producto (Productos): El producto de la página de detalle.
+        k (int): Cuántos productos devolver.
+
+    Returns:
+        List[Productos]: Los relacionados, de más a menos relevante.
+    """
+    ids = db.session.execute(
+        select(ProductoRecomendaciones.relacionados).where(ProductoRecomendaciones.producto_id == producto.id)
+    ).scalar() or []
+    elegidos = muestreo_reservorio(_productos_disponibles(ids), k)
+    if len(elegidos) < k:
+        elegidos.extend(_relleno_por_categoria(producto, k - len(elegidos), {producto.id, *(p.id for p in elegidos)}))
+    return elegidos
+
+
+def recomendaciones_usuario(usuario_id: str, k: int = 12) -> List[Productos]:
+    """
+    Recomienda productos a partir de los que le gustan a un usuario.
+
+    Reúne las listas de relacionados de sus productos con like (una lectura por clave
+    primaria con `IN`), puntúa cada candidato por su posición en esas listas y toma una
+    muestra entre los mejores. Si no alcanza, completa con los productos más populares.
+
+    Args:
+        usuario_id (str): El ID del usuario.
+        k (int): Cuántos productos devolver.
+
+    Returns:
+        List[Productos]: Los productos recomendados.
+    """
+    gustados = set(db.session.scalars(
+        select(Likes.producto_id).where(Likes.usuario_id == usuario_id, Likes.estado == EstadoEnum.ACTIVO)
+    ))
+    puntuacion = Counter()
+    if gustados:
+        listas = db.session.scalars(
+            select(ProductoRecomendaciones.relacionados).where(ProductoRecomendaciones.producto_id.in_(gustados))
+        )
+        for relacionados in listas:
+            for posicion, candidato in enumerate(relacionados or []):
+                if candidato not in gustados:
+                    puntuacion[candidato] += 1.0 / (posicion + 1)
+
+    mejores = [candidato for candidato, _ in puntuacion.most_common(k * _FACTOR_MUESTREO)]
+    elegidos = muestreo_reservorio(_productos_disponibles(mejores), k)
+
+    if len(elegidos) < k:
+        faltan = k - len(elegidos)
+        vistos = gustados | {p.id for p in elegidos}
+        populares = db.session.scalars(
+            select(ProductoRecomendaciones.producto_id)
+            .where(ProductoRecomendaciones.producto_id.notin_(vistos))
+            .order_by(ProductoRecomendaciones.popularidad.desc())
+            .limit(faltan * _FACTOR_MUESTREO)
+        ).all()
+        elegidos.extend(muestreo_reservorio(_productos_disponibles(populares), faltan))
+    return elegidos
+
+
+def muestra_de_categoria(nombre_categoria: str, k: int) -> List[Productos]:
+    """
+    Devuelve una muestra aleatoria de los productos visibles de una categoría principal.
+
+    Recorre solo los IDs de la categoría (sin ordenar ni cargar los productos), elige
+    la muestra con muestreo de reservorio y carga únicamente los `k` elegidos.
+
+    Args:
+        nombre_categoria (str): El nombre de la categoría principal (sin distinguir mayúsculas).
+        k (int): Cuántos productos devolver.
+
+    Returns:
+        List[Productos]: Los productos elegidos, con su jerarquía de categorías cargada.
+    """
+    ids = db.session.scalars(
+        select(Productos.id)
+        .join(Seudocategorias, Productos.seudocategoria_id == Seudocategorias.id)
+        .join(Subcategorias, Seudocategorias.subcategoria_id == Subcategorias.id)
+        .join(CategoriasPrincipales, Subcategorias.categoria_principal_id == CategoriasPrincipales.id)
+        .where(
+            func.lower(CategoriasPrincipales.nombre) == nombre_categoria.lower(),
+            Productos.estado == EstadoEnum.ACTIVO,
+            Productos._existencia > 0,
+            Seudocategorias.estado == EstadoEnum.ACTIVO,
+            Subcategorias.estado == EstadoEnum.ACTIVO,
+            CategoriasPrincipales.estado == EstadoEnum.ACTIVO
+        )
+        .execution_options(yield_per=500)
+    )
+    return _productos_disponibles(muestreo_reservorio(ids, k))
@@ -0,0 +1,152 @@
+"""
+Módulo del Historial de Seguimiento de Pedidos (`pedido_eventos`).
+
+El historial vivía en la columna JSON `pedidos.seguimiento_historial`: cada cambio de
+estado reescribía el documento completo (`flag_modified`), y tanto la búsqueda de
+notificaciones sin leer (`events.py`) como el relleno de estados intermedios
+(`lista_pedidos.update_pedido_estado`) lo recorrían en Python.
+
+Ahora cada entrada es una fila de `pedido_eventos` (ver `PedidoEvento`):
+- `Pedido.registrar_evento`: Añade un evento con un INSERT.
+- `estados_registrados` / `ultimo_evento`: Los estados ya presentes en el historial de
+  un pedido y su último evento, leídos del índice `(pedido_id, id)`.
+- `notificacion_pendiente` / `marcar_notificado`: La notificación sin leer más reciente
+  de un usuario y su confirmación. La primera se resuelve con el índice parcial
+  `idx_pedido_evento_no_leidos` (solo filas con `notificado = false`).
+- `backfill_pedido_eventos`: Migra el historial JSON de los pedidos existentes a la
+  tabla. Se ejecuta en cada despliegue (`flask preparar-despliegue`) y como el comando
+  `flask backfill-pedido-eventos`; es idempotente: solo procesa pedidos que aún no
+  tienen eventos.
+
+Las funciones no hacen `commit`; el llamador confirma la transacción.
+"""
+from datetime import datetime, timezone
+from typing import Optional, Set
+
+from sqlalchemy import exists, insert, select, update
+
+from app.extensions import db
+from app.models.domains.order_models import Pedido, PedidoEvento
+
+
+def estados_registrados(pedido_id: str) -> Set[str]:
+    """
+    Devuelve los estados de seguimiento presentes en el historial de un pedido.
+
+    Args:
+        pedido_id (str): El ID del pedido.
+
+    Returns:
+        Set[str]: Los valores de `EstadoSeguimiento` ya registrados.
+    """
+    return set(db.session.scalars(
+        select(PedidoEvento.estado).where(PedidoEvento.pedido_id == pedido_id).distinct()
+    ))
+
+
+def ultimo_evento(pedido_id: str) -> Optional[PedidoEvento]:
+    """
+    Devuelve el evento más reciente del historial de un pedido.
+
+    Args:
+        pedido_id (str): El ID del pedido.
+
+    Returns:
+        PedidoEvento | None: El último evento registrado, o None si no hay ninguno.
+    """
+    return db.session.scalars(
+        select(PedidoEvento).where(PedidoEvento.pedido_id == pedido_id)
+        .order_by(PedidoEvento.id.desc())
+        .limit(1)
+    ).first()
+
+
+def notificacion_pendiente(usuario_id: str, pedido_id: Optional[str] = None) -> Optional[PedidoEvento]:
+    """
+    Devuelve el evento sin notificar más reciente de un usuario.
+
+    Args:
+        usuario_id (str): El ID del usuario.
+        pedido_id (str, optional): Restringe la búsqueda a un pedido.
+
+    Returns:
+        PedidoEvento | None: El evento, o None si no hay notificaciones pendientes.
+    """
+    condiciones = [PedidoEvento.usuario_id == usuario_id, PedidoEvento.notificado.is_(False)]
+    if pedido_id is not None:
+        condiciones.append(PedidoEvento.pedido_id == pedido_id)
+    return db.session.scalars(
+        select(PedidoEvento).where(*condiciones)
+        .order_by(PedidoEvento.created_at.desc(), PedidoEvento.id.desc())
+        .limit(1)
+    ).first()
+
+
+def marcar_notificado(evento_id: int, usuario_id: str) -> bool:
+    """
+    Marca un evento como notificado, solo si seguía pendiente.
+
+    Args:
+        evento_id (int): El ID del evento.
+        usuario_id (str): El usuario al que pertenece (evita confirmar eventos ajenos).
+
+    Returns:
+        bool: False si el evento ya estaba notificado (p. ej. lo entregó otra pestaña).
+    """
+    resultado = db.session.execute(
+        update(PedidoEvento)
+        .where(PedidoEvento.id == evento_id, PedidoEvento.usuario_id == usuario_id,
+               PedidoEvento.notificado.is_(False))
+        .values(notificado=True),
+        execution_options={'synchronize_session': False},
+    )
+    return resultado.rowcount > 0
+
+
+def _parsear_timestamp(valor) -> datetime:
+    """Convierte el `timestamp` de una entrada JSON (ISO 8601, con o sin zona) a UTC sin zona."""
+    try:
+        momento = datetime.fromisoformat(str(valor).replace('Z', '+00:00'))
+    except (TypeError, ValueError):
+        return datetime.utcnow()
+    if momento.tzinfo is not None:
+        momento = momento.astimezone(timezone.utc).replace(tzinfo=None)
+    return momento
+
+
+def backfill_pedido_eventos(tamano_lote: int = 500) -> int:
+    """
+    Migra el historial JSON de los pedidos sin eventos a la tabla `pedido_eventos`.
+
+    Las entradas sin la clave `notified_to_client` se consideran ya notificadas.
+
+    Args:
+        tamano_lote (int): Número de pedidos leídos por lote.
+
+    Returns:
+        int: El número de eventos insertados.
+    """
+    pendientes = db.session.execute(
+        select(Pedido.id, Pedido.usuario_id, Pedido.historial_legado)
+        .where(Pedido.historial_legado.isnot(None),
+               ~exists().where(PedidoEvento.pedido_id == Pedido.id))
+        .execution_options(yield_per=tamano_lote)
+    )
+    insertados = 0
+    for lote in pendientes.partitions():
+        filas = [
+            {
+                'pedido_id': pedido_id,
+                'usuario_id': usuario_id,
+                'estado': entrada.get('estado') or 'recibido',
+                'notas': entrada.get('notas'),
+                'notificado': entrada.get('notified_to_client') is not False,
+                'created_at': _parsear_timestamp(entrada.get('timestamp')),
+            }
+            for pedido_id, usuario_id, historial in lote
+            for entrada in (historial or []) if isinstance(entrada, dict)
+        ]
+        if filas:
+            db.session.execute(insert(PedidoEvento), filas)
+            insertados += len(filas)
+    return insertados
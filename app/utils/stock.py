@@ -0,0 +1,273 @@
+"""
+Módulo de Reserva y Devolución de Stock.
+
+Antes, cada flujo que movía inventario (checkout del cliente, pedidos y ventas del
+panel, cancelaciones y reactivaciones) cargaba los productos uno a uno con
+`Productos.query.get`, comparaba `existencia` en Python y la descontaba con el setter.
+Sin bloqueo de filas, dos checkouts simultáneos podían leer el mismo stock y vender
+más unidades de las que había, y cada línea costaba su propia consulta.
+
+Este módulo centraliza esos movimientos:
+- `bloquear_productos`: Un único `SELECT ... FOR UPDATE` de todos los productos,
+  ordenado por ID. Todas las transacciones bloquean en el mismo orden, por lo que dos
+  pedidos con productos en común se esperan en lugar de bloquearse mutuamente.
+- `ajustar_stock`: Aplica todos los movimientos en una sola sentencia condicional:
+
+      UPDATE productos SET existencia = productos.existencia - v.cantidad
+        FROM (VALUES (:id, :cantidad), ...) AS v (id, cantidad)
+       WHERE productos.id = v.id AND productos.existencia >= v.cantidad
+      RETURNING productos.id, productos.existencia
+
+  Una fila que no vuelve en el `RETURNING` no tenía stock suficiente, y la operación
+  se aborta con `StockInsuficiente`.
+- `reservar_stock` / `liberar_stock`: Atajos para descontar o devolver cantidades.
+- `registrar_movimientos`: Añade en bloque las filas del diario `movimientos_stock`
+  (producto, delta, existencia resultante, motivo, pedido). `ajustar_stock` lo llama
+  siempre, de modo que ningún cambio de stock queda sin historial.
+
+Las funciones no confirman la transacción: el llamador hace `commit` junto con el
+pedido, o `rollback` si se lanza una excepción (el diario se revierte con él).
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, Iterable, Mapping, Optional, Tuple
+
+from sqlalchemy import Integer, String, column, insert, update, values
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.extensions import db
+from app.models.enums import MotivoMovimientoStock
+from app.utils import category_status
+
+if TYPE_CHECKING:
+    from app.models.domains.product_models import Productos
+
+
+class ProductoNoDisponible(ValueError):
+    """El producto no existe o no está activo."""
+
+    def __init__(self, producto_id, encontrado: bool = False):
+        self.producto_id = producto_id
+        self.encontrado = encontrado
+        mensaje = (f'Producto {producto_id} no disponible.' if encontrado
+                   else f'Producto con ID {producto_id} no encontrado')
+        super().__init__(mensaje)
+
+
+class StockInsuficiente(ValueError):
+    """Un producto no tiene existencias suficientes para el movimiento solicitado."""
+
+    def __init__(self, producto, solicitado: int):
+        self.producto = producto
+        self.solicitado = solicitado
+        super().__init__(
+            f'Stock insuficiente para {producto.nombre}. '
+            f'Disponible: {producto.existencia}, solicitado: {solicitado}'
+        )
+
+
+def cantidades_por_producto(lineas: Iterable[Tuple[str, int]]) -> Dict[str, int]:
+    """
+    Agrupa las cantidades por producto (un producto puede aparecer en varias líneas).
+
+    Args:
+        lineas (Iterable): Pares `(producto_id, cantidad)`.
+
+    Returns:
+        Dict[str, int]: `{producto_id: cantidad total}`.
+    """
+    cantidades = defaultdict(int)
+    for producto_id, cantidad in lineas:
+        cantidades[str(producto_id)] += cantidad
+    return dict(cantidades)
+
+
+def bloquear_productos(ids: Iterable[str]) -> Dict[str, 'Productos']:
+    """
+    Carga y bloquea (`FOR UPDATE`) los productos indicados en una sola consulta.
+
+    Las filas se bloquean en orden de ID para evitar interbloqueos entre transacciones
+    concurrentes. `populate_existing` descarta valores que la sesión tuviera en caché,
+    de modo que `existencia` refleja el valor bloqueado.
+
+    Args:
+        ids (Iterable[str]): Los IDs de los productos.
+
+    Returns:
+        Dict[str, Productos]: Los productos encontrados, por ID.
+    """
+    from app.models.domains.product_models import Productos
+
+    ids = sorted({str(i) for i in ids})
+    if not ids:
+        return {}
+    productos = (
+        Productos.query.filter(Productos.id.in_(ids))
+        .order_by(Productos.id)
+        .with_for_update()
+        .populate_existing()
+        .all()
+    )
+    return {p.id: p for p in productos}
+
+
+def _ejecutar_movimientos(cambios: Dict[str, int]) -> Dict[str, int]:
+    """Ejecuta el `UPDATE` condicional y devuelve `{producto_id: nueva existencia}`."""
+    from app.models.domains.product_models import Productos
+
+    # Se usa un UPDATE del ORM (no de Core) para que los listeners de la sesión
+    # (índice de facetas, búsqueda) sepan que el stock de estos productos cambió.
+    opciones = {'synchronize_session': False}
+    if db.session.get_bind().dialect.name == 'postgresql':
+        movimientos = values(
+            column('id', String), column('cantidad', Integer), name='movimientos'
+        ).data(list(cambios.items()))
+        stmt = (
+            update(Productos)
+            .where(Productos.id == movimientos.c.id, Productos._existencia >= movimientos.c.cantidad)
+            .values(_existencia=Productos._existencia - movimientos.c.cantidad)
+            .returning(Productos.id, Productos._existencia)
+        )
+        return dict(db.session.execute(stmt, execution_options=opciones).all())
+
+    # Otros motores (SQLite en desarrollo) no admiten `UPDATE ... FROM (VALUES ...)`:
+    # se aplica la misma condición producto por producto.
+    resultado = {}
+    for producto_id, cantidad in cambios.items():
+        fila = db.session.execute(
+            update(Productos)
+            .where(Productos.id == producto_id, Productos._existencia >= cantidad)
+            .values(_existencia=Productos._existencia - cantidad)
+            .returning(Productos._existencia),
+            execution_options=opciones,
+        ).first()
+        if fila is not None:
+            resultado[producto_id] = fila[0]
+    return resultado
+
+
+def registrar_movimientos(movimientos: Iterable[Tuple[str, int, int]], motivo: MotivoMovimientoStock,
+                          pedido_id: Optional[str] = None) -> None:
+    """
+    Añade movimientos al diario de stock con un único INSERT de varias filas.
+
+    Args:
+        movimientos (Iterable): Tuplas `(producto_id, delta, existencia_resultante)`,
+            donde un delta negativo es una salida de inventario.
+        motivo (MotivoMovimientoStock): El origen de los movimientos.
+        pedido_id (str, optional): El pedido que los originó.
+    """
+    from app.models.domains.inventory_models import MovimientoStock
+
+    ahora = datetime.utcnow()
+    filas = [
+        {'producto_id': producto_id, 'cantidad': delta, 'existencia_resultante': existencia,
+         'motivo': motivo, 'pedido_id': pedido_id, 'created_at': ahora}
+        for producto_id, delta, existencia in movimientos if delta
+    ]
+    if filas:
+        db.session.execute(insert(MovimientoStock), filas)
+
+
+def ajustar_stock(cambios: Mapping[str, int], motivo: MotivoMovimientoStock,
+                  productos: Optional[Dict[str, 'Productos']] = None, pedido_id: Optional[str] = None,
+                  exigir_activos: bool = False) -> Dict[str, 'Productos']:
+    """
+    Aplica movimientos de stock de forma atómica y los registra en el diario.
+
+    Args:
+        cambios (Mapping[str, int]): `{producto_id: cantidad}`. Una cantidad positiva
+            descuenta unidades y una negativa las devuelve al inventario.
+        motivo (MotivoMovimientoStock): El origen de los movimientos (para el diario).
+        productos (Dict, optional): Productos ya bloqueados con `bloquear_productos`.
+            Si no se indican, se bloquean aquí.
+        pedido_id (str, optional): El pedido que origina los movimientos.
+        exigir_activos (bool): Si es True, rechaza los productos inactivos que se descuentan.
+
+    Returns:
+        Dict[str, Productos]: Los productos bloqueados, con `existencia` actualizada.
+
+    Raises:
+        ProductoNoDisponible: Si un producto no existe (o está inactivo con `exigir_activos`).
+        StockInsuficiente: Si algún producto no tiene existencias suficientes.
+    """
+    from app.models.enums import EstadoEnum
+
+    cambios = {str(pid): cantidad for pid, cantidad in cambios.items() if cantidad}
+    if productos is None:
+        productos = bloquear_productos(cambios)
+    # Devolver unidades a un producto que ya no existe no tiene efecto.
+    cambios = {pid: cantidad for pid, cantidad in cambios.items() if cantidad > 0 or pid in productos}
+    if not cambios:
+        return productos
+
+    # Validación previa sobre las filas bloqueadas, para devolver un mensaje claro.
+    for producto_id, cantidad in sorted(cambios.items()):
+        producto = productos.get(producto_id)
+        if producto is None:
+            raise ProductoNoDisponible(producto_id)
+        if cantidad > 0 and exigir_activos and producto.estado != EstadoEnum.ACTIVO.value:
+            raise ProductoNoDisponible(producto_id, encontrado=True)
+        if producto.existencia < cantidad:
+            raise StockInsuficiente(producto, cantidad)
+
+    nuevas = _ejecutar_movimientos(cambios)
+    # La condición `existencia >= cantidad` del UPDATE es la garantía definitiva.
+    faltantes = sorted(set(cambios) - set(nuevas))
+    if faltantes:
+        raise StockInsuficiente(productos[faltantes[0]], cambios[faltantes[0]])
+
+    registrar_movimientos(
+        ((producto_id, -cambios[producto_id], existencia) for producto_id, existencia in nuevas.items()),
+        motivo, pedido_id
+    )
+
+    agotados = []
+    for producto_id, existencia in nuevas.items():
+        producto = productos[producto_id]
+        set_committed_value(producto, '_existencia', existencia)
+        db.session.expire(producto, ['updated_at'])
+        if existencia == 0:
+            agotados.append(producto.seudocategoria_id)
+    # Misma regla que el setter de `existencia`: un producto agotado revisa su categoría.
+    if agotados:
+        category_status.solicitar_recalculo(db.session, category_status.SEUDOCATEGORIA, *agotados)
+    return productos
+
+
+def reservar_stock(cantidades: Mapping[str, int], motivo: MotivoMovimientoStock,
+                   pedido_id: Optional[str] = None, exigir_activos: bool = False) -> Dict[str, 'Productos']:
+    """
+    Bloquea los productos y descuenta las cantidades indicadas.
+
+    Args:
+        cantidades (Mapping[str, int]): `{producto_id: cantidad}` (cantidades positivas).
+        motivo (MotivoMovimientoStock): El origen de la reserva (para el diario).
+        pedido_id (str, optional): El pedido que reserva el stock.
+        exigir_activos (bool): Si es True, rechaza los productos inactivos.
+
+    Returns:
+        Dict[str, Productos]: Los productos bloqueados, por ID.
+
+    Raises:
+        ProductoNoDisponible, StockInsuficiente: Ver `ajustar_stock`.
+    """
+    return ajustar_stock(cantidades, motivo, pedido_id=pedido_id, exigir_activos=exigir_activos)
+
+
+def liberar_stock(cantidades: Mapping[str, int], pedido_id: Optional[str] = None,
+                  motivo: MotivoMovimientoStock = MotivoMovimientoStock.CANCELACION) -> Dict[str, 'Productos']:
+    """
+    Devuelve al inventario las cantidades indicadas (p. ej. al cancelar un pedido).
+
+    Los productos que ya no existen se omiten.
+
+    Args:
+        cantidades (Mapping[str, int]): `{producto_id: cantidad}` (cantidades positivas).
+        pedido_id (str, optional): El pedido que libera el stock.
+        motivo (MotivoMovimientoStock): El origen de la devolución (para el diario).
+
+    Returns:
+        Dict[str, Productos]: Los productos bloqueados, por ID.
+    """
+    return ajustar_stock({pid: -cantidad for pid, cantidad in cantidades.items()}, motivo, pedido_id=pedido_id)
@@ -0,0 +1,156 @@
+"""
+Módulo de Tareas en Segundo Plano.
+
+La purga de carritos de invitado abandonados, el recálculo de las recomendaciones y
+el refresco de las instantáneas del dashboard lanzaban cada uno, desde una petición,
+su propio hilo `daemon`, con su propio cerrojo, su propio control de intervalo y su
+propio manejo de errores. Este módulo los reúne:
+- `lanzar`: Encola un trabajo en el único hilo de fondo del proceso, salvo que ya haya
+  uno pendiente con el mismo nombre. El trabajo corre en un contexto de aplicación
+  propio y sus errores se registran sin afectar a la petición que lo encoló.
+- `registrar_periodica`: Registra una tarea que debe ejecutarse cada cierto intervalo
+  (la purga de carritos en `carrito.init_carrito`, las recomendaciones en
+  `recomendaciones.init_recomendaciones`, la fotografía diaria del stock en
+  `inventario.init_inventario`).
+- `maybe_lanzar_periodicas`: Encola las tareas periódicas cuyo intervalo venció. Se
+  invoca al final de cada petición si `PERIODIC_TASKS_IN_REQUESTS` está activo.
+- `ejecutar_periodicas`: Ejecuta todas las tareas periódicas en el proceso actual.
+  Expuesto en `flask tareas-periodicas`, pensado para un cron (obligatorio en
+  serverless, donde un hilo de fondo puede no llegar a ejecutarse).
+"""
+import queue
+import threading
+import time
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from flask import current_app
+
+_en_peticiones = True
+_lock = threading.Lock()
+_cola: "queue.Queue[Tuple[object, str, Callable[[], None]]]" = queue.Queue()
+_pendientes: Set[str] = set()
+_hilo: Optional[threading.Thread] = None
+
+# {nombre: (función, intervalo en segundos)}
+_periodicas: Dict[str, Tuple[Callable[[], None], int]] = {}
+# {nombre: instante (monotónico) del último lanzamiento}
+_ultimo_lanzamiento: Dict[str, float] = {}
+
+
+def init_tareas(app) -> None:
+    """
+    Configura si las tareas periódicas se lanzan desde las peticiones.
+
+    Args:
+        app (Flask): La aplicación Flask.
+    """
+    global _en_peticiones
+    _en_peticiones = app.config.get('PERIODIC_TASKS_IN_REQUESTS', True)
+
+
+def registrar_periodica(nombre: str, intervalo: int, funcion: Callable[[], None],
+                        al_arrancar: bool = False) -> None:
+    """
+    Registra (o reemplaza) una tarea periódica.
+
+    Args:
+        nombre (str): El nombre de la tarea, usado en los registros.
+        intervalo (int): Segundos mínimos entre dos lanzamientos desde las peticiones.
+        funcion (Callable): La tarea. Corre en un contexto de aplicación y confirma su
+                            propia transacción.
+        al_arrancar (bool): Si es True, se lanza en la primera petición del proceso; si
+                            no, tras el primer intervalo.
+    """
+    _periodicas[nombre] = (funcion, intervalo)
+    if al_arrancar:
+        _ultimo_lanzamiento.pop(nombre, None)
+    else:
+        _ultimo_lanzamiento[nombre] = time.monotonic()
+
+
+def lanzar(nombre: str, funcion: Callable[[], None]) -> bool:
+    """
+    Encola un trabajo en el hilo de fondo del proceso.
+
+    Args:
+        nombre (str): El nombre del trabajo. Mientras haya uno pendiente con el mismo
+                      nombre, los siguientes se descartan.
+        funcion (Callable): El trabajo, sin argumentos.
+
+    Returns:
+        bool: True si el trabajo se encoló.
+    """
+    app = current_app._get_current_object()
+    with _lock:
+        if nombre in _pendientes:
+            return False
+        _pendientes.add(nombre)
+        _asegurar_hilo()
+    _cola.put((app, nombre, funcion))
+    return True
+
+
+def maybe_lanzar_periodicas() -> int:
+    """
+    Encola las tareas periódicas cuyo intervalo ya pasó.
+
+    Returns:
+        int: El número de tareas encoladas.
+    """
+    if not _en_peticiones:
+        return 0
+    ahora = time.monotonic()
+    lanzadas = 0
+    for nombre, (funcion, intervalo) in list(_periodicas.items()):
+        ultimo = _ultimo_lanzamiento.get(nombre)
+        if ultimo is not None and ahora - ultimo < intervalo:
+            continue
+        _ultimo_lanzamiento[nombre] = ahora
+        lanzadas += lanzar(nombre, funcion)
+    return lanzadas
+
+
+def ejecutar_periodicas() -> Dict[str, Optional[Exception]]:
+    """
+    Ejecuta en el proceso actual, una tras otra, todas las tareas periódicas.
+
+    Un error en una tarea se registra y no impide ejecutar las demás.
+
+    Returns:
+        dict: `{nombre: None si terminó bien, o la excepción}`.
+    """
+    app = current_app._get_current_object()
+    resultados: Dict[str, Optional[Exception]] = {}
+    for nombre, (funcion, _) in list(_periodicas.items()):
+        resultados[nombre] = _ejecutar(app, nombre, funcion)
+    return resultados
+
+
+def _ejecutar(app, nombre: str, funcion: Callable[[], None]) -> Optional[Exception]:
+    """Ejecuta un trabajo en un contexto de aplicación propio y registra sus errores."""
+    try:
+        with app.app_context():
+            funcion()
+        return None
+    except Exception as e:
+        app.logger.error(f"Error en la tarea en segundo plano '{nombre}': {e}", exc_info=True)
+        return e
+
+
+def _asegurar_hilo() -> None:
+    """Arranca el hilo de fondo si no está vivo (también tras un `fork` del proceso)."""
+    global _hilo
+    if _hilo is None or not _hilo.is_alive():
+        _hilo = threading.Thread(target=_trabajar, name='tareas-segundo-plano', daemon=True)
+        _hilo.start()
+
+
+def _trabajar() -> None:
+    """Bucle del hilo de fondo: ejecuta los trabajos encolados de uno en uno."""
+    while True:
+        app, nombre, funcion = _cola.get()
+        try:
+            _ejecutar(app, nombre, funcion)
+        finally:
+            with _lock:
+                _pendientes.discard(nombre)
@@ -0,0 +1,29 @@
+"""
+Módulo de Utilidades para `INSERT ... ON CONFLICT`.
+
+Los acumulados que se crean bajo demanda (resumen de ventas, ventas diarias, líneas
+del carrito) no pueden hacer "leer y, si no existe, insertar": dos transacciones que
+crean la misma fila a la vez leen ambas "no existe" (un `SELECT ... FOR UPDATE` no
+bloquea filas inexistentes) y la segunda falla con `IntegrityError`. La inserción con
+`ON CONFLICT` resuelve la carrera en la propia base de datos.
+
+- `insert_con_conflicto()`: Devuelve la construcción `insert` del dialecto activo
+  (PostgreSQL o SQLite), que admite `on_conflict_do_update` / `on_conflict_do_nothing`,
+  o `None` si el motor no lo admite y el llamador debe usar su camino ORM.
+"""
+from app.extensions import db
+
+
+def insert_con_conflicto():
+    """
+    Devuelve la construcción `insert` del dialecto activo con soporte de `ON CONFLICT`,
+    o `None` si el motor no lo admite.
+    """
+    dialecto = db.session.get_bind().dialect.name
+    if dialecto == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialecto == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert
@@ -0,0 +1,285 @@
+"""
+Módulo del Acumulado de Ventas Diarias.
+
+El dashboard (`dashboard_stats`), las estadísticas de ventas (`lista_venta`) y las
+tendencias de categoría (`categoria_detalle`) agregaban las líneas de pedido por fecha
+en cada carga: el costo de un gráfico crecía con el número de pedidos, y los días o
+meses sin ventas se rellenaban en Python (o con una consulta por mes).
+
+Ahora las ventas completadas se acumulan en la tabla `ventas_diarias` (una fila por
+día y producto) y las series se leen de ella:
+- `aplicar_lineas`: Suma o resta las líneas de un pedido en el día de su creación. La
+  llama `ventas_resumen.aplicar_pedido_al_resumen`, de modo que el acumulado se
+  mantiene en las mismas transiciones que el resumen por producto (completar,
+  cancelar o editar una venta) y en la misma transacción.
+- `reconstruir_ventas_diarias`: Recalcula la tabla con un único `INSERT ... SELECT`.
+  Expuesto en el comando `flask rebuild-ventas-resumen`.
+- `backfill_ventas_diarias_si_vacio`: Rellena la tabla en el despliegue
+  (`flask preparar-despliegue`) si está vacía y ya hay ventas completadas.
+- `serie_periodos` / `serie_completa`: Generan en SQL (`generate_series`) un periodo por
+  día, semana o mes del rango y cruzan con él cualquier agregado, de modo que los
+  periodos sin ventas aparecen con cero sin bucles en Python.
+- `serie_ventas` y `totales_ventas`: Unidades, ingresos y costo por periodo o del rango,
+  opcionalmente de una categoría principal. Su costo depende del número de días, no
+  del de pedidos.
+
+Las fechas son días UTC de `Pedido.created_at`, como en el resto del panel.
+"""
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import DateTime, cast, delete, func, insert, literal_column, select
+
+from app.extensions import db
+from app.models.domains.order_models import Pedido, PedidoProducto, VentasDiarias
+from app.models.domains.product_models import Productos, Seudocategorias, Subcategorias
+from app.models.enums import EstadoPedido
+from app.utils.upsert import insert_con_conflicto
+
+GRANULARIDADES = ('day', 'week', 'month')
+
+# {producto_id: (seudocategoria_id, unidades, ingresos, costo)}
+Lineas = Dict[str, Tuple[Optional[str], int, float, float]]
+
+
+# --- Mantenimiento ---
+
+def _asegurar_filas(fecha: date, lineas: Lineas) -> None:
+    """
+    Crea vacías, en una sola sentencia `INSERT ... ON CONFLICT DO NOTHING`, las filas
+    (día, producto) que aún no existen.
+
+    Los primeros pedidos completados de un día para un mismo producto ya no intentan
+    insertar ambos la fila (el `SELECT ... FOR UPDATE` no bloquea filas inexistentes y
+    el segundo fallaba con `IntegrityError`). En motores sin `ON CONFLICT` no hace nada
+    y la fila la crea el ORM.
+    """
+    insertar = insert_con_conflicto()
+    if insertar is None:
+        return
+    db.session.execute(
+        insertar(VentasDiarias).values([
+            {'fecha': fecha, 'producto_id': producto_id, 'seudocategoria_id': seudocategoria_id,
+             'unidades': 0, 'ingresos': 0.0, 'costo': 0.0}
+            for producto_id, (seudocategoria_id, *_) in lineas.items()
+        ]).on_conflict_do_nothing(index_elements=['fecha', 'producto_id'])
+    )
+
+
+def aplicar_lineas(fecha: date, lineas: Lineas, signo: int) -> None:
+    """
+    Suma (`signo=1`) o resta (`signo=-1`) las líneas agregadas de un pedido en un día.
+
+    Las filas afectadas se bloquean con `SELECT ... FOR UPDATE`, como en el resumen por
+    producto. Al sumar, las que faltan se crean antes con `INSERT ... ON CONFLICT DO
+    NOTHING` (ver `_asegurar_filas`), de modo que el bloqueo siempre las alcanza. Las
+    filas que quedan sin unidades se eliminan. No hace `commit`.
+
+    Args:
+        fecha (date): El día de creación del pedido.
+        lineas (Lineas): Las líneas del pedido agregadas por producto.
+        signo (int): `1` para sumar, `-1` para restar.
+    """
+    if not lineas:
+        return
+    if signo > 0:
+        _asegurar_filas(fecha, lineas)
+    existentes = {
+        fila.producto_id: fila for fila in VentasDiarias.query.filter(
+            VentasDiarias.fecha == fecha,
+            VentasDiarias.producto_id.in_(lineas.keys())
+        ).with_for_update().populate_existing().all()
+    }
+    for producto_id, (seudocategoria_id, unidades, ingresos, costo) in lineas.items():
+        fila = existentes.get(producto_id)
+        if fila is None:
+            if signo < 0:
+                # El acumulado está desincronizado; se corrige con `flask rebuild-ventas-resumen`.
+                current_app.logger.warning(f"Ventas diarias inexistentes para el producto {producto_id} el {fecha} al restar un pedido.")
+                continue
+            fila = VentasDiarias(fecha=fecha, producto_id=producto_id, seudocategoria_id=seudocategoria_id,
+                                 unidades=0, ingresos=0.0, costo=0.0)
+            db.session.add(fila)
+
+        fila.unidades = (fila.unidades or 0) + signo * unidades
+        fila.ingresos = round((fila.ingresos or 0.0) + signo * ingresos, 2)
+        fila.costo = round((fila.costo or 0.0) + signo * costo, 2)
+        if signo > 0:
+            fila.seudocategoria_id = seudocategoria_id
+        if fila.unidades <= 0:
+            db.session.delete(fila)
+
+
+def reconstruir_ventas_diarias() -> int:
+    """
+    Recalcula por completo la tabla `ventas_diarias` desde los pedidos completados.
+
+    No hace `commit`.
+
+    Returns:
+        int: El número de filas (día, producto) generadas.
+    """
+    fecha = cast(Pedido.created_at, db.Date)
+    origen = select(
+        fecha,
+        PedidoProducto.producto_id,
+        Productos.seudocategoria_id,
+        func.sum(PedidoProducto.cantidad),
+        func.sum(PedidoProducto.cantidad * PedidoProducto.precio_unitario),
+        func.sum(PedidoProducto.cantidad * func.coalesce(Productos.costo, 0)),
+    ).join(Pedido, Pedido.id == PedidoProducto.pedido_id)\
+     .join(Productos, Productos.id == PedidoProducto.producto_id)\
+     .where(Pedido.estado_pedido == EstadoPedido.COMPLETADO)\
+     .group_by(fecha, PedidoProducto.producto_id, Productos.seudocategoria_id)
+
+    db.session.execute(delete(VentasDiarias))
+    db.session.execute(insert(VentasDiarias).from_select(
+        ['fecha', 'producto_id', 'seudocategoria_id', 'unidades', 'ingresos', 'costo'], origen
+    ))
+    return db.session.query(func.count()).select_from(VentasDiarias).scalar() or 0
+
+
+def backfill_ventas_diarias_si_vacio() -> int | None:
+    """
+    Rellena `ventas_diarias` si está vacía y ya hay pedidos completados.
+
+    El acumulado incremental solo registra las ventas posteriores a la creación de la
+    tabla; sin este relleno, los gráficos del panel no muestran las ventas históricas.
+    Se ejecuta en cada despliegue (`flask preparar-despliegue`) y es idempotente: con la
+    tabla ya poblada no hace nada. No hace `commit`.
+
+    Returns:
+        int | None: El número de filas (día, producto) generadas, o `None` si no hacía falta.
+    """
+    if db.session.query(VentasDiarias.producto_id).first() is not None:
+        return None
+    hay_ventas = db.session.query(Pedido.id).filter(
+        Pedido.estado_pedido == EstadoPedido.COMPLETADO
+    ).first() is not None
+    if not hay_ventas:
+        return None
+    return reconstruir_ventas_diarias()
+
+
+# --- Lectura ---
+
+def periodo(columna, granularidad: str):
+    """
+    Expresión del inicio del periodo (día, semana o mes) de una fecha, etiquetada `periodo`.
+
+    Se convierte antes a `timestamp` para que coincida con `serie_periodos`.
+    """
+    if granularidad not in GRANULARIDADES:
+        raise ValueError(f"Granularidad de serie desconocida: '{granularidad}'")
+    return func.date_trunc(granularidad, cast(columna, DateTime)).label('periodo')
+
+
+def serie_periodos(desde: date, hasta: date, granularidad: str):
+    """
+    Tabla derivada con una fila `periodo` por cada día, semana o mes entre `desde` y `hasta`.
+
+    Args:
+        desde (date): El primer día del rango.
+        hasta (date): El último día del rango (incluido).
+        granularidad (str): 'day', 'week' o 'month'.
+    """
+    if granularidad not in GRANULARIDADES:
+        raise ValueError(f"Granularidad de serie desconocida: '{granularidad}'")
+    return func.generate_series(
+        func.date_trunc(granularidad, cast(desde, DateTime)),
+        cast(hasta, DateTime),
+        literal_column(f"interval '1 {granularidad}'")
+    ).table_valued('periodo').render_derived(name='serie')  # ... AS serie(periodo)
+
+
+def serie_completa(agregado, desde: date, hasta: date, granularidad: str) -> list:
+    """
+    Cruza un agregado por periodo con la serie completa del rango.
+
+    Args:
+        agregado: Subconsulta con una columna `periodo` (ver `periodo`) y columnas numéricas.
+        desde (date): El primer día del rango.
+        hasta (date): El último día del rango (incluido).
+        granularidad (str): 'day', 'week' o 'month'.
+
+    Returns:
+        list[Row]: Una fila por periodo, en orden, con `periodo` y las columnas del
+                   agregado (0 en los periodos sin datos).
+    """
+    serie = serie_periodos(desde, hasta, granularidad)
+    valores = [func.coalesce(columna, 0).label(columna.name) for columna in agregado.c if columna.name != 'periodo']
+    return db.session.execute(
+        select(serie.c.periodo, *valores)
+        .select_from(serie)
+        .outerjoin(agregado, agregado.c.periodo == serie.c.periodo)
+        .order_by(serie.c.periodo)
+    ).all()
+
+
+def _de_categoria(consulta, categoria_principal_id: Optional[str]):
+    """Restringe una consulta sobre `ventas_diarias` a una categoría principal."""
+    if categoria_principal_id is None:
+        return consulta
+    seudocategorias = select(Seudocategorias.id)\
+        .join(Subcategorias, Subcategorias.id == Seudocategorias.subcategoria_id)\
+        .where(Subcategorias.categoria_principal_id == categoria_principal_id)
+    return consulta.where(VentasDiarias.seudocategoria_id.in_(seudocategorias))
+
+
+def serie_ventas(desde: date, hasta: date, granularidad: str = 'day',
+                 categoria_principal_id: Optional[str] = None) -> List[dict]:
+    """
+    Unidades, ingresos y costo de cada periodo del rango, incluidos los periodos sin ventas.
+
+    Args:
+        desde (date): El primer día del rango.
+        hasta (date): El último día del rango (incluido).
+        granularidad (str): 'day', 'week' o 'month'.
+        categoria_principal_id (str, optional): Limita las ventas a una categoría principal.
+
+    Returns:
+        list[dict]: `{'periodo': datetime, 'unidades', 'ingresos', 'costo'}` por periodo, en orden.
+    """
+    inicio = periodo(VentasDiarias.fecha, granularidad)
+    agregado = _de_categoria(
+        select(
+            inicio,
+            func.sum(VentasDiarias.unidades).label('unidades'),
+            func.sum(VentasDiarias.ingresos).label('ingresos'),
+            func.sum(VentasDiarias.costo).label('costo'),
+        ).where(VentasDiarias.fecha.between(desde, hasta)),
+        categoria_principal_id
+    ).group_by(inicio).subquery()
+
+    return [
+        {'periodo': fila.periodo, 'unidades': int(fila.unidades), 'ingresos': float(fila.ingresos),
+         'costo': float(fila.costo)}
+        for fila in serie_completa(agregado, desde, hasta, granularidad)
+    ]
+
+
+def totales_ventas(desde: Optional[date] = None, hasta: Optional[date] = None,
+                   categoria_principal_id: Optional[str] = None) -> dict:
+    """
+    Unidades, ingresos y costo acumulados de un rango de días.
+
+    Args:
+        desde (date, optional): El primer día del rango; None no acota por abajo.
+        hasta (date, optional): El último día del rango (incluido); None no acota por arriba.
+        categoria_principal_id (str, optional): Limita las ventas a una categoría principal.
+
+    Returns:
+        dict: `{'unidades': int, 'ingresos': float, 'costo': float}`.
+    """
+    consulta = select(
+        func.sum(VentasDiarias.unidades),
+        func.sum(VentasDiarias.ingresos),
+        func.sum(VentasDiarias.costo),
+    )
+    if desde is not None:
+        consulta = consulta.where(VentasDiarias.fecha >= desde)
+    if hasta is not None:
+        consulta = consulta.where(VentasDiarias.fecha <= hasta)
+    unidades, ingresos, costo = db.session.execute(_de_categoria(consulta, categoria_principal_id)).one()
+    return {'unidades': int(unidades or 0), 'ingresos': float(ingresos or 0), 'costo': float(costo or 0)}
@@ -0,0 +1,270 @@
+"""
+Módulo de Mantenimiento del Resumen de Ventas por Producto.
+
+Este módulo mantiene la tabla materializada `producto_ventas_resumen`, que
+acumula por producto las ventas de los pedidos en estado `COMPLETADO`.
+
+Funcionalidades principales:
+- `registrar_transicion_pedido`: Aplica los deltas cuando un pedido entra o sale
+  del estado `COMPLETADO` (suma al entrar, resta al salir).
+- `aplicar_pedido_al_resumen`: Suma o resta las líneas actuales de un pedido.
+  Se usa también al editar un pedido ya completado (restar antes, sumar después).
+  Mantiene además el acumulado por día de `ventas_diarias`.
+- `reconstruir_resumen`: Recalcula toda la tabla desde `pedido_productos`.
+  Expuesto como el comando `flask rebuild-ventas-resumen`.
+- `backfill_resumen_si_vacio`: Rellena la tabla en el primer despliegue (comando
+  `flask preparar-despliegue`).
+- `get_resumen_ventas`: Lectura O(productos) usada por serializadores y analíticas.
+
+Las funciones no hacen `commit`: participan en la transacción del endpoint que
+las invoca, de modo que el resumen y el pedido se confirman (o revierten) juntos.
+"""
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func
+
+from app.extensions import db
+from app.models.domains.order_models import Pedido, PedidoProducto, ProductoVentasResumen
+from app.models.domains.product_models import Productos
+from app.models.enums import EstadoPedido
+from app.utils import ventas_diarias
+from app.utils.upsert import insert_con_conflicto
+
+
+def _clave_mes(fecha: datetime | None) -> str:
+    """Devuelve la clave `'YYYY-MM'` del bucket mensual para una fecha."""
+    return (fecha or datetime.utcnow()).strftime('%Y-%m')
+
+
+def _lineas_de_pedido(pedido_id: str):
+    """
+    Obtiene las líneas de un pedido junto con el costo actual de cada producto.
+
+    Se consulta la base de datos (con autoflush) en lugar de la relación
+    `pedido.productos` para incluir también las líneas recién añadidas a la sesión.
+    """
+    return db.session.query(
+        PedidoProducto.producto_id,
+        PedidoProducto.cantidad,
+        PedidoProducto.precio_unitario,
+        Productos.costo,
+        Productos.seudocategoria_id
+    ).join(Productos, Productos.id == PedidoProducto.producto_id)\
+     .filter(PedidoProducto.pedido_id == pedido_id).all()
+
+
+def _asegurar_filas_resumen(producto_ids) -> None:
+    """
+    Crea vacías, en una sola sentencia `INSERT ... ON CONFLICT DO NOTHING`, las filas de
+    resumen que aún no existen.
+
+    Dos primeras ventas simultáneas del mismo producto ya no intentan insertar ambas la
+    fila (la segunda fallaba con `IntegrityError`): la base de datos resuelve el
+    conflicto y el `SELECT ... FOR UPDATE` posterior siempre encuentra y bloquea la fila.
+    En motores sin `ON CONFLICT` no hace nada y la fila la crea el ORM.
+    """
+    insert = insert_con_conflicto()
+    if insert is None:
+        return
+    ahora = datetime.utcnow()
+    db.session.execute(
+        insert(ProductoVentasResumen).values([
+            {'producto_id': producto_id, 'unidades_vendidas': 0, 'ingresos_totales': 0.0,
+             'costo_total': 0.0, 'ultima_venta': None, 'ventas_mensuales': {}, 'updated_at': ahora}
+            for producto_id in producto_ids
+        ]).on_conflict_do_nothing(index_elements=['producto_id'])
+    )
+
+
+def aplicar_pedido_al_resumen(pedido: Pedido, signo: int) -> None:
+    """
+    Suma (`signo=1`) o resta (`signo=-1`) las líneas de un pedido al resumen.
+
+    Los acumulados de cada producto afectado se bloquean con `SELECT ... FOR UPDATE`
+    para que dos administradores completando pedidos a la vez no se pisen. Como ese
+    bloqueo no alcanza a filas que aún no existen, antes se crean las que falten con
+    `INSERT ... ON CONFLICT DO NOTHING` (ver `_asegurar_filas_resumen`).
+
+    Args:
+        pedido (Pedido): El pedido cuyas líneas se aplican.
+        signo (int): `1` para sumar, `-1` para restar.
+    """
+    agregados = {}
+    seudocategorias = {}
+    for linea in _lineas_de_pedido(pedido.id):
+        unidades, ingresos, costo = agregados.get(linea.producto_id, (0, 0.0, 0.0))
+        agregados[linea.producto_id] = (
+            unidades + linea.cantidad,
+            ingresos + linea.cantidad * linea.precio_unitario,
+            costo + linea.cantidad * (linea.costo or 0)
+        )
+        seudocategorias[linea.producto_id] = linea.seudocategoria_id
+    if not agregados:
+        return
+
+    # El acumulado diario de las series del panel se mantiene en las mismas transiciones.
+    ventas_diarias.aplicar_lineas(
+        (pedido.created_at or datetime.utcnow()).date(),
+        {pid: (seudocategorias[pid], *valores) for pid, valores in agregados.items()},
+        signo
+    )
+
+    if signo > 0:
+        _asegurar_filas_resumen(agregados.keys())
+    existentes = {
+        r.producto_id: r for r in ProductoVentasResumen.query.filter(
+            ProductoVentasResumen.producto_id.in_(agregados.keys())
+        ).with_for_update().populate_existing().all()
+    }
+    clave = _clave_mes(pedido.created_at)
+
+    for producto_id, (unidades, ingresos, costo) in agregados.items():
+        resumen = existentes.get(producto_id)
+        if resumen is None:
+            if signo < 0:
+                # El resumen está desincronizado; se corrige con `flask rebuild-ventas-resumen`.
+                current_app.logger.warning(f"Resumen de ventas inexistente para el producto {producto_id} al restar el pedido {pedido.id}.")
+                continue
+            resumen = ProductoVentasResumen(producto_id)
+            db.session.add(resumen)
+
+        resumen.unidades_vendidas = max(0, (resumen.unidades_vendidas or 0) + signo * unidades)
+        resumen.ingresos_totales = round(max(0.0, (resumen.ingresos_totales or 0.0) + signo * ingresos), 2)
+        resumen.costo_total = round(max(0.0, (resumen.costo_total or 0.0) + signo * costo), 2)
+
+        # Se reasigna un diccionario nuevo para que SQLAlchemy detecte el cambio en el JSON.
+        meses = dict(resumen.ventas_mensuales or {})
+        bucket = dict(meses.get(clave) or {'unidades': 0, 'ingresos': 0.0, 'costo': 0.0})
+        bucket['unidades'] = bucket['unidades'] + signo * unidades
+        bucket['ingresos'] = round(bucket['ingresos'] + signo * ingresos, 2)
+        bucket['costo'] = round(bucket['costo'] + signo * costo, 2)
+        if bucket['unidades'] > 0:
+            meses[clave] = bucket
+        else:
+            meses.pop(clave, None)
+        resumen.ventas_mensuales = meses
+
+        if signo > 0 and pedido.created_at and (resumen.ultima_venta is None or pedido.created_at > resumen.ultima_venta):
+            resumen.ultima_venta = pedido.created_at
+
+    if signo < 0:
+        # Al restar, la última venta solo puede recalcularse desde los pedidos restantes.
+        ultimas = dict(db.session.query(
+            PedidoProducto.producto_id,
+            func.max(Pedido.created_at)
+        ).join(Pedido, Pedido.id == PedidoProducto.pedido_id)
+         .filter(
+            PedidoProducto.producto_id.in_(agregados.keys()),
+            Pedido.estado_pedido == EstadoPedido.COMPLETADO,
+            Pedido.id != pedido.id
+        ).group_by(PedidoProducto.producto_id).all())
+        for producto_id, resumen in existentes.items():
+            resumen.ultima_venta = ultimas.get(producto_id)
+
+
+def registrar_transicion_pedido(pedido: Pedido, estado_anterior: EstadoPedido | None, estado_nuevo: EstadoPedido) -> None:
+    """
+    Actualiza el resumen cuando un pedido cambia de `estado_pedido`.
+
+    Solo las transiciones que cruzan `COMPLETADO` afectan al resumen. Debe
+    llamarse antes de cambiar `created_at` o las líneas del pedido.
+
+    Args:
+        pedido (Pedido): El pedido que cambia de estado.
+        estado_anterior (EstadoPedido | None): Estado previo (`None` si el pedido es nuevo).
+        estado_nuevo (EstadoPedido): Estado destino.
+    """
+    if estado_anterior == estado_nuevo:
+        return
+    if estado_nuevo == EstadoPedido.COMPLETADO:
+        aplicar_pedido_al_resumen(pedido, 1)
+    elif estado_anterior == EstadoPedido.COMPLETADO:
+        aplicar_pedido_al_resumen(pedido, -1)
+
+
+def reconstruir_resumen() -> int:
+    """
+    Recalcula por completo la tabla `producto_ventas_resumen`.
+
+    Ejecuta una única consulta agrupada por producto y mes sobre los pedidos
+    completados y reemplaza el contenido de la tabla. No hace `commit`.
+
+    Returns:
+        int: El número de productos con ventas resumidos.
+    """
+    mes = func.date_trunc('month', Pedido.created_at)
+    rows = db.session.query(
+        PedidoProducto.producto_id,
+        mes.label('mes'),
+        func.sum(PedidoProducto.cantidad).label('unidades'),
+        func.sum(PedidoProducto.cantidad * PedidoProducto.precio_unitario).label('ingresos'),
+        func.sum(PedidoProducto.cantidad * Productos.costo).label('costo'),
+        func.max(Pedido.created_at).label('ultima_venta')
+    ).join(Pedido, Pedido.id == PedidoProducto.pedido_id)\
+     .join(Productos, Productos.id == PedidoProducto.producto_id)\
+     .filter(Pedido.estado_pedido == EstadoPedido.COMPLETADO)\
+     .group_by(PedidoProducto.producto_id, mes).all()
+
+    resumenes = {}
+    for row in rows:
+        resumen = resumenes.get(row.producto_id)
+        if resumen is None:
+            resumen = resumenes[row.producto_id] = ProductoVentasResumen(row.producto_id)
+        unidades = int(row.unidades or 0)
+        ingresos = float(row.ingresos or 0)
+        costo = float(row.costo or 0)
+        resumen.unidades_vendidas += unidades
+        resumen.ingresos_totales = round(resumen.ingresos_totales + ingresos, 2)
+        resumen.costo_total = round(resumen.costo_total + costo, 2)
+        resumen.ventas_mensuales[_clave_mes(row.mes)] = {
+            'unidades': unidades, 'ingresos': round(ingresos, 2), 'costo': round(costo, 2)
+        }
+        if resumen.ultima_venta is None or row.ultima_venta > resumen.ultima_venta:
+            resumen.ultima_venta = row.ultima_venta
+
+    ProductoVentasResumen.query.delete(synchronize_session=False)
+    db.session.add_all(resumenes.values())
+    return len(resumenes)
+
+
+def backfill_resumen_si_vacio() -> int | None:
+    """
+    Rellena `producto_ventas_resumen` si está vacía y ya hay pedidos completados.
+
+    El mantenimiento incremental solo registra las ventas posteriores a la creación de
+    la tabla; sin este relleno, las ventas históricas no aparecen en el catálogo ni en
+    el panel. Se ejecuta en cada despliegue (`flask preparar-despliegue`) y es
+    idempotente: con la tabla ya poblada no hace nada. No hace `commit`.
+
+    Returns:
+        int | None: El número de productos resumidos, o `None` si no hacía falta.
+    """
+    if db.session.query(ProductoVentasResumen.producto_id).first() is not None:
+        return None
+    hay_ventas = db.session.query(Pedido.id).filter(
+        Pedido.estado_pedido == EstadoPedido.COMPLETADO
+    ).first() is not None
+    if not hay_ventas:
+        return None
+    return reconstruir_resumen()
+
+
+def get_resumen_ventas(producto_ids) -> dict:
+    """
+    Lee el resumen de ventas de varios productos en una sola consulta.
+
+    Args:
+        producto_ids (Iterable[str]): Los IDs de los productos.
+
+    Returns:
+        dict: `{producto_id: ProductoVentasResumen}`. Los productos sin ventas no aparecen.
+    """
+    producto_ids = {pid for pid in producto_ids if pid}
+    if not producto_ids:
+        return {}
+    return {
+        r.producto_id: r for r in ProductoVentasResumen.query.filter(
+            ProductoVentasResumen.producto_id.in_(producto_ids)
+        ).all()
+    }
@@ -46,6 +46,9 @@ class Config:
 
     # Modo de depuración de Flask. Se desactiva por defecto por seguridad.
     DEBUG = False
+    # Expone en la cabecera `X-Identity-Queries` cuántas consultas de identidad hizo cada
+    # petición. Siempre activo con DEBUG; en producción solo si se habilita explícitamente.
+    IDENTITY_QUERIES_HEADER = os.getenv('IDENTITY_QUERIES_HEADER', 'false').lower() == 'true'
 
     # --- Configuración de Flask-JWT-Extended ---
     # Especifica que los tokens JWT se buscarán en las cookies.
@@ -63,6 +66,105 @@ class Config:
     # Tiempo de expiración para el token JWT del administrador (en minutos). 10080 min = 7 días.
     ADMIN_JWT_EXPIRATION_MINUTES = 10080
 
+    # --- Backends de estado compartido ---
+    # Las claves `*_BACKEND` / `*_BROKER` de las secciones siguientes eligen dónde vive el
+    # estado de cada utilidad. 'memory' es por proceso: con varios workers se debe registrar
+    # un backend compartido (ej. Redis) en el registro correspondiente (ver `app.utils.backends`).
+
+    # --- Configuración de Presencia (last_seen) ---
+    # Backend del buffer de presencia (`app.utils.presence.BUFFERS`).
+    PRESENCE_BACKEND = os.getenv('PRESENCE_BACKEND', 'memory')
+    # Cada cuántos segundos se vuelcan los 'last_seen' acumulados a la base de datos. Con 0 se
+    # vuelcan al final de cada petición; es el valor por defecto en Vercel (variable `VERCEL`),
+    # donde una instancia puede descartarse con el buffer pendiente.
+    PRESENCE_FLUSH_INTERVAL_SECONDS = int(os.getenv('PRESENCE_FLUSH_INTERVAL_SECONDS', 0 if os.getenv('VERCEL') else 60))
+
+    # --- Configuración de la Caché del Árbol de Navegación ---
+    # Backend de versiones de la caché (`app.utils.backends.VERSION_STORES`).
+    NAVIGATION_CACHE_BACKEND = os.getenv('NAVIGATION_CACHE_BACKEND', 'memory')
+    # Tiempo máximo (en segundos) que un worker reutiliza el árbol sin reconstruirlo.
+    NAVIGATION_CACHE_TTL_SECONDS = int(os.getenv('NAVIGATION_CACHE_TTL_SECONDS', 300))
+
+    # --- Configuración del Índice de Facetas del Catálogo ---
+    # Backend de versiones del índice (`app.utils.backends.VERSION_STORES`).
+    FACET_INDEX_BACKEND = os.getenv('FACET_INDEX_BACKEND', 'memory')
+    # Tiempo máximo (en segundos) que un worker reutiliza el índice sin reconstruirlo.
+    FACET_INDEX_TTL_SECONDS = int(os.getenv('FACET_INDEX_TTL_SECONDS', 300))
+
+    # --- Configuración de la Búsqueda de Productos ---
+    # Backend del motor de búsqueda (`app.utils.product_search.MOTORES`): 'postgres' (tsvector +
+    # pg_trgm), 'memory' (índice en Python para SQLite en desarrollo) o 'auto' (según la URI).
+    PRODUCT_SEARCH_BACKEND = os.getenv('PRODUCT_SEARCH_BACKEND', 'auto')
+    # Similitud mínima de trigramas (0-1) para el respaldo ante errores de escritura.
+    PRODUCT_SEARCH_TRGM_THRESHOLD = float(os.getenv('PRODUCT_SEARCH_TRGM_THRESHOLD', 0.3))
+
+    # --- Configuración de las Notificaciones en Tiempo Real (SSE) ---
+    # El canal push `/events/stream` está desactivado por defecto: el cliente consulta
+    # `/events/api/check-notifications` en cada carga de página. Cada conexión SSE retiene un
+    # worker mientras está abierta, así que solo debe activarse con workers asíncronos
+    # (`gunicorn -k gevent`) y, con varios procesos, un `NOTIFICATIONS_BROKER` compartido.
+    # En Vercel se ignora: sus funciones entregan la respuesta completa, no un stream.
+    NOTIFICATIONS_SSE_ENABLED = os.getenv('NOTIFICATIONS_SSE_ENABLED', 'false').lower() == 'true' and not os.getenv('VERCEL')
+    # Broker de publicación/suscripción (`app.utils.notificaciones.BROKERS`).
+    NOTIFICATIONS_BROKER = os.getenv('NOTIFICATIONS_BROKER', 'memory')
+    # Duración máxima (en segundos) de cada conexión SSE. Al cerrarse, el navegador reconecta
+    # solo; el límite acota el tiempo que una conexión permanece abierta en el servidor.
+    NOTIFICATIONS_SSE_TIMEOUT_SECONDS = int(os.getenv('NOTIFICATIONS_SSE_TIMEOUT_SECONDS', 55))
+    # Milisegundos que el navegador espera antes de reconectar (campo `retry` del stream).
+    NOTIFICATIONS_SSE_RETRY_MS = int(os.getenv('NOTIFICATIONS_SSE_RETRY_MS', 15000))
+    # Cada cuántos segundos se envía un comentario de latido para mantener viva la conexión.
+    NOTIFICATIONS_SSE_HEARTBEAT_SECONDS = int(os.getenv('NOTIFICATIONS_SSE_HEARTBEAT_SECONDS', 15))
+
+    # --- Configuración de las Tareas Periódicas ---
+    # Si es True, las peticiones encolan las tareas periódicas vencidas (purga de carritos,
+    # recálculo de recomendaciones, fotografía del stock) en el hilo de fondo de
+    # `app.utils.tareas`. Desactívalo al ejecutarlas con `flask tareas-periodicas` desde un
+    # cron; en Vercel, donde un hilo de fondo puede no llegar a ejecutarse, está desactivado
+    # por defecto.
+    PERIODIC_TASKS_IN_REQUESTS = os.getenv('PERIODIC_TASKS_IN_REQUESTS', 'false' if os.getenv('VERCEL') else 'true').lower() == 'true'
+
+    # --- Configuración del Historial de Inventario ---
+    # Cada cuántos segundos se comprueba si falta la fotografía del stock del día (`snapshots_stock`).
+    STOCK_SNAPSHOT_CHECK_INTERVAL_SECONDS = int(os.getenv('STOCK_SNAPSHOT_CHECK_INTERVAL_SECONDS', 3600))
+
+    # --- Configuración de los Carritos de Invitado ---
+    # Días sin actividad tras los cuales un carrito de invitado (`session_id`) se considera abandonado.
+    CART_GUEST_TTL_DAYS = int(os.getenv('CART_GUEST_TTL_DAYS', 30))
+    # Cada cuántos segundos, como máximo, un worker encola la purga de carritos abandonados.
+    CART_SWEEP_INTERVAL_SECONDS = int(os.getenv('CART_SWEEP_INTERVAL_SECONDS', 3600))
+    # Líneas de carrito eliminadas por lote (cada lote es una transacción corta).
+    CART_SWEEP_BATCH_SIZE = int(os.getenv('CART_SWEEP_BATCH_SIZE', 500))
+
+    # --- Configuración de la Caché del Resumen del Carrito ---
+    # Almacén de los resúmenes `(total_items, total_price)` por carrito (`app.utils.cart_summary.ALMACENES`).
+    CART_SUMMARY_CACHE_BACKEND = os.getenv('CART_SUMMARY_CACHE_BACKEND', 'memory')
+    # Segundos que vive un resumen cacheado. Acota la obsolescencia ante cambios de precio o de
+    # estado de los productos, que no invalidan los carritos que los contienen.
+    CART_SUMMARY_CACHE_TTL_SECONDS = int(os.getenv('CART_SUMMARY_CACHE_TTL_SECONDS', 120))
+
+    # --- Configuración de las Recomendaciones de Productos ---
+    # Longitud máxima de la lista precalculada de relacionados de cada producto.
+    RECOMMENDATIONS_MAX_RELATED = int(os.getenv('RECOMMENDATIONS_MAX_RELATED', 24))
+    # Cada cuántos segundos, como máximo, se recalculan las listas (tarea periódica).
+    RECOMMENDATIONS_REFRESH_INTERVAL_SECONDS = int(os.getenv('RECOMMENDATIONS_REFRESH_INTERVAL_SECONDS', 21600))
+
+    # --- Configuración de las Analíticas de Compras por Cliente ---
+    # Backend del `VersionStore` que invalida las analíticas de un usuario cuando cambian sus
+    # pedidos (`app.utils.backends.VERSION_STORES`).
+    CUSTOMER_ANALYTICS_CACHE_BACKEND = os.getenv('CUSTOMER_ANALYTICS_CACHE_BACKEND', 'memory')
+    # Segundos que vive una analítica cacheada aunque no se invalide.
+    CUSTOMER_ANALYTICS_CACHE_TTL_SECONDS = int(os.getenv('CUSTOMER_ANALYTICS_CACHE_TTL_SECONDS', 600))
+
+    # --- Configuración de las Estadísticas del Dashboard ---
+    # Backend del `VersionStore` que invalida las instantáneas del dashboard al completar un
+    # pedido (`app.utils.backends.VERSION_STORES`).
+    DASHBOARD_STATS_CACHE_BACKEND = os.getenv('DASHBOARD_STATS_CACHE_BACKEND', 'memory')
+    # Segundos que una instantánea se sirve sin recalcular.
+    DASHBOARD_STATS_CACHE_TTL_SECONDS = int(os.getenv('DASHBOARD_STATS_CACHE_TTL_SECONDS', 60))
+    # Antigüedad máxima de una instantánea servida mientras se recalcula en segundo plano;
+    # más allá, se recalcula dentro de la petición.
+    DASHBOARD_STATS_MAX_STALE_SECONDS = int(os.getenv('DASHBOARD_STATS_MAX_STALE_SECONDS', 900))
+
 class DevelopmentConfig(Config):
     """Configuración para el entorno de desarrollo."""
     DEBUG = True